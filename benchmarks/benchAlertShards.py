@@ -0,0 +1,244 @@
+#!/usr/bin/python3
+"""
+ Copyright 2017 IBM Corporation
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+ Measures the alert throughput during a synthetic SEL storm as the number of alert shard processes goes from
+ 1 to the number of cores, and with the polls on threads of one process as the service runs without shards.
+ Every BMC logs a burst of new SEL entries for each of its polls, and is polled again as soon as its poll
+ finishes. A poll builds the SEL list of the burst, standing in for the ipmitool read, decodes it with the
+ ipmi event index and keeps the alerts that are new for each notify entity. The service process checks the
+ alerts again, formats them as JSON the way the plugins do, and sends the new reporting times to the shard
+ of the BMC, as the service does when an alert is delivered. Each number of processes is measured in a new
+ process. The alerts per second, the time per poll and the bytes sent over the shard pipes per alert are
+ reported.
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ibm-crassd'))
+sys.path.append('/opt/ibm/ras/bin')
+import config
+import ipmiSel
+import alertShards
+
+entities = ['csm', 'logstash']
+selLines = []
+reporting = {}
+reportingLock = threading.Lock()
+storm = {'bursts': 10, 'entries': 200, 'processes': 0, 'polls': 0, 'alerts': 0, 'pollTime': 0.0, 'lost': 0}
+finished = threading.Event()
+work = queue.Queue()
+
+def createCommandParser():
+    """
+         creates the parser for the command line
+
+         @return: returns the parser for the command line
+    """
+    benchDir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Measures the alert throughput of the alert shards during a SEL storm.")
+    parser.add_argument("-n", "--bmcs", type=int, default=64, help='The number of BMCs')
+    parser.add_argument("-b", "--bursts", type=int, default=10, help='The number of bursts logged by each BMC')
+    parser.add_argument("-e", "--entries", type=int, default=200, help='The number of SEL entries in a burst')
+    parser.add_argument("-t", "--threads", type=int, default=16, help='The number of polling threads, shared by the shards')
+    parser.add_argument("-m", "--max-processes", type=int, default=os.cpu_count(), help='The most shard processes measured')
+    parser.add_argument("-x", "--events", default=os.path.join(benchDir, '..', 'ipmiSelParser', 'resources', 'p8SMCBMCevents.xml'),
+                        help='The event table to build the index from')
+    parser.add_argument("--processes", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--index", help=argparse.SUPPRESS)
+    return parser
+
+def loadSELLines():
+    """
+        Builds the sensor, state and details of a SEL entry for every event of the event table
+    """
+    for key in sorted(ipmiSel.lookupEvents):
+        if '.*' in key or '..' in key:
+            continue
+        values = dict(zip(ipmiSel.eventNames, ipmiSel.lookupEvents[key]))
+        selLines.append(' | '.join([values['sensor'], values['state'], values['additonalDetails']]))
+
+def getSELList(bmcNumber, burst):
+    """
+        Returns the SEL list of a burst of a BMC, every entry one second after the one before
+    """
+    lines = []
+    first = burst * storm['entries']
+    for i in range(first, first + storm['entries']):
+        logged = time.localtime(1516010400 + i)
+        lines.append('{num:4x} | {date} | {entry}'.format(num=i + 1, date=time.strftime('%m/%d/%Y | %H:%M:%S', logged),
+                                                       entry=selLines[(i * 7 + bmcNumber) % len(selLines)]))
+    return '\n'.join(lines)
+
+def isNew(entity, bmcHostname, event):
+    """
+        Returns True if the alert is after the reporting times of the entity for the BMC
+    """
+    with reportingLock:
+        lastLogTime, dupList = reporting.get((entity, bmcHostname), ('0', []))
+    return event['timestamp'] > lastLogTime or (event['timestamp'] == lastLogTime and event['CerID'] not in dupList)
+
+def pollBMC(bmcHostname, burst):
+    """
+        Polls a burst of a BMC, in a shard or on a thread of the benchmark process
+
+        @return: tuple of the poll failure, the time the poll started and the new alerts, like the service
+    """
+    started = time.time()
+    events = ipmiSel.decodeSEL(getSELList(int(bmcHostname[3:]), burst))
+    alerts = []
+    for i in range(events['numAlerts']):
+        event = events['event' + str(i)]
+        if 'CerID' not in event:
+            continue
+        newFor = [entity for entity in entities if isNew(entity, bmcHostname, event)]
+        if newFor:
+            alerts.append((event, True, newFor))
+    return (False, started, alerts)
+
+def updateReporting(update):
+    """
+        Sets the reporting times of an entity for a BMC sent by the benchmark process
+    """
+    key, bmcHostname, lastLogTime, dupList = update[1:]
+    with reportingLock:
+        reporting[(key, bmcHostname)] = (lastLogTime, dupList)
+
+def pollDone(bmcHostname, result):
+    """
+        Delivers the new alerts of a poll and polls the next burst of the BMC
+    """
+    if result is None:
+        storm['lost'] += 1
+        result = (True, time.time(), [])
+    pollFailed, started, alerts = result
+    delivered = 0
+    for event, analysisPassed, keys in alerts:
+        for key in keys:
+            if not isNew(key, bmcHostname, event):
+                continue
+            json.dumps({'impactedNode': bmcHostname, 'event': event})
+            delivered += 1
+            with reportingLock:
+                lastLogTime, dupList = reporting.get((key, bmcHostname), ('0', []))
+                if event['timestamp'] > lastLogTime:
+                    lastLogTime, dupList = event['timestamp'], [event['CerID']]
+                else:
+                    dupList = dupList + [event['CerID']]
+                reporting[(key, bmcHostname)] = (lastLogTime, dupList)
+            if storm['processes'] > 0:
+                alertShards.sendState(bmcHostname, ('tracking', key, bmcHostname, lastLogTime, dupList))
+    with reportingLock:
+        storm['polls'] += 1
+        storm['alerts'] += delivered
+        storm['pollTime'] += time.time() - started
+        burst = storm['nextBurst'][bmcHostname]
+        storm['nextBurst'][bmcHostname] += 1
+    if burst < storm['bursts']:
+        poll(bmcHostname, burst)
+    elif storm['polls'] == storm['bursts'] * len(storm['nextBurst']):
+        finished.set()
+
+def poll(bmcHostname, burst):
+    if storm['processes'] > 0:
+        alertShards.dispatch(bmcHostname, burst)
+    else:
+        work.put((bmcHostname, burst))
+
+def runThreadPolls():
+    while True:
+        bmcHostname, burst = work.get()
+        pollDone(bmcHostname, pollBMC(bmcHostname, burst))
+
+def runStorm(args):
+    """
+        Runs the storm with the number of shard processes given on the command line and prints the results as JSON
+    """
+    storm['bursts'] = args.bursts
+    storm['entries'] = args.entries
+    storm['processes'] = args.processes
+    ipmiSel.eventTableLoc = args.events
+    ipmiSel.indexLoc = args.index
+    if not ipmiSel.initialize():
+        sys.exit(1)
+    loadSELLines()
+    bmcs = ['bmc{num:03d}'.format(num=i) for i in range(args.bmcs)]
+    storm['nextBurst'] = dict((bmc, 1) for bmc in bmcs)
+    if args.processes > 0:
+        alertShards.start(args.processes, int(math.ceil(float(args.threads) / args.processes)), lambda index: None, pollBMC, updateReporting,
+                          lambda: None, pollDone)
+    else:
+        for i in range(args.threads):
+            t = threading.Thread(target=runThreadPolls)
+            t.daemon = True
+            t.start()
+    started = time.time()
+    for bmc in bmcs:
+        poll(bmc, 0)
+    finished.wait()
+    elapsed = time.time() - started
+    shardStats = alertShards.getShardStats()
+    if args.processes > 0:
+        alertShards.stop()
+    #the manager process started by config holds the output pipe open until it exits
+    config.nodeManager.shutdown()
+    print(json.dumps({'elapsed': elapsed, 'polls': storm['polls'], 'alerts': storm['alerts'], 'pollTime': storm['pollTime'],
+                      'lost': storm['lost'], 'bytes': shardStats['bytesSent'] + shardStats['bytesReceived']}))
+    sys.stdout.flush()
+    os._exit(0)
+
+if __name__ == '__main__':
+    parser = createCommandParser()
+    args = parser.parse_args()
+    config.errorLogger = lambda severity, message: None
+    if args.processes is not None:
+        runStorm(args)
+    tempDir = tempfile.mkdtemp()
+    try:
+        ipmiSel.eventTableLoc = args.events
+        ipmiSel.indexLoc = os.path.join(tempDir, 'events.idx')
+        if not ipmiSel.initialize():
+            print('The event table {fname} could not be loaded'.format(fname=args.events))
+            sys.exit(1)
+        expected = args.bmcs * args.bursts * args.entries * len(entities)
+        print('{cores} cores, {bmcs} BMCs logging {bursts} bursts of {entries} SEL entries, {alerts} alerts to deliver'.format(
+            cores=os.cpu_count(), bmcs=args.bmcs, bursts=args.bursts, entries=args.entries, alerts=expected))
+        baseline = None
+        for processes in [0] + list(range(1, max(args.max_processes, 1) + 1)):
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--processes', str(processes),
+                                              '--index', ipmiSel.indexLoc, '-n', str(args.bmcs), '-b', str(args.bursts),
+                                              '-e', str(args.entries), '-t', str(args.threads), '-x', args.events])
+            result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+            rate = result['alerts'] / result['elapsed']
+            if baseline is None:
+                baseline = rate
+            name = 'threads in one process' if processes == 0 else '{count} shard processes'.format(count=processes)
+            print('{name:24s}: {alerts} alerts in {elapsed:6.2f} s, {rate:9.0f} alerts/s, {speedup:5.2f}x, {avg:7.1f} ms per poll, '
+                  '{bytes:6.0f} pipe bytes per alert, {missed} missed'.format(name=name, alerts=result['alerts'],
+                  elapsed=result['elapsed'], rate=rate, speedup=rate / baseline, avg=1000 * result['pollTime'] / result['polls'],
+                  bytes=result['bytes'] / max(result['alerts'], 1), missed=expected - result['alerts']))
+    finally:
+        shutil.rmtree(tempDir)
@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+"""
+ Copyright 2017 IBM Corporation
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+ Measures the time the socket server spends building the sensor data for one subscriber group each tick.
+ The scan path reads every sensor of every node from the shared sensor table and then walks the result with
+ the filters of the subscriber, which is how the filters were applied before they were compiled. The compiled
+ path reads only the slots picked by the compiled filter, which are cached with the catalog of each node.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ibm-crassd'))
+sys.path.append('/opt/ibm/ras/bin')
+import config
+import telemetryServer
+import sensorTable
+
+sensorTypes = [('temperature', 'DegreesC'), ('power', 'Watts'), ('fan_tach', 'RPMS'), ('voltage', 'Volts'), ('current', 'Amperes')]
+
+def createCommandParser():
+    """
+         creates the parser for the command line
+
+         @return: returns the parser for the command line
+    """
+    parser = argparse.ArgumentParser(description="Compares scanning and compiled subscriber filters over the shared sensor table.")
+    parser.add_argument("-n", "--nodes", type=int, default=5000, help='The number of nodes in the sensor table')
+    parser.add_argument("-s", "--sensors", type=int, default=150, help='The number of sensors per node')
+    parser.add_argument("-t", "--ticks", type=int, default=10, help='The number of ticks to measure for each filter')
+    parser.add_argument("-c", "--changed", type=float, default=0.1, help='Fraction of the sensors that change between ticks')
+    return parser
+
+def fillTable(nodeList, sensors):
+    for node in nodeList:
+        for i in range(sensors):
+            stype = sensorTypes[i % len(sensorTypes)]
+            sensorTable.writeSensor(node['xcatNodeName'], '{stype}_sensor{num}'.format(stype=stype[0], num=i), 30000 + i, -3, stype)
+        sensorTable.writeStatus(node['xcatNodeName'], int(time.time()), True, 'Powered On')
+    sensorTable.publishCatalogs()
+
+def scanFilter(filterInfo, sensorData):
+    """
+        Filters a full read of the sensor table by walking every sensor of every node
+    """
+    filteredDict = {}
+    if 'sensornames' in filterInfo:
+        for node in sensorData:
+            filteredDict[node] = {}
+            for sname in filterInfo['sensornames']:
+                filteredDict[node][sname] = sensorData[node][sname]
+            for key in telemetryServer.nodeStatusKeys:
+                filteredDict[node][key] = sensorData[node][key]
+        return filteredDict
+    elif 'sensortypes' in filterInfo:
+        for node in sensorData:
+            filteredDict[node] = {}
+            for sname in sensorData[node]:
+                if sname in telemetryServer.nodeStatusKeys:
+                    filteredDict[node][sname] = sensorData[node][sname]
+                elif sensorData[node][sname]['type'] is None or sensorData[node][sname]['type'][0] in filterInfo['sensortypes']:
+                    filteredDict[node][sname] = sensorData[node][sname]
+        return filteredDict
+    return sensorData
+
+def changeSensors(nodeList, sensors, count):
+    for i in range(count):
+        node = random.choice(nodeList)['xcatNodeName']
+        num = random.randrange(sensors)
+        stype = sensorTypes[num % len(sensorTypes)]
+        sensorTable.writeValue(node, '{stype}_sensor{num}'.format(stype=stype[0], num=num), random.randint(20000, 40000))
+
+def measure(nodeList, args, filterInfo, compiled):
+    """
+        Returns the average milliseconds per tick and the number of sensors built for the filter
+    """
+    readerCache = {}
+    select = telemetryServer.compileFilter(filterInfo)
+    changes = int(len(nodeList) * args.sensors * args.changed)
+    #the first read parses the catalogs and picks the slots, which happens once per catalog change
+    start = time.time()
+    if compiled:
+        sensorTable.readTable(readerCache, select, 'bench')
+    else:
+        scanFilter(filterInfo, sensorTable.readTable(readerCache))
+    firstTick = time.time() - start
+    elapsed = 0.0
+    for i in range(args.ticks):
+        changeSensors(nodeList, args.sensors, changes)
+        start = time.time()
+        if compiled:
+            filtered = sensorTable.readTable(readerCache, select, 'bench')
+        else:
+            filtered = scanFilter(filterInfo, sensorTable.readTable(readerCache))
+        elapsed += time.time() - start
+    sensors = sum([len(filtered[node]) - len(telemetryServer.nodeStatusKeys) for node in filtered])
+    return 1000 * firstTick, 1000 * elapsed / args.ticks, sensors
+
+if __name__ == '__main__':
+    parser = createCommandParser()
+    args = parser.parse_args()
+    nodeList = [{'xcatNodeName': 'node{num:04d}'.format(num=i)} for i in range(args.nodes)]
+    config.mynodelist = nodeList
+    sensorTable.create(nodeList, max(256, args.sensors))
+    fillTable(nodeList, args.sensors)
+    print('{nodes} nodes, {sensors} sensors per node, {changed:.0f}% of the sensors changed per tick'.format(
+          nodes=args.nodes, sensors=args.sensors, changed=args.changed * 100))
+    filters = [('all sensors', {}),
+               ('type power', {'sensortypes': ['power']}),
+               ('types temperature, fan_tach', {'sensortypes': ['temperature', 'fan_tach']}),
+               ('4 sensor names', {'sensornames': ['temperature_sensor0', 'power_sensor1', 'fan_tach_sensor2', 'voltage_sensor3']})]
+    for name, filterInfo in filters:
+        for compiled in [False, True]:
+            firstTick, perTick, sensors = measure(nodeList, args, filterInfo, compiled)
+            print('{name:>28} {path:>8}: first tick {first:8.1f} ms, {tick:8.1f} ms/tick, {sensors} sensors'.format(
+                  name=name, path='compiled' if compiled else 'scan', first=firstTick, tick=perTick, sensors=sensors))
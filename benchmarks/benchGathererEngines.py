@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+"""
+ Copyright 2017 IBM Corporation
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+ Compares the resident memory and CPU used by one telemetry gatherer process with the thread engine
+ and with the asyncio engine. All of the BMCs are simulated by a local mock BMC, see mockBmc.py.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ibm-crassd'))
+sys.path.append('/opt/ibm/ras/bin')
+import config
+import telemetryServer
+import sensorTable
+import mockBmc
+
+def createCommandParser():
+    """
+         creates the parser for the command line
+
+         @return: returns the parser for the command line
+    """
+    parser = argparse.ArgumentParser(description="Measures RSS and CPU of a telemetry gatherer process for the thread and asyncio engines.")
+    parser.add_argument("-n", "--nodes", type=int, default=100, help='The number of mock BMCs handled by the gatherer process')
+    parser.add_argument("-e", "--engines", default='thread,asyncio', help='Comma separated list of the gatherer engines to measure')
+    parser.add_argument("-s", "--sensors", type=int, default=40, help='The number of sensors on each mock BMC')
+    parser.add_argument("-i", "--interval", type=float, default=1.0, help='Seconds between sensor updates from each mock BMC')
+    parser.add_argument("-w", "--warmup", type=int, default=30, help='Seconds to wait for the websockets to connect before measuring')
+    parser.add_argument("-d", "--duration", type=int, default=60, help='Seconds to measure for')
+    parser.add_argument("-p", "--port", type=int, default=18443, help='The port for the mock BMC')
+    return parser
+
+def procStats(pid):
+    """
+        Returns the cpu seconds, resident set size in kB and thread count of a process
+    """
+    with open('/proc/{apid}/stat'.format(apid=pid), 'r') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / float(os.sysconf('SC_CLK_TCK'))
+    rss = 0
+    threads = 0
+    with open('/proc/{apid}/status'.format(apid=pid), 'r') as f:
+        for line in f:
+            if line.startswith('VmRSS'):
+                rss = int(line.split()[1])
+            elif line.startswith('Threads'):
+                threads = int(line.split()[1])
+    return cpu, rss, threads
+
+def createNodeList(count, port):
+    nodeList = []
+    for i, bmcHostname in enumerate(mockBmc.bmcHostnames(count, port)):
+        nodeList.append({'xcatNodeName': 'node{num:04d}'.format(num=i), 'bmcHostname': bmcHostname,
+                         'accessType': 'openbmcRest', 'username': 'root', 'password': '0penBmc'})
+    return nodeList
+
+def runGatherer(engine, nodeList):
+    config.gathererEngine = engine
+    telemetryServer.getGathererTarget()(nodeList, [])
+
+def measureEngine(engine, args):
+    nodeList = createNodeList(args.nodes, args.port)
+    config.mynodelist = nodeList
+    for node in nodeList:
+        config.nodeProperties[node['xcatNodeName']] = {}
+    telemetryServer.initSharedState()
+    gatherer = multiprocessing.Process(target=runGatherer, args=[engine, nodeList])
+    gatherer.start()
+    time.sleep(args.warmup)
+    cpuStart, rssStart, threads = procStats(gatherer.pid)
+    start = time.time()
+    time.sleep(args.duration)
+    latest = sensorTable.readTable({})
+    cpuEnd, rssEnd, threads = procStats(gatherer.pid)
+    elapsed = time.time() - start
+    telemetryServer.killSig.set()
+    gatherer.join(15)
+    if gatherer.is_alive():
+        gatherer.terminate()
+        gatherer.join()
+    connected = len([name for name in latest if latest[name]['Connected']])
+    return {'engine': engine, 'cpu': 100.0 * (cpuEnd - cpuStart) / elapsed, 'rss': rssEnd / 1024.0,
+            'threads': threads, 'connected': connected}
+
+def report(result, nodes):
+    per100 = 100.0 / nodes
+    print('{engine:>8}: {connected}/{nodes} connected, {threads} threads, RSS {rss:.1f} MB ({rss100:.1f} MB per 100 nodes), '
+          'CPU {cpu:.1f}% ({cpu100:.1f}% per 100 nodes)'.format(engine=result['engine'], connected=result['connected'], nodes=nodes,
+                                                               threads=result['threads'], rss=result['rss'], rss100=result['rss'] * per100,
+                                                               cpu=result['cpu'], cpu100=result['cpu'] * per100))
+
+if __name__ == '__main__':
+    parser = createCommandParser()
+    args = parser.parse_args()
+    ready = multiprocessing.Event()
+    mock = multiprocessing.Process(target=mockBmc.runMockBmc, args=[args.port, args.sensors, args.interval, 50, ready])
+    mock.daemon = True
+    mock.start()
+    if not ready.wait(30):
+        print('The mock BMC failed to start')
+        sys.exit(1)
+    try:
+        for engine in args.engines.split(','):
+            report(measureEngine(engine.strip(), args), args.nodes)
+    finally:
+        mock.terminate()
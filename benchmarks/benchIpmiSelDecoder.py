@@ -0,0 +1,189 @@
+#!/usr/bin/python3
+"""
+ Copyright 2017 IBM Corporation
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+ Compares the in process ipmi SEL decoder with the java SEL parser on SEL lists recorded with ipmitool sel list,
+ one file per BMC in the corpus directory. Without a corpus, one is generated with an entry for every event of
+ the event table, some entries that are not in the table and some ipmitool errors. Every SEL list is decoded by
+ both, and the alerts are compared field by field, leaving out the timestamps of alerts created for ipmitool
+ errors, which are the time of the poll. The time to build and to load the event index, and the time to decode
+ the SEL lists, are reported. ipmitool is replaced by a script that prints the SEL list of the BMC, so java
+ only reads the SEL list, loads the lookup table and decodes it. Build the jar with make first, without it
+ only the in process decoder is measured.
+"""
+import argparse
+import json
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ibm-crassd'))
+sys.path.append('/opt/ibm/ras/bin')
+import config
+import ipmiSel
+
+timestampFree = ['FQPSPIN0004M', 'FQPSPIN0002M', 'FQPSPIN0003M', 'FQPSPSE0004M', 'FQPSPCR0020M']
+
+def createCommandParser():
+    """
+         creates the parser for the command line
+
+         @return: returns the parser for the command line
+    """
+    benchDir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Compares the in process ipmi SEL decoder with the java SEL parser.")
+    parser.add_argument("-j", "--jar", default=os.path.join(benchDir, '..', 'lib', 'crassd.jar'),
+                        help='The SEL parser jar built by make')
+    parser.add_argument("-x", "--events", default=os.path.join(benchDir, '..', 'ipmiSelParser', 'resources', 'p8SMCBMCevents.xml'),
+                        help='The event table to build the index from')
+    parser.add_argument("-c", "--corpus", help='Directory of SEL lists recorded with ipmitool sel list, one file per BMC')
+    parser.add_argument("-b", "--bmcs", type=int, default=20, help='The number of BMCs in a generated corpus')
+    parser.add_argument("-r", "--repeat", type=int, default=20, help='The number of times the corpus is decoded in process')
+    return parser
+
+def generateCorpus(directory, bmcs):
+    """
+        Writes a SEL list for each BMC with the entries of the event table in a different order for each
+    """
+    lines = []
+    for key in sorted(ipmiSel.lookupEvents):
+        values = dict(zip(ipmiSel.eventNames, ipmiSel.lookupEvents[key]))
+        if '.*' in key or '..' in key:
+            continue
+        lines.append(' | '.join([values['sensor'], values['state'], values['additonalDetails']]))
+    lines.append('OEM record de | 040020 | 4f0000000000')
+    lines.append('OEM record de | 000000 | 0123456789ab')
+    lines.append('OEM record c0 | 000000 | cd126fffffff')
+    lines.append('OEM record df | 000000 | 0123456789ab')
+    lines.append('Unknown Sensor #0x01 | Not in the table | Asserted')
+    errors = ['Error: Unable to establish LAN session', 'Get SEL Info command failed']
+    for bmc in range(bmcs):
+        with open(os.path.join(directory, 'bmc{num:03d}'.format(num=bmc)), 'w') as f:
+            for i in range(len(lines)):
+                line = lines[(i * 7 + bmc) % len(lines)]
+                f.write('{num:4x} | 01/15/2018 | {hour:02d}:{minute:02d}:{second:02d} | {entry}\n'.format(
+                    num=i + 1, hour=i // 3600 % 24, minute=i // 60 % 60, second=i % 60, entry=line))
+            if bmc % 5 == 0:
+                f.write(errors[bmc // 5 % len(errors)] + '\n')
+
+def createIpmitool(directory, corpus):
+    """
+        Writes the ipmitool stand-in that prints the SEL list of the BMC named by -H from the corpus
+    """
+    toolName = os.path.join(directory, 'ipmitool')
+    with open(toolName, 'w') as f:
+        f.write('#!/bin/sh\nwhile [ $# -gt 0 ]; do\n  if [ "$1" = "-H" ]; then cat "{corpus}/$2"; exit 0; fi\n  shift\ndone\n'.format(corpus=corpus))
+    os.chmod(toolName, os.stat(toolName).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+def compareEvents(bmc, pythonEvents, javaEvents):
+    """
+        Compares the alerts of a SEL list decoded in process with the alerts from the java SEL parser
+
+        @return: list of the differences found
+    """
+    differences = []
+    if pythonEvents.get('numAlerts') != javaEvents.get('numAlerts'):
+        differences.append('{bmc}: numAlerts {py} in process, {java} from java'.format(bmc=bmc, py=pythonEvents.get('numAlerts'),
+                                                                                   java=javaEvents.get('numAlerts')))
+    for key in sorted(set(pythonEvents) | set(javaEvents)):
+        if key == 'numAlerts':
+            continue
+        pyEvent = dict(pythonEvents.get(key, {}))
+        javaEvent = dict(javaEvents.get(key, {}))
+        if pyEvent.get('CerID') in timestampFree:
+            pyEvent.pop('timestamp', None)
+            javaEvent.pop('timestamp', None)
+        if pyEvent != javaEvent:
+            fields = sorted(field for field in set(pyEvent) | set(javaEvent) if pyEvent.get(field) != javaEvent.get(field))
+            differences.append('{bmc} {key}: {fields} in process {py} java {java}'.format(
+                bmc=bmc, key=key, fields=fields, py=[pyEvent.get(f) for f in fields], java=[javaEvent.get(f) for f in fields]))
+    return differences
+
+def runJava(jar, corpus, bmcs):
+    """
+        Decodes the SEL list of each BMC with the java SEL parser
+
+        @return: tuple of the alerts of each BMC that could be parsed and the number of seconds it took
+    """
+    javaEvents = {}
+    start = time.time()
+    for bmc in bmcs:
+        output = subprocess.check_output(['java', '-jar', jar, bmc, 'ADMIN', 'ADMIN']).decode('utf-8', 'replace')
+        try:
+            javaEvents[bmc] = json.loads(output[output.index('{'):], strict=False)
+        except ValueError:
+            print('{bmc}: the java output is not valid JSON: {output}'.format(bmc=bmc, output=output[-200:].strip()))
+    return javaEvents, time.time() - start
+
+if __name__ == '__main__':
+    parser = createCommandParser()
+    args = parser.parse_args()
+    config.errorLogger = lambda severity, message: None
+    tempDir = tempfile.mkdtemp()
+    try:
+        ipmiSel.eventTableLoc = args.events
+        ipmiSel.indexLoc = os.path.join(tempDir, 'events.idx')
+        start = time.time()
+        if not ipmiSel.initialize():
+            print('The event table {fname} could not be loaded'.format(fname=args.events))
+            sys.exit(1)
+        buildTime = time.time() - start
+        start = time.time()
+        ipmiSel.initialize()
+        loadTime = time.time() - start
+        print('Event index: {count} events, built in {build:7.1f} ms, {kb:.0f} KB, loaded in {load:7.1f} ms'.format(
+            count=len(ipmiSel.lookupEvents), build=1000 * buildTime, kb=os.path.getsize(ipmiSel.indexLoc) / 1024.0,
+            load=1000 * loadTime))
+        corpus = args.corpus
+        if corpus is None:
+            corpus = os.path.join(tempDir, 'corpus')
+            os.mkdir(corpus)
+            generateCorpus(corpus, args.bmcs)
+        bmcs = sorted(os.listdir(corpus))
+        selLists = {}
+        for bmc in bmcs:
+            with open(os.path.join(corpus, bmc), 'r') as f:
+                selLists[bmc] = f.read()
+        entries = sum(len(selLists[bmc].splitlines()) for bmc in bmcs)
+        start = time.time()
+        for i in range(args.repeat):
+            pythonEvents = dict((bmc, ipmiSel.decodeSEL(selLists[bmc])) for bmc in bmcs)
+        elapsed = time.time() - start
+        print('In process: {bmcs} SEL lists, {entries} entries, {rate:10.0f} entries/s, {perList:8.2f} ms per SEL list'.format(
+            bmcs=len(bmcs), entries=entries, rate=entries * args.repeat / elapsed, perList=1000 * elapsed / (args.repeat * len(bmcs))))
+        if not os.path.exists(args.jar) or shutil.which('java') is None:
+            print('The SEL parser jar {jar} or java was not found, the java SEL parser was not compared'.format(jar=args.jar))
+            sys.exit(0)
+        createIpmitool(tempDir, corpus)
+        os.environ['PATH'] = tempDir + os.pathsep + os.environ['PATH']
+        javaEvents, elapsed = runJava(args.jar, corpus, bmcs)
+        print('Java:       {bmcs} SEL lists, {entries} entries, {rate:10.0f} entries/s, {perList:8.2f} ms per SEL list'.format(
+            bmcs=len(bmcs), entries=entries, rate=entries / elapsed, perList=1000 * elapsed / len(bmcs)))
+        differences = []
+        same = 0
+        for bmc in javaEvents:
+            found = compareEvents(bmc, pythonEvents[bmc], javaEvents[bmc])
+            if not found:
+                same += 1
+            differences.extend(found)
+        print('{same} of {bmcs} SEL lists decoded the same, {count} differences'.format(
+            same=same, bmcs=len(bmcs), count=len(differences)))
+        for difference in differences[:20]:
+            print('  ' + difference)
+    finally:
+        shutil.rmtree(tempDir)
@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+"""
+ Copyright 2017 IBM Corporation
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+ Compares ipmi polls decoded by starting the java SEL parser for every poll with polls decoded by the resident
+ SEL parser service, with the same number of polling threads. ipmitool is replaced by a script that prints a
+ fixed SEL list, so only the JVM startup, lookup table loading and decoding are measured. The peak memory is
+ the largest sum of the resident memory of this process and all of its children seen while polling. Build the
+ jar with make first.
+"""
+import argparse
+import json
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ibm-crassd'))
+sys.path.append('/opt/ibm/ras/bin')
+import config
+import ipmiSelService
+
+selLines = ['Power Supply #0x62 | Failure detected | Asserted',
+            'Power Supply #0x63 | Power Supply AC lost | Asserted',
+            'Processor #0x2c | Presence detected | Asserted',
+            'System Event #0x12 | Timestamp Clock Sync | Asserted',
+            'Temperature #0x31 | Upper Critical going high | Asserted',
+            'Fan #0x40 | Lower Critical going low  | Asserted']
+
+def createCommandParser():
+    """
+         creates the parser for the command line
+
+         @return: returns the parser for the command line
+    """
+    parser = argparse.ArgumentParser(description="Compares a JVM per ipmi poll with the resident SEL parser service.")
+    parser.add_argument("-j", "--jar", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib', 'crassd.jar'),
+                        help='The SEL parser jar built by make')
+    parser.add_argument("-w", "--workers", type=int, default=40, help='The number of polling threads')
+    parser.add_argument("-s", "--seconds", type=float, default=30, help='The number of seconds to poll for each mode')
+    parser.add_argument("-e", "--entries", type=int, default=200, help='The number of entries in the SEL list of each BMC')
+    return parser
+
+def createIpmitool(directory, entries):
+    """
+        Writes the ipmitool stand-in that prints the same SEL list for every BMC
+    """
+    selFile = os.path.join(directory, 'sel.txt')
+    with open(selFile, 'w') as f:
+        for i in range(entries):
+            f.write('{num:4x} | 01/15/2018 | 10:{minute:02d}:{second:02d} | {entry}\n'.format(
+                num=i + 1, minute=(i // 60) % 60, second=i % 60, entry=selLines[i % len(selLines)]))
+    toolName = os.path.join(directory, 'ipmitool')
+    with open(toolName, 'w') as f:
+        f.write('#!/bin/sh\ncat {selFile}\n'.format(selFile=selFile))
+    os.chmod(toolName, os.stat(toolName).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+def getTreeRSS():
+    """
+        Returns the resident memory in bytes of this process and all of its descendants
+    """
+    parents = {}
+    rss = {}
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open('/proc/{pid}/stat'.format(pid=pid), 'r') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            parents[int(pid)] = int(fields[1])
+            rss[int(pid)] = int(fields[21]) * os.sysconf('SC_PAGE_SIZE')
+        except (IOError, OSError, IndexError, ValueError):
+            continue
+    tree = set([os.getpid()])
+    grown = True
+    while grown:
+        grown = False
+        for pid in parents:
+            if pid not in tree and parents[pid] in tree:
+                tree.add(pid)
+                grown = True
+    return sum(rss.get(pid, 0) for pid in tree)
+
+def runPolls(poll, workers, seconds):
+    """
+        Polls from the worker threads until the time is up, sampling the memory in use
+
+        @return: tuple of the number of polls, the number of polls that failed to decode and the peak memory
+    """
+    counts = {'polls': 0, 'failed': 0}
+    countLock = threading.Lock()
+    stopAt = time.time() + seconds
+    def worker(num):
+        while time.time() < stopAt:
+            output = poll('bmc{num:02d}'.format(num=num))
+            try:
+                decoded = json.loads(output[output.index('{'):])
+                failed = 'numAlerts' not in decoded
+            except (AttributeError, ValueError):
+                failed = True
+            with countLock:
+                counts['polls'] += 1
+                if failed:
+                    counts['failed'] += 1
+    threads = [threading.Thread(target=worker, args=[i]) for i in range(workers)]
+    for t in threads:
+        t.start()
+    peak = 0
+    while any(t.is_alive() for t in threads):
+        peak = max(peak, getTreeRSS())
+        time.sleep(0.05)
+    return counts['polls'], counts['failed'], peak
+
+if __name__ == '__main__':
+    parser = createCommandParser()
+    args = parser.parse_args()
+    if not os.path.exists(args.jar):
+        print('The SEL parser jar {jar} was not found, build it with make'.format(jar=args.jar))
+        sys.exit(1)
+    config.errorLogger = lambda severity, message: None
+    tempDir = tempfile.mkdtemp()
+    try:
+        createIpmitool(tempDir, args.entries)
+        os.environ['PATH'] = tempDir + os.pathsep + os.environ['PATH']
+        baseRSS = getTreeRSS()
+        def pollJvm(host):
+            return subprocess.check_output(['java', '-jar', args.jar, host, 'ADMIN', 'ADMIN']).decode('utf-8')
+        polls, failed, peak = runPolls(pollJvm, args.workers, args.seconds)
+        print('JVM per poll:    {rate:8.1f} polls/s, {failed} failed, peak RSS {mb:8.1f} MB'.format(
+            rate=polls / args.seconds, failed=failed, mb=(peak - baseRSS) / 1048576.0))
+        ipmiSelService.jarLoc = args.jar
+        if not ipmiSelService.start(args.workers):
+            print('The SEL parser service failed to start')
+            sys.exit(1)
+        def pollService(host):
+            return ipmiSelService.getSEL(host, 'ADMIN', 'ADMIN')
+        polls, failed, peak = runPolls(pollService, args.workers, args.seconds)
+        print('Service:         {rate:8.1f} polls/s, {failed} failed, peak RSS {mb:8.1f} MB'.format(
+            rate=polls / args.seconds, failed=failed, mb=(peak - baseRSS) / 1048576.0))
+        ipmiSelService.stop()
+    finally:
+        shutil.rmtree(tempDir)
@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+"""
+ Copyright 2017 IBM Corporation
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+ Compares ipmi SEL polls that start ipmitool for every command with polls that use the pooled ipmitool
+ shells, against mockIpmitool.py standing in for ipmitool and the BMCs. Every BMC is polled the same number
+ of times from a pool of polling threads, the way the poll queue hands them out, followed by the ESA endpoint
+ collection of every BMC. The polls after the first only read the SEL info, since the SEL does not change.
+ The number of session setups, the poll rate and the average poll time are reported for each mode.
+"""
+import argparse
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import time
+benchDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchDir, '..', 'ibm-crassd'))
+sys.path.insert(0, os.path.join(benchDir, '..', 'ibm-crassd', 'plugins', 'ibm_esa'))
+sys.path.append('/opt/ibm/ras/bin')
+import config
+import ipmiSel
+import ipmiShellPool
+
+def createCommandParser():
+    """
+         creates the parser for the command line
+
+         @return: returns the parser for the command line
+    """
+    parser = argparse.ArgumentParser(description="Compares an ipmitool process per command with pooled ipmitool shells.")
+    parser.add_argument("-n", "--bmcs", type=int, default=40, help='The number of BMCs')
+    parser.add_argument("-t", "--threads", type=int, default=8, help='The number of polling threads')
+    parser.add_argument("-p", "--polls", type=int, default=10, help='The number of polls of each BMC')
+    parser.add_argument("-s", "--setup", type=float, default=0.2, help='The seconds the mock BMC takes to set up a session')
+    parser.add_argument("-c", "--command", type=float, default=0.01, help='The seconds the mock BMC takes for a command')
+    parser.add_argument("-e", "--entries", type=int, default=50, help='The number of entries in the SEL of each BMC')
+    return parser
+
+def runPolls(nodes, threads, polls):
+    """
+        Polls every BMC the given number of times from the polling threads
+
+        @return: tuple of the seconds it took, the number of failed polls and the total seconds spent polling
+    """
+    work = [node for i in range(polls) for node in nodes]
+    workLock = threading.Lock()
+    counts = {'failed': 0, 'pollTime': 0.0}
+    def worker():
+        while True:
+            with workLock:
+                if len(work) == 0:
+                    return
+                node = work.pop(0)
+            started = time.time()
+            events = ipmiSel.getSELEvents(node)
+            ipmiSel.finishPoll(node['bmcHostname'], True)
+            with workLock:
+                counts['pollTime'] += time.time() - started
+                if 'failedPoll' in events or any('CerID' in events[key] and events[key]['CerID'].startswith('FQPSPIN')
+                                                 for key in events if key != 'numAlerts'):
+                    counts['failed'] += 1
+    started = time.time()
+    pollers = [threading.Thread(target=worker) for i in range(threads)]
+    for t in pollers:
+        t.start()
+    for t in pollers:
+        t.join()
+    return time.time() - started, counts['failed'], counts['pollTime']
+
+def collectEndpoints(nodes, threads):
+    """
+        Runs the ESA endpoint collection for every BMC from the polling threads
+
+        @return: the number of seconds it took
+    """
+    import esanotify
+    work = list(nodes)
+    workLock = threading.Lock()
+    def worker():
+        while True:
+            with workLock:
+                if len(work) == 0:
+                    return
+                node = work.pop(0)
+            esanotify.getIPMIEndpointInfo(node['xcatNodeName'], node['bmcHostname'], node['username'], node['password'])
+    started = time.time()
+    collectors = [threading.Thread(target=worker) for i in range(threads)]
+    for t in collectors:
+        t.start()
+    for t in collectors:
+        t.join()
+    return time.time() - started
+
+def countSetups(logFile):
+    if not os.path.exists(logFile):
+        return 0
+    with open(logFile, 'r') as f:
+        return len(f.readlines())
+
+if __name__ == '__main__':
+    parser = createCommandParser()
+    args = parser.parse_args()
+    config.errorLogger = lambda severity, message: None
+    tempDir = tempfile.mkdtemp()
+    try:
+        toolName = os.path.join(tempDir, 'ipmitool')
+        with open(toolName, 'w') as f:
+            f.write('#!/bin/sh\nexec {python} {mock} "$@"\n'.format(python=sys.executable, mock=os.path.join(benchDir, 'mockIpmitool.py')))
+        os.chmod(toolName, os.stat(toolName).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        os.environ['PATH'] = tempDir + os.pathsep + os.environ['PATH']
+        os.environ['MOCK_IPMI_SETUP'] = str(args.setup)
+        os.environ['MOCK_IPMI_COMMAND'] = str(args.command)
+        os.environ['MOCK_IPMI_ENTRIES'] = str(args.entries)
+        ipmiSel.eventTableLoc = os.path.join(benchDir, '..', 'ipmiSelParser', 'resources', 'p8SMCBMCevents.xml')
+        ipmiSel.indexLoc = os.path.join(tempDir, 'events.idx')
+        if not ipmiSel.initialize():
+            print('The event table {fname} could not be loaded'.format(fname=ipmiSel.eventTableLoc))
+            sys.exit(1)
+        nodes = [{'bmcHostname': 'bmc{num:03d}'.format(num=i), 'xcatNodeName': 'node{num:03d}'.format(num=i),
+                  'username': 'ADMIN', 'password': 'ADMIN'} for i in range(args.bmcs)]
+        modes = [('ipmitool per command', False)]
+        if ipmiShellPool.isAvailable():
+            modes.append(('pooled ipmitool shells', True))
+        else:
+            print('pexpect is not installed, the pooled ipmitool shells were not measured')
+        for name, shells in modes:
+            config.ipmiShellSessions = shells
+            ipmiShellPool.resetPool()
+            ipmiSel.selCursors.clear()
+            logFile = os.path.join(tempDir, name.replace(' ', '_') + '.log')
+            os.environ['MOCK_IPMI_LOG'] = logFile
+            elapsed, failed, pollTime = runPolls(nodes, args.threads, args.polls)
+            pollSetups = countSetups(logFile)
+            print('{name:24s}: {polls} polls in {elapsed:6.2f} s, {rate:7.1f} polls/s, {avg:6.1f} ms per poll, '
+                  '{setups} session setups, {failed} failed'.format(name=name, polls=args.polls * len(nodes), elapsed=elapsed,
+                  rate=args.polls * len(nodes) / elapsed, avg=1000 * pollTime / (args.polls * len(nodes)), setups=pollSetups, failed=failed))
+            try:
+                elapsed = collectEndpoints(nodes, args.threads)
+                print('{name:24s}: ESA endpoint collection of {bmcs} BMCs in {elapsed:6.2f} s, {setups} more session setups'.format(
+                    name=name, bmcs=len(nodes), elapsed=elapsed, setups=countSetups(logFile) - pollSetups))
+            except ImportError as e:
+                print('The ESA plugin could not be loaded, the endpoint collection was not measured: {err}'.format(err=e))
+            ipmiShellPool.closePool()
+    finally:
+        shutil.rmtree(tempDir)
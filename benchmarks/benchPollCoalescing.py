@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+"""
+ Copyright 2017 IBM Corporation
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+ Replays a burst of push notifications from many BMCs into the alert worker threads. In queue mode every
+ notification is put on a plain queue, which is how nodes2poll worked, and every copy fetches the SEL of the
+ node. In coalesce mode the notifications go through the coalescing poll queue. A fetch is simulated by a
+ sleep. Every BMC must have a fetch that started after its last notification, or an alert would be missed.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ibm-crassd'))
+sys.path.append('/opt/ibm/ras/bin')
+import pollQueue
+
+def createCommandParser():
+    """
+         creates the parser for the command line
+
+         @return: returns the parser for the command line
+    """
+    parser = argparse.ArgumentParser(description="Compares a plain queue and the coalescing poll queue during a notification burst.")
+    parser.add_argument("-n", "--nodes", type=int, default=100, help='The number of BMCs sending notifications')
+    parser.add_argument("-b", "--burst", type=int, default=40, help='The number of notifications each BMC sends')
+    parser.add_argument("-w", "--window", type=float, default=2.0, help='Seconds the notifications of the burst are spread over')
+    parser.add_argument("-t", "--threads", type=int, default=40, help='The number of worker threads')
+    parser.add_argument("-f", "--fetch", type=float, default=0.2, help='Seconds a SEL fetch takes')
+    return parser
+
+def createBurst(nodes, burst, window):
+    """
+        Returns the notifications of the burst as a sorted list of (time offset, node)
+    """
+    events = []
+    for node in nodes:
+        for i in range(burst):
+            events.append((random.uniform(0, window), node))
+    events.sort(key=lambda event: event[0])
+    return events
+
+def runMode(mode, args, resultQueue):
+    nodes = [{'xcatNodeName': 'node{num:04d}'.format(num=i), 'bmcHostname': 'bmc{num:04d}'.format(num=i)} for i in range(args.nodes)]
+    events = createBurst(nodes, args.burst, args.window)
+    plainQueue = queue.Queue()
+    lastTrigger = {}
+    lastFetchStart = {}
+    fetches = [0]
+    statLock = threading.Lock()
+
+    def worker():
+        while True:
+            if mode == 'queue':
+                node = plainQueue.get()
+            else:
+                node, selEntries = pollQueue.get()
+            if node is None:
+                break
+            with statLock:
+                fetches[0] += 1
+                lastFetchStart[node['bmcHostname']] = time.time()
+            time.sleep(args.fetch)
+            if mode == 'queue':
+                plainQueue.task_done()
+            else:
+                pollQueue.done(node)
+
+    threads = []
+    for i in range(args.threads):
+        t = threading.Thread(target=worker)
+        t.daemon = True
+        t.start()
+        threads.append(t)
+    start = time.time()
+    for offset, node in events:
+        delay = start + offset - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        lastTrigger[node['bmcHostname']] = time.time()
+        if mode == 'queue':
+            plainQueue.put(node)
+        else:
+            pollQueue.put(node)
+    burstEnd = time.time()
+    #wait for the workers to go idle
+    while True:
+        time.sleep(0.05)
+        if mode == 'queue':
+            if plainQueue.unfinished_tasks == 0:
+                break
+        else:
+            queueStats = pollQueue.getQueueStats()
+            if queueStats['pending'] == 0 and queueStats['running'] == 0:
+                break
+    drained = time.time()
+    missed = len([name for name in lastTrigger if lastFetchStart.get(name, 0) < lastTrigger[name]])
+    result = {'mode': mode, 'fetches': fetches[0], 'drain': drained - burstEnd, 'total': drained - start, 'missed': missed,
+              'suppressed': 0, 'reruns': 0}
+    if mode != 'queue':
+        queueStats = pollQueue.getQueueStats()
+        result['suppressed'] = queueStats['suppressed']
+        result['reruns'] = queueStats['reruns']
+    resultQueue.put(result)
+
+if __name__ == '__main__':
+    parser = createCommandParser()
+    args = parser.parse_args()
+    print('{nodes} BMCs, {burst} notifications each over {window:.1f} s, {threads} worker threads, {fetch:.2f} s per fetch'.format(
+          nodes=args.nodes, burst=args.burst, window=args.window, threads=args.threads, fetch=args.fetch))
+    for mode in ['queue', 'coalesce']:
+        resultQueue = multiprocessing.Queue()
+        proc = multiprocessing.Process(target=runMode, args=[mode, args, resultQueue])
+        proc.start()
+        result = resultQueue.get()
+        proc.join()
+        print('{mode:>8}: {fetches:6d} SEL fetches, {suppressed:6d} suppressed, {reruns:5d} re-runs, drained {drain:6.2f} s after the burst, '
+              '{total:6.2f} s total, {missed} BMCs missed'.format(**result))
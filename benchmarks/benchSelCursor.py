@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+"""
+ Copyright 2017 IBM Corporation
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+ Measures the latency of one openbmc alert poll for growing SEL sizes. A full poll downloads and parses
+ every SEL entry, which is what every poll did before the SEL cursor. An incremental poll only reads the
+ entries created after the cursor, measured with no new entries and with one new entry. The BMC is
+ simulated by a local mock BMC, see mockBmc.py. openbmctool and the policy table must be installed.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ibm-crassd'))
+sys.path.append('/opt/ibm/ras/bin')
+import openbmcSel
+import sessionPool
+import mockBmc
+
+def createCommandParser():
+    """
+         creates the parser for the command line
+
+         @return: returns the parser for the command line
+    """
+    parser = argparse.ArgumentParser(description="Compares full and incremental openbmc SEL polls for growing SEL sizes.")
+    parser.add_argument("-s", "--sizes", default='10,100,500,1000,2000', help='Comma separated list of SEL sizes to measure')
+    parser.add_argument("-r", "--repeat", type=int, default=20, help='The number of polls to measure for each kind of poll')
+    parser.add_argument("-p", "--port", type=int, default=18444, help='The port for the mock BMC')
+    return parser
+
+def timePoll(node):
+    start = time.time()
+    events = openbmcSel.getSELEvents(node)
+    elapsed = time.time() - start
+    if 'failedPoll' in events:
+        raise RuntimeError('The poll of the mock BMC failed')
+    openbmcSel.finishPoll(node['bmcHostname'], True)
+    return elapsed, int(events['numAlerts'])
+
+def measureSize(size, args):
+    ready = multiprocessing.Event()
+    mock = multiprocessing.Process(target=mockBmc.runMockBmc, args=[args.port, 1, 3600, size, ready])
+    mock.daemon = True
+    mock.start()
+    if not ready.wait(30):
+        raise RuntimeError('The mock BMC failed to start')
+    node = {'xcatNodeName': 'node0000', 'bmcHostname': '127.0.0.1:{port}'.format(port=args.port),
+            'username': 'root', 'password': '0penBmc'}
+    results = {'full': 0.0, 'idle': 0.0, 'new': 0.0, 'fullEvents': 0, 'newEvents': 0}
+    try:
+        for i in range(args.repeat):
+            openbmcSel.selCursors.clear()
+            elapsed, results['fullEvents'] = timePoll(node)
+            results['full'] += elapsed
+        for i in range(args.repeat):
+            elapsed, events = timePoll(node)
+            results['idle'] += elapsed
+        for i in range(args.repeat):
+            sessionPool.request('post', node['bmcHostname'], node['username'], node['password'], '/mock/sel/add', json={'data': []})
+            elapsed, results['newEvents'] = timePoll(node)
+            results['new'] += elapsed
+    finally:
+        sessionPool.closePool()
+        mock.terminate()
+        mock.join()
+    for kind in ['full', 'idle', 'new']:
+        results[kind] = 1000 * results[kind] / args.repeat
+    return results
+
+if __name__ == '__main__':
+    parser = createCommandParser()
+    args = parser.parse_args()
+    if not openbmcSel.initialize():
+        print('The policy table {fname} could not be loaded'.format(fname=openbmcSel.policyTableLoc))
+        sys.exit(1)
+    for size in [int(s) for s in args.sizes.split(',')]:
+        results = measureSize(size, args)
+        print('{size:5d} SEL entries: full poll {full:8.1f} ms ({fullEvents} events), incremental poll {idle:6.1f} ms with no new entries, '
+              '{new:6.1f} ms with one new entry ({newEvents} events)'.format(size=size, **results))
@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+"""
+ Copyright 2017 IBM Corporation
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ibm-crassd'))
+sys.path.append('/opt/ibm/ras/bin')
+import config
+import openbmcSel
+
+def createCommandParser():
+    """
+         creates the parser for the command line
+
+         @return: returns the parser for the command line
+    """
+    parser = argparse.ArgumentParser(description="Compares openbmc SEL retrieval through an openbmctool subprocess against the in process path.")
+    parser.add_argument("-H", "--host", required=True, help='A hostname or IP for the BMC')
+    parser.add_argument("-U", "--user", default='root', help='The username to login with')
+    parser.add_argument("-P", "--PW", default='0penBmc', help='Provide the password in-line')
+    parser.add_argument("-n", "--polls", type=int, default=20, help='The number of polls to run for each retrieval path')
+    parser.add_argument("-t", "--policyTable", default=openbmcSel.policyTableLoc, help='The location of the policy table')
+    return parser
+
+def cpuSeconds(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+def benchSubprocess(args):
+    """
+        Polls the BMC by starting openbmctool for each poll, the same way ibm-crassd did before
+    """
+    latencies = []
+    cpuStart = cpuSeconds(resource.RUSAGE_SELF) + cpuSeconds(resource.RUSAGE_CHILDREN)
+    for i in range(args.polls):
+        start = time.time()
+        try:
+            subprocess.check_output([config.pyString, '/opt/ibm/ras/bin/openbmctool.py', '-H', args.host, '-U', args.user, '-P', args.PW,
+                                     '-j', '-t', args.policyTable, 'sel', 'print'])
+        except subprocess.CalledProcessError:
+            pass
+        latencies.append(time.time() - start)
+    cpuUsed = cpuSeconds(resource.RUSAGE_SELF) + cpuSeconds(resource.RUSAGE_CHILDREN) - cpuStart
+    return latencies, cpuUsed
+
+def benchNative(args):
+    """
+        Polls the BMC with the in process SEL retrieval, reusing the session between polls
+    """
+    openbmcSel.policyTableLoc = args.policyTable
+    openbmcSel.initialize()
+    node = {'bmcHostname': args.host, 'xcatNodeName': args.host, 'username': args.user, 'password': args.PW}
+    latencies = []
+    cpuStart = cpuSeconds(resource.RUSAGE_SELF)
+    for i in range(args.polls):
+        start = time.time()
+        openbmcSel.getSELEvents(node)
+        latencies.append(time.time() - start)
+    cpuUsed = cpuSeconds(resource.RUSAGE_SELF) - cpuStart
+    return latencies, cpuUsed
+
+def report(name, latencies, cpuUsed):
+    first = latencies[0]
+    latencies = sorted(latencies)
+    print("{name:<12} first: {first:8.3f}s  mean: {mean:8.3f}s  p90: {p90:8.3f}s  cpu/poll: {cpu:8.3f}s".format(
+        name=name, first=first, mean=sum(latencies)/len(latencies),
+        p90=latencies[int(len(latencies)*0.9)], cpu=cpuUsed/len(latencies)))
+
+if __name__ == '__main__':
+    parser = createCommandParser()
+    args = parser.parse_args()
+    latencies, cpuUsed = benchSubprocess(args)
+    report('subprocess', latencies, cpuUsed)
+    latencies, cpuUsed = benchNative(args)
+    report('in-process', latencies, cpuUsed)
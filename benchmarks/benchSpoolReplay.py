@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+"""
+ Copyright 2017 IBM Corporation
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+ Measures the alert spool of a notify entity that was down during an alert storm. The alerts are spooled
+ while the receiver is down, the spool is recovered from disk as it is when the service restarts, and it is
+ then replayed to a local stand-in receiver that reads one JSON alert per line from a TCP socket, the way
+ logstash does. The replay is measured for several batch sizes, the spool is acknowledged once per batch.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ibm-crassd'))
+sys.path.append('/opt/ibm/ras/bin')
+import alertSpool
+
+def createCommandParser():
+    """
+         creates the parser for the command line
+
+         @return: returns the parser for the command line
+    """
+    parser = argparse.ArgumentParser(description="Measures spooling, recovery and replay of the alert spool.")
+    parser.add_argument("-a", "--alerts", type=int, default=20000, help='The number of alerts spooled while the receiver is down')
+    parser.add_argument("-b", "--batches", default='1,10,100,500', help='Comma separated list of replay batch sizes to measure')
+    parser.add_argument("-p", "--port", type=int, default=18555, help='The port for the stand-in receiver')
+    return parser
+
+def runReceiver(port, readyEvent, countQueue):
+    """
+        Accepts connections and counts the alerts received until the connection is closed
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', port))
+    server.listen(1)
+    readyEvent.set()
+    while True:
+        conn, addr = server.accept()
+        count = 0
+        reader = conn.makefile('rb')
+        for line in reader:
+            json.loads(line.decode('utf-8'))
+            count += 1
+        conn.close()
+        countQueue.put(count)
+
+def createAlert(i):
+    return {'bmcHostname': 'bmc{num:04d}'.format(num=i % 1000), 'impactednode': 'node{num:04d}'.format(num=i % 1000), 'deliver': True,
+            'event': {'CerID': 'FQPSPCR0021F', 'timestamp': str(1500000000 + i), 'message': 'Power supply failure',
+                      'severity': 'Critical', 'serviceable': 'Yes', 'callHome': 'Yes', 'eventType': 'Hardware',
+                      'subSystem': 'Power', 'compInstance': 'powersupply0', 'logNum': str(i)}}
+
+def spoolAlerts(directory, count):
+    """
+        Spools the alerts one at a time, the way the delivery worker does while the receiver is down
+
+        @return: the number of seconds it took
+    """
+    alertSpool.openSpool('receiver', directory)
+    start = time.time()
+    for i in range(count):
+        alertSpool.append('receiver', [createAlert(i)])
+    elapsed = time.time() - start
+    alertSpool.close()
+    return elapsed
+
+def replay(directory, batch, port, countQueue):
+    """
+        Recovers the spool and replays it to the stand-in receiver
+
+        @return: tuple of the recovery time, the replay time and the number of alerts received
+    """
+    start = time.time()
+    alertSpool.openSpool('receiver', directory)
+    recovery = time.time() - start
+    conn = socket.create_connection(('127.0.0.1', port))
+    start = time.time()
+    while not alertSpool.isEmpty('receiver'):
+        records = alertSpool.read('receiver', batch)
+        for position, record in records:
+            conn.sendall((json.dumps(record['event']) + '\n').encode('utf-8'))
+        alertSpool.ack('receiver', records[-1][0], len(records))
+    conn.shutdown(socket.SHUT_WR)
+    received = countQueue.get()
+    elapsed = time.time() - start
+    conn.close()
+    alertSpool.close()
+    return recovery, elapsed, received
+
+if __name__ == '__main__':
+    parser = createCommandParser()
+    args = parser.parse_args()
+    ready = multiprocessing.Event()
+    countQueue = multiprocessing.Queue()
+    receiver = multiprocessing.Process(target=runReceiver, args=[args.port, ready, countQueue])
+    receiver.daemon = True
+    receiver.start()
+    if not ready.wait(30):
+        print('The stand-in receiver failed to start')
+        sys.exit(1)
+    alertSpool.configure(1024 * 1024 * 1024)
+    tempDir = tempfile.mkdtemp()
+    try:
+        for batch in [int(b) for b in args.batches.split(',')]:
+            directory = os.path.join(tempDir, 'batch{num}'.format(num=batch))
+            spoolTime = spoolAlerts(directory, args.alerts)
+            spoolBytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory) if name.endswith('.seg'))
+            recovery, elapsed, received = replay(directory, batch, args.port, countQueue)
+            print('{alerts} alerts, {mb:.1f} MB spooled at {spoolRate:7.0f} alerts/s, recovered in {recovery:6.1f} ms, '
+                  'replayed in batches of {batch:4d} at {replayRate:8.0f} alerts/s, {received} received'.format(
+                  alerts=args.alerts, mb=spoolBytes / 1048576.0, spoolRate=args.alerts / spoolTime, recovery=1000 * recovery,
+                  batch=batch, replayRate=args.alerts / elapsed, received=received))
+    finally:
+        shutil.rmtree(tempDir)
+        receiver.terminate()
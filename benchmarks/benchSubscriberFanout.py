@@ -0,0 +1,174 @@
+#!/usr/bin/python3
+"""
+ Copyright 2017 IBM Corporation
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+ Load test for the telemetry socket server. Fills the shared sensor table, starts the socket server and
+ connects a growing number of subscribers, reporting the CPU used by the socket server process for each
+ subscriber count. Subscribers with the same filter share one encoded frame, so with --filters 1 the CPU
+ should stay nearly flat as subscribers are added. The jitter is the standard deviation of the time between
+ frames received by a subscriber. With --stalled, that many extra subscribers connect and never read, which
+ must not delay the others.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import selectors
+import socket
+import struct
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ibm-crassd'))
+sys.path.append('/opt/ibm/ras/bin')
+import config
+import telemetryServer
+import sensorTable
+
+sensorTypes = [('temperature', 'DegreesC'), ('power', 'Watts'), ('fan_tach', 'RPMS'), ('voltage', 'Volts'), ('current', 'Amperes')]
+
+def createCommandParser():
+    """
+         creates the parser for the command line
+
+         @return: returns the parser for the command line
+    """
+    parser = argparse.ArgumentParser(description="Measures the socket server CPU as the number of telemetry subscribers grows.")
+    parser.add_argument("-n", "--nodes", type=int, default=500, help='The number of nodes in the sensor table')
+    parser.add_argument("-s", "--sensors", type=int, default=100, help='The number of sensors per node')
+    parser.add_argument("-c", "--clients", default='1,5,10,25,50', help='Comma separated list of subscriber counts to measure')
+    parser.add_argument("-f", "--filters", type=int, default=1, help='The number of distinct filters used by the subscribers, up to 31')
+    parser.add_argument("-d", "--duration", type=int, default=15, help='Seconds to measure each subscriber count for')
+    parser.add_argument("-e", "--encoding", default='json', help='The encoding the subscribers ask for, json or compact')
+    parser.add_argument("-t", "--stalled", type=int, default=0, help='The number of extra subscribers that never read their frames')
+    parser.add_argument("-p", "--port", type=int, default=53199, help='The port for the telemetry socket server')
+    return parser
+
+def fillTable(nodeList, sensors):
+    for node in nodeList:
+        for i in range(sensors):
+            stype = sensorTypes[i % len(sensorTypes)]
+            sensorTable.writeSensor(node['xcatNodeName'], '{stype}_sensor{num}'.format(stype=stype[0], num=i), 30000 + i, -3, stype)
+        sensorTable.writeStatus(node['xcatNodeName'], int(time.time()), True, 'Powered On')
+    sensorTable.publishCatalogs()
+
+def getFilters(count, encoding='json'):
+    """
+        Returns distinct sensor type filters, one for each subset of the sensor types
+    """
+    filters = []
+    for size in range(len(sensorTypes), 0, -1):
+        for combination in itertools.combinations([stype[0] for stype in sensorTypes], size):
+            filters.append({'frequency': 1, 'sensortypes': list(combination), 'encoding': encoding})
+    return filters[:max(1, min(count, len(filters)))]
+
+def runSubscribers(port, count, filters, stalled, stopEvent, resultQueue):
+    """
+        Connects the subscribers and reads their frames until stopped
+    """
+    selector = selectors.DefaultSelector()
+    states = []
+    stalledSockets = []
+    for i in range(stalled):
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        stalledSockets.append(sock)
+    for i in range(count):
+        sock = socket.create_connection(('127.0.0.1', port))
+        message = json.dumps(filters[i % len(filters)]).encode()
+        sock.sendall(struct.pack('>I', len(message)) + message)
+        sock.setblocking(False)
+        state = {'buffer': bytearray(), 'frames': 0, 'bytes': 0, 'arrivals': []}
+        states.append(state)
+        selector.register(sock, selectors.EVENT_READ, state)
+    while not stopEvent.is_set():
+        for key, mask in selector.select(0.5):
+            state = key.data
+            try:
+                data = key.fileobj.recv(1048576)
+            except BlockingIOError:
+                continue
+            if not data:
+                selector.unregister(key.fileobj)
+                continue
+            state['buffer'] += data
+            while len(state['buffer']) >= 4:
+                length = struct.unpack_from('>I', state['buffer'])[0]
+                if len(state['buffer']) < length + 4:
+                    break
+                state['bytes'] += length + 4
+                state['frames'] += 1
+                state['arrivals'].append(time.time())
+                del state['buffer'][:length + 4]
+    for key in list(selector.get_map().values()):
+        key.fileobj.close()
+    for sock in stalledSockets:
+        sock.close()
+    gaps = []
+    for state in states:
+        #the first frames arrive right after connecting, outside of the schedule
+        arrivals = state['arrivals'][2:]
+        gaps.extend([arrivals[i + 1] - arrivals[i] for i in range(len(arrivals) - 1)])
+    jitter = 0.0
+    if len(gaps) > 1:
+        mean = sum(gaps) / len(gaps)
+        jitter = (sum([(gap - mean) ** 2 for gap in gaps]) / len(gaps)) ** 0.5
+    resultQueue.put({'frames': sum([state['frames'] for state in states]), 'bytes': sum([state['bytes'] for state in states]),
+                     'jitter': jitter})
+
+def cpuSeconds(pid):
+    with open('/proc/{apid}/stat'.format(apid=pid), 'r') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / float(os.sysconf('SC_CLK_TCK'))
+
+if __name__ == '__main__':
+    parser = createCommandParser()
+    args = parser.parse_args()
+    nodeList = [{'xcatNodeName': 'node{num:04d}'.format(num=i), 'accessType': 'openbmcRest'} for i in range(args.nodes)]
+    config.mynodelist = nodeList
+    config.telemPort = args.port
+    telemetryServer.initSharedState()
+    telemetryServer.serverhostname = '127.0.0.1'
+    telemetryServer.update_every = 1000
+    fillTable(nodeList, args.sensors)
+    server = multiprocessing.Process(target=telemetryServer.socket_server, args=[socket.socket()])
+    server.daemon = True
+    server.start()
+    time.sleep(1)
+    filters = getFilters(args.filters, args.encoding)
+    print('{nodes} nodes, {sensors} sensors per node, {filters} distinct filters, {encoding} encoding'.format(
+          nodes=args.nodes, sensors=args.sensors, filters=len(filters), encoding=args.encoding))
+    try:
+        for count in [int(c) for c in args.clients.split(',')]:
+            stopEvent = multiprocessing.Event()
+            resultQueue = multiprocessing.Queue()
+            subscribers = multiprocessing.Process(target=runSubscribers, args=[args.port, count, filters, args.stalled, stopEvent, resultQueue])
+            subscribers.start()
+            time.sleep(2)
+            cpuStart = cpuSeconds(server.pid)
+            start = time.time()
+            time.sleep(args.duration)
+            cpuUsed = cpuSeconds(server.pid) - cpuStart
+            elapsed = time.time() - start
+            stopEvent.set()
+            result = resultQueue.get()
+            subscribers.join()
+            print('{count:>4} subscribers: socket server CPU {cpu:5.1f}%, {frames:6.1f} frames/s, {mbytes:7.2f} MB/s received, '
+                  'jitter {jitter:5.1f} ms'.format(count=count, cpu=100.0 * cpuUsed / elapsed, frames=result['frames'] / (elapsed + 2),
+                                                  mbytes=result['bytes'] / (elapsed + 2) / 1048576.0, jitter=1000 * result['jitter']))
+            time.sleep(1)
+    finally:
+        telemetryServer.killSig.set()
+        server.join(10)
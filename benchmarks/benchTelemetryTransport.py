@@ -0,0 +1,167 @@
+#!/usr/bin/python3
+"""
+ Copyright 2017 IBM Corporation
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+ Measures how sensor readings get from a gatherer process to the socket server. In queue mode the gatherer
+ sends delta records over a multiprocessing queue and the socket server applies them to its own copy of the
+ sensor data, which is how the telemetry server worked before the shared sensor table. In table mode the
+ gatherer writes the shared sensor table and the socket server reads it when a client needs data.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ibm-crassd'))
+sys.path.append('/opt/ibm/ras/bin')
+import telemetryServer
+import sensorTable
+
+def createCommandParser():
+    """
+         creates the parser for the command line
+
+         @return: returns the parser for the command line
+    """
+    parser = argparse.ArgumentParser(description="Compares the queue and the shared sensor table between a gatherer and the socket server.")
+    parser.add_argument("-n", "--nodes", type=int, default=100, help='The number of nodes handled by the gatherer')
+    parser.add_argument("-s", "--sensors", type=int, default=150, help='The number of sensors per node')
+    parser.add_argument("-c", "--changed", type=float, default=0.1, help='Fraction of the sensors that change between flushes')
+    parser.add_argument("-f", "--flushes", type=int, default=300, help='The number of flushes to send')
+    parser.add_argument("-r", "--reads", type=int, default=50, help='The number of client updates the socket server builds')
+    return parser
+
+def createSensorData(nodes, sensors):
+    sensorTypes = [('temperature', 'DegreesC'), ('power', 'Watts'), ('fan_tach', 'RPMS'), ('voltage', 'Volts'), ('current', 'Amperes')]
+    data = {}
+    for i in range(nodes):
+        nodeData = {'LastUpdateReceived': int(time.time()), 'Connected': True, 'NodeState': 'Powered On'}
+        for j in range(sensors):
+            nodeData['sensor{num}'.format(num=j)] = {'value': 30000, 'scale': 10 ** -3, 'type': sensorTypes[j % len(sensorTypes)]}
+        data['node{num:04d}'.format(num=i)] = nodeData
+    return data
+
+def cpuSeconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def privateKB():
+    with open('/proc/self/status', 'r') as f:
+        for line in f:
+            if line.startswith('RssAnon'):
+                return int(line.split()[1])
+    return 0
+
+def producer(mode, args, updateQueue, resultQueue):
+    sensorData = createSensorData(args.nodes, args.sensors)
+    telemetryServer.sensorData = sensorData
+    for nodeName in sensorData:
+        sensorTable.resetNode(nodeName)
+    names = [(node, sensor) for node in sensorData for sensor in sensorData[node] if sensor not in telemetryServer.nodeStatusKeys]
+    changesPerFlush = int(len(names) * args.changed)
+    flushState = {}
+    lastSent = {'sensors': {}, 'status': {}}
+    cpuStart = cpuSeconds()
+    for i in range(args.flushes):
+        for node, sensor in random.sample(names, changesPerFlush):
+            sensorData[node][sensor]['value'] += random.choice([-1, 1])
+            #processMessage marks every sensor it updates
+            telemetryServer.dirtySensors.add((node, sensor))
+        for node in sensorData:
+            sensorData[node]['LastUpdateReceived'] = int(time.time())
+        if mode == 'queue':
+            updateQueue.put(telemetryServer.getTelemetryDelta(sensorData, lastSent, allNodes=(i == 0)))
+        else:
+            telemetryServer.flushTelemetry(flushState)
+    cpuUsed = cpuSeconds() - cpuStart
+    updateQueue.put(None)
+    resultQueue.put({'producerCpu': cpuUsed})
+
+def applyRecords(sensorData, records):
+    for record in records:
+        if record[0] == telemetryServer.deltaValue:
+            sensorData[record[1]][record[2]]['value'] = record[3]
+        elif record[0] == telemetryServer.deltaSensor:
+            sensorData.setdefault(record[1], {})[record[2]] = {'value': record[3], 'scale': record[4], 'type': record[5]}
+        elif record[0] == telemetryServer.deltaStatus:
+            nodeData = sensorData.setdefault(record[1], {})
+            nodeData['LastUpdateReceived'], nodeData['Connected'], nodeData['NodeState'] = record[2:5]
+
+def filterTypes(sensorData, sensorTypes):
+    """
+        Filters a private copy of the sensor data by sensor type, like the socket server did before the shared table
+    """
+    filtered = {}
+    for node in sensorData:
+        filtered[node] = {}
+        for sname in sensorData[node]:
+            if sname in telemetryServer.nodeStatusKeys or sensorData[node][sname]['type'] is None or sensorData[node][sname]['type'][0] in sensorTypes:
+                filtered[node][sname] = sensorData[node][sname]
+    return filtered
+
+def consumer(mode, args, updateQueue, resultQueue):
+    rssStart = privateKB()
+    sensorData = {}
+    cpuStart = cpuSeconds()
+    while True:
+        update = updateQueue.get()
+        if update is None:
+            break
+        if mode == 'queue':
+            applyRecords(sensorData, update)
+    applyCpu = cpuSeconds() - cpuStart
+    #the memory the socket server keeps between client updates
+    privateCopy = privateKB() - rssStart
+    readerCache = {}
+    #a client subscribed to the temperature sensors
+    select = telemetryServer.compileFilter({'sensortypes': ['temperature']})
+    cpuStart = cpuSeconds()
+    for i in range(args.reads):
+        if mode == 'queue':
+            snapshot = filterTypes(sensorData, ['temperature'])
+        else:
+            snapshot = sensorTable.readTable(readerCache, select, 'temperature')
+    readCpu = cpuSeconds() - cpuStart
+    resultQueue.put({'consumerCpu': applyCpu, 'readCpu': readCpu, 'rss': privateCopy, 'end': time.time(),
+                     'sensors': sum([len(snapshot[node]) - 3 for node in snapshot])})
+
+def runMode(mode, args):
+    nodeList = [{'xcatNodeName': 'node{num:04d}'.format(num=i)} for i in range(args.nodes)]
+    sensorTable.create(nodeList, max(256, args.sensors))
+    updateQueue = multiprocessing.Queue()
+    resultQueue = multiprocessing.Queue()
+    receiver = multiprocessing.Process(target=consumer, args=[mode, args, updateQueue, resultQueue])
+    receiver.start()
+    sender = multiprocessing.Process(target=producer, args=[mode, args, updateQueue, resultQueue])
+    sender.start()
+    results = {}
+    for i in range(2):
+        results.update(resultQueue.get())
+    sender.join()
+    receiver.join()
+    print('{mode:>6}: gatherer {pcpu:6.2f} ms/flush, socket server {ccpu:6.2f} ms/flush applying, {rcpu:6.2f} ms/client update, '
+          '{rss:7.0f} kB private copy, {sensors} sensors seen'.format(
+          mode=mode, pcpu=1000 * results['producerCpu'] / args.flushes, ccpu=1000 * results['consumerCpu'] / args.flushes,
+          rcpu=1000 * results['readCpu'] / args.reads, rss=results['rss'], sensors=results['sensors']))
+
+if __name__ == '__main__':
+    parser = createCommandParser()
+    args = parser.parse_args()
+    print('{nodes} nodes, {sensors} sensors per node, {changed:.0f}% of the sensors changed per flush'.format(
+          nodes=args.nodes, sensors=args.sensors, changed=args.changed * 100))
+    for mode in ['queue', 'table']:
+        runMode(mode, args)
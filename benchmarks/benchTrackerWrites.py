@@ -0,0 +1,165 @@
+#!/usr/bin/python3
+"""
+ Copyright 2017 IBM Corporation
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+ Replays an alert storm into the tracker and reports the write amplification. In rewrite mode the whole
+ bmclastreports.ini file is rewritten for every reported alert, which is how the tracker was kept before the
+ tracker store. In store mode the alerts go through the SQLite tracker store, which merges them and writes
+ them in one transaction once they are due. The bytes written are read from /proc/self/io. The time
+ to load the reporting times of every BMC at startup is measured for both. The files are written to a
+ temporary directory.
+"""
+import argparse
+import configparser
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ibm-crassd'))
+sys.path.append('/opt/ibm/ras/bin')
+import trackerStore
+
+def createCommandParser():
+    """
+         creates the parser for the command line
+
+         @return: returns the parser for the command line
+    """
+    parser = argparse.ArgumentParser(description="Compares rewriting the tracker file for every alert with the tracker store.")
+    parser.add_argument("-n", "--nodes", type=int, default=1000, help='The number of BMCs in the tracker file')
+    parser.add_argument("-e", "--entities", type=int, default=2, help='The number of plugins notified of every alert')
+    parser.add_argument("-a", "--alerts", type=int, default=2000, help='The number of alerts in the storm')
+    parser.add_argument("-b", "--batch", type=int, default=2, help='The number of updates the tracker thread finds queued together')
+    return parser
+
+def getBytesWritten():
+    """
+        Returns the number of bytes this process has written, 0 when /proc/self/io is not available
+    """
+    try:
+        with open('/proc/self/io', 'r') as f:
+            for line in f:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return 0
+
+def createStorm(args):
+    """
+        Returns the tracker updates of the storm as a list of (entity, bmc hostname, data)
+    """
+    updates = []
+    for i in range(args.alerts):
+        bmc = 'bmc{num:04d}'.format(num=random.randrange(args.nodes))
+        logTime = int(time.time()) + i
+        data = {'lastLogTime': str(logTime), 'dupTimeIDList': [], 'hrTime': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(logTime))}
+        for entity in range(args.entities):
+            updates.append(('plugin{num}'.format(num=entity), bmc, data))
+    return updates
+
+def createTracker(fileName, args):
+    """
+        Writes a tracker file with an entry for every BMC and plugin
+    """
+    confParser = configparser.ConfigParser()
+    confParser['app_info'] = {'uuid': '00000000-0000-0000-0000-000000000000'}
+    data = {'lastLogTime': '0', 'dupTimeIDList': [], 'hrTime': '1970-01-01 00:00:00'}
+    for entity in range(args.entities):
+        section = 'plugin{num}_bmcs'.format(num=entity)
+        confParser[section] = {}
+        for i in range(args.nodes):
+            confParser[section]['bmc{num:04d}'.format(num=i)] = str(data)
+    with open(fileName, 'w') as f:
+        confParser.write(f)
+
+def runRewrite(fileName, updates):
+    """
+        Rewrites the tracker file for every update
+    """
+    confParser = configparser.ConfigParser()
+    confParser.read(fileName)
+    result = {'transactions': 0, 'bytes': getBytesWritten()}
+    start = time.time()
+    for entity, bmc, data in updates:
+        confParser[entity + '_bmcs'][bmc] = str(data)
+        with open(fileName, 'w') as f:
+            confParser.write(f)
+        result['transactions'] += 1
+    result['elapsed'] = time.time() - start
+    result['bytes'] = getBytesWritten() - result['bytes']
+    start = time.time()
+    confParser = configparser.ConfigParser()
+    confParser.read(fileName)
+    for section in confParser.sections():
+        if not section.endswith('_bmcs'):
+            continue
+        for bmc in confParser[section]:
+            json.loads(confParser[section][bmc].replace("\'", "\""))
+    result['load'] = time.time() - start
+    return result
+
+def runStore(fileName, updates, batch):
+    """
+        Hands the updates to the tracker store in batches and flushes them once they are due, the way the tracker
+        thread does. The storm is replayed faster than the flush interval, so the updates are written once
+        flushThreshold of them are pending and when the store is closed.
+    """
+    trackerStore.load(fileName)
+    result = {'transactions': 0, 'bytes': getBytesWritten()}
+    start = time.time()
+    for i in range(0, len(updates), batch):
+        for entity, bmc, data in updates[i:i + batch]:
+            trackerStore.recordUpdate(entity, bmc, data)
+        if trackerStore.flushDue():
+            trackerStore.flush()
+    trackerStore.close()
+    result['elapsed'] = time.time() - start
+    result['bytes'] = getBytesWritten() - result['bytes']
+    result['transactions'] = trackerStore.getStoreStats()['flushes']
+    start = time.time()
+    trackerStore.load(fileName)
+    entities = [row[0] for row in trackerStore.connection.execute("SELECT DISTINCT entity FROM cursors").fetchall()]
+    for entity in entities:
+        trackerStore.getCursors(entity)
+    result['load'] = time.time() - start
+    trackerStore.close()
+    return result
+
+if __name__ == '__main__':
+    parser = createCommandParser()
+    args = parser.parse_args()
+    updates = createStorm(args)
+    tempDir = tempfile.mkdtemp()
+    try:
+        fileName = os.path.join(tempDir, 'bmclastreports.ini')
+        createTracker(fileName, args)
+        trackerSize = os.path.getsize(fileName)
+        print('{alerts} alerts for {nodes} BMCs and {entities} plugins, {updates} tracker updates, {batch} updates queued together, '
+              '{size} byte tracker file'.format(alerts=args.alerts, nodes=args.nodes, entities=args.entities, updates=len(updates),
+                                                batch=args.batch, size=trackerSize))
+        rewrite = runRewrite(fileName, updates)
+        createTracker(fileName, args)
+        #the tracker store imports the bmclastreports.ini file the first time it is loaded
+        store = runStore(fileName, updates, args.batch)
+    finally:
+        shutil.rmtree(tempDir)
+    for mode, result in [('rewrite', rewrite), ('store', store)]:
+        print('{mode:>8}: {transactions:6d} transactions, {mb:9.1f} MB written, {perUpdate:9.0f} bytes per update, {elapsed:6.2f} s, '
+              '{loadMs:7.1f} ms to load every reporting time'.format(mode=mode, mb=result['bytes'] / 1048576.0, loadMs=1000 * result['load'],
+                                                                    perUpdate=float(result['bytes']) / len(updates), **result))
@@ -0,0 +1,223 @@
+#!/usr/bin/python3
+"""
+ Copyright 2017 IBM Corporation
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+ A mock openbmc BMC for the benchmarks. It answers the REST calls ibm-crassd makes (login, logout,
+ chassis power state, sensor enumerate, SEL enumerate, SEL entry list and single SEL entries) and serves
+ the /subscribe websocket, pushing a PropertiesChanged message for every sensor each interval. A POST to
+ /mock/sel/add creates a new SEL entry, so benchmarks can simulate new alerts.
+
+ One server handles any number of simulated BMCs. It listens on all addresses, so every 127.x.y.z
+ loopback address can be used as a separate BMC hostname with the same port.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import shutil
+import ssl
+import struct
+import subprocess
+import tempfile
+
+wsGUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+sensorTypes = [('temperature', 'DegreesC', -3, 30000),
+               ('power', 'Watts', -6, 150000000),
+               ('fan_tach', 'RPMS', 0, 9000),
+               ('voltage', 'Volts', -3, 12000),
+               ('current', 'Amperes', -3, 5000)]
+
+def bmcHostnames(count, port):
+    """
+        Returns a list of unique bmc hostnames served by a mock BMC on the port
+    """
+    return ['127.1.{a}.{b}:{port}'.format(a=i // 250, b=i % 250 + 1, port=port) for i in range(count)]
+
+def createSensors(count):
+    """
+        Creates the sensor enumerate data for a mock BMC
+        @param count: the number of sensors
+        @return: dictionary in the format of /xyz/openbmc_project/sensors/enumerate
+    """
+    sensors = {}
+    for i in range(count):
+        stype, unit, scale, value = sensorTypes[i % len(sensorTypes)]
+        path = '/xyz/openbmc_project/sensors/{stype}/{stype}_sensor{num}'.format(stype=stype, num=i)
+        sensors[path] = {'Scale': scale, 'Unit': 'xyz.openbmc_project.Sensor.Value.Unit.' + unit, 'Value': value}
+    return sensors
+
+def createSelEntry(entryId):
+    return {'AdditionalData': ['_PID=1234', 'CALLOUT_INVENTORY_PATH=/xyz/openbmc_project/inventory/system/chassis/motherboard/cpu0'],
+            'Id': entryId,
+            'Message': 'org.open_power.Host.Error.Event',
+            'Resolved': 0,
+            'Severity': 'xyz.openbmc_project.Logging.Entry.Level.Error',
+            'Timestamp': 1540000000000 + entryId * 1000,
+            'associations': []}
+
+def createSelEntries(count):
+    """
+        Creates SEL entries in the format of /xyz/openbmc_project/logging/entry/enumerate
+        @param count: the number of entries
+    """
+    entries = {}
+    for i in range(1, count + 1):
+        entries['/xyz/openbmc_project/logging/entry/{num}'.format(num=i)] = createSelEntry(i)
+    return entries
+
+def createCertificate(directory):
+    """
+        Creates a self signed certificate for the mock BMC with the openssl command
+        @return: tuple of the certificate and key file names
+    """
+    certFile = os.path.join(directory, 'mockbmc.crt')
+    keyFile = os.path.join(directory, 'mockbmc.key')
+    subprocess.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                           '-subj', '/CN=mockbmc', '-keyout', keyFile, '-out', certFile],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return certFile, keyFile
+
+def encodeFrame(opcode, payload):
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+async def readFrame(reader):
+    header = await reader.readexactly(2)
+    length = header[1] & 0x7f
+    if length == 126:
+        length = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', await reader.readexactly(8))[0]
+    mask = await reader.readexactly(4) if header[1] & 0x80 else b'\x00\x00\x00\x00'
+    payload = bytearray(await reader.readexactly(length))
+    for i in range(length):
+        payload[i] ^= mask[i % 4]
+    return header[0] & 0x0f, bytes(payload)
+
+def sendResponse(writer, data, status='200 OK', extraHeaders=''):
+    body = json.dumps(data).encode()
+    writer.write(('HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {length}\r\n'
+                  '{extra}\r\n').format(status=status, length=len(body), extra=extraHeaders).encode() + body)
+
+async def serveWebsocket(state, reader, writer, headers):
+    key = headers.get('sec-websocket-key', '').encode()
+    accept = base64.b64encode(hashlib.sha1(key + wsGUID).digest()).decode()
+    writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                  'Sec-WebSocket-Accept: {accept}\r\n\r\n').format(accept=accept).encode())
+    await readFrame(reader)
+    paths = list(state['sensors'].keys())
+    try:
+        while True:
+            await asyncio.sleep(state['interval'] * random.uniform(0.9, 1.1))
+            for path in paths:
+                value = state['sensors'][path]['Value'] + random.randint(-5, 5)
+                message = json.dumps({'event': 'PropertiesChanged', 'interface': 'xyz.openbmc_project.Sensor.Value',
+                                      'path': path, 'properties': {'Value': value}}).encode()
+                writer.write(encodeFrame(0x1, message))
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def handleConnection(state, reader, writer):
+    try:
+        while True:
+            request = await reader.readuntil(b'\r\n\r\n')
+            lines = request.decode('latin-1').split('\r\n')
+            method, path = lines[0].split(' ')[0:2]
+            headers = {}
+            for line in lines[1:]:
+                if ':' in line:
+                    name, value = line.split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+            if 'content-length' in headers:
+                await reader.readexactly(int(headers['content-length']))
+            if headers.get('upgrade', '').lower() == 'websocket':
+                await serveWebsocket(state, reader, writer, headers)
+                return
+            if path == '/login':
+                sendResponse(writer, {'data': "User 'root' logged in", 'message': '200 OK', 'status': 'ok'},
+                             extraHeaders='Set-Cookie: SESSION={sid}; Secure; HttpOnly\r\n'.format(sid=os.urandom(8).hex()))
+            elif path == '/logout':
+                sendResponse(writer, {'data': "User 'root' logged out", 'message': '200 OK', 'status': 'ok'})
+            elif path == '/xyz/openbmc_project/state/chassis0/attr/CurrentPowerState':
+                sendResponse(writer, {'data': 'xyz.openbmc_project.State.Chassis.PowerState.On', 'message': '200 OK', 'status': 'ok'})
+            elif path == '/xyz/openbmc_project/sensors/enumerate':
+                sendResponse(writer, {'data': state['sensors'], 'message': '200 OK', 'status': 'ok'})
+            elif path == '/xyz/openbmc_project/logging/entry/enumerate':
+                sendResponse(writer, {'data': state['selEntries'], 'message': '200 OK', 'status': 'ok'})
+            elif path == '/xyz/openbmc_project/logging/entry/list':
+                sendResponse(writer, {'data': list(state['selEntries'].keys()), 'message': '200 OK', 'status': 'ok'})
+            elif path in state['selEntries']:
+                sendResponse(writer, {'data': state['selEntries'][path], 'message': '200 OK', 'status': 'ok'})
+            elif path == '/mock/sel/add':
+                entryId = max([entry['Id'] for entry in state['selEntries'].values()] or [0]) + 1
+                state['selEntries']['/xyz/openbmc_project/logging/entry/{num}'.format(num=entryId)] = createSelEntry(entryId)
+                sendResponse(writer, {'data': entryId, 'message': '200 OK', 'status': 'ok'})
+            else:
+                sendResponse(writer, {'data': {'description': 'Not found'}, 'message': '404 Not Found', 'status': 'error'}, status='404 Not Found')
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+def runMockBmc(port, sensorCount=40, interval=1.0, selCount=50, readyEvent=None):
+    """
+        Runs the mock BMC until the process is terminated
+        @param port: the TCP port to listen on
+        @param sensorCount: the number of sensors on each BMC
+        @param interval: seconds between sensor updates on the websockets
+        @param selCount: the number of SEL entries returned by each BMC
+        @param readyEvent: optional multiprocessing event set once the server is listening
+    """
+    certDir = tempfile.mkdtemp()
+    try:
+        certFile, keyFile = createCertificate(certDir)
+        sslContext = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        sslContext.load_cert_chain(certFile, keyFile)
+    finally:
+        shutil.rmtree(certDir)
+    state = {'sensors': createSensors(sensorCount), 'interval': interval, 'selEntries': createSelEntries(selCount)}
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = loop.run_until_complete(asyncio.start_server(lambda r, w: handleConnection(state, r, w),
+                                                          '0.0.0.0', port, ssl=sslContext, backlog=1024))
+    if readyEvent is not None:
+        readyEvent.set()
+    try:
+        loop.run_forever()
+    finally:
+        server.close()
+        loop.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mock openbmc BMC used by the ibm-crassd benchmarks')
+    parser.add_argument('-p', '--port', type=int, default=8443, help='port to listen on')
+    parser.add_argument('-s', '--sensors', type=int, default=40, help='number of sensors per BMC')
+    parser.add_argument('-i', '--interval', type=float, default=1.0, help='seconds between sensor updates')
+    parser.add_argument('-e', '--selEntries', type=int, default=50, help='number of SEL entries per BMC')
+    args = parser.parse_args()
+    runMockBmc(args.port, args.sensors, args.interval, args.selEntries)
@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+"""
+ Copyright 2017 IBM Corporation
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+ A mock ipmitool and ipmi BMC for the benchmarks, so the ipmi polling path can be measured without hardware.
+ Put it on the PATH as ipmitool. It answers sel info, sel list, sel list last, fru print and mc info for any BMC, and runs
+ the commands read from stdin after an ipmitool> prompt when started with shell. Setting up the session
+ takes MOCK_IPMI_SETUP seconds, done once per process before the first command the way ipmitool opens a
+ lanplus session, and every command takes MOCK_IPMI_COMMAND seconds. Each session setup is appended to the
+ file named by MOCK_IPMI_LOG. The SEL of every BMC has MOCK_IPMI_ENTRIES entries.
+"""
+import os
+import sys
+import time
+
+selEntries = ['Fan #0xE3 | Transition to Critical from Less Severe | Asserted',
+              'Memory #0x1f | Device Enabled | Asserted',
+              'Drive Slot / Bay #0x4C | Drive Slot | Asserted']
+fruPrint = {'0': ['Chassis Part Number   : 9006-22P', 'Chassis Serial        : 1234567', 'Board Mfg Date        : Mon Jan  1 00:00:00 2018',
+                  'Product Manufacturer  : IBM', 'Product Part Number   : 01AF123', 'Product Asset Tag     : asset0'],
+            '47': ['Product Version       : OP8_v1.11_2.1']}
+mcInfo = ['Device ID                 : 32', 'Firmware Revision         : 3.01']
+session = {'open': False}
+
+def openSession(bmcHostname):
+    """
+        Waits for the session setup and records it
+    """
+    time.sleep(float(os.environ.get('MOCK_IPMI_SETUP', '0.2')))
+    if 'MOCK_IPMI_LOG' in os.environ:
+        with open(os.environ['MOCK_IPMI_LOG'], 'a') as f:
+            f.write(bmcHostname + '\n')
+    session['open'] = True
+
+def runCommand(bmcHostname, words):
+    """
+        Returns the output lines of an ipmitool command
+    """
+    if not session['open']:
+        openSession(bmcHostname)
+    time.sleep(float(os.environ.get('MOCK_IPMI_COMMAND', '0.01')))
+    entries = int(os.environ.get('MOCK_IPMI_ENTRIES', '50'))
+    if words[:2] == ['sel', 'info']:
+        return ['SEL Information', 'Version          : 1.5 (v1.5, v2 compliant)', 'Entries          : {num}'.format(num=entries),
+                'Last Add Time    : 01/15/2018 10:00:00', 'Last Del Time    : Not Available']
+    if words[:2] == ['sel', 'list']:
+        first = 0
+        if len(words) == 4 and words[2] == 'last':
+            first = max(entries - int(words[3]), 0)
+        return ['{num:4x} | 01/15/2018 | 10:{minute:02d}:{second:02d} | {entry}'.format(num=i + 1, minute=i // 60 % 60, second=i % 60,
+                entry=selEntries[i % len(selEntries)]) for i in range(first, entries)]
+    if words[:2] == ['fru', 'print'] and len(words) == 3 and words[2] in fruPrint:
+        return fruPrint[words[2]]
+    if words[:2] == ['mc', 'info']:
+        return mcInfo
+    return ['Invalid command: ' + ' '.join(words)]
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    bmcHostname = args[args.index('-H') + 1] if '-H' in args else 'localhost'
+    #the command follows the connection options
+    while len(args) > 0 and args[0].startswith('-'):
+        args = args[1:] if args[0] == '-E' else args[2:]
+    if args == ['shell']:
+        while True:
+            sys.stdout.write('ipmitool> ')
+            sys.stdout.flush()
+            line = sys.stdin.readline()
+            if not line or line.strip() in ['quit', 'exit']:
+                break
+            if line.strip() != '':
+                print('\n'.join(runCommand(bmcHostname, line.split())))
+    else:
+        print('\n'.join(runCommand(bmcHostname, args)))
@@ -14,6 +14,11 @@ import datetime
 import socket
 import struct
 
+#first byte of the messages when the compact encoding is requested, see decodeMessage
+compactDictionaryFrame = 0x44
+compactValueFrame = 0x56
+compactValueHeader = struct.Struct('<BIqII')
+
 
 def argsparser():
     parser = argparse.ArgumentParser(description='IBM-crassd Telemetry Plugin POC')
@@ -22,10 +27,14 @@ def argsparser():
    
 def processMessages():
     global sensorData
+    dictionary = {}
     while True:
-        text = messageQueue.get().decode()
+        data = messageQueue.get()
         try:
-            message = json.loads(text)
+            message = decodeMessage(data, dictionary)
+            if message is None:
+                messageQueue.task_done()
+                continue
             with lock:
                 sensorData.clear()
                 sensorData = message
@@ -33,6 +42,44 @@ def processMessages():
             pass
         messageQueue.task_done()
     
+def decodeMessage(data, dictionary):
+    """
+        Decodes a message received from ibm-crassd. JSON messages are loaded as they are. With the compact
+        encoding, dictionary frames are stored and value frames are rebuilt into the same structure as the
+        JSON messages using the stored dictionary.
+        @param data: The message received, without the 4 byte length header
+        @param dictionary: Dictionary kept between messages, holds the last compact dictionary frame
+        @return: The sensor data, or None if the message was a dictionary frame
+    """
+    if data[0] == compactDictionaryFrame:
+        dictionary.clear()
+        dictionary.update(json.loads(data[1:].decode()))
+        dictionary['struct'] = struct.Struct('<' + 'qbb' * len(dictionary['nodes']) + 'd' * len(dictionary['sensors']))
+        return None
+    if data[0] == compactValueFrame:
+        frameType, version, timeSent, nodeCount, sensorCount = compactValueHeader.unpack_from(data)
+        if dictionary.get('version') != version:
+            return None
+        fields = dictionary['struct'].unpack_from(data, compactValueHeader.size)
+        sensData = {'Time_Sent': timeSent}
+        for i in range(nodeCount):
+            lastUpdate, connected, nodeState = fields[i * 3:i * 3 + 3]
+            sensData[dictionary['nodes'][i]] = {'LastUpdateReceived': lastUpdate if lastUpdate >= 0 else None,
+                                                'Connected': {1: True, 0: False}.get(connected),
+                                                'NodeState': dictionary['nodeStates'][nodeState]}
+        values = fields[nodeCount * 3:]
+        for i in range(sensorCount):
+            nodeIndex, sname, scale, stype = dictionary['sensors'][i]
+            value = values[i]
+            if value != value:
+                #NaN, there is no reading
+                value = None
+            elif value.is_integer():
+                value = int(value)
+            sensData[dictionary['nodes'][nodeIndex]][sname] = {'value': value, 'scale': scale, 'type': stype}
+        return sensData
+    return json.loads(data.decode())
+
 def init():
     for sn in serviceNodeIPList:
         sockQueue.put(sn)
@@ -99,7 +146,7 @@ def socketConnector():
         snSockThread = threading.Thread(target = crassdClientSocket, args=[s, sn])
         snSockThread.daemon = True
         snSockThread.start()
-        sensfilters = {'frequency': 1}
+        sensfilters = {'frequency': 1, 'encoding': 'compact'}
         data2send = (json.dumps(sensfilters, indent=0, separators=(',', ':')).replace('\n','') +"\n").encode()
         msg = struct.pack('>I', len(data2send)) + data2send
         s.sendall(msg) 
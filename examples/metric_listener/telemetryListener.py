@@ -18,6 +18,11 @@ import socket
 import struct
 import json
 
+#first byte of the messages when the compact encoding is requested, see decodeMessage
+compactDictionaryFrame = 0x44
+compactValueFrame = 0x56
+compactValueHeader = struct.Struct('<BIqII')
+
 
 def recvall(sock, n):
     """
@@ -34,6 +39,44 @@ def recvall(sock, n):
         data += packet
     return data
 
+def decodeMessage(data, dictionary):
+    """
+        Decodes a message received from ibm-crassd. JSON messages are loaded as they are. With the compact
+        encoding, dictionary frames are stored and value frames are rebuilt into the same structure as the
+        JSON messages using the stored dictionary.
+        @param data: The message received, without the 4 byte length header
+        @param dictionary: Dictionary kept between messages, holds the last compact dictionary frame
+        @return: The sensor data, or None if the message was a dictionary frame
+    """
+    if data[0] == compactDictionaryFrame:
+        dictionary.clear()
+        dictionary.update(json.loads(data[1:].decode()))
+        dictionary['struct'] = struct.Struct('<' + 'qbb' * len(dictionary['nodes']) + 'd' * len(dictionary['sensors']))
+        return None
+    if data[0] == compactValueFrame:
+        frameType, version, timeSent, nodeCount, sensorCount = compactValueHeader.unpack_from(data)
+        if dictionary.get('version') != version:
+            return None
+        fields = dictionary['struct'].unpack_from(data, compactValueHeader.size)
+        sensData = {'Time_Sent': timeSent}
+        for i in range(nodeCount):
+            lastUpdate, connected, nodeState = fields[i * 3:i * 3 + 3]
+            sensData[dictionary['nodes'][i]] = {'LastUpdateReceived': lastUpdate if lastUpdate >= 0 else None,
+                                                'Connected': {1: True, 0: False}.get(connected),
+                                                'NodeState': dictionary['nodeStates'][nodeState]}
+        values = fields[nodeCount * 3:]
+        for i in range(sensorCount):
+            nodeIndex, sname, scale, stype = dictionary['sensors'][i]
+            value = values[i]
+            if value != value:
+                #NaN, there is no reading
+                value = None
+            elif value.is_integer():
+                value = int(value)
+            sensData[dictionary['nodes'][nodeIndex]][sname] = {'value': value, 'scale': scale, 'type': stype}
+        return sensData
+    return json.loads(data.decode())
+
 def crassdClientSocket(servSocket, sn):
     """
         Function to manage the opened socket with ibm-crassd
@@ -46,12 +89,14 @@ def crassdClientSocket(servSocket, sn):
     #sensornames can be any of the names from `openbmctool sensors print/list` sent as a list
     #sensortypes can be any of: temperature, current, power, voltage, fan_tach
     #sensornames takes priority over sensor types
-    sensfilters = {'frequency': 1, 'sensortypes': ['power']}
+    #encoding can be json (default) or compact, compact messages are decoded with decodeMessage
+    sensfilters = {'frequency': 1, 'sensortypes': ['power'], 'encoding': 'compact'}
     data2send = (json.dumps(sensfilters, indent=0, separators=(',', ':')).replace('\n','') +"\n").encode()
     msg = struct.pack('>I', len(data2send)) + data2send
     servSocket.sendall(msg)
 #----------------------------------------------------------------------
     
+    dictionary = {}
     while True:
         raw_msglen = recvall(servSocket, 4)
         if not raw_msglen:
@@ -61,13 +106,17 @@ def crassdClientSocket(servSocket, sn):
         if not data:
             break
         
-        sensData = json.loads(data.decode()) 
+        sensData = decodeMessage(data, dictionary)
+        if sensData is None:
+            continue
 #----------------------------------------------------------------------
 #Process the received data
 #         print("Total Nodes: {ncount}".format(ncount=len(sensData)))
         for node in sensData:
+            if 'Time_Sent' in node: continue
 #             print('{Node} Sensor Count: {scount}'.format(Node=node, scount=len(sensData[node].keys())))
             for sensName in sensData[node]:
+                if sensName in ['LastUpdateReceived', 'Connected', 'NodeState']: continue
                 print("{Node} Sensor: {sname}: {svalue} * (10^{sscale}) {sunits}".format(Node=node, sname=sensName, 
                                                                             svalue=sensData[node][sensName]['value'], 
                                                                             sscale=sensData[node][sensName]['scale'],
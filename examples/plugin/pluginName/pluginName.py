@@ -1,3 +1,44 @@
+import datetime
+import json
+import socket
+import syslog
+import config
+
+def connectToSocket(mySocket, host, port, pluginDown):
+    """
+        Opens a connection to PluginName. See the logstash plugin for a version that reconnects.
+
+        @param mySocket: the socket object to use
+        @param host: IP or hostname to connect to
+        @param port: port number of the PluginName service
+        @param pluginDown: boolean, True if PluginName is known to be down, to avoid logging the error again
+        @return: True if the connection was opened
+    """
+    try:
+        mySocket.connect((host, port))
+        return True
+    except socket.error as e:
+        if not pluginDown:
+            config.errorLogger(syslog.LOG_ERR, "Unable to connect to PluginName at {host}:{port}: {err}".format(host=host, port=port, err=e))
+        return False
+
+def writeToSocket(mySocket, alert2Send):
+    """
+        Sends the log entry, or the batch of log entries, to PluginName as JSON lines
+
+        @param mySocket: the connected socket
+        @param alert2Send: dictionary with the entityAttr and the logEntry or the logEntries to send
+        @return: True if the alerts were sent
+    """
+    logEntries = alert2Send.get('logEntries', [alert2Send.get('logEntry')])
+    data2send = "".join(json.dumps(logEntry) + "\n" for logEntry in logEntries).encode()
+    try:
+        mySocket.sendall(data2send)
+        return True
+    except socket.error as e:
+        config.errorLogger(syslog.LOG_ERR, "Unable to send alerts to PluginName: {err}".format(err=e))
+        return False
+
 
 def initialize():
     """
@@ -41,3 +82,24 @@ def notifyPluginName(cerEvent, impactedNode, entityAttr):
     return writeToSocket(config.pluginVars['pluginName']['mySocket'], queDict)
     
      
+
+def notifyBatch(events, entityAttr):
+    """
+         Optional. sends a batch of log entries from ibmcrassd to PluginName with a single write
+           
+         @param events: list of tuples of the cerEvent (logEntry) to send and the node that had the alert
+         @param entityAttr: dictionary, contains the list of known attributes for the entity to report to
+         @return: list with True for every alert that was sent, in the same order as events
+    """
+    
+    newAlerts = []
+    for cerEvent, impactedNode in events:
+        newAlerts.append({'type':'ibm-crasssd-bmc-alerts', 'source': impactedNode, 
+                          'timestamp': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                          'data': cerEvent
+                         })
+    queDict = {}
+    queDict['entityAttr'] = entityAttr
+    queDict['logEntries'] = newAlerts
+    sent = writeToSocket(config.pluginVars['pluginName']['mySocket'], queDict)
+    return [sent] * len(events)
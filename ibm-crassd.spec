@@ -68,12 +68,28 @@ rm -rf $RPM_BUILD_ROOT
 %files
 %defattr(-,root,root,-)
 /opt/ibm/ras/lib/crassd.jar
+/opt/ibm/ras/lib/p8SMCBMCevents.xml
+%ghost /opt/ibm/ras/lib/p8SMCBMCevents.idx
 %config /opt/ibm/ras/etc/ibm-crassd.config
 %attr(755,root,root) /opt/ibm/ras/bin/ibm_crassd.py
 /opt/ibm/ras/bin/__init__.py
 /opt/ibm/ras/bin/telemetryServer.py
 /opt/ibm/ras/bin/config.py
 /opt/ibm/ras/bin/notificationlistener.py
+/opt/ibm/ras/bin/openbmcSel.py
+/opt/ibm/ras/bin/sessionPool.py
+/opt/ibm/ras/bin/asyncGatherer.py
+/opt/ibm/ras/bin/sensorTable.py
+/opt/ibm/ras/bin/pollScheduler.py
+/opt/ibm/ras/bin/pollQueue.py
+/opt/ibm/ras/bin/trackerStore.py
+/opt/ibm/ras/bin/deliveryQueue.py
+/opt/ibm/ras/bin/alertSpool.py
+/opt/ibm/ras/bin/alertAnalyzer.py
+/opt/ibm/ras/bin/ipmiSelService.py
+/opt/ibm/ras/bin/ipmiSel.py
+/opt/ibm/ras/bin/ipmiShellPool.py
+/opt/ibm/ras/bin/alertShards.py
 %attr(755,root,root) /opt/ibm/ras/bin/updateNodeTimes.py
 %attr(755,root,root) /opt/ibm/ras/bin/buildNodeList.py
 /opt/ibm/ras/bin/plugins/
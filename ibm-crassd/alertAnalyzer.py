@@ -0,0 +1,179 @@
+#
+#  Copyright 2017 IBM Corporation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+"""
+    This module runs the analyzers that decide whether an alert is reported to the notify entities. An
+    analyzer is the module analyze<alertID>.py in the ibm-crassd directory. It is loaded into the service
+    once at startup and must provide the function
+
+        analyzeAlert(event, node, selEntries, session, option)
+
+    which is called for every new alert with that ID. event is the alert, node holds the bmcHostname,
+    username, password and xcatNodeName of the BMC, selEntries are the raw SEL entries read from the BMC by
+    the poll that found the alert, or None when they are not available, session is the pooled session of the
+    BMC, or None when the BMC could not be logged in to, and option is clear or filter from the analysis
+    section of the configuration. It returns True when the alert is reported, False when it is filtered. An
+    analyzer may also provide initialize(), called once after it is loaded, which returns False when the
+    analyzer cannot run.
+
+    The analyzers run on a pool of analysisThreads worker threads, so only that many analyses, and the BMC
+    connections they open, are in progress at a time. An analysis that does not finish within analysisTimeout
+    seconds, or raises an exception, reports the alert.
+"""
+import imp
+import os
+import sys
+import syslog
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import config
+import sessionPool
+
+analyzers = {}
+settings = {'timeout': 60.0}
+executor = None
+analyzerLock = threading.Lock()
+stats = {}
+
+def getAnalyzerName(alertID):
+    return 'analyze{id}'.format(id=alertID)
+
+def loadAnalyzer(alertID, directory):
+    """
+        Loads and initializes the analyzer module of an alert ID
+
+        @param alertID: string, the ID of the alert the analyzer is for
+        @param directory: the directory holding the analyzer module
+        @return: the loaded module, or None if it could not be loaded
+    """
+    modname = getAnalyzerName(alertID)
+    try:
+        info = imp.find_module(modname, [directory])
+        try:
+            analyzer = imp.load_module(modname, *info)
+        finally:
+            if info[0] is not None:
+                info[0].close()
+        if not hasattr(analyzer, 'analyzeAlert'):
+            config.errorLogger(syslog.LOG_CRIT, "Analysis module {modname} has no analyzeAlert function. Continuing to run without it.".format(modname=modname))
+            return None
+        if hasattr(analyzer, 'initialize') and not analyzer.initialize():
+            config.errorLogger(syslog.LOG_CRIT, "Analysis module {modname} failed to initialize. Continuing to run without it.".format(modname=modname))
+            return None
+        return analyzer
+    except Exception as e:
+        config.errorLogger(syslog.LOG_CRIT, "Unable to load analysis module {modname}: {err}. Continuing to run without it.".format(modname=modname, err=e))
+        return None
+
+def start(alertIDs, directory, workers=4, timeout=60):
+    """
+        Loads the analyzers and starts the worker pool that runs them
+
+        @param alertIDs: list of the alert IDs to load an analyzer for
+        @param directory: the directory holding the analyzer modules
+        @param workers: the most analyses run at the same time
+        @param timeout: the number of seconds to wait for an analysis before reporting the alert
+        @return: list of the alert IDs whose analyzer was loaded
+    """
+    global executor
+    settings['timeout'] = float(timeout)
+    for alertID in alertIDs:
+        analyzer = loadAnalyzer(alertID, directory)
+        if analyzer is not None:
+            analyzers[alertID] = analyzer
+            stats[alertID] = {'runs': 0, 'filtered': 0, 'timeouts': 0, 'errors': 0, 'totalTime': 0.0, 'maxTime': 0.0}
+    if analyzers:
+        executor = ThreadPoolExecutor(max_workers=workers)
+    return list(analyzers.keys())
+
+def runAnalyzer(alertID, event, node, selEntries, option):
+    """
+        Runs the analyzer of an alert in a worker thread of the pool
+
+        @return: True if the alert is reported
+    """
+    session = sessionPool.getSession(node['bmcHostname'], node['username'], node['password'])
+    if session is None or sessionPool.isString(session):
+        session = None
+    started = time.time()
+    try:
+        return analyzers[alertID].analyzeAlert(event, node, selEntries, session, option)
+    finally:
+        elapsed = time.time() - started
+        with analyzerLock:
+            stats[alertID]['totalTime'] += elapsed
+            stats[alertID]['maxTime'] = max(stats[alertID]['maxTime'], elapsed)
+
+def analyze(event, node, selEntries, option):
+    """
+        Analyzes an alert with its analyzer and waits for the result
+
+        @param event: dictionary containing all the alert properties
+        @param node: dictionary with the bmcHostname, username, password and xcatNodeName of the BMC
+        @param selEntries: the raw SEL entries read by the poll that found the alert, or None
+        @param option: string, clear or filter
+        @return: True if the alert is reported, False if the analysis filtered it
+    """
+    alertID = event['CerID']
+    if alertID not in analyzers:
+        return True
+    with analyzerLock:
+        stats[alertID]['runs'] += 1
+    future = executor.submit(runAnalyzer, alertID, event, node, selEntries, option)
+    try:
+        analysisPassed = bool(future.result(timeout=settings['timeout']))
+    except TimeoutError:
+        future.cancel()
+        config.errorLogger(syslog.LOG_ERR, "Analysis of {id} on {host} did not finish within {timeout} seconds. Reporting the alert.".format(
+            id=alertID, host=node['bmcHostname'], timeout=settings['timeout']))
+        with analyzerLock:
+            stats[alertID]['timeouts'] += 1
+        return True
+    except Exception as e:
+        exc_type, exc_obj, exc_tb = sys.exc_info()
+        fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+        config.errorLogger(syslog.LOG_ERR, "Exception analyzing {id} on {host}: {type} {fname} {lineNo}".format(
+            id=alertID, host=node['bmcHostname'], type=exc_type, fname=fname, lineNo=exc_tb.tb_lineno))
+        config.errorLogger(syslog.LOG_ERR, str(e))
+        traceback.print_tb(e.__traceback__)
+        with analyzerLock:
+            stats[alertID]['errors'] += 1
+        return True
+    if not analysisPassed:
+        with analyzerLock:
+            stats[alertID]['filtered'] += 1
+    return analysisPassed
+
+def shutdown():
+    """
+        Stops the worker pool without waiting for the analyses in progress
+    """
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+def getAnalyzerStats():
+    """
+        Returns the statistics of every analyzer for logging
+    """
+    analyzerStats = {}
+    with analyzerLock:
+        for alertID in stats:
+            analyzerStats[alertID] = dict(stats[alertID])
+            if stats[alertID]['runs'] > 0:
+                analyzerStats[alertID]['averageTime'] = stats[alertID]['totalTime'] / stats[alertID]['runs']
+    return analyzerStats
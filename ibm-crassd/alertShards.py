@@ -0,0 +1,536 @@
+#
+#  Copyright 2017 IBM Corporation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+"""
+    This module runs the alert processing of the BMCs in worker processes, the alert shards, so reading and
+    decoding the SELs, filtering the alerts that were already reported and analyzing them are spread over the
+    cores instead of sharing the GIL of the service process. The BMCs are placed on the shards with a
+    consistent hash ring, so changing the number of shards only moves the BMCs of the shards added or removed.
+    A shard owns the SEL cursors and a copy of the reporting times of its BMCs, and polls them on its own
+    threads.
+
+    The main process keeps the poll queue, the delivery queues and the plugins. The nodes taken from the poll
+    queue are sent to their shard, which sends back the result of the poll with the alerts that are new. The
+    changes to the reporting times made by the deliveries are sent to the shard of the BMC. Both directions of
+    the channel to a shard are a pipe carrying lists of short tuples, the messages waiting to be sent are
+    pickled and written together.
+
+    The shards are forked by the spawner, a process forked from the service process before it starts any
+    threads, so every shard starts with the loaded modules and settings of the service without inheriting
+    locks held by its threads. A shard that exits is started again by the spawner, and the polls it had not
+    finished are reported as failed. The spawner only holds the state of the service when it was forked, so
+    the state that changed since is sent to the new shard by the restore handler.
+"""
+import bisect
+import hashlib
+import multiprocessing
+import multiprocessing.connection
+import multiprocessing.reduction
+import os
+import pickle
+import signal
+import sys
+import syslog
+import threading
+import time
+import traceback
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+import config
+
+#points of every shard on the hash ring, more points spread the BMCs more evenly
+ringPoints = 64
+#the most messages pickled into one write
+maxBatch = 256
+#seconds a shard must have run before it is started again right away
+restartDelay = 5.0
+
+shards = []
+ring = []
+ringKeys = []
+handlers = {}
+settings = {'threads': 1, 'stopping': False}
+spawner = {'process': None, 'conn': None}
+shardLock = threading.Lock()
+spawnLock = threading.Lock()
+stats = {'dispatched': 0, 'results': 0, 'stateUpdates': 0, 'lostPolls': 0, 'restarts': 0, 'messagesSent': 0, 'writes': 0,
+         'bytesSent': 0, 'messagesReceived': 0, 'bytesReceived': 0}
+
+def getHash(key):
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+def buildRing(count, points=ringPoints):
+    """
+        Places the points of every shard on the hash ring
+
+        @param count: the number of shards
+        @param points: the number of points of each shard
+        @return: list of tuples of the hash of a point and the index of its shard, sorted by the hash
+    """
+    return sorted((getHash('shard{index}-{point}'.format(index=index, point=point)), index)
+                  for index in range(count) for point in range(points))
+
+def getShard(bmcHostname):
+    """
+        Returns the index of the shard that owns a BMC, the shard of the first point on the ring after the BMC
+    """
+    position = bisect.bisect(ringKeys, getHash(bmcHostname)) % len(ringKeys)
+    return ring[position][1]
+
+def runWriter(channel):
+    """
+        Sends the messages queued on a channel until None is queued. The messages waiting together are sent in
+        one write.
+
+        @param channel: dictionary with the conn to write to and the outbox the messages are queued on
+    """
+    outbox = channel['outbox']
+    while True:
+        messages = [outbox.get()]
+        while len(messages) < maxBatch and messages[-1] is not None:
+            try:
+                messages.append(outbox.get_nowait())
+            except queue.Empty:
+                break
+        stop = messages[-1] is None
+        if stop:
+            messages.pop()
+        if messages:
+            data = pickle.dumps(messages, pickle.HIGHEST_PROTOCOL)
+            try:
+                channel['conn'].send_bytes(data)
+            except (OSError, ValueError):
+                #the reader of the channel finds the pipe closed
+                pass
+            with shardLock:
+                stats['messagesSent'] += len(messages)
+                stats['writes'] += 1
+                stats['bytesSent'] += len(data)
+        if stop:
+            return
+
+def readMessages(conn):
+    """
+        Waits for the next write on a channel
+
+        @return: list of the messages sent together
+    """
+    data = conn.recv_bytes()
+    messages = pickle.loads(data)
+    with shardLock:
+        stats['messagesReceived'] += len(messages)
+        stats['bytesReceived'] += len(data)
+    return messages
+
+def runPolls(work, channel):
+    """
+        Polls the BMCs sent to a shard and sends back the results. Runs in the threads of the shard.
+    """
+    while True:
+        bmcHostname, selEntries = work.get()
+        try:
+            result = handlers['poll'](bmcHostname, selEntries)
+        except Exception as e:
+            exc_type, exc_obj, exc_tb = sys.exc_info()
+            fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+            config.errorLogger(syslog.LOG_ERR, "Exception polling {host} in an alert shard: {type} {fname} {lineNo}".format(
+                host=bmcHostname, type=exc_type, fname=fname, lineNo=exc_tb.tb_lineno))
+            config.errorLogger(syslog.LOG_ERR, str(e))
+            traceback.print_tb(e.__traceback__)
+            result = None
+        channel['outbox'].put(('r', bmcHostname, result))
+
+def runShard(index, conn):
+    """
+        Main function of a shard process. Polls the BMCs sent by the service process until it is told to stop
+        or the service process exits.
+
+        @param index: the index of the shard
+        @param conn: the shard end of the pipe to the service process
+    """
+    #the service process decides when the shards stop
+    for signum in [signal.SIGINT, signal.SIGTERM, signal.SIGUSR1, signal.SIGUSR2]:
+        signal.signal(signum, signal.SIG_IGN)
+    for key in stats:
+        stats[key] = 0
+    try:
+        handlers['init'](index)
+    except Exception as e:
+        exc_type, exc_obj, exc_tb = sys.exc_info()
+        fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+        config.errorLogger(syslog.LOG_CRIT, "Alert shard {index} failed to start: {type} {fname} {lineNo}".format(
+            index=index, type=exc_type, fname=fname, lineNo=exc_tb.tb_lineno))
+        config.errorLogger(syslog.LOG_CRIT, str(e))
+        traceback.print_tb(e.__traceback__)
+        return
+    channel = {'conn': conn, 'outbox': queue.Queue()}
+    work = queue.Queue()
+    threads = [threading.Thread(target=runWriter, args=[channel])]
+    threads.extend(threading.Thread(target=runPolls, args=[work, channel]) for i in range(settings['threads']))
+    for t in threads:
+        t.daemon = True
+        t.start()
+    stop = False
+    while not stop:
+        try:
+            messages = readMessages(conn)
+        except (EOFError, OSError):
+            break
+        for message in messages:
+            if message[0] == 'p':
+                work.put((message[1], message[2]))
+            elif message[0] == 's':
+                try:
+                    handlers['update'](message[1])
+                except Exception as e:
+                    config.errorLogger(syslog.LOG_ERR, "Alert shard {index} could not apply {update}: {err}".format(
+                        index=index, update=message[1][0], err=e))
+            elif message[0] == 'q':
+                stop = True
+    try:
+        handlers['stop']()
+    except Exception as e:
+        config.errorLogger(syslog.LOG_ERR, "Exception stopping alert shard {index}: {err}".format(index=index, err=e))
+    conn.close()
+
+def runSpawnedShard(index, conn, inherited):
+    """
+        Closes the connections the shard inherited from the spawner, so the shard finds its pipe closed when the
+        service process exits, and runs the shard
+    """
+    for other in inherited:
+        other.close()
+    runShard(index, conn)
+
+def runSpawner(conn):
+    """
+        Main function of the spawner process. Forks the shards requested by the service process until it
+        closes its end of the pipe. The spawner has no threads, so the shards never inherit a held lock.
+
+        @param conn: the spawner end of the pipe to the service process
+    """
+    for signum in [signal.SIGINT, signal.SIGTERM, signal.SIGUSR1, signal.SIGUSR2]:
+        signal.signal(signum, signal.SIG_IGN)
+    #the spawner is a daemon of the service process, but it has to be allowed to start the shards
+    multiprocessing.current_process().daemon = False
+    context = multiprocessing.get_context('fork')
+    processes = {}
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            break
+        if request[0] == 'start':
+            index = request[1]
+            parentConn, childConn = context.Pipe()
+            process = context.Process(target=runSpawnedShard, args=[index, childConn, [parentConn, conn]],
+                                      name='alertShard{index}'.format(index=index))
+            process.daemon = True
+            process.start()
+            childConn.close()
+            processes[index] = process
+            conn.send(process.pid)
+            #the service process receives its own copy of the shard end of the pipe
+            multiprocessing.reduction.send_handle(conn, parentConn.fileno(), os.getppid())
+            parentConn.close()
+        elif request[0] == 'wait':
+            process = processes.get(request[1])
+            if process is None:
+                conn.send(None)
+                continue
+            process.join(request[2])
+            if process.exitcode is None and request[3]:
+                process.terminate()
+                process.join(1)
+            conn.send(process.exitcode)
+        elif request[0] == 'alive':
+            conn.send(sum(1 for process in processes.values() if process.is_alive()))
+        elif request[0] == 'stop':
+            conn.send(True)
+            break
+    #the shards still running are terminated when the spawner exits
+    conn.close()
+
+def startSpawner():
+    """
+        Forks the spawner process. Must be called before the service process starts any threads.
+    """
+    context = multiprocessing.get_context('fork')
+    parentConn, childConn = context.Pipe()
+    process = context.Process(target=runSpawner, args=[childConn], name='alertShardSpawner')
+    process.daemon = True
+    process.start()
+    childConn.close()
+    spawner['process'] = process
+    spawner['conn'] = parentConn
+
+def askSpawner(request):
+    """
+        Sends a request to the spawner and waits for its answer
+
+        @param request: tuple of the request and its values
+        @return: the answer of the spawner, and the handle it sent with the answer to a start request
+    """
+    with spawnLock:
+        spawner['conn'].send(request)
+        answer = spawner['conn'].recv()
+        handle = None
+        if request[0] == 'start':
+            handle = multiprocessing.reduction.recv_handle(spawner['conn'])
+    return answer, handle
+
+def startShard(index):
+    """
+        Starts the process of a shard with the spawner
+
+        @return: True if the shard was started
+    """
+    shard = shards[index]
+    try:
+        pid, handle = askSpawner(('start', index))
+    except (EOFError, OSError) as e:
+        config.errorLogger(syslog.LOG_CRIT, "Unable to start alert shard {index}: {err}".format(index=index, err=e))
+        return False
+    shard['channel'] = {'conn': multiprocessing.connection.Connection(handle), 'outbox': queue.Queue(), 'writer': None}
+    shard['pid'] = pid
+    shard['started'] = time.time()
+    return True
+
+def waitShard(index, timeout, terminate=False):
+    """
+        Waits for the process of a shard to exit
+
+        @param timeout: the number of seconds to wait
+        @param terminate: True to terminate the shard when it did not exit in time
+        @return: the exit code of the shard, None if it is still running
+    """
+    try:
+        return askSpawner(('wait', index, timeout, terminate))[0]
+    except (EOFError, OSError):
+        return None
+
+def startWriter(channel):
+    """
+        Starts the thread sending the messages queued for a shard over its pipe
+    """
+    channel['writer'] = threading.Thread(target=runWriter, args=[channel])
+    channel['writer'].daemon = True
+    channel['writer'].start()
+
+def queueMessage(shard, message):
+    """
+        Queues a message for a shard, or holds it until the shard has been started again. The messages for a
+        shard that could not be started again are dropped. Must be called with the shard lock held.
+    """
+    if shard['channel'] is None:
+        return
+    if shard['pending'] is not None:
+        shard['pending'].append(message)
+    else:
+        shard['channel']['outbox'].put(message)
+
+def restartShard(index):
+    """
+        Starts a shard that exited again, and reports the polls it had not finished as failed
+
+        @return: True if the shard was started again
+    """
+    shard = shards[index]
+    config.errorLogger(syslog.LOG_ERR, "Alert shard {index} exited with code {code}. Starting it again.".format(
+        index=index, code=waitShard(index, 1)))
+    #every poll sent or queued for the exited shard was lost with it, the messages queued from now on are held
+    #for the new shard
+    with shardLock:
+        lost = list(shard['inFlight'])
+        shard['inFlight'].clear()
+        shard['pending'] = []
+        stats['lostPolls'] += len(lost)
+        stats['restarts'] += 1
+    channel = shard['channel']
+    channel['outbox'].put(None)
+    channel['writer'].join(5)
+    channel['conn'].close()
+    wait = shard['started'] + restartDelay - time.time()
+    if wait > 0:
+        time.sleep(wait)
+    started = not settings['stopping'] and startShard(index)
+    if started:
+        startWriter(shard['channel'])
+        with shardLock:
+            for message in shard['pending']:
+                shard['channel']['outbox'].put(message)
+            shard['pending'] = None
+        #the state is restored after the held messages were queued, so it is never older than them
+        for update in handlers['restore'](index):
+            with shardLock:
+                stats['stateUpdates'] += 1
+                queueMessage(shard, ('s', update))
+    else:
+        #the polls held for the shard are lost as well, and the polls dispatched from now on fail right away
+        with shardLock:
+            shard['channel'] = None
+            shard['pending'] = None
+            lost.extend(shard['inFlight'])
+            shard['inFlight'].clear()
+    for bmcHostname in lost:
+        handlers['pollDone'](bmcHostname, None)
+    return started
+
+def runReader(index):
+    """
+        Hands the poll results sent by a shard to the poll done handler, and starts the shard again when it exits
+    """
+    shard = shards[index]
+    while True:
+        try:
+            messages = readMessages(shard['channel']['conn'])
+        except (EOFError, OSError):
+            if settings['stopping']:
+                return
+            if not restartShard(index):
+                return
+            continue
+        for message in messages:
+            if message[0] != 'r':
+                continue
+            with shardLock:
+                found = message[1] in shard['inFlight']
+                shard['inFlight'].discard(message[1])
+                stats['results'] += 1
+            if found:
+                try:
+                    handlers['pollDone'](message[1], message[2])
+                except Exception as e:
+                    exc_type, exc_obj, exc_tb = sys.exc_info()
+                    fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+                    config.errorLogger(syslog.LOG_ERR, "Exception finishing the poll of {host}: {type} {fname} {lineNo}".format(
+                        host=message[1], type=exc_type, fname=fname, lineNo=exc_tb.tb_lineno))
+                    config.errorLogger(syslog.LOG_ERR, str(e))
+                    traceback.print_tb(e.__traceback__)
+
+def start(count, threads, init, poll, update, stop, pollDone, restore=None):
+    """
+        Starts the spawner and the shard processes. Must be called before the service starts any threads.
+
+        @param count: the number of shard processes
+        @param threads: the number of threads polling the BMCs in each shard
+        @param init: function called with the index of the shard in a shard process when it starts
+        @param poll: function called in a shard with the bmcHostname and the pushed SEL entries of a BMC to
+        poll, returns the result handed to pollDone
+        @param update: function called in a shard with the updates sent by sendState and broadcast
+        @param stop: function called in a shard when it stops
+        @param pollDone: function called in the service process with the bmcHostname and the result of a poll,
+        the result is None when the shard exited during the poll
+        @param restore: function called in the service process with the index of a shard that was started
+        again, returns the list of updates that bring the shard up to date with the service process
+    """
+    handlers.update({'init': init, 'poll': poll, 'update': update, 'stop': stop, 'pollDone': pollDone,
+                     'restore': restore if restore is not None else lambda index: []})
+    settings['threads'] = max(int(threads), 1)
+    ring[:] = buildRing(count)
+    ringKeys[:] = [point[0] for point in ring]
+    for index in range(count):
+        shards.append({'pid': None, 'channel': None, 'pending': None, 'inFlight': set(), 'started': 0.0})
+    startSpawner()
+    for index in range(count):
+        startShard(index)
+    for index in range(count):
+        if shards[index]['channel'] is None:
+            continue
+        startWriter(shards[index]['channel'])
+        t = threading.Thread(target=runReader, args=[index])
+        t.daemon = True
+        t.start()
+
+def dispatch(bmcHostname, selEntries=None):
+    """
+        Sends a BMC to be polled by its shard. The result is handed to the pollDone handler.
+
+        @param bmcHostname: string, the hostname or IP address of the bmc
+        @param selEntries: dictionary of SEL entries pushed by the BMC, None to read the SEL
+    """
+    shard = shards[getShard(bmcHostname)]
+    with shardLock:
+        stats['dispatched'] += 1
+        running = shard['channel'] is not None
+        if running:
+            shard['inFlight'].add(bmcHostname)
+            queueMessage(shard, ('p', bmcHostname, selEntries))
+    if not running:
+        handlers['pollDone'](bmcHostname, None)
+
+def sendState(bmcHostname, update):
+    """
+        Sends an update of the state of a BMC to the shard that owns it
+
+        @param bmcHostname: string, the hostname or IP address of the bmc
+        @param update: tuple handed to the update handler in the shard
+    """
+    with shardLock:
+        stats['stateUpdates'] += 1
+        queueMessage(shards[getShard(bmcHostname)], ('s', update))
+
+def broadcast(update):
+    """
+        Sends an update to every shard
+    """
+    with shardLock:
+        stats['stateUpdates'] += len(shards)
+        for shard in shards:
+            queueMessage(shard, ('s', update))
+
+def getShardSizes(bmcHostnames):
+    """
+        Returns the number of the given BMCs owned by each shard
+    """
+    sizes = [0] * len(shards)
+    for bmcHostname in bmcHostnames:
+        sizes[getShard(bmcHostname)] += 1
+    return sizes
+
+def stop(timeout=5):
+    """
+        Tells the shards to stop and waits for them to exit
+    """
+    settings['stopping'] = True
+    with shardLock:
+        for shard in shards:
+            queueMessage(shard, ('q',))
+            queueMessage(shard, None)
+    for index in range(len(shards)):
+        waitShard(index, timeout, True)
+    try:
+        askSpawner(('stop',))
+    except (EOFError, OSError):
+        pass
+    spawner['process'].join(timeout)
+
+def getShardStats():
+    """
+        Returns the counters of the shards for logging
+    """
+    with shardLock:
+        shardStats = dict(stats)
+        shardStats['inFlight'] = [len(shard['inFlight']) for shard in shards]
+    shardStats['alive'] = 0
+    if spawner['conn'] is not None:
+        try:
+            shardStats['alive'] = askSpawner(('alive',))[0]
+        except (EOFError, OSError):
+            pass
+    return shardStats
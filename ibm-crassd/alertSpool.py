@@ -0,0 +1,275 @@
+#
+#  Copyright 2017 IBM Corporation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+"""
+    This module keeps the on disk spool of the alerts that could not be delivered to a notify entity. Every
+    entity has its own directory of numbered segment files. Alerts are appended to the newest segment as one
+    JSON line each and synced to disk, and a new segment is started once it reaches segmentBytes.
+
+    The alerts are read back in the order they were spooled. The position of the first alert not yet
+    delivered is kept in the cursor file of the entity, written with a rename so it is never partly written.
+    Segments before the cursor have been delivered and are deleted. When the service starts, the spool of an
+    entity is recovered from its segments and cursor, and a segment cut short by a crash is truncated after
+    its last complete alert.
+
+    The segments of an entity are limited to maxBytes. When an alert does not fit, the overflow policy either
+    deletes the oldest segment, losing the alerts in it, or rejects the new alert.
+"""
+import json
+import os
+import syslog
+import threading
+import config
+
+settings = {'maxBytes': 100 * 1024 * 1024, 'segmentBytes': 4 * 1024 * 1024, 'overflow': 'dropOldest'}
+overflowPolicies = ['dropOldest', 'reject']
+
+spools = {}
+spoolLock = threading.RLock()
+
+def configure(maxBytes, overflow='dropOldest'):
+    """
+        Sets the size limit and overflow policy of the spools
+
+        @param maxBytes: the most bytes of segments kept for each entity
+        @param overflow: dropOldest to delete the oldest segment when an alert does not fit, reject to refuse
+        the alert
+    """
+    with spoolLock:
+        settings['maxBytes'] = int(maxBytes)
+        #keep several segments within the limit so dropping one frees only part of the spool
+        settings['segmentBytes'] = max(min(4 * 1024 * 1024, settings['maxBytes'] // 8), 4096)
+        settings['overflow'] = overflow
+
+def getSegmentName(spool, segment):
+    return os.path.join(spool['directory'], '{num:012d}.seg'.format(num=segment))
+
+def writeCursor(spool):
+    """
+        Writes the cursor file of a spool
+    """
+    cursorName = os.path.join(spool['directory'], 'cursor')
+    with open(cursorName + '.tmp', 'w') as f:
+        json.dump(spool['cursor'], f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(cursorName + '.tmp', cursorName)
+
+def countRecords(fileName, offset=0):
+    """
+        Returns the number of alerts in a segment after the offset
+    """
+    count = 0
+    with open(fileName, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            count += 1
+    return count
+
+def openSpool(entity, directory):
+    """
+        Opens the spool of an entity, recovering the alerts left from before a restart
+
+        @param entity: the name of the notify entity
+        @param directory: the directory holding the segments of the entity
+        @return: the number of alerts waiting in the spool
+    """
+    with spoolLock:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        segments = sorted(int(name[:-4]) for name in os.listdir(directory) if name.endswith('.seg'))
+        spool = {'directory': directory, 'segments': [], 'writer': None, 'records': 0, 'bytes': 0,
+                 'cursor': {'segment': segments[0] if segments else 0, 'offset': 0},
+                 'stats': {'spooled': 0, 'acked': 0, 'dropped': 0, 'rejected': 0}}
+        cursorName = os.path.join(directory, 'cursor')
+        if os.path.exists(cursorName):
+            try:
+                with open(cursorName, 'r') as f:
+                    spool['cursor'] = json.load(f)
+            except ValueError:
+                config.errorLogger(syslog.LOG_ERR, "The spool cursor {fname} is damaged, replaying the whole spool".format(fname=cursorName))
+        for segment in segments:
+            if segment < spool['cursor']['segment']:
+                os.remove(getSegmentName(spool, segment))
+            else:
+                spool['segments'].append(segment)
+        if spool['segments']:
+            #drop an alert cut short by a crash while it was appended
+            lastName = getSegmentName(spool, spool['segments'][-1])
+            with open(lastName, 'rb+') as f:
+                data = f.read()
+                if data and not data.endswith(b'\n'):
+                    f.truncate(data.rfind(b'\n') + 1)
+            if spool['segments'][0] != spool['cursor']['segment']:
+                spool['cursor'] = {'segment': spool['segments'][0], 'offset': 0}
+        else:
+            spool['cursor']['offset'] = 0
+        for segment in spool['segments']:
+            offset = spool['cursor']['offset'] if segment == spool['cursor']['segment'] else 0
+            spool['records'] += countRecords(getSegmentName(spool, segment), offset)
+            spool['bytes'] += os.path.getsize(getSegmentName(spool, segment))
+        spools[entity] = spool
+        return spool['records']
+
+def dropOldestSegment(spool):
+    """
+        Deletes the oldest segment of a spool and moves the cursor past it. Must be called with the spool lock
+        held.
+
+        @return: the number of alerts lost
+    """
+    segment = spool['segments'].pop(0)
+    fileName = getSegmentName(spool, segment)
+    offset = spool['cursor']['offset'] if segment == spool['cursor']['segment'] else 0
+    lost = countRecords(fileName, offset)
+    if not spool['segments'] and spool['writer'] is not None:
+        spool['writer'].close()
+        spool['writer'] = None
+    spool['bytes'] -= os.path.getsize(fileName)
+    spool['records'] -= lost
+    spool['cursor'] = {'segment': spool['segments'][0] if spool['segments'] else segment + 1, 'offset': 0}
+    writeCursor(spool)
+    os.remove(fileName)
+    return lost
+
+def append(entity, records):
+    """
+        Appends alerts to the spool of an entity and syncs them to disk
+
+        @param entity: the name of the notify entity
+        @param records: list of the alerts to spool, each one must be JSON serializable
+        @return: True if the alerts were spooled, False if they were rejected
+    """
+    data = b''.join((json.dumps(record) + '\n').encode('utf-8') for record in records)
+    with spoolLock:
+        spool = spools[entity]
+        while spool['bytes'] + len(data) > settings['maxBytes']:
+            if settings['overflow'] == 'reject' or not spool['segments']:
+                spool['stats']['rejected'] += len(records)
+                config.errorLogger(syslog.LOG_ERR, "The alert spool of {entity} is full, {count} alerts were not spooled".format(
+                    entity=entity, count=len(records)))
+                return False
+            lost = dropOldestSegment(spool)
+            spool['stats']['dropped'] += lost
+            config.errorLogger(syslog.LOG_ERR, "The alert spool of {entity} is full, dropped the {count} oldest alerts".format(
+                entity=entity, count=lost))
+        if spool['writer'] is None or spool['writer'].tell() >= settings['segmentBytes']:
+            if spool['writer'] is not None:
+                spool['writer'].close()
+            if spool['segments']:
+                segment = spool['segments'][-1] + 1
+            else:
+                segment = spool['cursor']['segment']
+                spool['cursor']['offset'] = 0
+            spool['segments'].append(segment)
+            spool['writer'] = open(getSegmentName(spool, segment), 'ab')
+        spool['writer'].write(data)
+        spool['writer'].flush()
+        os.fsync(spool['writer'].fileno())
+        spool['bytes'] += len(data)
+        spool['records'] += len(records)
+        spool['stats']['spooled'] += len(records)
+    return True
+
+def read(entity, maxRecords):
+    """
+        Reads the oldest alerts of the spool of an entity without removing them
+
+        @param entity: the name of the notify entity
+        @param maxRecords: the most alerts to read
+        @return: list of tuples of the position after the alert, to pass to ack, and the alert
+    """
+    records = []
+    with spoolLock:
+        spool = spools[entity]
+        if spool['writer'] is not None:
+            spool['writer'].flush()
+        offset = spool['cursor']['offset']
+        for segment in spool['segments']:
+            if segment < spool['cursor']['segment']:
+                continue
+            with open(getSegmentName(spool, segment), 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    offset += len(line)
+                    records.append(({'segment': segment, 'offset': offset}, json.loads(line.decode('utf-8'))))
+                    if len(records) >= maxRecords:
+                        return records
+            offset = 0
+    return records
+
+def ack(entity, position, count):
+    """
+        Removes the delivered alerts from the spool of an entity and deletes the segments they emptied
+
+        @param entity: the name of the notify entity
+        @param position: the position returned by read with the last delivered alert
+        @param count: the number of alerts delivered
+    """
+    with spoolLock:
+        spool = spools[entity]
+        spool['cursor'] = dict(position)
+        spool['records'] -= count
+        spool['stats']['acked'] += count
+        emptied = []
+        while spool['segments'] and spool['segments'][0] < spool['cursor']['segment']:
+            segment = spool['segments'].pop(0)
+            spool['bytes'] -= os.path.getsize(getSegmentName(spool, segment))
+            emptied.append(segment)
+        if spool['records'] == 0 and spool['segments']:
+            #everything was delivered, start over with an empty segment
+            if spool['writer'] is not None:
+                spool['writer'].close()
+                spool['writer'] = None
+            emptied.extend(spool['segments'])
+            spool['cursor'] = {'segment': spool['segments'][-1] + 1, 'offset': 0}
+            spool['segments'] = []
+            spool['bytes'] = 0
+        #the segments are deleted after the cursor moved past them, a crash in between leaves them to openSpool
+        writeCursor(spool)
+        for segment in emptied:
+            os.remove(getSegmentName(spool, segment))
+
+def isEmpty(entity):
+    """
+        Returns True when no alerts are waiting in the spool of an entity
+    """
+    with spoolLock:
+        return entity not in spools or spools[entity]['records'] == 0
+
+def close():
+    """
+        Closes the segments being written
+    """
+    with spoolLock:
+        for entity in spools:
+            if spools[entity]['writer'] is not None:
+                spools[entity]['writer'].close()
+                spools[entity]['writer'] = None
+
+def getSpoolStats():
+    """
+        Returns the spool statistics of every entity for logging
+    """
+    spoolStats = {}
+    with spoolLock:
+        for entity in spools:
+            entityStats = dict(spools[entity]['stats'])
+            entityStats['waiting'] = spools[entity]['records']
+            entityStats['bytes'] = spools[entity]['bytes']
+            entityStats['segments'] = len(spools[entity]['segments'])
+            spoolStats[entity] = entityStats
+    return spoolStats
@@ -13,13 +13,18 @@
    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
    See the License for the specific language governing permissions and
    limitations under the License.
+
+ Analyzer for alert FQPSPAA0001M. ibm-crassd loads it with alertAnalyzer and calls analyzeAlert for each
+ FQPSPAA0001M alert. The alert is a false report when the esel signature is INTCQFIR[52:54] or CXAFIR[37].
 """
 import argparse
-import subprocess
-import json
-from openbmctool import login, connectionErrHandler
 import requests
 import sys
+import syslog
+import config
+import openbmcSel
+import sessionPool
+from sessionPool import connectionErrHandler
 
 def createCommandParser():
     """
@@ -33,7 +38,6 @@ def createCommandParser():
     actionType = parser.add_mutually_exclusive_group(required=True)
     actionType.add_argument("-a", "--auto", action='store_true', help='Automatically take action on the alert as needed')
     actionType.add_argument('-t', '--test', action='store_true', help='Test for a problem and report whether the INTCQ[52:54] false error is present')
-    actionType.add_argument("-c", "--crassd", action='store_true', help='Used to indicate the function was called by ibm-crassd. Not intended for end-users')
     amount = parser.add_mutually_exclusive_group(required=True)
     amount.add_argument('-n', '--logNumber', help='The log number of the entry to test')
     amount.add_argument('-f', '--fullLogTest', action='store_true', help='Test all the bmc logs.')
@@ -43,6 +47,44 @@ def createCommandParser():
     
     return parser
 
+def initialize():
+    """
+        Loads the policy table used to parse the esel details, when the SEL is not already parsed in process
+    """
+    if not config.policyTable:
+        config.policyTable = openbmcSel.loadPolicyTable(openbmcSel.policyTableLoc)
+    return len(config.policyTable) > 0
+
+def getSels(node, selEntries=None):
+    """
+        Parses the sel entries with the esel details. The entries are retrieved with the pooled session for
+        the bmc when they are not provided, so the same login is reused when the entries are deleted.
+    """
+    if selEntries is None:
+        selEntries, errorEvents = openbmcSel.getSELEntries(node)
+        if errorEvents is not None:
+            return errorEvents
+    return openbmcSel.parseSELEntries(selEntries, devdebug=True)
+
+def findFalseReports(sels, logNumber=None):
+    """
+        Returns the log numbers of the FQPSPAA0001M entries that are false reports
+
+        @param sels: dictionary of the parsed sel entries
+        @param logNumber: the log number of the entry to test, None to test all the entries
+    """
+    logs2Resolve = []
+    for item in sels:
+        if(type(sels[item])!=dict or 'logNum' not in sels[item]): continue
+        if(logNumber is None or str(logNumber) in sels[item]['logNum'] ):
+            if 'CommonEventID' not in sels[item]: continue
+            if 'eselParts' in sels[item] and 'signatureDescription' in sels[item]['eselParts']:
+                if('FQPSPAA0001M' in sels[item]['CommonEventID']):
+                    if('INTCQFIR[52:54]' in sels[item]['eselParts']['signatureDescription'] or 'CXAFIR[37]' in sels[item]['eselParts']['signatureDescription']):
+                        #False Report
+                        logs2Resolve.append(sels[item]['logNum'])
+    return logs2Resolve
+
 def selDelete(host, session, sels):
     """
         Deletes all the sel entries in list sels, using the specified session
@@ -54,15 +96,39 @@ def selDelete(host, session, sels):
         try:
             session.post(url, headers=httpHeader, data=data, verify=False, timeout=30)
         except(requests.exceptions.Timeout):
-            return connectionErrHandler(args.json, "Timeout", None)
+            return connectionErrHandler(True, "Timeout", None)
         except(requests.exceptions.ConnectionError) as err:
-            return connectionErrHandler(args.json, "ConnectionError", err)
+            return connectionErrHandler(True, "ConnectionError", err)
     return True
+
+def analyzeAlert(event, node, selEntries, session, option):
+    """
+        Checks an FQPSPAA0001M alert for a false report, and deletes the false report from the bmc when the
+        option is clear
+
+        @param event: dictionary containing all the alert properties
+        @param node: dictionary with the bmcHostname, username, password and xcatNodeName of the BMC
+        @param selEntries: the raw SEL entries read by the poll that found the alert, or None
+        @param session: the pooled session of the bmc, or None
+        @param option: string, clear or filter
+        @return: True if the alert should be forwarded, False for a false report
+    """
+    if selEntries is not None and not any(path.endswith('/entry/' + str(event['logNum'])) for path in selEntries):
+        #the poll did not read the entry of the alert, read the whole sel
+        selEntries = None
+    sels = getSels(node, selEntries)
+    logs2Resolve = findFalseReports(sels, event['logNum'])
+    if len(logs2Resolve) == 0:
+        return True
+    if option == 'clear' and session is not None:
+        status = selDelete(node['bmcHostname'], session, logs2Resolve)
+        if status != True:
+            config.errorLogger(syslog.LOG_ERR, "Unable to delete the false FQPSPAA0001M reports from {host}".format(host=node['bmcHostname']))
+    return False
   
 if __name__ == '__main__':
     """
-        If called by ibm-crassd, the -c option is used. This will print True if the alert should be forwarded
-        and False if the alert should not be forwarded. Otherwise human readable output is supplied. 
+        Tests the bmc for false FQPSPAA0001M reports and prints the results in human readable output
     """
     if(sys.version_info < (3,0)):
         import urllib3
@@ -71,42 +137,25 @@ if __name__ == '__main__':
         requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
     parser = createCommandParser()
     args = parser.parse_args()
-    logs2Resolve = []
-    if(sys.version_info<= (3,0)):
-        pyString = 'python'
+    initialize()
+    node = {'bmcHostname': args.host, 'username': args.user, 'password': args.PW, 'xcatNodeName': args.host}
+    sels = getSels(node)
+    if args.fullLogTest:
+        logs2Resolve = findFalseReports(sels)
     else:
-        pyString = 'python3'
-    
-    sels = subprocess.check_output([pyString, '/opt/ibm/ras/bin/openbmctool.py', '-j', '-H', args.host, '-U', args.user, '-P', args.PW, 'sel', 'print', '-d']).decode('utf-8')
-    sels = json.loads(sels)
-
-    for item in sels:
-        if(type(sels[item])==int): continue
-        if(args.fullLogTest or str(args.logNumber) in sels[item]['logNum'] ):
-            if 'CommonEventID' not in sels[item]: continue
-            if 'eselParts' in sels[item] and 'signatureDescription' in sels[item]['eselParts']:
-                if('FQPSPAA0001M' in sels[item]['CommonEventID']):
-                    if('INTCQFIR[52:54]' in sels[item]['eselParts']['signatureDescription'] or 'CXAFIR[37]' in sels[item]['eselParts']['signatureDescription']):
-                        #False Report
-                        logs2Resolve.append(sels[item]['logNum'])
+        logs2Resolve = findFalseReports(sels, args.logNumber)
     if(args.auto):
-        if not args.crassd:
-             print('Attempting to delete the following sel entries: {selList}'.format(selList=' '.join(logs2Resolve)))
-        session = login(args.host,args.user, args.PW, True)
-        status = selDelete(args.host, session, logs2Resolve)
+        print('Attempting to delete the following sel entries: {selList}'.format(selList=' '.join(logs2Resolve)))
+        session = sessionPool.getSession(args.host, args.user, args.PW)
+        if session is None or sessionPool.isString(session):
+            status = session
+        else:
+            status = selDelete(args.host, session, logs2Resolve)
         if(status != True):
-            if not args.crassd:
-                print(status)
+            print(status)
     if args.test:
         if len(logs2Resolve)>0:
             print('A false report was detected for the following sel numbers: {selList}'.format(selList=' '.join(logs2Resolve)))
         else:
             print('No false reports were found')
-    if args.crassd:
-        if len(logs2Resolve)>0:
-            print(False)
-        else:
-            print(True)
-    
-        
-    
\ No newline at end of file
+    sessionPool.closePool()
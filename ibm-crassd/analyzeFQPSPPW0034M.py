@@ -13,14 +13,22 @@
    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
    See the License for the specific language governing permissions and
    limitations under the License.
+
+ Analyzer for alert FQPSPPW0034M. ibm-crassd loads it with alertAnalyzer and calls analyzeAlert for each
+ FQPSPPW0034M alert. The alert is a false report when the chassis is powered on and the pmbus status words of
+ both power supplies show no fault.
 """
 import argparse
 import os
 import sys
-import subprocess
 import pexpect
 import tempfile
-import json
+import threading
+import sessionPool
+
+#hwmon directories of the verified power supplies of each bmc, they do not change while the bmc is running
+powerSupplyPaths = {}
+pathsLock = threading.Lock()
 
 def createCommandParser():
     """
@@ -34,7 +42,6 @@ def createCommandParser():
     actionType = parser.add_mutually_exclusive_group(required=True)
     actionType.add_argument("-a", "--auto", action='store_true', help='Automatically take action on the alert as needed')
     actionType.add_argument('-t', '--test', action='store_true', help='Test for a problem and report whether the power supply is healthy or not')
-    actionType.add_argument("-c", "--crassd", action='store_true', help='Used to indicate the function was called by ibm-crassd. Not intended for end-users')
     amount = parser.add_mutually_exclusive_group(required=True)
     amount.add_argument('-n', '--logNumber', help='The log number of the entry to test')
     amount.add_argument('-f', '--fullLogTest', action='store_true', help='Test all the bmc logs.')
@@ -94,14 +101,21 @@ def getPowerSupplyPath(bmchostname, username, password):
     else:
         return []
 
-def getPowerSupplyStatus(bmchostname, username, password, psPath):
-    command = 'cat /sys/kernel/debug/pmbus/{Path}/status0'.format(Path=psPath)
-#     print(command)
+def getPowerSupplyStatuses(bmchostname, username, password, psPaths):
+    """
+        Reads the status words of all the power supplies with a single ssh session
+
+        @return: list of the status words in the order of psPaths, or a string when the bmc could not be read
+    """
+    command = 'cat ' + ' '.join('/sys/kernel/debug/pmbus/{Path}/status0'.format(Path=psPath) for psPath in psPaths)
     try:
         output = ssh(bmchostname, command, username, password).strip()
     except Exception as e:
         return "Failed to connect to the specified BMC and get data"
-    return output
+    statuses = [line.strip() for line in output.split('\n') if line.strip() != '']
+    if len(statuses) != len(psPaths):
+        return "Failed to connect to the specified BMC and get data"
+    return statuses
 
 def hex2bin(str):
     bin = ['0000','0001','0010','0011',
@@ -131,22 +145,58 @@ def convertStatusWord(hexString):
     return (pgoodFault or psoff)
 
 def checkSystemPower(host, user, pw):
-    if(sys.version_info<= (3,0)):
-        pyString = 'python'
-    else:
-        pyString = 'python3'
-    
-    powerStatus = subprocess.check_output([pyString, '/opt/ibm/ras/bin/openbmctool.py', '-H', host, '-U', user, '-P', pw,'-j','chassis', 'power', 'status']).decode('utf-8')
-    statusDict = json.loads(powerStatus)
-    if statusDict['Chassis Power State'] == 'On':
+    """
+        Reads the chassis power state with the pooled session for the bmc
+    """
+    res, loginError = sessionPool.request('get', host, user, pw, '/xyz/openbmc_project/state/chassis0/attr/CurrentPowerState')
+    if res is None:
+        raise Exception(loginError)
+    return res.json()['data'].endswith('PowerState.On')
+
+def getCachedPowerSupplyPath(host, user, pw):
+    """
+        Returns the verified power supply paths of the bmc, finding them with ssh the first time
+    """
+    with pathsLock:
+        if host in powerSupplyPaths:
+            return powerSupplyPaths[host]
+    paths = getPowerSupplyPath(host, user, pw)
+    if not isinstance(paths, str) and len(paths) > 0:
+        with pathsLock:
+            powerSupplyPaths[host] = paths
+    return paths
+
+def analyzeAlert(event, node, selEntries, session, option):
+    """
+        Checks the power supplies of the system for an FQPSPPW0034M alert
+
+        @param event: dictionary containing all the alert properties
+        @param node: dictionary with the bmcHostname, username, password and xcatNodeName of the BMC
+        @param selEntries: the raw SEL entries read by the poll that found the alert, or None
+        @param session: the pooled session of the bmc, or None
+        @param option: string, clear or filter
+        @return: True if the alert should be forwarded, False when both power supplies are healthy
+    """
+    host = node['bmcHostname']
+    user = node['username']
+    pw = node['password']
+    if not checkSystemPower(host, user, pw):
+        #the power supplies can only be checked with the chassis powered on
         return True
-    else:
-        return False
+    paths = getCachedPowerSupplyPath(host, user, pw)
+    if 'Failed to connect' in paths or len(paths) == 0:
+        return True
+    statuses = getPowerSupplyStatuses(host, user, pw, paths)
+    if 'Failed to connect' in statuses:
+        return True
+    for sw in statuses:
+        if convertStatusWord(sw):
+            return True
+    return False
     
 if __name__ == '__main__':
     """
-        If called by ibm-crassd, the -c option is used. This will print True if the alert should be forwarded
-        and False if the alert should not be forwarded. Otherwise human readable output is supplied. 
+        Checks the power supplies of the system and prints the results in human readable output
     """
     parser = createCommandParser()
     args = parser.parse_args()
@@ -154,31 +204,27 @@ if __name__ == '__main__':
     if powerOn:
         paths = getPowerSupplyPath(args.host, args.user, args.PW)
         if 'Failed to connect' in paths:
-            if args.crassd:
-                    print("True")
+            print(paths)
             sys.exit()
         if len(paths) >0:
-            count = 0
             badps = False
-            for path in paths:
-                sw = getPowerSupplyStatus(args.host, args.user, args.PW, path)
+            statuses = getPowerSupplyStatuses(args.host, args.user, args.PW, paths)
+            if 'Failed to connect' in statuses:
+                print(statuses)
+                sys.exit()
+            for sw in statuses:
                 if convertStatusWord(sw):
                     badps = True
             if badps:
                 if args.test:
                     print("A bad power supply has been detected.")
-                if args.crassd:
-                    print("True")
             else:
                 if args.test:
                     print("The power supplies are healthy.")
-                if args.crassd:
-                    print("False")
                 if args.auto:
                     print("This is a false report. Action will be taken on the BMC")
         else:
             print("Failed to get the directory for the power supplies")
     else:
         print("Chassis Power Must be On")
-        
-    
\ No newline at end of file
+    sessionPool.closePool()
@@ -0,0 +1,372 @@
+#
+#  Copyright 2017 IBM Corporation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+"""
+    This module is the asyncio gatherer engine for the telemetry server. Instead of running one thread per BMC
+    websocket, a single event loop in each gatherer process services all of the websockets assigned to it.
+    Logging in, reading the initial sensor values, listening to the websocket and reconnecting are run as
+    coroutines, so a gatherer process can handle hundreds of BMCs.
+
+    The REST calls made while connecting to a BMC still use the requests based functions from the telemetry
+    server, and are run on a small thread pool so the event loop is never blocked by a slow BMC. The websocket
+    itself is a minimal RFC 6455 client built on asyncio streams, which covers what the BMC subscribe interface
+    needs: text frames, ping/pong and close.
+
+    Enable this engine by setting gathererEngine = asyncio in the telemetry_configuration section.
+"""
+import asyncio
+import base64
+import hashlib
+import os
+import ssl
+import struct
+import sys
+import syslog
+import signal
+import time
+import traceback
+import json
+import requests
+from concurrent.futures import ThreadPoolExecutor
+import config
+import sessionPool
+import telemetryServer
+
+wsGUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+#limits the number of BMCs logging in or reading their initial sensor values at the same time
+restWorkers = 16
+connectTimeout = 30
+
+def getSSLContext():
+    """
+        Returns an ssl context that does not verify the BMC certificate, matching the websocket-client settings
+    """
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+def splitHost(bmcHostname):
+    """
+        Splits a bmc hostname that may include a port into the host and the port
+        @param bmcHostname: string, hostname or IP address of the bmc, optionally followed by :port
+        @return: tuple of the host and the port number
+    """
+    if bmcHostname.count(':') == 1:
+        host, port = bmcHostname.split(':')
+        return host, int(port)
+    return bmcHostname, 443
+
+def maskPayload(mask, payload):
+    """
+        Applies the websocket masking key to a payload
+        @param mask: the 4 byte masking key
+        @param payload: bytes to mask
+        @return: the masked bytes
+    """
+    length = len(payload)
+    if length == 0:
+        return payload
+    fullMask = (mask * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(fullMask, 'big')).to_bytes(length, 'big')
+
+def buildFrame(opcode, payload):
+    """
+        Creates a masked client frame
+        @param opcode: integer, the websocket opcode
+        @param payload: bytes to send
+        @return: the encoded frame
+    """
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, 0x80 | length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 0x80 | 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 0x80 | 127, length)
+    mask = os.urandom(4)
+    return header + mask + maskPayload(mask, payload)
+
+async def wsConnect(bmcHostname, path, cookieStr, sslContext):
+    """
+        Opens a websocket with the bmc
+        @param bmcHostname: string, hostname or IP address of the bmc
+        @param path: the path of the websocket on the bmc
+        @param cookieStr: the session cookie to authenticate with
+        @param sslContext: the ssl context to use for the connection
+        @return: dictionary describing the websocket connection
+    """
+    host, port = splitHost(bmcHostname)
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port, ssl=sslContext), connectTimeout)
+    key = base64.b64encode(os.urandom(16))
+    handshake = ("GET {path} HTTP/1.1\r\n"
+                 "Host: {host}\r\n"
+                 "Upgrade: websocket\r\n"
+                 "Connection: Upgrade\r\n"
+                 "Sec-WebSocket-Key: {key}\r\n"
+                 "Sec-WebSocket-Version: 13\r\n"
+                 "Cookie: {cookie}\r\n\r\n").format(path=path, host=bmcHostname, key=key.decode(), cookie=cookieStr)
+    writer.write(handshake.encode())
+    try:
+        response = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), connectTimeout)
+    except Exception:
+        writer.close()
+        raise
+    lines = response.decode('latin-1').split('\r\n')
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    expectedAccept = base64.b64encode(hashlib.sha1(key + wsGUID).digest()).decode()
+    if ' 101' not in lines[0] or headers.get('sec-websocket-accept') != expectedAccept:
+        writer.close()
+        raise ConnectionError("Websocket handshake rejected by {bmc}: {status}".format(bmc=bmcHostname, status=lines[0]))
+    return {'reader': reader, 'writer': writer, 'url': 'wss://{bmc}{path}'.format(bmc=bmcHostname, path=path), 'closed': False}
+
+def wsSend(conn, text, opcode=0x1):
+    """
+        Sends a message on the websocket
+        @param conn: dictionary describing the websocket connection
+        @param text: string or bytes to send
+        @param opcode: integer, the websocket opcode. Defaults to a text frame.
+    """
+    if isinstance(text, str):
+        text = text.encode('utf-8')
+    conn['writer'].write(buildFrame(opcode, text))
+
+async def wsRecv(conn):
+    """
+        Waits for the next message from the bmc. Control frames are handled here.
+        @param conn: dictionary describing the websocket connection
+        @return: the message text, or None when the websocket is closed
+    """
+    reader = conn['reader']
+    fragments = []
+    while True:
+        try:
+            header = await reader.readexactly(2)
+            length = header[1] & 0x7f
+            if length == 126:
+                length = struct.unpack('!H', await reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack('!Q', await reader.readexactly(8))[0]
+            mask = None
+            if header[1] & 0x80:
+                mask = await reader.readexactly(4)
+            payload = await reader.readexactly(length)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+        if mask is not None:
+            payload = maskPayload(mask, payload)
+        opcode = header[0] & 0x0f
+        if opcode == 0x9:
+            wsSend(conn, payload, 0xA)
+        elif opcode == 0xA:
+            continue
+        elif opcode == 0x8:
+            wsClose(conn)
+            return None
+        else:
+            fragments.append(payload)
+            if header[0] & 0x80:
+                return b''.join(fragments).decode('utf-8')
+
+def wsClose(conn):
+    """
+        Closes the websocket. Safe to call more than once.
+        @param conn: dictionary describing the websocket connection
+    """
+    if conn['closed']:
+        return
+    conn['closed'] = True
+    try:
+        conn['writer'].write(buildFrame(0x8, struct.pack('!H', 1000)))
+    except Exception:
+        pass
+    conn['writer'].close()
+
+def getCookieString(mysession):
+    """
+        Returns the cookies of a requests session formatted for the websocket handshake
+    """
+    cookie = mysession.cookies.get_dict()
+    cookieStr = ""
+    for key in cookie:
+        if cookieStr != "":
+            cookieStr = cookieStr + ";"
+        cookieStr = cookieStr + key +"=" + cookie[key]
+    return cookieStr
+
+async def listenWebSocket(node, cookieStr, sslContext):
+    """
+        Subscribes to the sensors of a node and processes the push notifications until the websocket closes
+        @param node: dictionary containing the node properties
+        @param cookieStr: the session cookie to authenticate with
+        @param sslContext: the ssl context to use for the connection
+    """
+    bmcIP = node['bmcHostname']
+    try:
+        conn = await wsConnect(bmcIP, '/subscribe', cookieStr, sslContext)
+    except Exception as e:
+        node['telemlistener'] = None
+        config.errorLogger(syslog.LOG_DEBUG, "Websocket error for {bmc}, details: {err}".format(bmc=bmcIP, err=e))
+        node['LastUpdateReceived'] = int(time.time())
+        node['Connected'] = False
+        node['connecting'] = False
+        #the session may have been rejected by the BMC, login again on the next connection attempt
+        sessionPool.invalidateSession(bmcIP, node['session'], doLogout=True)
+        return
+    node['websocket'] = conn
+    subList = node['SensorList'] + telemetryServer.sensorList
+    data = {"paths": subList, "interfaces": ["xyz.openbmc_project.Sensor.Value","xyz.openbmc_project.Logging.Entry",'org.open_power.OCC.Status', 'xyz.openbmc_project.State.Chassis']}
+    wsSend(conn, json.dumps(data))
+    telemetryServer.sendQueue.put((node, None))
+    config.errorLogger(syslog.LOG_DEBUG, "Websocket opened for {bmc}".format(bmc=bmcIP))
+    node['connecting'] = False
+    node['Connected'] = True
+    node['LastUpdateReceived'] = int(time.time())
+    node['retryCount'] = 0
+    try:
+        while True:
+            message = await wsRecv(conn)
+            if message is None:
+                break
+            node['down'] = False
+            telemetryServer.processMessage({'node': node, 'msg': message})
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        if not conn['closed']:
+            config.errorLogger(syslog.LOG_DEBUG, "Websocket error for {bmc}, details: {err}".format(bmc=bmcIP, err=e))
+            sessionPool.invalidateSession(bmcIP, node['session'], doLogout=True)
+    finally:
+        wsClose(conn)
+        if node['websocket'] is conn:
+            node['telemlistener'] = None
+            node['LastUpdateReceived'] = int(time.time())
+            node['Connected'] = False
+        config.errorLogger(syslog.LOG_DEBUG, "Websocket closed for {bmc}".format(bmc=bmcIP))
+
+async def openWebSocket(node, loop, sslContext):
+    """
+        Logs into the bmc, gets the initial sensor readings and then listens to the websocket of the node
+        @param node: dictionary containing the node properties
+        @param loop: the event loop of the gatherer process
+        @param sslContext: the ssl context to use for the connection
+    """
+    sensorData = telemetryServer.sensorData
+    bmcIP = node['bmcHostname']
+    systemName = node['xcatNodeName']
+    node['connecting'] = True
+    mysession = await loop.run_in_executor(None, sessionPool.getSession, bmcIP, node['username'], node['password'])
+    node['session'] = mysession
+    if isinstance(mysession, requests.sessions.Session):
+        node['down'] = False
+        try:
+            node['LastUpdateReceived'] = int(time.time())
+            for i in range(3):
+                await loop.run_in_executor(None, telemetryServer.getNodePowerState, bmcIP, mysession, systemName, node)
+                await loop.run_in_executor(None, telemetryServer.initSensors, bmcIP, mysession, systemName, node)
+                if len(sensorData[systemName])>0:
+                    break
+            if len(sensorData[systemName])>0:
+                node['retryCount'] = 0
+                await listenWebSocket(node, getCookieString(mysession), sslContext)
+            else:
+                await loop.run_in_executor(None, sessionPool.invalidateSession, bmcIP, mysession, True)
+                raise ValueError("Failed to get initial sensor readings")
+        except asyncio.CancelledError:
+            raise
+        except ValueError:
+            node['telemlistener'] = None
+            node['connecting'] = False
+            config.errorLogger(syslog.LOG_CRIT, "Failed to initialize sensors with BMC: {bmc} three times. The BMC session is now terminated.".format(bmc=bmcIP))
+        except Exception as e:
+            node['telemlistener'] = None
+            node['connecting'] = False
+            config.errorLogger(syslog.LOG_CRIT, "Failed to open the websocket with BMC: {bmc}".format(bmc=bmcIP))
+            exc_type, exc_obj, exc_tb = sys.exc_info()
+            fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+            config.errorLogger(syslog.LOG_DEBUG, "Exception: Error: {err}, Details: {etype}, {fname}, {lineno}".format(err=e, etype=exc_type, fname=fname, lineno=exc_tb.tb_lineno))
+            traceback.print_tb(e.__traceback__)
+    else:
+        node['down'] = True
+        node['telemlistener'] = None
+        node['connecting'] = False
+        if mysession is not None:
+            config.errorLogger(syslog.LOG_CRIT, "Failed to login to BMC: {bmc}".format(bmc=bmcIP))
+            config.errorLogger(syslog.LOG_ERR, "{err}".format(err=mysession))
+
+async def superviseNodes(nodeList, mngedNodeList, loop, sslContext):
+    """
+        Replaces the gatherer loop of the thread engine. Forwards alert notifications, reconnects
+        nodes and hands the sensor data to the socket server.
+        @param nodeList: list of the nodes handled by this gatherer process
+        @param mngedNodeList: managed list shared with the main process
+        @param loop: the event loop of the gatherer process
+        @param sslContext: the ssl context to use for the connections
+    """
+    def startListener(node):
+        node['telemlistener'] = loop.create_task(openWebSocket(node, loop, sslContext))
+
+    flushState = {}
+    while not telemetryServer.killSig.is_set():
+        try:
+            telemetryServer.forwardPollRequests(mngedNodeList)
+            curTime = time.time()
+            for node in nodeList:
+                if node['accessType'] == 'openbmcRest':
+                    telemetryServer.superviseNode(node, curTime, startListener)
+        except Exception as e:
+            config.errorLogger(syslog.LOG_ERR, "Error supervising the telemetry websockets.")
+            exc_type, exc_obj, exc_tb = sys.exc_info()
+            fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+            config.errorLogger(syslog.LOG_DEBUG, "Exception: Error: {err}, Details: {etype}, {fname}, {lineno}".format(err=e, etype=exc_type, fname=fname, lineno=exc_tb.tb_lineno))
+            traceback.print_tb(e.__traceback__)
+        await asyncio.sleep(0.9)
+        telemetryServer.flushTelemetry(flushState)
+    config.errorLogger(syslog.LOG_DEBUG, "Killing gatherer process pid {mpid}".format(mpid=os.getpid()))
+
+def startMonitoringProcess(nodeList, mngedNodeList):
+    """
+        Runs a gatherer process with the asyncio engine
+        @param nodeList: list of the nodes handled by this gatherer process
+        @param mngedNodeList: managed list shared with the main process
+    """
+    signal.signal(signal.SIGUSR1, telemetryServer.gathererDumpMem)
+    #sessions created by the parent process can't be shared with this process
+    sessionPool.resetPool()
+    telemetryServer.gathererNodeList = nodeList
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=restWorkers))
+    sslContext = getSSLContext()
+    for node in nodeList:
+        telemetryServer.initGathererNode(node)
+        if node['accessType'] == 'openbmcRest':
+            node['telemlistener'] = loop.create_task(openWebSocket(node, loop, sslContext))
+        config.updateManagedDict(config.nodeProperties[node['xcatNodeName']], node)
+    try:
+        loop.run_until_complete(superviseNodes(nodeList, mngedNodeList, loop, sslContext))
+    finally:
+        for node in nodeList:
+            if node.get('telemlistener') is not None:
+                node['telemlistener'].cancel()
+        pending = [task for task in [node.get('telemlistener') for node in nodeList] if task is not None]
+        if len(pending) > 0:
+            loop.run_until_complete(asyncio.wait(pending, timeout=5))
+        loop.close()
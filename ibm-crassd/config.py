@@ -27,8 +27,6 @@ import collections
 global crassd_version
 crassd_version = '1.2.0'
 
-global nodes2poll
-nodes2poll = queue.Queue()
 global updateConfFile
 updateConfFile = queue.Queue()
 global notifyList
@@ -66,12 +64,31 @@ telemPort = 53322
 global nodespercore
 nodespercore = 10
 
+global gathererEngine
+gathererEngine = 'thread'
+
+global maxSensorsPerNode
+maxSensorsPerNode = 256
+
+global nativeSelRetrieval
+nativeSelRetrieval = True
+#decode the ipmi SEL with one resident java SEL parser instead of a JVM per poll
+ipmiSelService = True
+#decode the ipmi SEL in process with an index of the event table instead of the java SEL parser
+nativeIpmiDecoding = True
+#run ipmitool commands in pooled ipmitool shells instead of a new ipmitool process for each command
+ipmiShellSessions = True
+#number of alert shard processes polling the BMCs, 0 polls them on threads of the service process
+alertProcesses = 0
+
+global policyTable
+policyTable = {}
+
 global alertMessageQueue
 alertMessageQueue = multiprocessing.Queue()
 
 global configFileName
 configFileName = '/opt/ibm/ras/etc/ibm-crassd.config'
-updateNodeTimesfile = '/opt/ibm/ras/etc/updateNodes.ini'
 bmclastreports = '/opt/ibm/ras/etc'
 if(sys.version_info<= (3,0)):
     pyString = 'python'
@@ -88,6 +105,9 @@ global nodeManager
 nodeManager = multiprocessing.Manager()
 global nodeProperties
 nodeProperties = {}
+#session cookies of the logged in BMCs, shared by the main process and the telemetry gatherer processes
+global bmcSessions
+bmcSessions = nodeManager.dict()
 
 def set_procname(newname):
     from ctypes import cdll, byref, create_string_buffer
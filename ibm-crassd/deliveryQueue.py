@@ -0,0 +1,343 @@
+#
+#  Copyright 2017 IBM Corporation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+"""
+    This module delivers the alerts to the notify entities. Every entity has a bounded queue and its own
+    worker thread, so a receiver that is slow or down only holds up its own deliveries, never the worker
+    threads polling the BMCs. The alerts of an entity are delivered in the order they were queued. When the
+    queue of an entity is full, the thread queuing an alert waits for room.
+
+    An alert stays marked as queued until its delivery finishes, so a poll of the BMC in the meantime does
+    not queue it again. Once an alert is delivered, the accepted handler is called so the tracking times can
+    move past it.
+
+    When spooling is enabled, an alert that fails to be delivered is written to the on disk spool of the
+    entity and accepted, so it is not read from the BMC again. While the spool holds alerts, new alerts are
+    appended behind them to keep the order. Every retryInterval seconds the worker replays the spool in
+    batches until it is empty or a delivery fails again.
+
+    When an alert is neither delivered nor spooled, the alerts of the same BMC queued behind it for that
+    entity are dropped, because the tracking times of the BMC must not move past the failed alert. The
+    failure handler is called for the failed and the dropped alerts, so they can be read again by a later poll.
+
+    For the entities whose plugin can notify a batch of alerts at once, the worker gathers the alerts queued
+    within batchWindow seconds, up to maxBatch of them, and hands them to the batch delivery function, which
+    returns whether each alert was delivered. Each alert is then accepted, spooled or failed the same way as
+    one delivered on its own. Replays of the spool of these entities are delivered in batches too.
+"""
+import os
+import sys
+import syslog
+import threading
+import time
+import traceback
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+import config
+import alertSpool
+
+queues = {}
+queuedAlerts = set()
+outstanding = {}
+failedBmcs = set()
+deliveryLock = threading.Lock()
+stats = {}
+settings = {'spool': False, 'retryInterval': 30.0, 'replayBatch': 100, 'batchWindow': 0.2, 'maxBatch': 100}
+batchEntities = set()
+replayDue = {}
+
+def getAlertKey(entity, bmcHostname, event):
+    return (entity, bmcHostname, event['timestamp'], event['CerID'])
+
+def start(entities, deliver, accepted, failed, maxSize=1000, spoolDirectory=None, retryInterval=30,
+          deliverBatch=None, batching=(), batchWindow=0.2):
+    """
+        Creates the queue of every entity and starts its delivery worker thread
+
+        @param entities: list of the names of the notify entities
+        @param deliver: function called with the entity name and the queued item, returns True when the alert
+        was delivered
+        @param accepted: function called with the entity name and the queued item once the alert was delivered
+        or spooled
+        @param failed: function called with the entity name and the queued item when the alert failed to be
+        delivered or was dropped
+        @param maxSize: the most alerts queued for an entity
+        @param spoolDirectory: the directory holding the spools of the entities, None to disable spooling
+        @param retryInterval: the number of seconds between attempts to replay the spool of an entity
+        @param deliverBatch: function called with the entity name and a list of queued items, returns a list
+        with True for every alert that was delivered
+        @param batching: the names of the entities whose alerts are delivered with deliverBatch
+        @param batchWindow: the number of seconds to gather alerts for a batch, 0 to deliver them one at a time
+    """
+    settings['spool'] = spoolDirectory is not None
+    settings['retryInterval'] = float(retryInterval)
+    settings['batchWindow'] = float(batchWindow)
+    if deliverBatch is not None and settings['batchWindow'] > 0:
+        batchEntities.update(batching)
+    for entity in entities:
+        queues[entity] = queue.Queue(maxSize)
+        stats[entity] = {'queued': 0, 'delivered': 0, 'failed': 0, 'dropped': 0, 'waitedForRoom': 0,
+                         'spooled': 0, 'replayed': 0, 'batches': 0, 'totalLatency': 0.0, 'maxLatency': 0.0}
+        replayDue[entity] = 0
+        if settings['spool']:
+            waiting = alertSpool.openSpool(entity, os.path.join(spoolDirectory, entity))
+            if waiting > 0:
+                config.errorLogger(syslog.LOG_INFO, "{count} spooled alerts are waiting to be delivered to {entity}".format(
+                    count=waiting, entity=entity))
+        t = threading.Thread(target=runDelivery, args=[entity, deliver, accepted, failed, deliverBatch], name='deliver-' + entity)
+        t.daemon = True
+        t.start()
+
+def isQueued(entity, bmcHostname, event):
+    """
+        Returns True when the alert is waiting to be delivered to the entity
+    """
+    with deliveryLock:
+        return getAlertKey(entity, bmcHostname, event) in queuedAlerts
+
+def put(entity, bmcHostname, event, item):
+    """
+        Queues an alert for delivery to an entity, waiting for room when the queue of the entity is full
+
+        @param entity: the name of the notify entity
+        @param bmcHostname: string, the hostname or IP address of the bmc that logged the alert
+        @param event: dictionary containing all the alert properties
+        @param item: dictionary of additional values handed to the delivery function with the alert
+    """
+    item = dict(item)
+    item['bmcHostname'] = bmcHostname
+    item['event'] = event
+    item['queuedAt'] = time.time()
+    with deliveryLock:
+        queuedAlerts.add(getAlertKey(entity, bmcHostname, event))
+        outstanding[(entity, bmcHostname)] = outstanding.get((entity, bmcHostname), 0) + 1
+        stats[entity]['queued'] += 1
+        if queues[entity].full():
+            stats[entity]['waitedForRoom'] += 1
+    queues[entity].put(item)
+
+def callDeliver(entity, deliver, item):
+    """
+        Calls the delivery function, logging any exception it raises
+
+        @return: True if the alert was delivered
+    """
+    try:
+        return deliver(entity, item)
+    except Exception as e:
+        exc_type, exc_obj, exc_tb = sys.exc_info()
+        fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+        config.errorLogger(syslog.LOG_ERR, "Exception delivering an alert to {entity}: {type} {fname} {lineNo}".format(
+            entity=entity, type=exc_type, fname=fname, lineNo=exc_tb.tb_lineno))
+        config.errorLogger(syslog.LOG_ERR, str(e))
+        traceback.print_tb(e.__traceback__)
+        return False
+
+def callDeliverBatch(entity, deliverBatch, items):
+    """
+        Calls the batch delivery function, logging any exception it raises
+
+        @return: list with True for every alert that was delivered
+    """
+    try:
+        results = list(deliverBatch(entity, items))
+        if len(results) != len(items):
+            config.errorLogger(syslog.LOG_ERR, "The batch delivery to {entity} returned {results} results for {count} alerts".format(
+                entity=entity, results=len(results), count=len(items)))
+            return [False] * len(items)
+        return results
+    except Exception as e:
+        exc_type, exc_obj, exc_tb = sys.exc_info()
+        fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+        config.errorLogger(syslog.LOG_ERR, "Exception delivering a batch of alerts to {entity}: {type} {fname} {lineNo}".format(
+            entity=entity, type=exc_type, fname=fname, lineNo=exc_tb.tb_lineno))
+        config.errorLogger(syslog.LOG_ERR, str(e))
+        traceback.print_tb(e.__traceback__)
+        return [False] * len(items)
+
+def getSpoolRecord(item):
+    """
+        Returns the values of a queued item that are written to the spool
+    """
+    record = dict(item)
+    del record['queuedAt']
+    return record
+
+def deliverItem(entity, item, deliver, accepted, failed, result=None):
+    """
+        Delivers, spools or drops a queued alert
+
+        @param result: whether the alert was already delivered in a batch, None to deliver it now
+    """
+    bmcKey = (entity, item['bmcHostname'])
+    with deliveryLock:
+        #an alert a batch already delivered is accepted even if an earlier alert of its BMC failed
+        dropped = bmcKey in failedBmcs and not result
+    delivered = False
+    spooled = False
+    if not dropped:
+        if result is None and settings['spool'] and not alertSpool.isEmpty(entity):
+            #keep the order behind the alerts waiting in the spool
+            spooled = alertSpool.append(entity, [getSpoolRecord(item)])
+        else:
+            if result is None:
+                delivered = callDeliver(entity, deliver, item)
+            else:
+                delivered = result
+            if not delivered and settings['spool']:
+                spoolStarted = alertSpool.isEmpty(entity)
+                spooled = alertSpool.append(entity, [getSpoolRecord(item)])
+                if spooled and spoolStarted:
+                    config.errorLogger(syslog.LOG_INFO, "Spooling the alerts for {entity} until it can be notified".format(entity=entity))
+                    replayDue[entity] = time.time() + settings['retryInterval']
+    if delivered or spooled:
+        try:
+            accepted(entity, item)
+        except Exception as e:
+            config.errorLogger(syslog.LOG_ERR, "Exception accepting an alert for {entity}: {err}".format(entity=entity, err=e))
+    else:
+        try:
+            failed(entity, item)
+        except Exception as e:
+            config.errorLogger(syslog.LOG_ERR, "Exception handling a failed delivery to {entity}: {err}".format(entity=entity, err=e))
+    latency = time.time() - item['queuedAt']
+    with deliveryLock:
+        queuedAlerts.discard(getAlertKey(entity, item['bmcHostname'], item['event']))
+        if delivered:
+            stats[entity]['delivered'] += 1
+            stats[entity]['totalLatency'] += latency
+            stats[entity]['maxLatency'] = max(stats[entity]['maxLatency'], latency)
+        elif spooled:
+            stats[entity]['spooled'] += 1
+        elif dropped:
+            stats[entity]['dropped'] += 1
+        else:
+            stats[entity]['failed'] += 1
+            failedBmcs.add(bmcKey)
+        outstanding[bmcKey] -= 1
+        if outstanding[bmcKey] == 0:
+            #nothing of the BMC is left behind the failed alert, the next poll queues its alerts again
+            del outstanding[bmcKey]
+            failedBmcs.discard(bmcKey)
+
+def deliverItems(entity, items, deliver, accepted, failed, deliverBatch):
+    """
+        Delivers a batch of queued alerts with a single call to the batch delivery function, then accepts,
+        spools or fails each one by its result
+    """
+    if len(items) == 1 or (settings['spool'] and not alertSpool.isEmpty(entity)):
+        for item in items:
+            deliverItem(entity, item, deliver, accepted, failed)
+        return
+    results = callDeliverBatch(entity, deliverBatch, items)
+    with deliveryLock:
+        stats[entity]['batches'] += 1
+    for item, result in zip(items, results):
+        deliverItem(entity, item, deliver, accepted, failed, bool(result))
+
+def replaySpool(entity, deliver, deliverBatch=None):
+    """
+        Delivers the next batch of spooled alerts of an entity in order, stopping at the first failure
+
+        @return: True if the whole batch was delivered
+    """
+    records = alertSpool.read(entity, settings['replayBatch'])
+    if entity in batchEntities and records and not config.killNow:
+        results = callDeliverBatch(entity, deliverBatch, [record for position, record in records])
+    else:
+        results = None
+    lastPosition = None
+    count = 0
+    for i, (position, record) in enumerate(records):
+        if results is not None:
+            if not results[i]:
+                break
+        elif config.killNow or not callDeliver(entity, deliver, record):
+            break
+        lastPosition = position
+        count += 1
+    if count > 0:
+        alertSpool.ack(entity, lastPosition, count)
+        with deliveryLock:
+            stats[entity]['replayed'] += count
+        if alertSpool.isEmpty(entity):
+            config.errorLogger(syslog.LOG_INFO, "Delivered every spooled alert to {entity}".format(entity=entity))
+    return count == len(records)
+
+def getBatch(deliveryQueue, item):
+    """
+        Gathers the alerts queued within the batch window after the first one
+
+        @return: list of the queued items, starting with item
+    """
+    items = [item]
+    windowEnd = time.time() + settings['batchWindow']
+    while len(items) < settings['maxBatch'] and not config.killNow:
+        wait = windowEnd - time.time()
+        try:
+            if wait > 0:
+                items.append(deliveryQueue.get(timeout=wait))
+            else:
+                items.append(deliveryQueue.get_nowait())
+        except queue.Empty:
+            break
+    return items
+
+def runDelivery(entity, deliver, accepted, failed, deliverBatch=None):
+    """
+        Delivers the queued and spooled alerts of an entity until the service is stopped
+    """
+    deliveryQueue = queues[entity]
+    while not config.killNow:
+        replayWaiting = settings['spool'] and not alertSpool.isEmpty(entity)
+        wait = 1.0
+        if replayWaiting:
+            wait = min(max(replayDue[entity] - time.time(), 0), wait)
+        try:
+            if wait > 0:
+                item = deliveryQueue.get(timeout=wait)
+            else:
+                item = deliveryQueue.get_nowait()
+        except queue.Empty:
+            item = None
+        if item is not None:
+            if entity in batchEntities:
+                items = getBatch(deliveryQueue, item)
+                deliverItems(entity, items, deliver, accepted, failed, deliverBatch)
+            else:
+                items = [item]
+                deliverItem(entity, item, deliver, accepted, failed)
+            for item in items:
+                deliveryQueue.task_done()
+        if replayWaiting and time.time() >= replayDue[entity]:
+            if not replaySpool(entity, deliver, deliverBatch):
+                replayDue[entity] = time.time() + settings['retryInterval']
+
+def getDeliveryStats():
+    """
+        Returns the queue depth and delivery statistics of every entity for logging
+    """
+    deliveryStats = {}
+    with deliveryLock:
+        for entity in queues:
+            entityStats = dict(stats[entity])
+            entityStats['depth'] = queues[entity].qsize()
+            if stats[entity]['delivered'] > 0:
+                entityStats['averageLatency'] = stats[entity]['totalLatency'] / stats[entity]['delivered']
+            deliveryStats[entity] = entityStats
+    return deliveryStats
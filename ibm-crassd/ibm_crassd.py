@@ -32,9 +32,24 @@ from config import *
 import imp
 import socket
 import telemetryServer
+import sessionPool
+import pollScheduler
+import pollQueue
+import trackerStore
+import deliveryQueue
+import alertSpool
+import alertAnalyzer
+import ipmiSelService
+import ipmiSel
+import ipmiShellPool
+import alertShards
 import traceback
 import uuid
 
+#the nodes the alert shards poll, by bmcHostname, and the settings the shards start with
+shardNodes = {}
+shardSettings = {}
+
 def sigHandler(signum, frame):
     """
          Used to handle kill signals from the operating system
@@ -49,51 +64,60 @@ def sigHandler(signum, frame):
         killNow = True
         config.killNow = True
     elif(signum == signal.SIGUSR1):
-        config.errorLogger(syslog.LOG_DEBUG,"Queue size: " + str(nodes2poll.qsize()))
+        config.errorLogger(syslog.LOG_DEBUG,"Queue size: " + str(pollQueue.qsize()))
+        config.errorLogger(syslog.LOG_DEBUG,"Poll queue: " + str(pollQueue.getQueueStats()))
+        config.errorLogger(syslog.LOG_DEBUG,"BMC session pool: " + str(sessionPool.getPoolStats()))
+        config.errorLogger(syslog.LOG_DEBUG,"Poll scheduler: " + str(pollScheduler.getSchedulerStats()))
+        if config.nativeSelRetrieval and 'openbmcSel' in globals():
+            config.errorLogger(syslog.LOG_DEBUG,"SEL retrieval: " + str(openbmcSel.selStats))
+        config.errorLogger(syslog.LOG_DEBUG,"Tracker store: " + str(trackerStore.getStoreStats()))
+        config.errorLogger(syslog.LOG_DEBUG,"Delivery queues: " + str(deliveryQueue.getDeliveryStats()))
+        config.errorLogger(syslog.LOG_DEBUG,"Alert spools: " + str(alertSpool.getSpoolStats()))
+        config.errorLogger(syslog.LOG_DEBUG,"Alert analyzers: " + str(alertAnalyzer.getAnalyzerStats()))
+        if config.ipmiSelService:
+            config.errorLogger(syslog.LOG_DEBUG,"ipmi SEL parser service: " + str(ipmiSelService.getServiceStats()))
+        if config.nativeIpmiDecoding:
+            config.errorLogger(syslog.LOG_DEBUG,"ipmi SEL decoding: " + str(ipmiSel.getDecoderStats()))
+        if config.ipmiShellSessions:
+            config.errorLogger(syslog.LOG_DEBUG,"ipmitool shell pool: " + str(ipmiShellPool.getPoolStats()))
+        if config.alertProcesses > 0:
+            config.errorLogger(syslog.LOG_DEBUG,"Alert shards: " + str(alertShards.getShardStats()))
     else:
         config.errorLogger(syslog.LOG_DEBUG, "Signal received: {sigNum}".format(sigNum=signum))
 
 
 def updateTimesforLastReports(signum, frame):
     """
-        Updates BMC last reports file to current time
+        Updates the reporting times of the nodes set by updateNodeTimes.py in the tracker store
     """
-    filename = config.updateNodeTimesfile
-    if os.path.exists(filename):
-        Updatesconfparser = configparser.ConfigParser()
-        parsedFiles = Updatesconfparser.read(filename)
-        updatedNodes =[]
-        if filename in parsedFiles:
-            try:
-                for section in Updatesconfparser.sections(): 
-                    nodes = dict(Updatesconfparser.items(section))
-                    for node in config.mynodelist:
-                        for markedNode in Updatesconfparser[section]:
-                            if node['xcatNodeName'] == str(markedNode):
-                                bmcHostname = node['bmcHostname']
-                                impactednode = node['xcatNodeName']
-                                updateNotifyTimesData = {'entity': section, 'bmchostname': node['bmcHostname'], 'lastLogTime': nodes[markedNode],
-                                                         'dupTimeIDList': []}
-                                updateConfFile.put(updateNotifyTimesData)
-                                updatedNodes.append(markedNode)
-                                with lock: 
-                                    notifyList[section][bmcHostname]['lastLogTime'] = nodes[markedNode]
-                                    del notifyList[section][bmcHostname]['dupTimeIDList'][:]
-            except Exception as e:
-                exc_type, exc_obj, exc_tb = sys.exc_info()
-                fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-                config.errorLogger(LOG_ERR, "exception: {etype} {fname} {lineNum}".format(etype=exc_type, fname=fname, lineNum=exc_tb.tb_lineno))
-                config.errorLogger(LOG_ERR, "{excDetails}".format(excDetails=e))
-            try:
-                os.remove(config.updateNodeTimesfile)
-                for section in Updatesconfparser.sections():
-                    errorLogger(syslog.LOG_INFO, "Updated {entity} BMC reporting times for: {bmcList}".format(bmcList=", ".join(updatedNodes), entity=section))
-            except Exception as e:
-                errorLogger(syslog.LOG_ERR, 'Unable to delete file {filename}'.format(filename=config.updateNodeTimesfile))
-        else:
-            errorLogger(syslog.LOG_ERR, "Unable to parse updateNodes.ini file.")
-        
-
+    try:
+        updates = trackerStore.takeNodeUpdates()
+    except Exception as e:
+        errorLogger(syslog.LOG_ERR, "Unable to read the node updates from the tracker store: {err}".format(err=e))
+        return
+    updatedNodes = {}
+    try:
+        for update in updates:
+            section = update['entity']
+            bmcHostname = update['bmchostname']
+            if section not in notifyList or bmcHostname not in notifyList[section]:
+                continue
+            updateNotifyTimesData = {'entity': section, 'bmchostname': bmcHostname, 'lastLogTime': update['lastLogTime'],
+                                     'dupTimeIDList': []}
+            updateConfFile.put(updateNotifyTimesData)
+            updatedNodes.setdefault(section, []).append(update['node'])
+            with lock: 
+                notifyList[section][bmcHostname]['lastLogTime'] = update['lastLogTime']
+                del notifyList[section][bmcHostname]['dupTimeIDList'][:]
+            if config.alertProcesses > 0:
+                alertShards.sendState(bmcHostname, ('tracking', section, bmcHostname, update['lastLogTime'], []))
+    except Exception as e:
+        exc_type, exc_obj, exc_tb = sys.exc_info()
+        fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+        config.errorLogger(LOG_ERR, "exception: {etype} {fname} {lineNum}".format(etype=exc_type, fname=fname, lineNum=exc_tb.tb_lineno))
+        config.errorLogger(LOG_ERR, "{excDetails}".format(excDetails=e))
+    for section in updatedNodes:
+        errorLogger(syslog.LOG_INFO, "Updated {entity} BMC reporting times for: {bmcList}".format(bmcList=", ".join(updatedNodes[section]), entity=section))
         
         
 def errorLogger(severity, message):
@@ -151,54 +175,76 @@ def statistics2Write():
 
 def updateBMCLastReports():
     """
-         update the bmc ini file to record last log reported
+         update the tracker store to record last log reported. The updates are merged by the tracker store and
+         written together in one transaction once they are due.
     """
     global killNow
-    confParser = configparser.ConfigParser()
-    if os.path.exists(config.bmclastreports):
-        try:
-            confParser.read(config.bmclastreports)
-        except Exception as e:
-            exc_type, exc_obj, exc_tb = sys.exc_info()
-            fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-            print ("exception: ", exc_type, fname, exc_tb.tb_lineno)
     while True:
         if killNow: break
         #node contains {entity: entName, bmchostname: bmchostname, lastlogtime: timestamp, dupTimeIDList: [ID1, ID2]
-        node = updateConfFile.get()
-
-        if len(node['dupTimeIDList']) >= 1:
-            tmpList = []
-            for cerid in node['dupTimeIDList']:
-                tmpList.append(str(cerid))
-            node['dupTimeIDList'] = tmpList
-        data2write = {'lastLogTime': str(node['lastLogTime']), 'dupTimeIDList': node['dupTimeIDList'], 'hrTime': datetime.datetime.fromtimestamp(int(node['lastLogTime'])).strftime("%Y-%m-%d %H:%M:%S")}
-        statistics = statistics2Write()
-        if len(statistics)>0:
-            confParser['statistics'] = statistics
+        batch = []
         try:
-            if node['entity']+'_bmcs' not in confParser:
-                confParser[node['entity']+'_bmcs'] = {}
-            confParser[node['entity']+'_bmcs'][node['bmchostname']] = str(data2write)
-            with open(config.bmclastreports, 'w') as configfile:
-                confParser.write(configfile)
+            batch.append(updateConfFile.get(timeout=1))
+        except queue.Empty:
+            pass
+        while 0 < len(batch) < trackerStore.flushThreshold:
+            try:
+                batch.append(updateConfFile.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            for node in batch:
+                if len(node['dupTimeIDList']) >= 1:
+                    tmpList = []
+                    for cerid in node['dupTimeIDList']:
+                        tmpList.append(str(cerid))
+                    node['dupTimeIDList'] = tmpList
+                data2write = {'lastLogTime': str(node['lastLogTime']), 'dupTimeIDList': node['dupTimeIDList'], 'hrTime': datetime.datetime.fromtimestamp(int(node['lastLogTime'])).strftime("%Y-%m-%d %H:%M:%S")}
+                trackerStore.recordUpdate(node['entity'], node['bmchostname'], data2write)
+            if trackerStore.flushDue():
+                trackerStore.flush(statistics2Write())
         except Exception as e:
             exc_type, exc_obj, exc_tb = sys.exc_info()
             fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-            config.errorLogger(syslog.LOG_DEBUG,"exception: ", exc_type, fname, exc_tb.tb_lineno)
+            config.errorLogger(syslog.LOG_DEBUG,"exception: {etype} {fname} {lineNum}".format(etype=exc_type, fname=fname, lineNum=exc_tb.tb_lineno))
             traceback.print_tb(e.__traceback__)
             config.errorLogger(syslog.LOG_DEBUG,str(e))
-            continue
+        for node in batch:
+            updateConfFile.task_done()
 
-        updateConfFile.task_done()
 
 
+def getBMCAlertsOpenbmctool(node):
+    """
+        Gets alerts from an openbmc node's BMC by running openbmctool in a subprocess
+
+        @param node: A dictionary containing properties about a node
+        @return: dictionary in the openbmctool sel print format
+    """
+    bmcHostname = node['bmcHostname']
+    impactednode = node['xcatNodeName']
+    try:
+        eventBytes = subprocess.check_output([config.pyString, '/opt/ibm/ras/bin/openbmctool.py', '-H', bmcHostname, '-U', node['username'], '-P', node['password'],'-j','-t','/opt/ibm/ras/lib/policyTable.json', 'sel', 'print'])
+        eventList = eventBytes.decode('utf-8')
+    except subprocess.CalledProcessError as e:
+        if e.returncode == 1:
+            eventList = e.output.decode('utf-8')
+        else:
+            errorLogger(syslog.LOG_ERR, "An unknown error has occurred when retrieving bmc alerts from {hostname}. Error Details: {msg}".format(hostname=impactednode, msg=e.output))
+            return {'numAlerts': 0, 'failedPoll': True}
+    if eventList.find('{') != -1: #check for valid response
+        eventList = eventList[eventList.index('{'):]
+        return json.loads(eventList)
+    else:
+        errorLogger(syslog.LOG_ERR, "An invalid response was received from bmc when requesting alerts for {hostname}".format(hostname=impactednode))
+        return {'numAlerts': 0, 'failedPoll': True}
 
-def getBMCAlerts(node):
+def getBMCAlerts(node, selEntries=None):
     """
         Gets alerts from the node's BMC and puts them into a dictionary with a common format
         
         @param node: A dictionary containing properties about a node
+        @param selEntries: dictionary of SEL entries pushed by an openbmc BMC, None to read the SEL
         @return: dictionary with common format containing alerts
     """        
     eventList=""
@@ -211,30 +257,31 @@ def getBMCAlerts(node):
     try:
         #get the alerts from the bmc and place in a common format
         if(node['accessType']=="openbmcRest"):
-            #use openbmctool for openbmc rest interface
-            try:
-                eventBytes = subprocess.check_output([config.pyString, '/opt/ibm/ras/bin/openbmctool.py', '-H', bmcHostname, '-U', username, '-P', password,'-j','-t','/opt/ibm/ras/lib/policyTable.json', 'sel', 'print'])
-                eventList = eventBytes.decode('utf-8')
-            except subprocess.CalledProcessError as e:
-                if e.returncode == 1:
-                    eventList = e.output.decode('utf-8')
-                else:
-                    errorLogger(syslog.LOG_ERR, "An unknown error has occurred when retrieving bmc alerts from {hostname}. Error Details: {msg}".format(hostname=impactednode, msg=e.message))
-                    eventList = {'numAlerts': 0, 'failedPoll': True}
-            if not isString(eventList):
-                eventList = eventList.decode('utf-8')
-            if eventList.find('{') != -1: #check for valid response
-                eventList = eventList[eventList.index('{'):]
-                eventsDict = json.loads(eventList)
-                if not config.useTelem:
-                    config.nodeProperties[node['xcatNodeName']]['LastUpdateReceived'] = int(time.time())
+            if config.nativeSelRetrieval and selEntries is not None:
+                #the BMC pushed the new entries, parse them without reading the sel
+                openbmcSel.polledEntries[bmcHostname] = selEntries
+                eventsDict = openbmcSel.parseSELEntries(selEntries)
+            elif config.nativeSelRetrieval:
+                #retrieve and parse the sel in process using a cached session and policy table
+                eventsDict = openbmcSel.getSELEvents(node)
             else:
-                errorLogger(syslog.LOG_ERR, "An invalid response was received from bmc when requesting alerts for {hostname}".format(hostname=impactednode))
-                eventsDict = {'numAlerts': 0, 'failedPoll': True}
+                eventsDict = getBMCAlertsOpenbmctool(node)
+            if 'failedPoll' not in eventsDict and not config.useTelem:
+                config.nodeProperties[node['xcatNodeName']]['LastUpdateReceived'] = int(time.time())
             eventsDict = updateEventDictionary(eventsDict)
+        elif(node['accessType']=="ipmi" and config.nativeIpmiDecoding):
+            #read the sel with ipmitool and decode it in process with the event index
+            eventsDict = ipmiSel.getSELEvents(node)
+            if 'failedPoll' not in eventsDict:
+                config.nodeProperties[node['xcatNodeName']]['LastUpdateReceived'] = int(time.time())
         elif(node['accessType']=="ipmi"):
             #use java sel parser and ipmitool to get alerts from ipmi node
-            eventList = subprocess.check_output(['java', '-jar', '/opt/ibm/ras/lib/crassd.jar', bmcHostname, username, password]).decode('utf-8')
+            eventList = None
+            if config.ipmiSelService:
+                #the resident parser service keeps the lookup table loaded
+                eventList = ipmiSelService.getSEL(bmcHostname, username, password)
+            if eventList is None:
+                eventList = subprocess.check_output(['java', '-jar', '/opt/ibm/ras/lib/crassd.jar', bmcHostname, username, password]).decode('utf-8')
             if eventList.find('{') != -1: #check for valid response
                 eventList = eventList[eventList.index('{'):] 
                 eventsDict = json.loads(eventList)
@@ -287,230 +334,426 @@ def analyzeit(event, username, bmcHostname, password, accessType):
         Returns True if the event is valid to report upstream, otherwise returns false.
     """
     analysisPassed = True
-    pyVersion = config.pyString
     if(event['CerID'] in config.analyzeIDList and accessType == 'openbmcRest'):
-        script2call = 'analyze{id}.py'.format(id=event['CerID'])
-        if 'FQPSPW0034M' in script2call:
-            pyVersion = 'python'
-        command = [pyVersion, script2call, '-c', '-U', username, '-H', bmcHostname, '-P', password, '-n', event['logNum']]
-        if 'clear' in config.analysisOptions[event['CerID']]:
-            command.append('-a')
-        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-        result, err = proc.communicate()
-        if 'false' in result.decode('utf-8').lower():
-            analysisPassed = False
+        node = {'bmcHostname': bmcHostname, 'username': username, 'password': password, 'xcatNodeName': bmcHostname}
+        selEntries = None
+        if config.nativeSelRetrieval:
+            selEntries = openbmcSel.getPolledEntries(bmcHostname)
+        analysisPassed = alertAnalyzer.analyze(event, node, selEntries, config.analysisOptions[event['CerID']])
+        if not analysisPassed:
             with lock: 
                 config.analyzeIDcount[event['CerID']] +=1
     return analysisPassed
        
-def processAlert(event, bmcHostname, impactednode, username, password, accessType):   
+def isNewAlert(key, bmcHostname, event):
     """
-        Processes the given alert and notifies the correct entity. If unable to report, increments pollNotifyFailed
-        for the notify entity. 
-       
+        Returns True if the alert was not reported to the notify entity yet
+
+       @param key: the name of the notify entity
+       @param bmcHostname: The identifier used for the BMC
+       @param event: Dictionary containing all the alert properties
+    """
+    with lock:
+        dupList = notifyList[key][bmcHostname]['dupTimeIDList']
+        lastlogtime = notifyList[key][bmcHostname]['lastLogTime']
+        failedThisPoll = notifyList[key][bmcHostname]['pollNotifyFailed']
+    return (event['timestamp']>lastlogtime or
+            (event['timestamp']==lastlogtime and event['CerID'] not in dupList) and
+            failedThisPoll==0)
+
+def processAlert(event, bmcHostname, impactednode, username, password, accessType, alerts=None):
+    """
+        Processes the given alert and queues it for delivery to every notify entity it is new for. The delivery
+        worker of the entity notifies it and updates the tracking times.
+
        @param event: Dictionary containing all the alert properties
-       @return: True if the notifyTimes need updated, False otherwise
+       @param alerts: list to add a tuple of the alert, the result of its analysis and the entities it is new for
+       to instead of queueing it, used in the alert shard processes
     """
-    updateTimes = False
     analysisPassed = None
+    newFor = []
     for key in notifyList:
-        updateNotifyTimes = False
-        
-        with lock:
-            receiveEntityStatus = notifyList[key]['receiveEntityDown']
-            dupList = notifyList[key][bmcHostname]['dupTimeIDList']
-            func = notifyList[key]['function']
-            notifyList[key]['failedFirstTry'] = False
-            lastlogtime = notifyList[key][bmcHostname]['lastLogTime']
-            failedThisPoll = notifyList[key][bmcHostname]['pollNotifyFailed']
-        newAlert = (event['timestamp']>lastlogtime or 
-                    (event['timestamp']==lastlogtime and event['CerID'] not in dupList) and
-                    failedThisPoll==0)
-        if(newAlert):
+        newAlert = isNewAlert(key, bmcHostname, event)
+        if(newAlert and (alerts is not None or not deliveryQueue.isQueued(key, bmcHostname, event))):
             #only report new alerts
             if analysisPassed is None:
                 #run any available analysis scripts
                 analysisPassed = analyzeit(event, username, bmcHostname, password, accessType)
-            if analysisPassed:
-                #process the valid alert
-                repsuccess = func(event, impactednode, notifyList) 
-                with lock:
-                    notifyList[key]['successfullyReported'] = repsuccess
-                if repsuccess:
-                    updateTrackingTimes(event, notifyList[key], bmcHostname)
-                    updateNotifyTimes = True
-                else:
-                    with lock:
-                        notifyList[key]['failedFirstTry'] = True
-                        receiveEntityStatus = notifyList[key]['receiveEntityDown']
-                    if(receiveEntityStatus== False):
-                        with lock:
-                            func = notifyList[key]['function']
-                        repsuccess = func(event, impactednode, notifyList)
-                        
-                        with lock:
-                            notifyList[key]['successfullyReported'] = repsuccess 
-                        if(repsuccess):
-                            updateTrackingTimes(event, notifyList[key], bmcHostname)
-                            updateNotifyTimes = True
-                        else:
-                            with lock:
-                                notifyList[key][bmcHostname]['pollNotifyFailed'] += 1
-                    else:
-                        with lock:
-                            notifyList[key][bmcHostname]['pollNotifyFailed'] += 1
+                if not analysisPassed:
+                    errorLogger(syslog.LOG_INFO, "Filtered alert {id} on {thenode}".format(id=event['CerID'], thenode=impactednode))
+            if alerts is not None:
+                newFor.append(key)
             else:
-                #analysis found a false alert, filter it
-                updateTrackingTimes(event, notifyList[key], bmcHostname)
-                updateNotifyTimes = True
-                errorLogger(syslog.LOG_INFO, "Filtered alert {id} on {thenode}".format(id=event['CerID'], thenode=impactednode))
-            if updateNotifyTimes:
-                #node contains {entity: entName, bmchostname: bmchostname, lastlogtime: timestamp, dupTimeIDList: [ID1, ID2]     
-                updateNotifyTimesData = {'entity': key, 'bmchostname': bmcHostname, 'lastLogTime': notifyList[key][bmcHostname]['lastLogTime'],
-                                          'dupTimeIDList': notifyList[key][bmcHostname]['dupTimeIDList']}
-                updateConfFile.put(updateNotifyTimesData)
+                #filtered alerts are queued too, so the tracking times move past them in order
+                deliveryQueue.put(key, bmcHostname, event, {'impactednode': impactednode, 'deliver': analysisPassed})
+    if newFor:
+        alerts.append((event, analysisPassed, newFor))
+
+def deliverAlert(key, item):
+    """
+        Notifies an entity of a queued or spooled alert. Runs in the delivery worker thread of the entity.
+       
+       @param key: the name of the notify entity
+       @param item: the queued alert, see deliveryQueue.put
+       @return: True if the alert was reported or filtered, False if the entity could not be notified
+    """
+    event = item['event']
+    if item['deliver']:
+        #process the valid alert
+        with lock:
+            func = notifyList[key]['function']
+            notifyList[key]['failedFirstTry'] = False
+        repsuccess = func(event, item['impactednode'], notifyList) 
+        with lock:
+            notifyList[key]['successfullyReported'] = repsuccess
+        if not repsuccess:
+            with lock:
+                notifyList[key]['failedFirstTry'] = True
+                receiveEntityStatus = notifyList[key]['receiveEntityDown']
+            if(receiveEntityStatus== False):
+                repsuccess = func(event, item['impactednode'], notifyList)
+                with lock:
+                    notifyList[key]['successfullyReported'] = repsuccess 
+        return repsuccess
+    return True
+
+def deliverAlertBatch(key, items):
+    """
+        Notifies an entity of a batch of queued or spooled alerts with the notifyBatch function of its plugin.
+        Runs in the delivery worker thread of the entity.
+       
+       @param key: the name of the notify entity
+       @param items: list of the queued alerts, see deliveryQueue.put
+       @return: list with True for every alert that was reported or filtered
+    """
+    results = [True] * len(items)
+    pending = [i for i in range(len(items)) if items[i]['deliver']]
+    if not pending:
+        return results
+    with lock:
+        func = notifyList[key]['batchFunction']
+        notifyList[key]['failedFirstTry'] = False
+    #alerts the plugin gives no result for are failed
+    for i in pending:
+        results[i] = False
+    for i, repsuccess in zip(pending, func([(items[i]['event'], items[i]['impactednode']) for i in pending], notifyList)):
+        results[i] = repsuccess
+    failedAlerts = [i for i in pending if not results[i]]
+    with lock:
+        notifyList[key]['successfullyReported'] = not failedAlerts
+    if failedAlerts:
+        with lock:
+            notifyList[key]['failedFirstTry'] = True
+            receiveEntityStatus = notifyList[key]['receiveEntityDown']
+        if(receiveEntityStatus== False):
+            for i, repsuccess in zip(failedAlerts, func([(items[i]['event'], items[i]['impactednode']) for i in failedAlerts], notifyList)):
+                results[i] = repsuccess
+            with lock:
+                notifyList[key]['successfullyReported'] = all(results[i] for i in failedAlerts)
+    return results
+
+def alertAccepted(key, item):
+    """
+        Updates the tracking times once an alert was reported to an entity or spooled for it
+       
+       @param key: the name of the notify entity
+       @param item: the queued alert, see deliveryQueue.put
+    """
+    event = item['event']
+    bmcHostname = item['bmcHostname']
+    updateTrackingTimes(event, notifyList[key], bmcHostname)
+    #node contains {entity: entName, bmchostname: bmchostname, lastlogtime: timestamp, dupTimeIDList: [ID1, ID2]     
+    with lock:
+        updateNotifyTimesData = {'entity': key, 'bmchostname': bmcHostname, 'lastLogTime': notifyList[key][bmcHostname]['lastLogTime'],
+                                 'dupTimeIDList': list(notifyList[key][bmcHostname]['dupTimeIDList'])}
+    updateConfFile.put(updateNotifyTimesData)
+    if config.alertProcesses > 0:
+        alertShards.sendState(bmcHostname, ('tracking', key, bmcHostname, updateNotifyTimesData['lastLogTime'],
+                                            list(updateNotifyTimesData['dupTimeIDList'])))
+
+def deliveryFailed(key, item):
+    """
+        Records an alert that could not be delivered to an entity, so it is read again by a later poll
+       
+       @param key: the name of the notify entity
+       @param item: the queued alert, see deliveryQueue.put
+    """
+    bmcHostname = item['bmcHostname']
+    with lock:
+        notifyList[key][bmcHostname]['pollNotifyFailed'] += 1
+    if config.alertProcesses > 0:
+        #the SEL cursors are kept by the alert shard of the BMC
+        alertShards.sendState(bmcHostname, ('failed', key, bmcHostname))
+    else:
+        dropSELCursors(bmcHostname)
+
+def dropSELCursors(bmcHostname):
+    """
+        Drops the SEL cursors of a BMC, so its next poll reads the alerts the cursors may have moved past
+    """
+    if config.nativeSelRetrieval and 'openbmcSel' in globals():
+        openbmcSel.dropCursor(bmcHostname)
+    if config.nativeIpmiDecoding:
+        ipmiSel.dropCursor(bmcHostname)
 
  
+def pollBMC(node, selEntries, alerts=None):
+    """
+         Gets the alerts of a node's BMC and queues the ones that are new for delivery
+
+         @param node: A dictionary containing properties about a node
+         @param selEntries: dictionary of SEL entries pushed by an openbmc BMC, None to read the SEL
+         @param alerts: list to add the new alerts to instead of queueing them, see processAlert
+         @return: True if the BMC could not be polled
+    """
+    eventsDict = {}
+    nodeCommsLost = False
+    pollFailed = True
+    selProcessed = False
+    name = threading.currentThread().getName()
+    bmcHostname = node['bmcHostname']
+    impactednode = node['xcatNodeName']
+    username = node['username']
+    password = node['password']
+    resetFailedNotify(bmcHostname)
+    try:
+        config.errorLogger(syslog.LOG_DEBUG, str(name +": " + bmcHostname))
+        #get the alerts from the bmc and place in a common format
+        eventsDict = getBMCAlerts(node, selEntries)
+        pollFailed = 'failedPoll' in eventsDict
+        
+        #process the alerts
+        if (eventsDict['numAlerts'] == 0):
+            #node poll was successful and no alerts to process
+            node['pollFailedCount'] = 0
+            selProcessed = True
+        elif('failedPoll' in eventsDict):
+            node['pollFailedCount'] += 1
+            if(node['pollFailedCount'] != 2):
+                #create a log entry for failing to process sel entries
+                errorLogger(syslog.LOG_ERR, "Failed to process BMC alerts for {host} three or more times".format(host=impactednode))
+        else:
+            #process the received alerts
+            for i in range(len(eventsDict)-1):
+                if(killNow):
+                    break
+                event = "event" +str(i)
+                if "error" in eventsDict[event]:
+                    node['pollFailedCount'] = 0
+                    begIndex = eventsDict[event]['error'].rfind(":") + 2
+                    missingKey = eventsDict[event]['error'][begIndex:]
+                    if(missingKey not in missingEvents.keys()):
+                        with lock: 
+                            missingEvents[missingKey] = True
+                        errorLogger(syslog.LOG_ERR, "Event not found in lookup table for node {node}: {alert}".format(alert=missingKey, node=impactednode))
+                else:
+                    #check for failure to poll the bmc
+                    if(eventsDict[event]['CerID'] in networkErrorList):
+                        if (nodeCommsLost == False):
+                            nodeCommsLost = True
+                            pollFailed = True
+                            node['pollFailedCount'] += 1
+                        if(node['pollFailedCount'] != 2):
+                            #forward the network connection failure at 3 consecutive failures. 
+                            continue
+
+                    #process the alerts
+                    processAlert(eventsDict[event], bmcHostname, impactednode, username, password, node['accessType'], alerts)
+            selProcessed = not nodeCommsLost
+    except Exception as e:
+        exc_type, exc_obj, exc_tb = sys.exc_info()
+        fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+        config.errorLogger(syslog.LOG_DEBUG,"exception: {type} {fname} {lineNo}".format( type=exc_type, fname=fname, lineNo=exc_tb.tb_lineno))
+        config.errorLogger(syslog.LOG_DEBUG, str(e))
+    finally:
+        #the alerts are only queued here, a delivery that fails later drops the cursors with dropSELCursors
+        if node['accessType'] == 'openbmcRest' and config.nativeSelRetrieval:
+            openbmcSel.finishPoll(bmcHostname, selProcessed)
+        elif node['accessType'] == 'ipmi' and config.nativeIpmiDecoding:
+            ipmiSel.finishPoll(bmcHostname, selProcessed)
+    return pollFailed
+
 def BMCEventProcessor():
     """
          processes alerts and is run in child threads
     """  
-    eventsDict = {};
-    global notifyList
     global killNow
-    global networkErrorList
     while True:
-        nodeCommsLost = False
         if killNow: 
             break
-        else:
-            node = nodes2poll.get()
-            eventList = {}
-            bmcEvent = {}
-            name = threading.currentThread().getName()
-            bmcHostname = node['bmcHostname']
-            impactednode = node['xcatNodeName']
-            username = node['username']
-            password = node['password']
-            resetFailedNotify(bmcHostname)
-            try:
-                config.errorLogger(syslog.LOG_DEBUG, str(name +": " + bmcHostname))
-                #get the alerts from the bmc and place in a common format
-                eventsDict = getBMCAlerts(node)
-                
-                #process the alerts
-                if (eventsDict['numAlerts'] == 0):
-                    #node poll was successful and no alerts to process
-                    node['pollFailedCount'] = 0
-                    continue
-                elif('failedPoll' in eventsDict):
-                    node['pollFailedCount'] += 1
-                    if(node['pollFailedCount'] != 2):
-                        #create a log entry for failing to process sel entries
-                        errorLogger(syslog.LOG_ERR, "Failed to process BMC alerts for {host} three or more times".format(host=impactednode))
-                        continue
-                else:
-                    #process the received alerts
-                    for i in range(len(eventsDict)-1):
-                        if(killNow):
-                            break
-                        event = "event" +str(i)
-                        bmcEvent = eventsDict[event]
-                        if "error" in eventsDict[event]:
-                            node['pollFailedCount'] = 0
-                            begIndex = eventsDict[event]['error'].rfind(":") + 2
-                            missingKey = eventsDict[event]['error'][begIndex:]
-                            if(missingKey not in missingEvents.keys()):
-                                with lock: 
-                                    missingEvents[missingKey] = True
-                                errorLogger(syslog.LOG_ERR, "Event not found in lookup table for node {node}: {alert}".format(alert=missingKey, node=impactednode))
-                        else:
-                            #check for failure to poll the bmc
-                            if(eventsDict[event]['CerID'] in networkErrorList):
-                                if (nodeCommsLost == False):
-                                    nodeCommsLost = True
-                                    node['pollFailedCount'] += 1
-                                if(node['pollFailedCount'] != 2):
-                                    #forward the network connection failure at 3 consecutive failures. 
-                                    continue
+        node, selEntries = pollQueue.get()
+        pollStarted = time.time()
+        pollFailed = True
+        try:
+            pollFailed = pollBMC(node, selEntries)
+        finally:
+            pollScheduler.pollComplete(node, not pollFailed, pollStarted, pollQueue.getToken(node))
+            pollQueue.done(node)
 
-                            #process the alerts
-                            processAlert(eventsDict[event], bmcHostname, impactednode, username, password, node['accessType'])                                   
-                nodes2poll.task_done()
-            except Exception as e:
-                exc_type, exc_obj, exc_tb = sys.exc_info()
-                fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-                config.errorLogger(syslog.LOG_DEBUG,"exception: {type} {fname} {lineNo}".format( type=exc_type, fname=fname, lineNo=exc_tb.tb_lineno))
-                config.errorLogger(syslog.LOG_DEBUG, str(e))
-            eventsDict.clear()
+def dispatchPolls():
+    """
+         Sends the nodes taken from the poll queue to the alert shards that own them
+    """
+    global killNow
+    while not killNow:
+        node, selEntries = pollQueue.get(timeout=1)
+        if node is None:
+            continue
+        resetFailedNotify(node['bmcHostname'])
+        alertShards.dispatch(node['bmcHostname'], selEntries)
+
+def shardPollDone(bmcHostname, result):
+    """
+         Queues the alerts found by the poll of a BMC in its alert shard for delivery and finishes the poll.
+         Runs in the service process.
+
+         @param bmcHostname: The identifier used for the BMC
+         @param result: the tuple returned by shardPoll, None when the shard exited during the poll
+    """
+    node = shardNodes[bmcHostname]
+    pollStarted = time.time()
+    pollFailed = True
+    try:
+        if result is not None:
+            pollFailed, pollStarted, alerts = result
+            for event, analysisPassed, keys in alerts:
+                if not analysisPassed:
+                    with lock:
+                        config.analyzeIDcount[event['CerID']] += 1
+                for key in keys:
+                    #the shard may not have the reporting times of the deliveries that finished during the poll yet
+                    if(key in notifyList and isNewAlert(key, bmcHostname, event) and not deliveryQueue.isQueued(key, bmcHostname, event)):
+                        deliveryQueue.put(key, bmcHostname, event, {'impactednode': node['xcatNodeName'], 'deliver': analysisPassed})
+    except Exception as e:
+        exc_type, exc_obj, exc_tb = sys.exc_info()
+        fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+        config.errorLogger(syslog.LOG_DEBUG,"exception: {type} {fname} {lineNo}".format( type=exc_type, fname=fname, lineNo=exc_tb.tb_lineno))
+        config.errorLogger(syslog.LOG_DEBUG, str(e))
+        traceback.print_tb(e.__traceback__)
+    finally:
+        pollScheduler.pollComplete(node, not pollFailed, pollStarted, pollQueue.getToken(node))
+        pollQueue.done(node)
+
+def initShard(index):
+    """
+         Prepares an alert shard process to poll its BMCs. Runs in the shard when it starts.
+
+         @param index: the index of the shard
+    """
+    global lock
+    #the shard does not share the locks, sessions and shells of the service process
+    lock = threading.Lock()
+    config.lock = lock
+    sessionPool.resetPool()
+    ipmiShellPool.resetPool()
+    set_procname('ibm-crassd-alerts{index}'.format(index=index).encode('utf-8'))
+    getIDstoAnalyze(shardSettings['confParser'])
+    startAnalyzers(shardSettings['analysisThreads'], shardSettings['analysisTimeout'])
+    if config.ipmiSelService:
+        config.ipmiSelService = ipmiSelService.start(shardSettings['ipmiSelWorkers'])
+
+def shardPoll(bmcHostname, selEntries):
+    """
+         Polls a BMC in its alert shard
+
+         @param bmcHostname: The identifier used for the BMC
+         @param selEntries: dictionary of SEL entries pushed by an openbmc BMC, None to read the SEL
+         @return: tuple of True if the BMC could not be polled, the time the poll started and the list of the
+         new alerts, see processAlert
+    """
+    alerts = []
+    pollStarted = time.time()
+    pollFailed = pollBMC(shardNodes[bmcHostname], selEntries, alerts)
+    return (pollFailed, pollStarted, alerts)
+
+def updateShardState(update):
+    """
+         Applies a change to the reporting state of a BMC made by the service process. Runs in the alert shard
+         of the BMC.
+
+         @param update: tuple of the kind of change and its values. tracking sets the reporting times of an entity
+         for a BMC, failed records an alert that could not be delivered and entities lists the notify entities
+         whose plugin was loaded.
+    """
+    if update[0] == 'tracking':
+        key, bmcHostname, lastLogTime, dupTimeIDList = update[1:]
+        with lock:
+            if key in notifyList and bmcHostname in notifyList[key]:
+                notifyList[key][bmcHostname]['lastLogTime'] = lastLogTime
+                notifyList[key][bmcHostname]['dupTimeIDList'] = dupTimeIDList
+    elif update[0] == 'failed':
+        key, bmcHostname = update[1:]
+        with lock:
+            if key in notifyList:
+                notifyList[key][bmcHostname]['pollNotifyFailed'] = notifyList[key][bmcHostname].get('pollNotifyFailed', 0) + 1
+        dropSELCursors(bmcHostname)
+    elif update[0] == 'entities':
+        with lock:
+            for key in list(notifyList.keys()):
+                if key not in update[1]:
+                    del notifyList[key]
+
+def restoreShard(index):
+    """
+         Returns the reporting state of the BMCs of an alert shard that was started again. The new shard starts
+         with the state the service process had when the shards were first started. Runs in the service process.
+
+         @param index: the index of the shard
+         @return: list of the updates for updateShardState
+    """
+    updates = [('entities', list(notifyList.keys()))]
+    with lock:
+        for key in notifyList:
+            for bmcHostname in notifyList[key]:
+                if bmcHostname in shardNodes and alertShards.getShard(bmcHostname) == index:
+                    updates.append(('tracking', key, bmcHostname, notifyList[key][bmcHostname]['lastLogTime'],
+                                    list(notifyList[key][bmcHostname]['dupTimeIDList'])))
+    return updates
+
+def stopShard():
+    """
+         Ends the services used by an alert shard when it stops
+    """
+    alertAnalyzer.shutdown()
+    ipmiSelService.stop()
+    ipmiShellPool.closePool()
+    sessionPool.closePool()
             
             
 def loadBMCLastReports():
     """
-         Loads the previously reported alerts from a configuration file
+         Loads the previously reported alerts from the tracker store
            
          @return: modifies global list of monitored nodes with previously reported alerts
     """ 
-    if os.path.exists(config.bmclastreports):
-        confParser = configparser.ConfigParser()
-        global notifyList
-        try: 
-            confParser.read(config.bmclastreports)
-        except Exception as e:
-            exc_type, exc_obj, exc_tb = sys.exc_info()
-            fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-            print ("exception: ", exc_type, fname, exc_tb.tb_lineno)
-        try:
-            if 'app_info' in confParser:
-                if 'uuid' in confParser['app_info'] and confParser['app_info']['uuid'].strip() !='':
-                    config.crassd_uuid = confParser['app_info']['uuid']
-                else:
-                    config.crassd_uuid = str(uuid.uuid1())
-                    confParser['app_info']['uuid'] = config.crassd_uuid
-                    with open(config.bmclastreports, 'w') as configfile:
-                        confParser.write(configfile)
-            else:
-                config.crassd_uuid = str(uuid.uuid1())
-                confParser['app_info'] = {}
-                confParser['app_info']['uuid'] = config.crassd_uuid
-                with open(config.bmclastreports, 'w') as configfile:
-                    confParser.write(configfile)
-            if 'statistics' in confParser:
-                for key in dict(confParser['statistics']):
-                    id = key.split('suppressed_')[1].upper()
-                    config.analyzeIDcount[id] = int(confParser['statistics'][key])
-            for key in notifyList:
-                if str(key) + '_bmcs' not in confParser:
-                    errorLogger(syslog.LOG_ERR, "No section: "+str(key) +"_bmcs in ini file. All bmc events will be forwarded to entities being notified. ")
-                    continue
-                bmcs = dict(confParser.items(str(key) + '_bmcs'))
-                for node in mynodelist:
-                    if node['bmcHostname'] in bmcs:
-                        bmcString = str(bmcs[node['bmcHostname']]).replace("\'", "\"")
-                        bmcs[node['bmcHostname']]= json.loads(bmcString)
-                        notifyList[key][node['bmcHostname']]['lastLogTime'] = str(bmcs[node['bmcHostname']]['lastLogTime'])
-                        notifyList[key][node['bmcHostname']]['dupTimeIDList'] = bmcs[node['bmcHostname']]['dupTimeIDList']
-        except KeyError:
-            errorLogger(syslog.LOG_ERR, "No section: "+str(key) + "_bmcs in ini file. All bmc events will be forwarded to entities being notified. ")
-        except configparser.NoSectionError:
-            errorLogger(syslog.LOG_ERR, "No section: "+str(key) +"_bmcs in ini file. All bmc events will be forwarded to entities being notified. ")
-
-    else:
-        try:
-            #tracker file doesn't exist. create UUID and write initial tracker file
-            confParser = configparser.ConfigParser()
+    global notifyList
+    try:
+        #imports the bmclastreports.ini file the first time the tracker store is opened
+        trackerStore.load(config.bmclastreports)
+        config.crassd_uuid = trackerStore.getAppInfo('uuid')
+        if config.crassd_uuid is None or config.crassd_uuid.strip() == '':
             config.crassd_uuid = str(uuid.uuid1())
-            confParser['app_info'] = {}
-            confParser['app_info']['uuid'] = config.crassd_uuid
-            with open(config.bmclastreports, 'w') as configfile:
-                confParser.write(configfile)
-        except Exception as e:
-            config.errorLogger(syslog.LOG_ERR, "Failed to create a new tracker file. Exiting.")
-            exc_type, exc_obj, exc_tb = sys.exc_info()
-            fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-            config.errorLogger(syslog.LOG_DEBUG, "Exception: Error: {err}, Details: {etype}, {fname}, {lineno}".format(err=e, etype=exc_type, fname=fname, lineno=exc_tb.tb_lineno))
-            traceback.print_tb(e.__traceback__)
-            sys.exit(1)
+            trackerStore.setAppInfo('uuid', config.crassd_uuid)
+        statistics = trackerStore.getStatistics()
+    except Exception as e:
+        config.errorLogger(syslog.LOG_ERR, "Failed to open the tracker store for {fname}. Exiting.".format(fname=config.bmclastreports))
+        exc_type, exc_obj, exc_tb = sys.exc_info()
+        fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+        config.errorLogger(syslog.LOG_DEBUG, "Exception: Error: {err}, Details: {etype}, {fname}, {lineno}".format(err=e, etype=exc_type, fname=fname, lineno=exc_tb.tb_lineno))
+        traceback.print_tb(e.__traceback__)
+        sys.exit(1)
+    for key in statistics:
+        id = key.split('suppressed_')[1].upper()
+        config.analyzeIDcount[id] = int(statistics[key])
+    for key in notifyList:
+        bmcs = trackerStore.getCursors(str(key))
+        if len(bmcs) == 0:
+            errorLogger(syslog.LOG_ERR, "No reporting times for "+str(key) +" in the tracker store. All bmc events will be forwarded to entities being notified. ")
+            continue
+        for node in mynodelist:
+            if node['bmcHostname'] in bmcs:
+                notifyList[key][node['bmcHostname']]['lastLogTime'] = str(bmcs[node['bmcHostname']]['lastLogTime'])
+                notifyList[key][node['bmcHostname']]['dupTimeIDList'] = bmcs[node['bmcHostname']]['dupTimeIDList']
 
 def getPlugins():
     """
@@ -587,6 +830,8 @@ def createNodeList(confParser):
     if needWebsocket:
         global notificationlistener
         import notificationlistener
+        global openbmcSel
+        import openbmcSel
     
     #check the node count to see if nodes were specified
     if len(mynodelist)<1:
@@ -698,6 +943,9 @@ def initPlugins(confParser):
             if isString(notifyList[entity]['function']):
                 if hasattr(plugin, notifyList[entity]["function"]):
                     notifyList[entity]["function"] = getattr(plugin, notifyList[entity]["function"])
+                    #plugins can also notify a batch of alerts at once
+                    if hasattr(plugin, 'notifyBatch'):
+                        notifyList[entity]['batchFunction'] = plugin.notifyBatch
 
  
 def configurePushNotifications():   
@@ -719,7 +967,7 @@ def queryAllNodes():
     """ 
     for node in mynodelist:
         #loads all nodes into the queue for retrieving the current state of the nodes
-        nodes2poll.put(node)
+        pollQueue.put(node)
         
 
 def getMinimumPollingInterval(numWorkerThreads):
@@ -837,6 +1085,8 @@ def autoConfigureNodes(confParser):
         if needWebsocket:
             global notificationlistener
             import notificationlistener
+            global openbmcSel
+            import openbmcSel
         updateConfigFileNodes(confParser, nodes2monitor)
         getConfigPaths(True)
     else:
@@ -845,6 +1095,10 @@ def autoConfigureNodes(confParser):
         sys.exit(1)
 
 def getIDstoAnalyze(confParser):
+    """
+        Builds the list of alert IDs to analyze from the analysis section of the configuration, or from the
+        analysis modules in the working directory when the section cannot be read
+    """
     directory = os.getcwd() + os.sep
     filelist = [afile for afile in os.listdir(directory) if os.path.isfile(''.join([directory, afile]))]
     try:
@@ -855,30 +1109,40 @@ def getIDstoAnalyze(confParser):
                     config.analysisOptions[upperID] = 'clear'
                 elif 'filter' in confParser['analysis'][id]:
                     config.analysisOptions[upperID] = 'filter'
-                if id not in config.analyzeIDList:
+                else:
+                    #disabled analysis is not loaded
+                    continue
+                if upperID not in config.analyzeIDList:
                     with lock:
                         config.analyzeIDList.append(upperID)
-                        config.analyzeIDcount[upperID] = 0
-            for id in config.analyzeIDList:
-                tempfilename = 'analyze{id}.py'.format(id=upperID)
-                if tempfilename not in filelist:
-                    errorLogger(syslog.LOG_CRIT, "Unable to find analysis script {scriptName}. Continuing to run without it.".format(scriptName=tempfilename))
-                    with lock:
-                        config.analyzeIDList.remove(upperID)
-                        config.analyzeIDcount.pop(upperID, None)
+                        config.analyzeIDcount.setdefault(upperID, 0)
             return
     except Exception as e:
         errorLogger(syslog.LOG_CRIT, "Unable to read the analysis section of the ibm-crassd configuration file. Attempting to run with the installed analysis scripts in filter mode.")
 
     for f in filelist:
-        if 'analyze' in f:
+        if f.startswith('analyze') and f.endswith('.py'):
             id = f.split('analyze')[1].split('.')[0]
             if id not in config.analyzeIDList:
                 with lock:
                     config.analyzeIDList.append(id)
-                    config.analyzeIDcount[id] = 0
+                    config.analyzeIDcount.setdefault(id, 0)
                     config.analysisOptions[id] = 'filter'
 
+def startAnalyzers(workers, timeout):
+    """
+        Loads the analysis modules into the service and drops the alert IDs whose module could not be loaded
+        
+        @param workers: the most analyses run at the same time
+        @param timeout: the number of seconds to wait for an analysis before reporting the alert
+    """
+    loaded = alertAnalyzer.start(list(config.analyzeIDList), os.getcwd(), workers, timeout)
+    with lock:
+        for id in list(config.analyzeIDList):
+            if id not in loaded:
+                config.analyzeIDList.remove(id)
+                config.analyzeIDcount.pop(id, None)
+
 def updateMaxThreads(confParser):
     """
         Called after an autoconfigure to set the maxThreads variable dynamically to ensure best performance
@@ -923,6 +1187,43 @@ def initialize():
             config.enableDebug = True
         else:
             config.enableDebug = False
+    if 'nativeSelRetrieval' in confParser['base_configuration']:
+        if 'False' in confParser['base_configuration']['nativeSelRetrieval']:
+            config.nativeSelRetrieval = False
+    if 'nativeIpmiDecoding' in confParser['base_configuration']:
+        if 'False' in confParser['base_configuration']['nativeIpmiDecoding']:
+            config.nativeIpmiDecoding = False
+    if 'ipmiSelService' in confParser['base_configuration']:
+        if 'False' in confParser['base_configuration']['ipmiSelService']:
+            config.ipmiSelService = False
+    ipmiSelWorkers = 16
+    try:
+        if 'ipmiSelWorkers' in confParser['base_configuration']:
+            ipmiSelWorkers = max(int(confParser['base_configuration']['ipmiSelWorkers']), 1)
+    except ValueError:
+        errorLogger(syslog.LOG_ERR, "Invalid ipmiSelWorkers in the base configuration. Using the default of 16.")
+    if 'ipmiShellSessions' in confParser['base_configuration']:
+        if 'False' in confParser['base_configuration']['ipmiShellSessions']:
+            config.ipmiShellSessions = False
+    ipmiShellsPerBMC = 2
+    try:
+        if 'ipmiShellsPerBMC' in confParser['base_configuration']:
+            ipmiShellsPerBMC = max(int(confParser['base_configuration']['ipmiShellsPerBMC']), 1)
+    except ValueError:
+        errorLogger(syslog.LOG_ERR, "Invalid ipmiShellsPerBMC in the base configuration. Using the default of 2.")
+    ipmiShellIdleTimeout = 120
+    try:
+        if 'ipmiShellIdleTimeout' in confParser['base_configuration']:
+            ipmiShellIdleTimeout = max(int(confParser['base_configuration']['ipmiShellIdleTimeout']), 1)
+    except ValueError:
+        errorLogger(syslog.LOG_ERR, "Invalid ipmiShellIdleTimeout in the base configuration. Using the default of 120 seconds.")
+    alertProcesses = 0
+    try:
+        if 'alertProcesses' in confParser['base_configuration']:
+            alertProcesses = max(int(confParser['base_configuration']['alertProcesses']), 0)
+    except ValueError:
+        errorLogger(syslog.LOG_ERR, "Invalid alertProcesses in the base configuration. Polling the BMCs in the service process.")
+    config.alertProcesses = min(alertProcesses, len(mynodelist))
     try:
         maxThreads = int(confParser['base_configuration']['maxThreads'])
     except KeyError:
@@ -936,6 +1237,71 @@ def initialize():
     minPollingInterval = getMinimumPollingInterval(maxThreads)
     config.maxThreads = maxThreads
     
+    #polling interval of the ipmi nodes, defaults to the minimum for the number of worker threads
+    pollInterval = minPollingInterval
+    maxPollInterval = 300
+    pollJitter = 0.1
+    try:
+        if 'pollInterval' in confParser['base_configuration']:
+            pollInterval = max(int(confParser['base_configuration']['pollInterval']), minPollingInterval)
+        if 'maxPollInterval' in confParser['base_configuration']:
+            maxPollInterval = int(confParser['base_configuration']['maxPollInterval'])
+        if 'pollJitter' in confParser['base_configuration']:
+            pollJitter = float(confParser['base_configuration']['pollJitter'])
+    except ValueError:
+        errorLogger(syslog.LOG_ERR, "Invalid polling interval settings in the base configuration. Using the defaults.")
+        pollInterval = minPollingInterval
+        maxPollInterval = 300
+        pollJitter = 0.1
+    
+    #number of alerts that can wait for delivery to each notify entity
+    deliveryQueueSize = 1000
+    try:
+        if 'deliveryQueueSize' in confParser['base_configuration']:
+            deliveryQueueSize = max(int(confParser['base_configuration']['deliveryQueueSize']), 1)
+    except ValueError:
+        errorLogger(syslog.LOG_ERR, "Invalid deliveryQueueSize in the base configuration. Using the default of 1000.")
+    
+    #alerts that cannot be delivered are spooled to disk, up to spoolMaxMB for each notify entity
+    spoolMaxMB = 100
+    spoolOverflow = 'dropOldest'
+    spoolRetryInterval = 30
+    try:
+        if 'spoolMaxMB' in confParser['base_configuration']:
+            spoolMaxMB = max(int(confParser['base_configuration']['spoolMaxMB']), 0)
+        if 'spoolRetryInterval' in confParser['base_configuration']:
+            spoolRetryInterval = max(int(confParser['base_configuration']['spoolRetryInterval']), 1)
+    except ValueError:
+        errorLogger(syslog.LOG_ERR, "Invalid spool settings in the base configuration. Using the defaults.")
+        spoolMaxMB = 100
+        spoolRetryInterval = 30
+    if 'spoolOverflow' in confParser['base_configuration']:
+        if confParser['base_configuration']['spoolOverflow'] in alertSpool.overflowPolicies:
+            spoolOverflow = confParser['base_configuration']['spoolOverflow']
+        else:
+            errorLogger(syslog.LOG_ERR, "Unknown spoolOverflow {policy}, using dropOldest.".format(policy=confParser['base_configuration']['spoolOverflow']))
+    
+    #alerts queued within notifyBatchWindow seconds are sent together to the plugins with notifyBatch
+    notifyBatchWindow = 0.2
+    try:
+        if 'notifyBatchWindow' in confParser['base_configuration']:
+            notifyBatchWindow = max(float(confParser['base_configuration']['notifyBatchWindow']), 0)
+    except ValueError:
+        errorLogger(syslog.LOG_ERR, "Invalid notifyBatchWindow in the base configuration. Using the default of 0.2.")
+    
+    #analysis modules run on analysisThreads threads, an analysis taking over analysisTimeout seconds reports the alert
+    analysisThreads = 4
+    analysisTimeout = 60
+    try:
+        if 'analysisThreads' in confParser['base_configuration']:
+            analysisThreads = max(int(confParser['base_configuration']['analysisThreads']), 1)
+        if 'analysisTimeout' in confParser['base_configuration']:
+            analysisTimeout = max(int(confParser['base_configuration']['analysisTimeout']), 1)
+    except ValueError:
+        errorLogger(syslog.LOG_ERR, "Invalid analysis settings in the base configuration. Using the defaults.")
+        analysisThreads = 4
+        analysisTimeout = 60
+    
     #load last reported times from storage file to prevent duplicate entries
     loadBMCLastReports()
     
@@ -945,23 +1311,75 @@ def initialize():
         config.updateManagedDict(config.nodeProperties[node['xcatNodeName']], node)
         config.nodeProperties[node['xcatNodeName']]['LastUpdateReceived'] = 0
     
+    #parse the openbmc policy table once for in process SEL retrieval
+    if config.nativeSelRetrieval and 'openbmcSel' in globals():
+        config.nativeSelRetrieval = openbmcSel.initialize()
+    
+    #load the ipmi event index once for in process SEL decoding
+    if config.nativeIpmiDecoding and any(node['accessType'] == 'ipmi' for node in mynodelist):
+        config.nativeIpmiDecoding = ipmiSel.initialize()
+    else:
+        config.nativeIpmiDecoding = False
+    
+    #start the java SEL parser once for all of the ipmi polls when they are not decoded in process
+    if config.ipmiSelService and not config.nativeIpmiDecoding and any(node['accessType'] == 'ipmi' for node in mynodelist):
+        if config.alertProcesses == 0:
+            config.ipmiSelService = ipmiSelService.start(ipmiSelWorkers)
+    else:
+        config.ipmiSelService = False
+    
+    #share long lived ipmitool shells between the ipmi polls and the plugins
+    if config.ipmiShellSessions and ipmiShellPool.isAvailable():
+        ipmiShellPool.configure(ipmiShellsPerBMC, ipmiShellIdleTimeout)
+    elif config.ipmiShellSessions:
+        errorLogger(syslog.LOG_ERR, "pexpect is not installed. Starting ipmitool for every ipmi command.")
+        config.ipmiShellSessions = False
+    
+    #fork the alert shards before the plugins start their threads, each shard starts its own SEL parser service
+    if config.alertProcesses > 0:
+        shardSettings.update({'confParser': confParser, 'analysisThreads': analysisThreads, 'analysisTimeout': analysisTimeout,
+                              'ipmiSelWorkers': max(ipmiSelWorkers // config.alertProcesses, 1)})
+        for node in mynodelist:
+            shardNodes[node['bmcHostname']] = node
+        alertShards.start(config.alertProcesses, math.ceil(float(maxThreads) / config.alertProcesses), initShard, shardPoll,
+                          updateShardState, stopShard, shardPollDone, restoreShard)
+        errorLogger(syslog.LOG_INFO, "Polling the BMCs in {count} alert processes, BMCs per process: {sizes}".format(
+            count=config.alertProcesses, sizes=alertShards.getShardSizes(shardNodes.keys())))
+    
     #load the plugins and initialize them
     initPlugins(confParser)
     
     
     #validate all of the needed plugins loaded
     validatePluginNotifications(confParser)
+    if config.alertProcesses > 0:
+        alertShards.broadcast(('entities', list(notifyList.keys())))
     
-    #Check for analysis scripts
+    #Check for analysis scripts and load them
     getIDstoAnalyze(confParser)
+    startAnalyzers(analysisThreads, analysisTimeout)
 
-    #Create the worker threads
-    for i in range(maxThreads):
-        config.errorLogger(syslog.LOG_DEBUG,"Creating thread " + str(i))
+    #Start the delivery workers of the notify entities
+    spoolDirectory = None
+    if spoolMaxMB > 0:
+        spoolDirectory = os.path.splitext(config.bmclastreports)[0] + '.spool'
+        alertSpool.configure(spoolMaxMB * 1024 * 1024, spoolOverflow)
+    batchEntities = [key for key in notifyList if 'batchFunction' in notifyList[key]]
+    deliveryQueue.start(list(notifyList.keys()), deliverAlert, alertAccepted, deliveryFailed, deliveryQueueSize,
+                        spoolDirectory, spoolRetryInterval, deliverAlertBatch, batchEntities, notifyBatchWindow)
 
-        t = threading.Thread(target=BMCEventProcessor)
+    #Create the worker threads, or the thread sending the polls to the alert shards
+    if config.alertProcesses > 0:
+        t = threading.Thread(target=dispatchPolls)
         t.daemon = True
-        t.start()   
+        t.start()
+    else:
+        for i in range(maxThreads):
+            config.errorLogger(syslog.LOG_DEBUG,"Creating thread " + str(i))
+
+            t = threading.Thread(target=BMCEventProcessor)
+            t.daemon = True
+            t.start()   
       
     t = threading.Thread(target=updateBMCLastReports)
     t.daemon = True
@@ -971,6 +1389,13 @@ def initialize():
     if 'telemetry_configuration' in confParser:
         if 'nodesPerGathererProcess' in confParser['telemetry_configuration']:
             config.nodespercore = int(confParser['telemetry_configuration']['nodesPerGathererProcess'])
+        if 'maxSensorsPerNode' in confParser['telemetry_configuration']:
+            config.maxSensorsPerNode = int(confParser['telemetry_configuration']['maxSensorsPerNode'])
+        if 'gathererEngine' in confParser['telemetry_configuration']:
+            if confParser['telemetry_configuration']['gathererEngine'] in ['thread', 'asyncio']:
+                config.gathererEngine = confParser['telemetry_configuration']['gathererEngine']
+            else:
+                config.errorLogger(syslog.LOG_ERR, "Unknown gathererEngine {engine}, using the thread engine.".format(engine=confParser['telemetry_configuration']['gathererEngine']))
     if 'enableTelemetry' in confParser['base_configuration']:
         enableTelem = confParser['base_configuration']['enableTelemetry']
         if confParser['base_configuration']['enableTelemetry'] == 'True':
@@ -988,14 +1413,16 @@ def initialize():
         #subscribe to events only if no telemetry
         configurePushNotifications()
     
-    #Setup polling interval
+    #Schedule the nodes that have to be polled
+    pollScheduler.start([node for node in mynodelist if node['accessType'] == 'ipmi'], pollInterval, maxPollInterval, pollJitter)
     pollNodes(minPollingInterval) 
 
 def pollNodes(interval):
     """
-         Used as timer for the polling interval. set to 25 second minimum
+         Used as timer for checking the push notification listeners. The nodes that are polled are put on the
+         queue by the poll scheduler.
            
-         @return: Does not return a specific value but loads the global queue with nodes that get polled 
+         @return: Does not return a specific value but restarts push notification listeners that have stopped
     """ 
     global killNow
     if not killNow:
@@ -1004,10 +1431,7 @@ def pollNodes(interval):
         t.start()
     
     for node in mynodelist:
-        if node['accessType'] == 'ipmi':
-            #load nodes that are using polling into the queue
-            nodes2poll.put(node)
-        elif node['accessType'] == 'openbmcRest':
+        if node['accessType'] == 'openbmcRest':
             if not config.useTelem:
                 if 'listener' in node and not node['listener'].isAlive():
                     config.errorLogger(syslog.LOG_DEBUG,"Main process opening new connection to {bmc}".format(bmc=node['bmcHostname']))
@@ -1044,6 +1468,13 @@ if __name__ == '__main__':
         if telemThread is not None:
             config.errorLogger(syslog.LOG_DEBUG, "Waiting on the telemetry server to stop.")
             telemThread.join()
+        alertShards.stop()
+        trackerStore.close(statistics2Write())
+        alertSpool.close()
+        alertAnalyzer.shutdown()
+        ipmiSelService.stop()
+        ipmiShellPool.closePool()
+        sessionPool.closePool()
         errorLogger(syslog.LOG_ERR, "The ibm-crassd service has been stopped")
         sys.exit()
     except KeyboardInterrupt:
@@ -0,0 +1,476 @@
+#
+#  Copyright 2017 IBM Corporation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+"""
+    This module reads the SEL of ipmi nodes with ipmitool and decodes it in process, giving the same alerts
+    as the java SEL parser without starting java.
+
+    The SEL list printed by ipmitool names the sensor, the state and the additional details of every entry,
+    and the event table in p8SMCBMCevents.xml is looked up by the same three fields. The table is parsed once
+    into an index of the fields the alerts need, keyed by the lower case sensor|state|details text the java
+    parser uses, with the regular expressions of the OEM records kept in a separate list. The index is pickled
+    next to the event table, and is memory mapped and unpickled at startup. It is built again when the event
+    table changes.
+
+    Each poll reads the SEL info first, with the number of entries and the times of the last add and erase.
+    When it has not changed since the last processed poll the poll ends there, and when entries were only
+    added just those are read with sel list last. A SEL that was cleared, or changed in another way, is read
+    in full again.
+"""
+import mmap
+import os
+import pickle
+import re
+import subprocess
+import syslog
+import threading
+import time
+import xml.etree.ElementTree as ET
+import config
+import ipmiShellPool
+
+eventTableLoc = '/opt/ibm/ras/lib/p8SMCBMCevents.xml'
+indexLoc = '/opt/ibm/ras/lib/p8SMCBMCevents.idx'
+indexVersion = 1
+ipmitoolTimeout = 120
+
+#the alert properties in the order the java parser prints them, with the event table field of each
+eventFields = [('CerID', 'CommonEventID'), ('sensor', 'Sensor'), ('state', 'State'), ('additonalDetails', 'AdditionalDetails'),
+               ('message', 'Message'), ('serviceable', 'Serviceable'), ('callHome', 'CallHomeCandidate'),
+               ('severity', 'Severity'), ('eventType', 'EventType'), ('vmMigration', 'VMMigrationFlag'),
+               ('subSystem', 'AffectedSubsystem'), ('timestamp', None), ('compInstance', 'ComponentInstance'),
+               ('userAction', 'UserAction')]
+eventNames = [name for name, field in eventFields]
+#OEM records whose additional details are matched with the regular expressions of the event table
+oemRegexRecords = {'oem record de': 'oem record de|040020', 'oem record c0': 'oem record c0'}
+
+#the alerts created for connection errors reported by ipmitool, checked in order against every line
+connectionErrors = [
+    (lambda line: 'Error: Unable to establish IPMI v2 / RMCP+ session' in line,
+     {'CerID': 'FQPSPIN0004M', 'sensor': 'N/A', 'state': 'N/A',
+      'additonalDetails': 'Error: Unable to establish IPMI v2 / RMCP+ session',
+      'message': 'Connection Error: Unable to establish IPMI v2 / RMCP+ session', 'serviceable': 'Yes',
+      'callHome': 'No', 'severity': 'Critical', 'eventType': 'Communication Failure/Timeout', 'vmMigration': 'Yes',
+      'subSystem': 'Interconnect (Networking)',
+      'userAction': 'Correct the issue highlighted in additional details and try again'}),
+    (lambda line: 'Address lookup for' in line and 'failed' in line,
+     {'CerID': 'FQPSPIN0002M', 'sensor': 'N/A', 'state': 'N/A', 'additonalDetails': 'N/A',
+      'message': 'BMC Address lookup failed.', 'serviceable': 'Yes', 'callHome': 'No', 'severity': 'Critical',
+      'eventType': 'Communication Failure/Timeout', 'vmMigration': 'Yes', 'subSystem': 'Interconnect (Networking)',
+      'userAction': 'Correct the issue highlighted in additional details and try again'}),
+    (lambda line: 'Error: Unable to establish LAN session' in line,
+     {'CerID': 'FQPSPIN0003M', 'sensor': 'N/A', 'state': 'N/A', 'additonalDetails': 'N/A',
+      'message': 'Unable to establish LAN session with BMC.', 'serviceable': 'Yes', 'callHome': 'No',
+      'severity': 'Critical', 'eventType': 'Communication Failure/Timeout', 'vmMigration': 'Yes',
+      'subSystem': 'Interconnect (Networking)',
+      'userAction': 'Ensure the BMC is connected to the network and is pingable'}),
+    (lambda line: 'Authentication type NONE not supported' in line,
+     {'CerID': 'FQPSPSE0004M', 'sensor': 'N/A', 'state': 'N/A', 'additonalDetails': 'N/A',
+      'message': 'Authentication Error. Ensure your BMC supports IPMI.', 'serviceable': 'Yes', 'callHome': 'No',
+      'severity': 'Critical', 'eventType': 'Security', 'vmMigration': 'Yes', 'subSystem': 'Systems Management: Security',
+      'userAction': 'Ensure the BMC supports IPMI. Ensure the credentials provided are correct.'})]
+ipmitoolError = {'CerID': 'FQPSPCR0020M', 'sensor': 'N/A', 'state': 'N/A',
+                 'message': 'IPMI tool encountered an error. See Additional Details', 'serviceable': 'Yes',
+                 'callHome': 'No', 'severity': 'Critical', 'eventType': 'Firmware/Software Failure ', 'vmMigration': 'No',
+                 'subSystem': 'Systems Management: Core / Virtual Appliance',
+                 'userAction': 'Ensure the BMC supports IPMI. Ensure the BMC is in a functional state and try again.'}
+
+lookupEvents = {}
+oemPatterns = {}
+statsLock = threading.Lock()
+#SEL info and newest record id of the last processed poll of each BMC
+selCursors = {}
+#cursors of the entries returned by the last poll, applied when the poll was processed
+pendingCursors = {}
+#the number of times the cursor of each BMC was dropped, and the number when its poll in progress started.
+#A poll only moves the cursor when it was not dropped since the poll started, otherwise the cursor computed
+#by the poll would skip past the entries of the delivery that failed.
+cursorGenerations = {}
+pollGenerations = {}
+cursorLock = threading.Lock()
+selStats = {'polls': 0, 'unchanged': 0, 'incrementalReads': 0, 'fullReads': 0, 'resets': 0, 'ipmitoolFailures': 0,
+            'entriesDecoded': 0, 'notFound': 0, 'decodeTime': 0.0}
+
+def getTextContent(element):
+    """
+        Returns the text of an element of the event table the way the java parser reads it, with the text that
+        is only white space left out
+    """
+    return ''.join(text for text in element.itertext() if text.strip() != '')
+
+def buildIndex(fileLoc):
+    """
+        Parses the event table into the lookup index
+
+        @param fileLoc: the location of the event table xml
+        @return: dictionary with the alert properties of every event by lookup key, and the OEM record keys
+    """
+    events = {}
+    tree = ET.parse(fileLoc)
+    for event in tree.getroot().iterfind('./Events/Event'):
+        attr = {}
+        sensor = state = details = ''
+        for child in event:
+            if not isinstance(child.tag, str):
+                continue
+            attr[child.tag] = getTextContent(child)
+            #a missing State or AdditionalDetails takes the value of the field before it, as in the java parser
+            if child.tag == 'Sensor':
+                sensor = state = details = attr[child.tag]
+            elif child.tag == 'State':
+                state = details = attr[child.tag]
+            elif child.tag == 'AdditionalDetails':
+                details = attr[child.tag]
+        values = []
+        for name, field in eventFields:
+            if field in ['Serviceable', 'CallHomeCandidate']:
+                values.append('true' if attr.get(field) == 'Yes' else 'false')
+            elif field == 'ComponentInstance':
+                values.append(attr.get(field, 'N/A'))
+            elif field is not None:
+                values.append(attr.get(field, ''))
+            else:
+                values.append(None)
+        events['|'.join([sensor.strip().lower(), state.strip().lower(), details.strip().lower()])] = tuple(values)
+    oemKeys = {}
+    for sensor in oemRegexRecords:
+        oemKeys[sensor] = [key for key in events if key.startswith(oemRegexRecords[sensor])]
+    return {'version': indexVersion, 'events': events, 'oemKeys': oemKeys}
+
+def saveIndex(index, fileLoc):
+    """
+        Writes the lookup index to a file, replacing the old index only once the new one is complete
+
+        @param index: the lookup index returned by buildIndex
+        @param fileLoc: the location of the index file
+    """
+    tempLoc = fileLoc + '.tmp'
+    with open(tempLoc, 'wb') as f:
+        pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tempLoc, fileLoc)
+
+def loadIndex(fileLoc):
+    """
+        Memory maps and unpickles the lookup index
+
+        @param fileLoc: the location of the index file
+        @return: the lookup index, or None if it could not be read
+    """
+    try:
+        with open(fileLoc, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                index = pickle.loads(m)
+        if index.get('version') != indexVersion:
+            return None
+        return index
+    except Exception as e:
+        config.errorLogger(syslog.LOG_WARNING, "Unable to read the ipmi event index {fname}: {err}".format(fname=fileLoc, err=e))
+        return None
+
+def initialize():
+    """
+        Loads the lookup index one time for use by all of the worker threads, building it from the event table
+        when there is no index or the event table is newer.
+
+        @return: True if the lookup index was loaded, otherwise False
+    """
+    global lookupEvents, oemPatterns
+    index = None
+    try:
+        if os.path.exists(indexLoc) and os.path.getmtime(indexLoc) >= os.path.getmtime(eventTableLoc):
+            index = loadIndex(indexLoc)
+        if index is None:
+            index = buildIndex(eventTableLoc)
+            try:
+                saveIndex(index, indexLoc)
+            except (IOError, OSError) as e:
+                config.errorLogger(syslog.LOG_WARNING, "Unable to save the ipmi event index {fname}: {err}".format(fname=indexLoc, err=e))
+    except Exception as e:
+        config.errorLogger(syslog.LOG_ERR, "Event table {fname} could not be loaded: {err}. Falling back to the java SEL parser.".format(
+            fname=eventTableLoc, err=e))
+        return False
+    lookupEvents = index['events']
+    oemPatterns = {}
+    for sensor in index['oemKeys']:
+        oemPatterns[sensor] = [(re.compile(key.split('|')[2]), key) for key in index['oemKeys'][sensor]]
+    config.errorLogger(syslog.LOG_INFO, "Loaded {count} ipmi events for in process SEL decoding".format(count=len(lookupEvents)))
+    return True
+
+def formatSEL(line):
+    """
+        Splits a SEL entry into its fields and normalizes the sensor, state and additional details for the lookup
+
+        @param line: string, a line of the SEL list printed by ipmitool
+        @return: list of the fields of the entry
+    """
+    pieces = line.split('|')
+    pieces[4] = pieces[4].replace('()', '')
+    pieces[3] = pieces[3].strip().lower()
+    pieces[4] = pieces[4].strip().lower()
+    if pieces[3] != 'oem record df':
+        pieces[5] = pieces[5].strip().lower()
+    #the device in parenthesis is not part of the event table
+    openPar = pieces[4].find('(')
+    if openPar > -1:
+        pieces[4] = pieces[4][:openPar].strip()
+    return pieces
+
+def getMapKey(pieces):
+    """
+        Returns the lookup key of a formatted SEL entry
+    """
+    sensor = pieces[3]
+    if sensor == 'oem record df':
+        return 'oem record df|.*|.*'
+    if sensor in oemPatterns:
+        for pattern, key in oemPatterns[sensor]:
+            if pattern.fullmatch(pieces[5]):
+                return key
+        return sensor + '|.*|.*'
+    return '|'.join([sensor, pieces[4], pieces[5]])
+
+def getTimestamp(pieces):
+    """
+        Returns the unix timestamp of a formatted SEL entry as a string
+    """
+    if 'Pre-Init' in pieces[1]:
+        return pieces[2].strip()
+    #MM/dd/yyyy HH:mm:ss in local time, split by hand since strptime is most of the decoding time
+    month, day, year = pieces[1].split('/')
+    hour, minute, second = pieces[2].split(':')
+    return str(int(time.mktime((int(year), int(month), int(day), int(hour), int(minute), int(second), 0, 0, -1))))
+
+def getConnectionError(line):
+    """
+        Returns the alert for a line of ipmitool output that reports a connection error, or None
+    """
+    for matches, error in connectionErrors:
+        if matches(line):
+            return dict(error)
+    return None
+
+def decodeSEL(selList):
+    """
+        Decodes the SEL list of a BMC with the lookup index
+
+        @param selList: string, the output of ipmitool sel list
+        @return: dictionary with the alerts in the same format as the java SEL parser
+    """
+    eventsDict = {}
+    alertCount = 0
+    notFound = 0
+    started = time.time()
+    for line in selList.splitlines():
+        event = getConnectionError(line)
+        if event is not None:
+            event['timestamp'] = str(int(time.time()))
+        elif 'SEL has no entries' in line:
+            continue
+        elif line.count('|') >= 5:
+            pieces = formatSEL(line)
+            mapKey = getMapKey(pieces)
+            values = lookupEvents.get(mapKey)
+            if values is not None:
+                event = dict(zip(eventNames, values))
+                event['timestamp'] = getTimestamp(pieces)
+            else:
+                event = {'error': 'Could not find: ' + mapKey}
+                notFound += 1
+        else:
+            #ipmitool error, also used for entries with missing fields
+            event = dict(ipmitoolError)
+            event['additonalDetlails'] = line.strip().replace('\t', ' ')
+            event['timestamp'] = str(int(time.time()))
+        eventsDict['event' + str(alertCount)] = event
+        alertCount += 1
+    eventsDict['numAlerts'] = alertCount
+    with statsLock:
+        selStats['entriesDecoded'] += alertCount
+        selStats['notFound'] += notFound
+        selStats['decodeTime'] += time.time() - started
+    return eventsDict
+
+def runIpmitool(node, command):
+    """
+        Runs an ipmitool sel command against a BMC
+
+        @param node: dictionary with the bmcHostname, username and password of the BMC
+        @param command: list of the sel command and its arguments
+        @return: string, the output of ipmitool with its errors, or None if ipmitool could not be run
+    """
+    if config.ipmiShellSessions:
+        #use the established session of a pooled ipmitool shell
+        output, healthy = ipmiShellPool.runCommand(node['bmcHostname'], node['username'], node['password'], ' '.join(['sel'] + command))
+        if output is not None:
+            return output
+    #the password is passed in the environment so it is not on the command line
+    env = dict(os.environ)
+    env['IPMI_PASSWORD'] = node['password']
+    try:
+        proc = subprocess.run(['ipmitool', '-I', 'lan', '-H', node['bmcHostname'], '-U', node['username'], '-E', 'sel'] + command,
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env, timeout=ipmitoolTimeout)
+        return proc.stdout.decode('utf-8', 'replace')
+    except (OSError, subprocess.TimeoutExpired) as e:
+        with statsLock:
+            selStats['ipmitoolFailures'] += 1
+        config.errorLogger(syslog.LOG_ERR, "Unable to read the SEL of {host} with ipmitool: {err}".format(host=node['bmcHostname'], err=e))
+        return None
+
+def parseSELInfo(selInfo):
+    """
+        Returns the number of entries and the last add and erase times from the output of ipmitool sel info,
+        or None if the output has no entry count
+    """
+    fields = {}
+    for line in selInfo.splitlines():
+        if ':' in line:
+            name, value = line.split(':', 1)
+            fields[name.strip()] = value.strip()
+    try:
+        return {'entries': int(fields['Entries']), 'addTime': fields.get('Last Add Time', ''), 'delTime': fields.get('Last Del Time', '')}
+    except (KeyError, ValueError):
+        return None
+
+def getRecordIds(selList):
+    """
+        Returns the record ids of the SEL entries in the output of ipmitool sel list
+    """
+    recordIds = []
+    for line in selList.splitlines():
+        if line.count('|') >= 5:
+            try:
+                recordIds.append(int(line.split('|', 1)[0].strip(), 16))
+            except ValueError:
+                continue
+    return recordIds
+
+def getNewSELList(node, cursor, selInfo):
+    """
+        Reads only the SEL entries added since the cursor with sel list last, when the SEL info shows that
+        entries were only added.
+
+        @param node: dictionary with the bmcHostname, username and password of the BMC
+        @param cursor: dictionary with the SEL info and the newest record id of the last processed poll
+        @param selInfo: dictionary with the current SEL info of the BMC
+        @return: tuple of the output of ipmitool and the record ids of the new entries. The output is None
+        when the SEL was cleared or changed in another way and has to be read in full, and the record ids
+        are None when ipmitool could not be run.
+    """
+    newEntries = selInfo['entries'] - cursor['entries']
+    if selInfo['delTime'] != cursor['delTime'] or newEntries <= 0:
+        return None, []
+    selList = runIpmitool(node, ['list', 'last', str(newEntries)])
+    if selList is None:
+        return None, None
+    recordIds = getRecordIds(selList)
+    if len(recordIds) != newEntries or min(recordIds) <= cursor['lastId']:
+        #the entries before the new ones changed
+        return None, []
+    return selList, recordIds
+
+def getSELEvents(node):
+    """
+        Reads the SEL list of an ipmi BMC with ipmitool and decodes it. The SEL info is read first, and when
+        it is the same as at the last processed poll nothing else is read. When entries were only added, just
+        those entries are read, otherwise the whole SEL is read again. The cursor is moved by finishPoll.
+
+        @param node: dictionary with the bmcHostname, username and password of the BMC
+        @return: dictionary with the alerts in the same format as the java SEL parser
+    """
+    bmcHostname = node['bmcHostname']
+    with cursorLock:
+        pollGenerations[bmcHostname] = cursorGenerations.get(bmcHostname, 0)
+    with statsLock:
+        selStats['polls'] += 1
+    selInfoOutput = runIpmitool(node, ['info'])
+    if selInfoOutput is None:
+        return {'numAlerts': 0, 'failedPoll': True}
+    selInfo = parseSELInfo(selInfoOutput)
+    if selInfo is None:
+        #connection errors are reported the same way as when reading the sel list
+        return decodeSEL(selInfoOutput)
+    cursor = selCursors.get(bmcHostname)
+    selList = None
+    if cursor is not None:
+        if selInfo == dict((name, cursor[name]) for name in selInfo):
+            with statsLock:
+                selStats['unchanged'] += 1
+            pendingCursors[bmcHostname] = cursor
+            return {'numAlerts': 0}
+        selList, recordIds = getNewSELList(node, cursor, selInfo)
+        if recordIds is None:
+            return {'numAlerts': 0, 'failedPoll': True}
+        if selList is None:
+            with statsLock:
+                selStats['resets'] += 1
+            config.errorLogger(syslog.LOG_INFO, "The SEL of {host} was cleared or changed, reading all of the entries".format(host=node['xcatNodeName']))
+        else:
+            with statsLock:
+                selStats['incrementalReads'] += 1
+            entries = cursor['entries'] + len(recordIds)
+    if selList is None:
+        selList = runIpmitool(node, ['list'])
+        if selList is None:
+            return {'numAlerts': 0, 'failedPoll': True}
+        with statsLock:
+            selStats['fullReads'] += 1
+        recordIds = getRecordIds(selList)
+        entries = len(recordIds)
+    newCursor = dict(selInfo)
+    #entries added after the SEL info was read are counted by the entries and ids that were listed
+    newCursor['entries'] = entries
+    newCursor['lastId'] = max(recordIds) if len(recordIds) > 0 else -1
+    pendingCursors[bmcHostname] = newCursor
+    return decodeSEL(selList)
+
+def finishPoll(bmcHostname, processed):
+    """
+        Moves the SEL cursor of a BMC past the entries returned by the last poll. If the entries were not
+        processed, for example because a plugin could not be notified, the cursor is kept and they are
+        returned again by the next poll.
+
+        @param bmcHostname: string, the hostname or IP address of the bmc
+        @param processed: boolean, True when all of the returned entries were processed
+    """
+    with cursorLock:
+        cursor = pendingCursors.pop(bmcHostname, None)
+        generation = pollGenerations.pop(bmcHostname, None)
+        if processed and cursor is not None and generation == cursorGenerations.get(bmcHostname, 0):
+            selCursors[bmcHostname] = cursor
+
+def dropCursor(bmcHostname):
+    """
+        Forgets the SEL cursor of a BMC, so the next poll reads its whole SEL again. A poll in progress does
+        not move the cursor when it finishes.
+
+        @param bmcHostname: string, the hostname or IP address of the bmc
+    """
+    with cursorLock:
+        cursorGenerations[bmcHostname] = cursorGenerations.get(bmcHostname, 0) + 1
+        selCursors.pop(bmcHostname, None)
+        pendingCursors.pop(bmcHostname, None)
+
+def getDecoderStats():
+    """
+        Returns the statistics of the in process SEL decoding for logging
+    """
+    with statsLock:
+        decoderStats = dict(selStats)
+    if decoderStats['entriesDecoded'] > 0:
+        decoderStats['averageEntryTime'] = decoderStats['decodeTime'] / decoderStats['entriesDecoded']
+    return decoderStats
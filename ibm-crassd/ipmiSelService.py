@@ -0,0 +1,228 @@
+#
+#  Copyright 2017 IBM Corporation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+"""
+    This module keeps the java SEL parser for ipmi nodes running as a service, instead of starting a JVM that
+    loads the lookup table again for every poll. The service is started with the --server option and reads
+    the SEL list of each BMC with ipmitool and decodes it with the lookup table loaded once.
+
+    Requests are written to the stdin of the service, one per line with a request id, the BMC hostname, user
+    name and password separated by tabs. The service decodes up to workers requests at the same time and
+    answers each on its stdout with a line holding the request id and the length of the JSON document,
+    followed by the document. A reader thread hands every answer to the thread waiting for it, so all of the
+    polling threads share the one service. Only ibm-crassd holds the pipes, so no other process can send it
+    requests.
+
+    When the service stops, the requests waiting for it fail and it is started again by the next request. Only
+    one thread starts the service at a time, without holding the service lock while the lookup table loads.
+"""
+import itertools
+import select
+import subprocess
+import syslog
+import threading
+import time
+import config
+
+jarLoc = '/opt/ibm/ras/lib/crassd.jar'
+settings = {'workers': 16, 'timeout': 120.0, 'startTimeout': 60.0}
+
+service = {'process': None, 'reader': None}
+serviceLock = threading.Lock()
+startLock = threading.Lock()
+writeLock = threading.Lock()
+pending = {}
+requestIds = itertools.count()
+stats = {'starts': 0, 'requests': 0, 'failures': 0, 'timeouts': 0, 'totalTime': 0.0, 'maxTime': 0.0}
+
+def startService():
+    """
+        Starts the SEL parser service and waits for it to load the lookup table. Must be called with the
+        start lock held and the service lock released.
+
+        @return: True if the service is ready
+    """
+    try:
+        proc = subprocess.Popen(['java', '-jar', jarLoc, '--server', str(settings['workers'])],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    except OSError as e:
+        config.errorLogger(syslog.LOG_ERR, "Unable to start the ipmi SEL parser service: {err}".format(err=e))
+        return False
+    ready = b''
+    try:
+        readable = select.select([proc.stdout], [], [], settings['startTimeout'])[0]
+        if readable:
+            ready = proc.stdout.readline().strip()
+    except (IOError, OSError, ValueError) as e:
+        config.errorLogger(syslog.LOG_ERR, "Unable to read from the ipmi SEL parser service: {err}".format(err=e))
+    if ready != b'ready':
+        config.errorLogger(syslog.LOG_ERR, "The ipmi SEL parser service failed to load the lookup table within {timeout} seconds".format(
+            timeout=settings['startTimeout']))
+        proc.kill()
+        proc.wait()
+        return False
+    t = threading.Thread(target=readResponses, args=[proc], name='ipmiSelService')
+    t.daemon = True
+    with serviceLock:
+        service['process'] = proc
+        service['reader'] = t
+        stats['starts'] += 1
+    t.start()
+    config.errorLogger(syslog.LOG_INFO, "Started the ipmi SEL parser service with {workers} workers".format(workers=settings['workers']))
+    return True
+
+def start(workers=16, timeout=120):
+    """
+        Starts the SEL parser service used by getSEL
+
+        @param workers: the number of BMCs the service reads and decodes at the same time
+        @param timeout: the number of seconds to wait for the decoded SEL of a BMC
+        @return: True if the service is ready
+    """
+    settings['workers'] = int(workers)
+    settings['timeout'] = float(timeout)
+    with startLock:
+        return startService()
+
+def getService():
+    """
+        Returns the running SEL parser service, starting it if it is not running
+
+        @return: the process of the service, or None if it could not be started
+    """
+    with serviceLock:
+        if service['process'] is not None:
+            return service['process']
+    #the threads that find the service stopped wait here while one of them starts it
+    with startLock:
+        with serviceLock:
+            if service['process'] is not None:
+                return service['process']
+        if not startService():
+            return None
+    with serviceLock:
+        return service['process']
+
+def readResponses(proc):
+    """
+        Reads the answers of the service and wakes up the threads waiting for them, until the service stops
+    """
+    try:
+        while True:
+            header = proc.stdout.readline()
+            if not header:
+                break
+            requestId, length = header.decode('utf-8').split('\t')
+            document = proc.stdout.read(int(length))
+            with serviceLock:
+                waiting = pending.pop(requestId, None)
+            if waiting is not None:
+                waiting['response'] = document.decode('utf-8')
+                waiting['done'].set()
+    except Exception as e:
+        config.errorLogger(syslog.LOG_ERR, "Invalid response from the ipmi SEL parser service: {err}".format(err=e))
+    with serviceLock:
+        #stop() forgets the process before closing it
+        unexpected = service['process'] is proc
+        if unexpected:
+            service['process'] = None
+        #the requests sent to this service will not be answered
+        for requestId in list(pending):
+            if pending[requestId]['process'] is proc:
+                pending.pop(requestId)['done'].set()
+    if unexpected:
+        config.errorLogger(syslog.LOG_ERR, "The ipmi SEL parser service stopped")
+    try:
+        proc.kill()
+    except OSError:
+        pass
+    proc.wait()
+
+def getSEL(bmcHostname, username, password):
+    """
+        Reads and decodes the SEL of an ipmi BMC with the SEL parser service
+
+        @param bmcHostname: string, the hostname or IP address of the bmc
+        @param username: The user name for the bmc
+        @param password: The password for the bmc
+        @return: the output of the SEL parser for the BMC, or None if the service could not decode it
+    """
+    for value in [bmcHostname, username, password]:
+        if '\t' in value or '\n' in value or '\r' in value:
+            return None
+    requestId = str(next(requestIds))
+    waiting = {'done': threading.Event(), 'response': None}
+    if getService() is None:
+        return None
+    with serviceLock:
+        proc = service['process']
+        if proc is None:
+            #the service stopped again before the request was queued
+            return None
+        waiting['process'] = proc
+        pending[requestId] = waiting
+    started = time.time()
+    try:
+        with writeLock:
+            proc.stdin.write('\t'.join([requestId, bmcHostname, username, password]).encode('utf-8') + b'\n')
+            proc.stdin.flush()
+    except (IOError, OSError, ValueError) as e:
+        with serviceLock:
+            pending.pop(requestId, None)
+            stats['failures'] += 1
+        config.errorLogger(syslog.LOG_ERR, "Unable to send a request to the ipmi SEL parser service: {err}".format(err=e))
+        return None
+    if not waiting['done'].wait(settings['timeout']):
+        with serviceLock:
+            pending.pop(requestId, None)
+            stats['timeouts'] += 1
+        config.errorLogger(syslog.LOG_ERR, "The ipmi SEL parser service did not answer for {host} within {timeout} seconds".format(
+            host=bmcHostname, timeout=settings['timeout']))
+        return None
+    elapsed = time.time() - started
+    with serviceLock:
+        stats['requests'] += 1
+        stats['totalTime'] += elapsed
+        stats['maxTime'] = max(stats['maxTime'], elapsed)
+        if waiting['response'] is None:
+            stats['failures'] += 1
+    return waiting['response']
+
+def stop():
+    """
+        Stops the SEL parser service by closing its stdin
+    """
+    with serviceLock:
+        proc = service['process']
+        service['process'] = None
+    if proc is not None:
+        try:
+            proc.stdin.close()
+            proc.wait(10)
+        except Exception:
+            proc.kill()
+
+def getServiceStats():
+    """
+        Returns the statistics of the SEL parser service for logging
+    """
+    with serviceLock:
+        serviceStats = dict(stats)
+        serviceStats['waiting'] = len(pending)
+        serviceStats['running'] = service['process'] is not None
+        if stats['requests'] > 0:
+            serviceStats['averageTime'] = stats['totalTime'] / stats['requests']
+    return serviceStats
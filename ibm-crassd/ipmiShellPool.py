@@ -0,0 +1,295 @@
+#
+#  Copyright 2017 IBM Corporation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+"""
+    This module keeps long lived ipmitool shell sessions to the ipmi BMCs. The SEL polls and the plugins send
+    their ipmitool commands to a shell whose RMCP+ session is already established, instead of starting
+    ipmitool and authenticating again for every command.
+
+    Each BMC has up to shellsPerBMC shells, and a shell runs one command at a time. A command that does not
+    return to the ipmitool prompt within the command timeout, or whose output shows the session was lost,
+    closes the shell, and the command is retried once in a new shell when the closed shell had worked before.
+    Shells that have been idle longer than the idle timeout are closed when the pool is next used.
+
+    The pool is per process. Subprocesses must call resetPool() after they start so they do not use the
+    shells of their parent.
+"""
+import os
+import syslog
+import threading
+import time
+import config
+try:
+    import pexpect
+except ImportError:
+    pexpect = None
+
+prompt = 'ipmitool> '
+settings = {'shellsPerBMC': 2, 'idleTimeout': 120.0, 'commandTimeout': 60.0, 'interface': 'lanplus'}
+#output of a command that means the session of the shell can no longer be used
+sessionErrors = ['Unable to establish', 'nvalid session', 'Unable to send', 'Error: no response']
+
+pool = {}
+poolLock = threading.Condition()
+stats = {'commands': 0, 'opened': 0, 'openFailures': 0, 'closed': 0, 'evicted': 0, 'retries': 0, 'busy': 0,
+         'timeouts': 0, 'commandTime': 0.0, 'openTime': 0.0}
+
+def configure(shellsPerBMC=2, idleTimeout=120, commandTimeout=60):
+    """
+        Sets the limits of the shell pool
+
+        @param shellsPerBMC: the most shells kept open to one BMC
+        @param idleTimeout: the number of seconds a shell is kept open without being used
+        @param commandTimeout: the number of seconds to wait for a command to finish
+    """
+    settings['shellsPerBMC'] = max(int(shellsPerBMC), 1)
+    settings['idleTimeout'] = float(idleTimeout)
+    settings['commandTimeout'] = float(commandTimeout)
+
+def isAvailable():
+    """
+        Returns True if pexpect can be used to run ipmitool shells
+    """
+    return pexpect is not None
+
+def openShell(bmcHostname, username, password):
+    """
+        Starts an ipmitool shell for a BMC and waits for its prompt
+
+        @return: tuple of the shell and the output of ipmitool. The shell is None when it could not be started,
+        the output is then the error printed by ipmitool, or None if ipmitool could not be run.
+    """
+    #the password is passed in the environment so it is not on the command line
+    env = dict(os.environ)
+    env['IPMI_PASSWORD'] = password
+    started = time.time()
+    try:
+        child = pexpect.spawn('ipmitool', ['-I', settings['interface'], '-H', bmcHostname, '-U', username, '-E', 'shell'],
+                              env=env, timeout=settings['commandTimeout'], maxread=65536, searchwindowsize=len(prompt) + 64,
+                              encoding='utf-8', codec_errors='replace', echo=False)
+    except (OSError, pexpect.ExceptionPexpect) as e:
+        config.errorLogger(syslog.LOG_ERR, "Unable to start an ipmitool shell for {host}: {err}".format(host=bmcHostname, err=e))
+        return None, None
+    index = child.expect_exact([prompt, pexpect.EOF, pexpect.TIMEOUT])
+    if index != 0:
+        output = child.before.replace('\r\n', '\n')
+        child.close(force=True)
+        with poolLock:
+            stats['openFailures'] += 1
+        return None, output
+    with poolLock:
+        stats['opened'] += 1
+        stats['openTime'] += time.time() - started
+    return {'child': child, 'credentials': (username, password), 'lastUsed': time.time(), 'commands': 0}, None
+
+def closeShell(shell):
+    """
+        Ends an ipmitool shell, letting ipmitool close its session with the BMC when it still answers
+    """
+    child = shell['child']
+    try:
+        if child.isalive():
+            child.sendline('quit')
+            child.expect(pexpect.EOF, timeout=5)
+    except (OSError, pexpect.ExceptionPexpect):
+        pass
+    try:
+        child.close(force=True)
+    except (OSError, pexpect.ExceptionPexpect):
+        pass
+
+def evictIdle(now):
+    """
+        Removes the shells that have been idle too long from the pool. Must be called with the pool lock held.
+
+        @return: list of the removed shells, to be closed without the lock
+    """
+    evicted = []
+    for bmcHostname in pool:
+        entry = pool[bmcHostname]
+        for shell in list(entry['idle']):
+            if now - shell['lastUsed'] > settings['idleTimeout'] or not shell['child'].isalive():
+                entry['idle'].remove(shell)
+                entry['open'] -= 1
+                evicted.append(shell)
+    stats['evicted'] += len(evicted)
+    return evicted
+
+def checkout(bmcHostname, username, password):
+    """
+        Takes an idle shell of the BMC from the pool, or opens a new one when the BMC has fewer than
+        shellsPerBMC shells. Waits up to the command timeout for a shell when all of them are in use.
+
+        @return: tuple of the shell and the output of ipmitool when a new shell could not be started
+    """
+    deadline = time.time() + settings['commandTimeout']
+    stale = []
+    shell = None
+    with poolLock:
+        stale.extend(evictIdle(time.time()))
+        entry = pool.setdefault(bmcHostname, {'idle': [], 'open': 0})
+        while True:
+            while len(entry['idle']) > 0 and shell is None:
+                candidate = entry['idle'].pop()
+                if candidate['credentials'] == (username, password):
+                    shell = candidate
+                else:
+                    entry['open'] -= 1
+                    stale.append(candidate)
+            if shell is not None or entry['open'] < settings['shellsPerBMC']:
+                break
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                stats['busy'] += 1
+                break
+            poolLock.wait(remaining)
+        if shell is None and entry['open'] < settings['shellsPerBMC']:
+            #reserve the slot while the shell is started
+            entry['open'] += 1
+            opening = True
+        else:
+            opening = False
+    for staleShell in stale:
+        closeShell(staleShell)
+    if shell is not None or not opening:
+        return shell, None
+    shell, output = openShell(bmcHostname, username, password)
+    if shell is None:
+        with poolLock:
+            entry['open'] -= 1
+            poolLock.notify()
+    return shell, output
+
+def checkin(bmcHostname, shell):
+    """
+        Returns a shell to the pool after a command, or ends it when ipmitool has exited or the pool was closed
+    """
+    with poolLock:
+        entry = pool.get(bmcHostname)
+        if entry is not None and shell['child'].isalive():
+            shell['lastUsed'] = time.time()
+            entry['idle'].append(shell)
+            poolLock.notify()
+            return
+    discard(bmcHostname, shell)
+
+def discard(bmcHostname, shell):
+    """
+        Ends a shell that was taken from the pool and frees its place for a new shell
+    """
+    with poolLock:
+        stats['closed'] += 1
+        entry = pool.get(bmcHostname)
+        if entry is not None:
+            entry['open'] -= 1
+            poolLock.notify()
+    closeShell(shell)
+
+def sendCommand(shell, command):
+    """
+        Runs a command in a shell and reads its output up to the next prompt
+
+        @return: tuple of the output of the command and True if the shell can be used again. The output is
+        None when the command did not return to the prompt, since what it printed may be cut off.
+    """
+    child = shell['child']
+    try:
+        child.sendline(command)
+        child.expect_exact(prompt, timeout=settings['commandTimeout'])
+    except (OSError, pexpect.ExceptionPexpect):
+        #timed out or ipmitool exited
+        with poolLock:
+            stats['timeouts'] += 1
+        return None, False
+    lines = child.before.replace('\r\n', '\n').split('\n')
+    #ipmitool built with readline echoes the command
+    if len(lines) > 0 and lines[0].strip() == command:
+        lines = lines[1:]
+    output = '\n'.join(lines)
+    healthy = not any(error in output for error in sessionErrors)
+    return output, healthy
+
+def runCommand(bmcHostname, username, password, command):
+    """
+        Runs an ipmitool command for a BMC in a pooled shell
+
+        @param bmcHostname: string, the hostname or IP address of the bmc
+        @param username: The user name for the bmc
+        @param password: The password for the bmc
+        @param command: string, the ipmitool command without the connection options, for example sel info
+        @return: tuple of the output of the command and True if it ran in a working session. The output is
+        None when no shell could be used or started, or the command did not finish in its shell, and the
+        command must be run with a new ipmitool process.
+    """
+    if pexpect is None:
+        return None, False
+    for attempt in range(2):
+        shell, output = checkout(bmcHostname, username, password)
+        if shell is None:
+            #leave the command to a new ipmitool process, which can use the interface the caller chooses
+            if output is not None:
+                config.errorLogger(syslog.LOG_DEBUG, "Unable to open an ipmitool shell for {host}: {err}".format(host=bmcHostname,
+                                   err=output.strip()))
+            return None, False
+        reused = shell['commands'] > 0
+        started = time.time()
+        output, healthy = sendCommand(shell, command)
+        shell['commands'] += 1
+        with poolLock:
+            stats['commands'] += 1
+            stats['commandTime'] += time.time() - started
+        if healthy:
+            checkin(bmcHostname, shell)
+            return output, True
+        discard(bmcHostname, shell)
+        if not reused:
+            #a new shell failed, a second one would fail the same way
+            break
+        with poolLock:
+            stats['retries'] += 1
+    return output, False
+
+def resetPool():
+    """
+        Drops all of the shells inherited from a parent process without ending them
+    """
+    global poolLock
+    poolLock = threading.Condition()
+    pool.clear()
+    for key in stats:
+        stats[key] = 0
+
+def closePool():
+    """
+        Ends every idle shell and empties the pool
+    """
+    with poolLock:
+        shells = [shell for entry in pool.values() for shell in entry['idle']]
+        pool.clear()
+    for shell in shells:
+        closeShell(shell)
+
+def getPoolStats():
+    """
+        Returns the counters of the shell pool for logging
+    """
+    with poolLock:
+        poolStats = dict(stats)
+        poolStats['idle'] = sum(len(entry['idle']) for entry in pool.values())
+        poolStats['open'] = sum(entry['open'] for entry in pool.values())
+    if poolStats['commands'] > 0:
+        poolStats['averageCommandTime'] = poolStats['commandTime'] / poolStats['commands']
+    return poolStats
@@ -15,7 +15,8 @@
 """
 import websocket
 
-import openbmctool
+import sessionPool
+import pollQueue
 import ssl
 import json
 import config
@@ -23,6 +24,9 @@ import syslog
 import threading
 import sys
 
+#the properties parseAlerts needs to build an event from a SEL entry
+requiredEntryProperties = ['AdditionalData', 'Id', 'Message', 'Severity', 'Timestamp']
+
 def getNode():
     """
         returns the hostname of the bmc
@@ -35,13 +39,37 @@ def getNode():
                 break
     return thisnode
 
+def decodeLoggingMessage(message):
+    """
+        Decodes the SEL entry carried by a logging push notification. A new entry is pushed with all of its
+        properties, so it can be processed without reading the SEL.
+
+        @param message: dictionary, the decoded websocket message
+        @return: dictionary with the entry in the format of /xyz/openbmc_project/logging/entry/enumerate, or None
+        if the message does not carry a complete new entry and the SEL has to be read
+    """
+    path = message.get('path', '')
+    if message.get('event') != 'InterfacesAdded' or '/logging/entry/' not in path or path.endswith('/callout'):
+        return None
+    properties = {}
+    for interface in message.get('interfaces', {}).values():
+        properties.update(interface)
+    for prop in requiredEntryProperties:
+        if prop not in properties:
+            return None
+    return {path: properties}
+
 def on_message(ws, message):
     """
         websocket message handler
     """
 
     node = getNode()
-    config.nodes2poll.put(node)
+    try:
+        selEntries = decodeLoggingMessage(json.loads(message))
+    except (ValueError, AttributeError):
+        selEntries = None
+    pollQueue.put(node, selEntries)
 
 def on_error(ws, wserror):
     """
@@ -64,7 +92,7 @@ def on_open(ws):
     data = {"paths": ["/xyz/openbmc_project/logging"]}
     ws.send(json.dumps(data))
     node = getNode()
-    config.nodes2poll.put(node)
+    pollQueue.put(node)
 
 
 def reportNodeDown(jsonEvent):
@@ -74,7 +102,7 @@ def reportNodeDown(jsonEvent):
     global bmcHostname
     node = getNode()
     node['pollFailedCount'] = 1
-    config.nodes2poll.put(node)
+    pollQueue.put(node)
 def isString(var):
     """
         Returns True if the variable is a string, otherwise false. 
@@ -93,8 +121,8 @@ def openSocket(hostname, username, password):
     websocket.enableTrace(False)
     failedConCount = 0
     for i in range(3):
-        mysession = openbmctool.login(hostname,username, password, True, allowExpiredPassword=False)
-        if not isString(mysession):
+        mysession = sessionPool.getSession(hostname, username, password)
+        if mysession is not None and not isString(mysession):
             break;
         else:
             failedConCount += 1
@@ -0,0 +1,259 @@
+"""
+ Copyright 2017 IBM Corporation
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+import argparse
+import json
+import os
+import sys
+import syslog
+import threading
+import traceback
+import requests
+import openbmctool
+import config
+import sessionPool
+
+policyTableLoc = '/opt/ibm/ras/lib/policyTable.json'
+#above this many new entries the full SEL is downloaded instead of one request per entry
+maxIncrementalEntries = 20
+
+#Id and Timestamp of the newest SEL entry processed for each BMC
+selCursors = {}
+#cursors of the entries returned by the last poll, applied when the poll was processed
+pendingCursors = {}
+#drop count of the cursor of each BMC, and the drop count when its poll in progress started. A cursor
+#dropped during a poll stays dropped, the poll computed its cursor before the delivery failed.
+cursorGenerations = {}
+pollGenerations = {}
+cursorLock = threading.Lock()
+#raw SEL entries read by the poll in progress of each BMC, for the alert analyzers
+polledEntries = {}
+selStats = {'fullReads': 0, 'incrementalReads': 0, 'resets': 0, 'entriesParsed': 0}
+
+def loadPolicyTable(fileLoc):
+    """
+        Loads the openbmc policy table used to translate SEL entries into common events
+
+        @param fileLoc: the full path to the policy table json file
+        @return: dictionary containing the events from the policy table. Empty if unable to load.
+    """
+    policyTable = {}
+    if(os.path.exists(fileLoc)):
+        with open(fileLoc, 'r') as stream:
+            try:
+                contents = json.load(stream)
+                policyTable = contents['events']
+            except Exception as err:
+                config.errorLogger(syslog.LOG_ERR, "Unable to load the policy table {fname}: {err}".format(fname=fileLoc, err=err))
+    return policyTable
+
+def initialize():
+    """
+        Parses the policy table one time for use by all of the worker threads.
+
+        @return: True if the policy table was loaded, otherwise False
+    """
+    requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
+    config.policyTable = loadPolicyTable(policyTableLoc)
+    if len(config.policyTable) == 0:
+        config.errorLogger(syslog.LOG_ERR, "Policy table {fname} could not be loaded. Falling back to openbmctool for SEL retrieval.".format(fname=policyTableLoc))
+        return False
+    return True
+
+def requestData(node, path):
+    """
+        Sends a get request to the BMC using the pooled session for the BMC.
+
+        @param node: dictionary containing the node properties
+        @param path: string, the path of the url, starting with /
+        @return: tuple of the data from the response and an error dictionary. One of them is always None.
+    """
+    try:
+        res, loginError = sessionPool.request('get', node['bmcHostname'], node['username'], node['password'], path)
+    except(requests.exceptions.Timeout):
+        return None, json.loads(sessionPool.connectionErrHandler(True, "Timeout", None))
+    except(requests.exceptions.ConnectionError) as err:
+        return None, json.loads(sessionPool.connectionErrHandler(True, "ConnectionError", err))
+    if res is None:
+        if loginError is None:
+            return None, {'numAlerts': 0, 'failedPoll': True}
+        return None, json.loads(loginError)
+    try:
+        return res.json()['data'], None
+    except (ValueError, KeyError):
+        config.errorLogger(syslog.LOG_ERR, "An invalid response was received from bmc when requesting alerts for {hostname}".format(hostname=node['xcatNodeName']))
+        return None, {'numAlerts': 0, 'failedPoll': True}
+
+def getSELEntries(node):
+    """
+        Downloads all of the raw SEL entries from the BMC using the pooled session for the BMC.
+
+        @param node: dictionary containing the node properties
+        @return: tuple of the SEL entries dictionary and an error dictionary. One of them is always None.
+    """
+    return requestData(node, '/xyz/openbmc_project/logging/entry/enumerate')
+
+def getEntryId(path):
+    """
+        Returns the Id of the SEL entry an object path belongs to, or None for paths outside of the entries
+    """
+    try:
+        return int(path.split('/logging/entry/', 1)[1].split('/', 1)[0])
+    except (IndexError, ValueError):
+        return None
+
+def getNewSELEntries(node, cursor):
+    """
+        Downloads only the SEL entries created after the cursor. The list of entry paths is small, so it is
+        read first and the new entries are requested one at a time. When there are many new entries the full
+        SEL is downloaded instead, and the old entries are dropped before they are parsed.
+
+        @param node: dictionary containing the node properties
+        @param cursor: dictionary with the Id and Timestamp of the newest processed entry
+        @return: tuple of the new SEL entries dictionary and an error dictionary. The entries are None
+        when the SEL was cleared or wrapped, or the entry of the cursor is gone, and it has to be read in full.
+    """
+    paths, errorEvents = requestData(node, '/xyz/openbmc_project/logging/entry/list')
+    if errorEvents is not None:
+        return None, errorEvents
+    entryIds = [getEntryId(path) for path in paths]
+    if len(paths) > 0 and max([entryId for entryId in entryIds if entryId is not None] or [0]) < cursor['id']:
+        #the entry ids started over
+        return None, None
+    if cursor['id'] > 0 and cursor['id'] not in entryIds:
+        #the SEL was cleared, or the entry was deleted, and the ids may have grown past the cursor again
+        return None, None
+    newPaths = [path for path, entryId in zip(paths, entryIds) if entryId is not None and entryId > cursor['id']]
+    newEntries = {}
+    if len(set([getEntryId(path) for path in newPaths])) > maxIncrementalEntries:
+        selEntries, errorEvents = getSELEntries(node)
+        if errorEvents is not None:
+            return None, errorEvents
+        for path in selEntries:
+            entryId = getEntryId(path)
+            if entryId is not None and entryId > cursor['id']:
+                newEntries[path] = selEntries[path]
+    else:
+        for path in newPaths:
+            newEntries[path], errorEvents = requestData(node, path)
+            if errorEvents is not None:
+                return None, errorEvents
+    for path in newEntries:
+        if not path.endswith('/callout') and newEntries[path].get('Timestamp', cursor['timestamp']) < cursor['timestamp']:
+            #a new id with an older time means the SEL was reset
+            return None, None
+    return newEntries, None
+
+def getCursor(selEntries):
+    """
+        Returns the cursor for the newest entry of a set of SEL entries, or None if there are no entries
+    """
+    cursor = None
+    for path in selEntries:
+        entryId = getEntryId(path)
+        if entryId is not None and not path.endswith('/callout') and (cursor is None or entryId > cursor['id']):
+            cursor = {'id': entryId, 'timestamp': selEntries[path].get('Timestamp', 0)}
+    return cursor
+
+def parseSELEntries(selEntries, devdebug=False):
+    """
+        Translates raw SEL entries into events using the cached policy table
+
+        @param selEntries: dictionary of SEL entries as returned by the BMC
+        @param devdebug: boolean, include the esel details in the events
+        @return: dictionary of events in the openbmctool sel print format
+    """
+    args = argparse.Namespace(json=True, devdebug=devdebug, fileloc=None, policyTableLoc=policyTableLoc)
+    events = openbmctool.parseAlerts(config.policyTable, selEntries, args)
+    events['numAlerts'] = len(events)
+    return events
+
+def getSELEvents(node):
+    """
+        Gets the alerts from the node's BMC without starting an openbmctool subprocess. Only the entries
+        created after the SEL cursor of the BMC are returned, the cursor is moved by finishPoll.
+
+        @param node: dictionary containing the node properties
+        @return: dictionary of events in the openbmctool sel print format
+    """
+    try:
+        bmcHostname = node['bmcHostname']
+        with cursorLock:
+            pollGenerations[bmcHostname] = cursorGenerations.get(bmcHostname, 0)
+        cursor = selCursors.get(bmcHostname)
+        selEntries = None
+        if cursor is not None:
+            selEntries, errorEvents = getNewSELEntries(node, cursor)
+            if errorEvents is not None:
+                return errorEvents
+            if selEntries is None:
+                selStats['resets'] += 1
+                config.errorLogger(syslog.LOG_INFO, "The SEL of {host} was cleared or wrapped, reading all of the entries".format(host=node['xcatNodeName']))
+            else:
+                selStats['incrementalReads'] += 1
+                pendingCursors[bmcHostname] = getCursor(selEntries) or cursor
+        if selEntries is None:
+            selEntries, errorEvents = getSELEntries(node)
+            if errorEvents is not None:
+                return errorEvents
+            selStats['fullReads'] += 1
+            pendingCursors[bmcHostname] = getCursor(selEntries) or {'id': 0, 'timestamp': 0}
+        if len(selEntries) == 0:
+            return {'numAlerts': 0}
+        polledEntries[bmcHostname] = selEntries
+        selStats['entriesParsed'] += len(selEntries)
+        return parseSELEntries(selEntries)
+    except Exception as e:
+        exc_type, exc_obj, exc_tb = sys.exc_info()
+        fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+        config.errorLogger(syslog.LOG_DEBUG, "Exception: Error: {err}, Details: {etype}, {fname}, {lineno}".format(err=e, etype=exc_type, fname=fname, lineno=exc_tb.tb_lineno))
+        traceback.print_tb(e.__traceback__)
+        return {'numAlerts': 0, 'failedPoll': True}
+
+def finishPoll(bmcHostname, processed):
+    """
+        Moves the SEL cursor of a BMC past the entries returned by the last poll. If the entries were not
+        processed, for example because a plugin could not be notified, the cursor is kept and they are
+        returned again by the next poll.
+
+        @param bmcHostname: string, the hostname or IP address of the bmc
+        @param processed: boolean, True when all of the returned entries were processed
+    """
+    polledEntries.pop(bmcHostname, None)
+    with cursorLock:
+        cursor = pendingCursors.pop(bmcHostname, None)
+        generation = pollGenerations.pop(bmcHostname, None)
+        if processed and cursor is not None and generation == cursorGenerations.get(bmcHostname, 0):
+            selCursors[bmcHostname] = cursor
+
+def getPolledEntries(bmcHostname):
+    """
+        Returns the raw SEL entries read from a BMC by its poll in progress, or None if there are none
+
+        @param bmcHostname: string, the hostname or IP address of the bmc
+    """
+    return polledEntries.get(bmcHostname)
+
+def dropCursor(bmcHostname):
+    """
+        Forgets the SEL cursor of a BMC, so the next poll reads its whole SEL again. A poll in progress does
+        not move the cursor when it finishes.
+
+        @param bmcHostname: string, the hostname or IP address of the bmc
+    """
+    with cursorLock:
+        cursorGenerations[bmcHostname] = cursorGenerations.get(bmcHostname, 0) + 1
+        selCursors.pop(bmcHostname, None)
+        pendingCursors.pop(bmcHostname, None)
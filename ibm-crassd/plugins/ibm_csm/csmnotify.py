@@ -34,6 +34,9 @@ def errorLogger(severity, message):
     syslog.syslog(severity, message)    
 
 def initialize():
+    config.pluginVars['csm'] = {}
+    #keep the connection to csmrestd alive between the alerts
+    config.pluginVars['csm']['session'] = requests.Session()
     config.pluginPolicies['csmPolicy'] = loadPolicyTable('/opt/ibm/ras/bin/plugins/ibm_csm/CSMpolicyTable.json')
     if config.pluginPolicies['csmPolicy'] is not None:
         return True
@@ -62,14 +65,9 @@ def createArgString(cerEvent):
             break
         argInstance += 1
     return argString
-def notifyCSM(cerEvent, impactedNode, entityAttr):
+def getCSMUrl():
     """
-         sends alert to CSM
-           
-         @param cerEvent: dict, the cerEvent to send
-         @param impactedNode; the node that had the alert
-         @param entityAttr: dictionary, contains the list of known attributes for the entity to report to
-         @return: True if notification was successful, false if it was unable to send the alert
+         returns the url of the csmrestd service to create RAS events with
     """
     try:
         host=config.pluginConfigs['csm']['host']
@@ -78,16 +76,32 @@ def notifyCSM(cerEvent, impactedNode, entityAttr):
         errorLogger(syslog.LOG_ERR, "Host and port configurations missing for CSM plugin. Defaulting to 127.0.0.1:4213")
         host="127.0.0.1"
         port="4213"
-    httpHeader = {'Content-Type':'application/json'}
-    with config.lock:
-        failedFirstFlag = entityAttr['csm']['failedFirstTry']
-        csmDown = entityAttr['csm']['receiveEntityDown']
+    return 'http://{host}:{port}/csmi/V1.0/ras/event/create'.format(host=host, port=port)
+
+def isCSMEnabled(cerEvent):
+    """
+         checks the CSM policy table for alerts that are not forwarded to CSM
+           
+         @param cerEvent: dict, the cerEvent to send
+         @return: False if the policy table disables the alert for CSM
+    """
     try:
         if(config.pluginPolicies['csmPolicy'][cerEvent['CerID']]['CSMEnabled']== False):
-            return True
+            return False
     except KeyError:
         #Report the alert is missing and forward the event to CSM by default. 
         config.errorLogger(syslog.LOG_ERR, "Event ID {cerID} missing in CSM Policy Table. Forwarding to CSM".format(cerID=cerEvent['CerID']))
+    return True
+
+def createEventEntry(cerEvent, impactedNode, failedFirstFlag):
+    """
+         creates the CSM RAS event for an alert
+           
+         @param cerEvent: dict, the cerEvent to send
+         @param impactedNode; the node that had the alert
+         @param failedFirstFlag: True to send the generic event used when the first attempt failed
+         @return: tuple of the message ID and the event to post
+    """
     if(failedFirstFlag == False):
         msgID = "bmc." + "".join(cerEvent['eventType'].split()) + "." + cerEvent['CerID']
         argString = createArgString(cerEvent)
@@ -106,9 +120,24 @@ def notifyCSM(cerEvent, impactedNode, entityAttr):
                                   cerEvent['severity'])}
     if("additionalDetails" in cerEvent):
         eventEntry['raw_data'] = eventEntry['raw_data'] + cerEvent['sensor'] + " || " + cerEvent['state'] + " || " + cerEvent['additionalDetails']
+    return msgID, eventEntry
+
+def postEvent(session, csmurl, msgID, eventEntry, impactedNode, entityAttr, csmDown):
+    """
+         posts a RAS event to csmrestd
+           
+         @param session: the requests.Session holding the connection to csmrestd
+         @param csmurl: the url to post the event to
+         @param msgID: the message ID of the event
+         @param eventEntry: dict, the event to post
+         @param impactedNode; the node that had the alert
+         @param entityAttr: dictionary, contains the list of known attributes for the entity to report to
+         @param csmDown: True if csmrestd was down before this attempt
+         @return: True if notification was successful, false if it was unable to send the alert
+    """
+    httpHeader = {'Content-Type':'application/json'}
     try:
-        csmurl = 'http://{host}:{port}/csmi/V1.0/ras/event/create'.format(host=host, port=port)
-        r = requests.post(csmurl, headers=httpHeader, data=json.dumps(eventEntry), timeout=30)
+        r = session.post(csmurl, headers=httpHeader, data=json.dumps(eventEntry), timeout=30)
         if (r.status_code != 200):
 
             with config.lock:
@@ -135,6 +164,55 @@ def notifyCSM(cerEvent, impactedNode, entityAttr):
         return False   
     except IndexError:
         traceback.print_stack()
+        return False
+
+def notifyCSM(cerEvent, impactedNode, entityAttr):
+    """
+         sends alert to CSM
+           
+         @param cerEvent: dict, the cerEvent to send
+         @param impactedNode; the node that had the alert
+         @param entityAttr: dictionary, contains the list of known attributes for the entity to report to
+         @return: True if notification was successful, false if it was unable to send the alert
+    """
+    csmurl = getCSMUrl()
+    with config.lock:
+        failedFirstFlag = entityAttr['csm']['failedFirstTry']
+        csmDown = entityAttr['csm']['receiveEntityDown']
+    if not isCSMEnabled(cerEvent):
+        return True
+    msgID, eventEntry = createEventEntry(cerEvent, impactedNode, failedFirstFlag)
+    return postEvent(config.pluginVars['csm']['session'], csmurl, msgID, eventEntry, impactedNode, entityAttr, csmDown)
+
+def notifyBatch(events, entityAttr):
+    """
+         sends a batch of alerts to CSM. The csmrestd API creates one RAS event per request, so the events
+         of the batch are posted over the one kept alive connection of the session, and the rest of the batch
+         is failed without being posted once csmrestd is found to be down.
+           
+         @param events: list of tuples of the cerEvent to send and the node that had the alert
+         @param entityAttr: dictionary, contains the list of known attributes for the entity to report to
+         @return: list with True for every alert that was sent or is not forwarded to CSM
+    """
+    csmurl = getCSMUrl()
+    with config.lock:
+        failedFirstFlag = entityAttr['csm']['failedFirstTry']
+        csmDown = entityAttr['csm']['receiveEntityDown']
+    results = []
+    posted = False
+    for cerEvent, impactedNode in events:
+        if not isCSMEnabled(cerEvent):
+            results.append(True)
+            continue
+        if posted and csmDown:
+            results.append(False)
+            continue
+        posted = True
+        msgID, eventEntry = createEventEntry(cerEvent, impactedNode, failedFirstFlag)
+        results.append(postEvent(config.pluginVars['csm']['session'], csmurl, msgID, eventEntry, impactedNode, entityAttr, csmDown))
+        with config.lock:
+            csmDown = entityAttr['csm']['receiveEntityDown']
+    return results
     
      
 def loadPolicyTable(fileLoc):
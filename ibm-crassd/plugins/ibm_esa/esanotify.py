@@ -26,7 +26,10 @@ except ImportError:
 import traceback
 import socket
 import multiprocessing
+from multiprocessing.pool import ThreadPool
 import openbmctool
+import sessionPool
+import ipmiShellPool
 import subprocess
 import sys
 import os, shutil
@@ -116,9 +119,9 @@ def getOBMCEndpointInfo(hostIP, nodeIP, nodeUser, nodePass):
         @return: NoneType if collection failed, 
                  Dictionary with node info if successful
     '''
-    bmcsession = openbmctool.login(nodeIP, nodeUser, nodePass, True, False)
+    bmcsession = sessionPool.getSession(nodeIP, nodeUser, nodePass)
     nodeInfo = None
-    if isinstance(bmcsession, str):
+    if bmcsession is None or isinstance(bmcsession, str):
         config.errorLogger(syslog.LOG_ERR, "ESA Plugin Failed to login to the bmc: {bmc}".format(bmc=nodeIP))
     else:
         url="https://"+nodeIP+"/xyz/openbmc_project/inventory/system"
@@ -165,6 +168,29 @@ def getOBMCEndpointInfo(hostIP, nodeIP, nodeUser, nodePass):
         return nodeInfo        
 
 
+def runIPMITool(nodeIP, nodeUser, nodePass, command):
+    '''
+        Runs an ipmitool command for a BMC, in a pooled ipmitool shell when they are enabled
+        @param nodeIP: The address of the bmc
+        @param nodeUser: The username for the bmc
+        @param nodePass: The password for the bmc
+        @param command: list of the ipmitool command and its arguments
+        @return: string, the output of the command
+        raises subprocess.CalledProcessError with the output of ipmitool when the command failed
+    '''
+    if config.ipmiShellSessions:
+        output, healthy = ipmiShellPool.runCommand(nodeIP, nodeUser, nodePass, ' '.join(command))
+        if output is not None and not healthy:
+            raise subprocess.CalledProcessError(1, command, output=output.encode('utf-8'))
+        if output is not None:
+            return output
+    return subprocess.check_output(['ipmitool', 
+                                    '-I', 'lanplus',
+                                    '-H', nodeIP, 
+                                    '-U', nodeUser, 
+                                    '-P', nodePass] + command, stderr=subprocess.STDOUT).decode('utf-8')
+
+
 def getIPMIEndpointInfo(hostIP, nodeIP, nodeUser, nodePass):
     '''
         Collects information from an IPMI based system
@@ -177,13 +203,7 @@ def getIPMIEndpointInfo(hostIP, nodeIP, nodeUser, nodePass):
     '''
     nodeInfo = None
     try:
-        chassisInfo = subprocess.check_output(['/usr/bin/ipmitool', 
-                                               '-I', 'lanplus',
-                                               '-H', nodeIP, 
-                                               '-U', nodeUser, 
-                                               '-P', nodePass, 
-                                               'fru', 'print', '0'
-                                              ], stderr=subprocess.STDOUT).decode('utf-8')
+        chassisInfo = runIPMITool(nodeIP, nodeUser, nodePass, ['fru', 'print', '0'])
         nodeInfo = {}
         for line in chassisInfo.split("\n"):
             #AssetTag
@@ -226,13 +246,7 @@ def getIPMIEndpointInfo(hostIP, nodeIP, nodeUser, nodePass):
     firmwareString = ''
     #collect host firmware info
     try:
-        chassisInfo = subprocess.check_output(['/usr/bin/ipmitool', 
-                                               '-I', 'lanplus',
-                                               '-H', nodeIP, 
-                                               '-U', nodeUser, 
-                                               '-P', nodePass, 
-                                               'fru', 'print', '47'
-                                              ], stderr=subprocess.STDOUT).decode('utf-8')
+        chassisInfo = runIPMITool(nodeIP, nodeUser, nodePass, ['fru', 'print', '47'])
         for line in chassisInfo.split("\n"):
             if 'Product Version' in line:
                 firmwareInfo  = "Host: {version}\n".format(version=line.split(':')[1].strip())
@@ -257,13 +271,7 @@ def getIPMIEndpointInfo(hostIP, nodeIP, nodeUser, nodePass):
 
     # collect bmc firmware info
     try:
-        chassisInfo = subprocess.check_output(['/usr/bin/ipmitool', 
-                                               '-I', 'lanplus',
-                                               '-H', nodeIP, 
-                                               '-U', nodeUser, 
-                                               '-P', nodePass, 
-                                               'mc', 'info'
-                                              ], stderr=subprocess.STDOUT).decode('utf-8')
+        chassisInfo = runIPMITool(nodeIP, nodeUser, nodePass, ['mc', 'info'])
         for line in chassisInfo.split("\n"):
             if 'Firmware Revision' in line:
                 firmwareInfo  = firmwareInfo + "BMC: {version}\n".format(version= line.split(':')[1].strip())
@@ -833,6 +841,9 @@ def primaryMonitoringProcess():
         This is run as a sub process and handles the main work with collecting service data
         and with daily routines       
     ''' 
+    #the BMC sessions and ipmitool shells of the main process are not used by this process
+    sessionPool.resetPool()
+    ipmiShellPool.resetPool()
     if config.pluginVars['esa']['runDaily'].is_set():
         if not 'scheduler' in dir():
             #Using default MemoryJobStore , default maximum thread count 10 , default job instance 1
@@ -922,7 +933,8 @@ def initialize():
             config.pluginVars['esa']['runDaily'].set()
             
         if config.pluginVars['esa']['crassdID'] is not None:
-            with multiprocessing.Pool(min(40, len(config.mynodelist))) as p:
+            #collected in threads so the BMC sessions are kept for the polls
+            with ThreadPool(min(40, len(config.mynodelist))) as p:
                 updatedNodeList = p.map(nodeInfoCollection, config.mynodelist)
                 with config.lock:
                     config.mynodelist = updatedNodeList
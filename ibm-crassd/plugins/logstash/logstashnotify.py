@@ -67,13 +67,26 @@ def connectToSocket(logSocket, host, port, logstashDown):
             config.errorLogger(syslog.LOG_ERR, "Logstash connection failure: {}".format(errorString))
     return connected
 
+def formatLogEntry(logEntry):
+    """
+        Formats an alert as a single JSON line for logstash
+        @param logEntry: dictionary, the alert to send
+        
+        @return: the JSON line ending with a newline
+    """
+    return json.dumps(logEntry, indent=0, separators=(',', ':')).replace('\n','') +"\n"
+
 def writeToSocket(logSocket, alert2Send):
     #while not config.killNow:
         sendFailed = False
         #alert2Send = logqueue.get()
         #data2send = json.dumps(alert2Send['logEntry'],sort_keys=False, indent=4, separators=(',', ': ')).encode()
 #         eventTime =datetime.datetime.fromtimestamp(int(alert2Send['logEntry']['timestamp'])).strftime("%Y-%m-%d %H:%M:%S")
-        data2send = json.dumps(alert2Send['logEntry'], indent=0, separators=(',', ':')).replace('\n','') +"\n"
+        if 'logEntries' in alert2Send:
+            #a batch of alerts is sent as one write of JSON lines
+            data2send = "".join(formatLogEntry(logEntry) for logEntry in alert2Send['logEntries'])
+        else:
+            data2send = formatLogEntry(alert2Send['logEntry'])
         data2send = data2send.encode()
         try:
             logSocket.sendall(data2send)
@@ -128,6 +141,19 @@ def initialize():
     return True
    
 
+def createLogEntry(cerEvent, impactedNode):
+    """
+         creates the logstash entry of an alert
+           
+         @param cerEvent: dict, the cerEvent to send
+         @param impactedNode: the node that had the alert
+         @return: dictionary, the entry to send to logstash
+    """
+    return {'type':'ibm-crasssd-bmc-alerts', 'source': impactedNode, 
+            'timestamp': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'data': cerEvent
+           }
+
 def notifyLogstash(cerEvent, impactedNode, entityAttr):
     """
          sends alert to logstash
@@ -138,13 +164,24 @@ def notifyLogstash(cerEvent, impactedNode, entityAttr):
          @return: True if notification was successful, false if it was unable to send the alert
     """
     
-    newAlert = {'type':'ibm-crasssd-bmc-alerts', 'source': impactedNode, 
-                'timestamp': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'data': cerEvent
-             }
+    newAlert = createLogEntry(cerEvent, impactedNode)
     queDict = {}
     queDict['entityAttr'] = entityAttr
     queDict['logEntry'] = newAlert
     return writeToSocket(config.pluginVars['logstash']['logstashSocket'], queDict)
     
-     
\ No newline at end of file
+     
+
+def notifyBatch(events, entityAttr):
+    """
+         sends a batch of alerts to logstash with a single write
+           
+         @param events: list of tuples of the cerEvent to send and the node that had the alert
+         @param entityAttr: dictionary, contains the list of known attributes for the entity to report to
+         @return: list with True for every alert that was sent, the alerts are all sent or all fail together
+    """
+    queDict = {}
+    queDict['entityAttr'] = entityAttr
+    queDict['logEntries'] = [createLogEntry(cerEvent, impactedNode) for cerEvent, impactedNode in events]
+    sent = writeToSocket(config.pluginVars['logstash']['logstashSocket'], queDict)
+    return [sent] * len(events)
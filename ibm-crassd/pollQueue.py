@@ -0,0 +1,156 @@
+#
+#  Copyright 2017 IBM Corporation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+"""
+    This module is the queue of nodes whose alerts have to be fetched by the worker threads. It holds at most
+    one pending fetch per BMC. Push notifications arrive in bursts, a BMC logging one error sends several
+    property changes, and each of them asks for the alerts of the node. A request for a BMC that is already
+    waiting in the queue is merged with the waiting one. A request for a BMC that is being fetched marks it
+    dirty instead, and the BMC is queued once more when the worker thread finishes, so alerts logged during a
+    fetch are not missed.
+
+    A request can carry the SEL entries pushed by the BMC, so the worker thread can process them without
+    reading the SEL. Pushed entries for the same BMC are merged. A request without entries asks for the SEL
+    to be read, and since that read returns every new entry, it replaces the pushed entries it is merged with.
+
+    A request can also carry a token that identifies who asked for it, the poll scheduler uses it to tell its
+    own polls from the ones asked for by push notifications. The token is kept when the request is merged, and
+    getToken returns the token of the fetch a worker thread is running.
+
+    Worker threads take nodes with get() and must call done() with the node when they are finished with it.
+"""
+import collections
+import threading
+import time
+
+order = collections.deque()
+pending = {}
+running = set()
+dirty = {}
+runningTokens = {}
+queueCondition = threading.Condition()
+stats = {'triggers': 0, 'pushed': 0, 'queued': 0, 'suppressed': 0, 'reruns': 0}
+
+def getKey(node):
+    return node['bmcHostname']
+
+def mergeEntries(queuedEntries, selEntries):
+    """
+        Returns the SEL entries of two requests for the same BMC, None when the SEL has to be read
+    """
+    if queuedEntries is None or selEntries is None:
+        return None
+    merged = dict(queuedEntries)
+    merged.update(selEntries)
+    return merged
+
+def put(node, selEntries=None, token=None):
+    """
+        Asks for the alerts of a node to be fetched
+
+        @param node: the node dictionary to fetch the alerts of
+        @param selEntries: dictionary of SEL entries pushed by the BMC, None to read the SEL
+        @param token: identifies the request to the one who made it, see getToken
+    """
+    with queueCondition:
+        stats['triggers'] += 1
+        if selEntries is not None:
+            stats['pushed'] += 1
+        key = getKey(node)
+        if key in running:
+            if key in dirty:
+                stats['suppressed'] += 1
+                selEntries = mergeEntries(dirty[key][1], selEntries)
+                if token is None:
+                    token = dirty[key][2]
+            #the latest copy of the node is used for the next fetch
+            dirty[key] = (node, selEntries, token)
+        elif key in pending:
+            stats['suppressed'] += 1
+            if token is None:
+                token = pending[key][2]
+            pending[key] = (node, mergeEntries(pending[key][1], selEntries), token)
+        else:
+            pending[key] = (node, selEntries, token)
+            order.append(key)
+            stats['queued'] += 1
+            queueCondition.notify()
+
+def get(timeout=None):
+    """
+        Takes the next node to fetch the alerts of, waiting until there is one
+
+        @param timeout: the number of seconds to wait, None to wait until there is a node
+        @return: tuple of the node dictionary and the pushed SEL entries, which are None when the SEL has to
+        be read. The node is None when the timeout expired.
+    """
+    if timeout is not None:
+        deadline = time.time() + timeout
+    with queueCondition:
+        while not order:
+            if timeout is None:
+                queueCondition.wait()
+            else:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None, None
+                queueCondition.wait(remaining)
+        key = order.popleft()
+        running.add(key)
+        node, selEntries, runningTokens[key] = pending.pop(key)
+        return node, selEntries
+
+def done(node):
+    """
+        Marks the fetch of a node as finished and queues it again when it was asked for during the fetch
+
+        @param node: the node dictionary returned by get
+    """
+    with queueCondition:
+        key = getKey(node)
+        running.discard(key)
+        runningTokens.pop(key, None)
+        if key in dirty:
+            pending[key] = dirty.pop(key)
+            order.append(key)
+            stats['reruns'] += 1
+            queueCondition.notify()
+
+def getToken(node):
+    """
+        Returns the token of the request served by the fetch of a node that is running, None if no request
+        with a token was merged into it
+    """
+    with queueCondition:
+        return runningTokens.get(getKey(node))
+
+def qsize():
+    """
+        Returns the number of nodes waiting to be fetched
+    """
+    with queueCondition:
+        return len(order)
+
+def getQueueStats():
+    """
+        Returns the queue statistics for logging
+    """
+    with queueCondition:
+        queueStats = dict(stats)
+        queueStats['pending'] = len(order)
+        queueStats['running'] = len(running)
+        queueStats['dirty'] = len(dirty)
+    return queueStats
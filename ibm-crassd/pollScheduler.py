@@ -0,0 +1,183 @@
+#
+#  Copyright 2017 IBM Corporation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+"""
+    This module schedules the polling of the nodes that do not support push notifications. Every node has its
+    own due time kept in a heap, and a single scheduler thread puts each node on the poll queue when it
+    comes due. The first due times are spread evenly across the polling interval so the worker threads get a
+    steady stream of nodes instead of all of them at once.
+
+    Each node gets a small random jitter on every due time so the nodes do not drift back into step. Nodes that
+    fail to be polled have their interval doubled, up to the maximum polling interval, and go back to the normal
+    interval after the next successful poll. The worker threads report every finished poll with pollComplete,
+    which records how late the poll started compared to its due time. Each poll the scheduler asks for carries
+    a new token of its node, so polls asked for by push notifications or by hand, which may finish while the
+    scheduled poll is still queued or running, are not taken for it. A node that is still queued or being
+    polled when it comes due again has fallen behind, that round is skipped and counted.
+"""
+import heapq
+import os
+import random
+import sys
+import syslog
+import threading
+import time
+import traceback
+import config
+import pollQueue
+
+#the longest the scheduler thread sleeps before checking for termination
+maxSleep = 1.0
+
+schedule = []
+entries = {}
+scheduleCondition = threading.Condition()
+settings = {'interval': 25.0, 'maxInterval': 300.0, 'jitter': 0.1}
+stats = {'dispatched': 0, 'completed': 0, 'failed': 0, 'behind': 0, 'late': 0, 'totalLateness': 0.0, 'maxLateness': 0.0}
+
+def getJitter(interval):
+    """
+        Returns a random offset of up to the jitter fraction of the interval, in either direction
+    """
+    return random.uniform(-settings['jitter'], settings['jitter']) * interval
+
+def scheduleNode(entry, phase):
+    """
+        Places a node in the heap. Must be called with the schedule condition held.
+
+        @param entry: the schedule entry of the node
+        @param phase: the time the node is due without jitter
+    """
+    entry['phase'] = phase
+    entry['due'] = phase + getJitter(entry['interval'])
+    heapq.heappush(schedule, (entry['due'], entry['name']))
+    scheduleCondition.notify()
+
+def start(nodeList, interval, maxInterval=None, jitter=0.1):
+    """
+        Schedules the nodes and starts the scheduler thread
+
+        @param nodeList: list of the node dictionaries to poll
+        @param interval: the number of seconds between polls of each node
+        @param maxInterval: the longest number of seconds between polls of a node that keeps failing
+        @param jitter: fraction of the interval to randomly move each due time by
+        @return: the scheduler thread
+    """
+    with scheduleCondition:
+        settings['interval'] = float(interval)
+        settings['maxInterval'] = max(float(maxInterval or interval), settings['interval'])
+        settings['jitter'] = max(0.0, min(float(jitter), 0.5))
+        now = time.time()
+        for i, node in enumerate(nodeList):
+            entry = {'name': node['xcatNodeName'], 'node': node, 'interval': settings['interval'], 'inFlight': False,
+                     'dispatchedDue': None, 'token': 0}
+            entries[entry['name']] = entry
+            #spread the first due times evenly across the interval
+            scheduleNode(entry, now + settings['interval'] * i / len(nodeList))
+    t = threading.Thread(target=runScheduler)
+    t.daemon = True
+    t.start()
+    return t
+
+def dispatchDue(now):
+    """
+        Puts every node that is due on the poll queue and schedules its next poll. Must be called with the
+        schedule condition held.
+
+        @param now: the current time
+        @return: the number of seconds until the next node is due
+    """
+    while schedule and schedule[0][0] <= now:
+        due, name = heapq.heappop(schedule)
+        entry = entries[name]
+        if entry['inFlight']:
+            stats['behind'] += 1
+            config.errorLogger(syslog.LOG_DEBUG, "Skipping a poll of {node}, the previous poll has not finished".format(node=name))
+        else:
+            entry['inFlight'] = True
+            entry['dispatchedDue'] = due
+            entry['token'] += 1
+            stats['dispatched'] += 1
+            pollQueue.put(entry['node'], token=entry['token'])
+        nextPhase = entry['phase'] + entry['interval']
+        if nextPhase <= now:
+            #keep the place of the node in the interval instead of polling it again right away
+            nextPhase += entry['interval'] * (int((now - nextPhase) / entry['interval']) + 1)
+        scheduleNode(entry, nextPhase)
+    if schedule:
+        return schedule[0][0] - now
+    return maxSleep
+
+def runScheduler():
+    """
+        Runs the scheduler until the service is stopped
+    """
+    while not config.killNow:
+        try:
+            with scheduleCondition:
+                wait = dispatchDue(time.time())
+                if wait > 0:
+                    scheduleCondition.wait(min(wait, maxSleep))
+        except Exception as e:
+            exc_type, exc_obj, exc_tb = sys.exc_info()
+            fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+            config.errorLogger(syslog.LOG_ERR, "Exception in the poll scheduler: {type} {fname} {lineNo}".format(
+                type=exc_type, fname=fname, lineNo=exc_tb.tb_lineno))
+            config.errorLogger(syslog.LOG_ERR, str(e))
+            traceback.print_tb(e.__traceback__)
+            time.sleep(maxSleep)
+
+def pollComplete(node, success, started, token=None):
+    """
+        Records a finished poll of a node and adapts its polling interval. Polls that were not put on the
+        queue by the scheduler are ignored.
+
+        @param node: the node dictionary that was polled
+        @param success: boolean, False when the BMC could not be reached
+        @param started: the time a worker thread started polling the node
+        @param token: the token of the poll returned by pollQueue.getToken
+    """
+    with scheduleCondition:
+        entry = entries.get(node['xcatNodeName'])
+        if entry is None or not entry['inFlight'] or token != entry['token']:
+            return
+        entry['inFlight'] = False
+        stats['completed'] += 1
+        lateness = max(0.0, started - entry['dispatchedDue'])
+        stats['totalLateness'] += lateness
+        stats['maxLateness'] = max(stats['maxLateness'], lateness)
+        if lateness > entry['interval']:
+            stats['late'] += 1
+            config.errorLogger(syslog.LOG_WARNING, "Polling of {node} started {late:.1f} seconds after it was due. Consider raising maxThreads.".format(
+                node=entry['name'], late=lateness))
+        if success:
+            entry['interval'] = settings['interval']
+        else:
+            stats['failed'] += 1
+            entry['interval'] = min(entry['interval'] * 2, settings['maxInterval'])
+
+def getSchedulerStats():
+    """
+        Returns the scheduler statistics for logging
+    """
+    with scheduleCondition:
+        schedulerStats = dict(stats)
+        schedulerStats['nodes'] = len(entries)
+        schedulerStats['inFlight'] = len([name for name in entries if entries[name]['inFlight']])
+        schedulerStats['backedOff'] = len([name for name in entries if entries[name]['interval'] > settings['interval']])
+        if stats['completed'] > 0:
+            schedulerStats['averageLateness'] = stats['totalLateness'] / stats['completed']
+    return schedulerStats
@@ -0,0 +1,461 @@
+#
+#  Copyright 2017 IBM Corporation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+"""
+    This module holds the sensor readings of all the monitored nodes in a shared memory table. The table is an
+    anonymous shared mmap created by the telemetry server before it starts its subprocesses, so the gatherer
+    processes and the socket server all see the same memory. Gatherers write the slots of their nodes and the
+    socket server reads them directly, without copying the data through a queue.
+
+    Every node has a fixed region, assigned from its position in the node list:
+        node header: seq, catalog version, sensor count, Connected, NodeState, LastUpdateReceived
+        catalog:     json lists of the sensor names, the sensor types and the type code of every sensor
+        slots:       one per sensor with seq, flags, type code, value, scale and the time it was written
+
+    Each node is only written by the gatherer process that monitors it. Writers and readers of a node hold the
+    node lock, one of lockStripes process shared locks, so a reader never sees a header or slot half written.
+    The locks also order the writes to the shared memory for readers on other cores. Readers only copy the
+    bytes of the node while they hold the lock and decode them after releasing it, and skip a node whose lock
+    they cannot get within readLockTimeout. The pid of the process holding each lock is kept next to it, so a
+    lock left held by a process that died is taken over instead of stalling every node of its stripe. Every header and slot has a
+    sequence counter that is bumped on each write, so readers can reuse what they decoded for slots that did
+    not change. The catalog only changes when a sensor is added or changes type, so readers keep a parsed copy
+    and only read it again when the catalog version changes. Gatherers publish the catalog changes of a flush
+    at once with publishCatalogs, slots of sensors that are not in the published catalog yet are not read.
+
+    Readers can read a selection of the slots of a node, for example the sensors matching the filters of a
+    telemetry client. The selection is computed from the catalog and cached with it, so it is only computed
+    again when the catalog of the node changes.
+"""
+import contextlib
+import json
+import mmap
+import multiprocessing
+import os
+import struct
+import syslog
+import time
+import config
+
+#seq, catalog version, sensor count, Connected, NodeState, LastUpdateReceived
+nodeHeader = struct.Struct('<IIIbbxxq')
+nodeHeaderSize = 32
+#seq, flags, type code, value, scale, timestamp
+slotStruct = struct.Struct('<IHHddd')
+slotSize = slotStruct.size
+seqStruct = struct.Struct('<I')
+catalogLength = struct.Struct('<I')
+catalogSize = 16384
+
+valuePresent = 0x1
+valueIsInt = 0x2
+scalePresent = 0x4
+scaleIsInt = 0x8
+sensorRemoved = 0x10
+
+nodeStateCodes = {None: 0, False: 1, 'Powered On': 2, 'Powered Off': 3}
+nodeStates = {0: None, 1: False, 2: 'Powered On', 3: 'Powered Off'}
+connectedCodes = {None: -1, False: 0, True: 1}
+connectedStates = {-1: None, 0: False, 1: True}
+#number of locks shared by the nodes, node i uses lock i % lockStripes
+lockStripes = 64
+#seconds between the checks that the process holding a node lock is still alive
+staleLockCheck = 1.0
+#seconds a reader waits for a node lock before it skips the node
+readLockTimeout = 0.5
+
+table = None
+nodeLocks = []
+#pid of the process holding each node lock, 0 when it is free
+lockOwners = None
+takeoverLock = None
+maxSensors = 256
+regionSize = 0
+nodeIndex = {}
+nodeNames = []
+#catalogs of the nodes written by this process
+writerCatalogs = {}
+
+def create(nodeList, sensorsPerNode=256):
+    """
+        Creates the shared table. Must be called before the subprocesses that use it are started.
+        @param nodeList: list of the nodes to make a region for, in the order of their regions
+        @param sensorsPerNode: the number of sensor slots for each node
+    """
+    global table
+    global maxSensors
+    global regionSize
+    global nodeNames
+    maxSensors = sensorsPerNode
+    regionSize = nodeHeaderSize + catalogSize + maxSensors * slotSize
+    nodeNames = [node['xcatNodeName'] for node in nodeList]
+    nodeIndex.clear()
+    writerCatalogs.clear()
+    for i in range(len(nodeNames)):
+        nodeIndex[nodeNames[i]] = i
+    table = mmap.mmap(-1, max(regionSize * len(nodeNames), mmap.PAGESIZE))
+    global lockOwners
+    global takeoverLock
+    nodeLocks[:] = [multiprocessing.Lock() for i in range(min(lockStripes, max(len(nodeNames), 1)))]
+    lockOwners = multiprocessing.RawArray('i', len(nodeLocks))
+    takeoverLock = multiprocessing.Lock()
+    for i in range(len(nodeNames)):
+        nodeHeader.pack_into(table, i * regionSize, 0, 0, 0, connectedCodes[None], nodeStateCodes[None], -1)
+        catalogLength.pack_into(table, i * regionSize + nodeHeaderSize, 0)
+
+def tableSize():
+    """
+        Returns the size of the shared table in bytes
+    """
+    if table is None:
+        return 0
+    return len(table)
+
+def isProcessAlive(pid):
+    """
+        Returns False if the process has exited, including a process that exited but was not reaped yet
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    try:
+        with open('/proc/{pid}/stat'.format(pid=pid), 'r') as f:
+            #the state follows the command name, which is in parentheses
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except (IOError, OSError, IndexError):
+        return False
+
+def acquireNodeLock(nodeName, timeout=None):
+    """
+        Takes the lock of a node, taking it over when the process holding it has exited
+
+        @param nodeName: the xcatNodeName of the node
+        @param timeout: the most seconds to wait, None to wait as long as a live process holds the lock
+        @return: the stripe of the lock to pass to releaseNodeLock, or None if the timeout expired
+    """
+    stripe = nodeIndex[nodeName] % len(nodeLocks)
+    lock = nodeLocks[stripe]
+    deadline = None if timeout is None else time.time() + timeout
+    while True:
+        wait = staleLockCheck if deadline is None else max(0.0, min(staleLockCheck, deadline - time.time()))
+        if lock.acquire(True, wait):
+            lockOwners[stripe] = os.getpid()
+            return stripe
+        owner = lockOwners[stripe]
+        if owner != 0 and not isProcessAlive(owner) and takeoverLock.acquire(True, staleLockCheck):
+            try:
+                #the lock stays held, it is released by the process taking it over
+                if lockOwners[stripe] == owner:
+                    lockOwners[stripe] = os.getpid()
+                    config.errorLogger(syslog.LOG_WARNING, "Taking over the sensor table lock of {node} from the exited process {pid}".format(
+                        node=nodeName, pid=owner))
+                    return stripe
+            finally:
+                takeoverLock.release()
+        if deadline is not None and time.time() >= deadline:
+            return None
+
+def releaseNodeLock(stripe):
+    lockOwners[stripe] = 0
+    nodeLocks[stripe].release()
+
+@contextlib.contextmanager
+def lockedNode(nodeName):
+    """
+        Holds the lock of a node while a writer updates its region
+    """
+    stripe = acquireNodeLock(nodeName)
+    try:
+        yield
+    finally:
+        releaseNodeLock(stripe)
+
+def nextSeq(offset):
+    return (seqStruct.unpack_from(table, offset)[0] + 1) & 0xffffffff
+
+def writeNodeHeader(base, catalogVersion, sensorCount, connected, nodeState, lastUpdate):
+    nodeHeader.pack_into(table, base, nextSeq(base), catalogVersion, sensorCount, connected, nodeState, lastUpdate)
+
+def writeCatalog(base, catalog):
+    """
+        Writes the sensor name catalog of a node and bumps its catalog version. Must be called with the node lock held.
+        @return: True if the catalog fit in the node region
+    """
+    data = json.dumps([catalog['sensors'], catalog['types'], catalog['sensorTypes']], separators=(',', ':')).encode()
+    if len(data) + catalogLength.size > catalogSize:
+        return False
+    seq, version, sensorCount, connected, nodeState, lastUpdate = nodeHeader.unpack_from(table, base)
+    catalogLength.pack_into(table, base + nodeHeaderSize, len(data))
+    table[base + nodeHeaderSize + catalogLength.size:base + nodeHeaderSize + catalogLength.size + len(data)] = data
+    writeNodeHeader(base, (version + 1) & 0xffffffff, len(catalog['sensors']), connected, nodeState, lastUpdate)
+    return True
+
+def resetNode(nodeName):
+    """
+        Clears the sensors of a node. Used when a gatherer process starts monitoring the node.
+        @param nodeName: the xcatNodeName of the node
+    """
+    if nodeName not in nodeIndex:
+        return
+    base = nodeIndex[nodeName] * regionSize
+    catalog = {'sensors': [], 'types': [], 'sensorTypes': [], 'slots': {}, 'typeCodes': {}, 'changed': False}
+    writerCatalogs[nodeName] = catalog
+    with lockedNode(nodeName):
+        writeCatalog(base, catalog)
+
+def getWriterCatalog(nodeName):
+    if nodeName not in writerCatalogs:
+        resetNode(nodeName)
+    return writerCatalogs[nodeName]
+
+def addSensor(nodeName, sname, catalog):
+    """
+        Assigns a slot to a new sensor of a node. The sensor is visible to readers after publishCatalogs.
+        @return: the slot number, or None if the node has no free slots
+    """
+    if len(catalog['sensors']) >= maxSensors:
+        config.errorLogger(syslog.LOG_ERR, "The sensor table is full for {node}, {sensor} is not streamed. Increase maxSensorsPerNode.".format(node=nodeName, sensor=sname))
+        return None
+    catalog['sensors'].append(sname)
+    catalog['sensorTypes'].append(0)
+    catalog['slots'][sname] = len(catalog['sensors']) - 1
+    catalog['changed'] = True
+    return catalog['slots'][sname]
+
+def getTypeCode(nodeName, sensorType, catalog):
+    if sensorType is None:
+        return 0
+    sensorType = tuple(sensorType)
+    if sensorType not in catalog['typeCodes']:
+        catalog['types'].append(list(sensorType))
+        catalog['typeCodes'][sensorType] = len(catalog['types'])
+        catalog['changed'] = True
+    return catalog['typeCodes'][sensorType]
+
+def publishCatalogs():
+    """
+        Writes the catalogs changed by this process since the last call, making new sensors visible to readers
+    """
+    for nodeName in writerCatalogs:
+        catalog = writerCatalogs[nodeName]
+        if not catalog['changed']:
+            continue
+        catalog['changed'] = False
+        base = nodeIndex[nodeName] * regionSize
+        with lockedNode(nodeName):
+            while not writeCatalog(base, catalog):
+                #drop the newest sensors until the catalog fits in the node region
+                sname = catalog['sensors'].pop()
+                catalog['sensorTypes'].pop()
+                del catalog['slots'][sname]
+                config.errorLogger(syslog.LOG_ERR, "The sensor catalog is full for {node}, {sensor} is not streamed.".format(node=nodeName, sensor=sname))
+
+def encodeNumber(number, presentFlag, intFlag):
+    if isinstance(number, bool) or not isinstance(number, (int, float)):
+        return 0, 0.0
+    if isinstance(number, int):
+        return presentFlag | intFlag, float(number)
+    return presentFlag, number
+
+def writeSlot(offset, flags, typeCode, value, scale):
+    slotStruct.pack_into(table, offset, nextSeq(offset), flags, typeCode, value, scale, time.time())
+
+def writeSensor(nodeName, sname, value, scale, sensorType):
+    """
+        Writes a sensor reading along with its scale and type
+        @param nodeName: the xcatNodeName of the node
+        @param sname: the name of the sensor
+        @param value: the sensor value, or None
+        @param scale: the scale of the value, or None
+        @param sensorType: tuple of the sensor type and unit, or None
+    """
+    if nodeName not in nodeIndex:
+        return
+    catalog = getWriterCatalog(nodeName)
+    slot = catalog['slots'].get(sname)
+    if slot is None:
+        slot = addSensor(nodeName, sname, catalog)
+        if slot is None:
+            return
+    typeCode = getTypeCode(nodeName, sensorType, catalog)
+    if catalog['sensorTypes'][slot] != typeCode:
+        catalog['sensorTypes'][slot] = typeCode
+        catalog['changed'] = True
+    valueFlags, value = encodeNumber(value, valuePresent, valueIsInt)
+    scaleFlags, scale = encodeNumber(scale, scalePresent, scaleIsInt)
+    with lockedNode(nodeName):
+        writeSlot(nodeIndex[nodeName] * regionSize + nodeHeaderSize + catalogSize + slot * slotSize, valueFlags | scaleFlags, typeCode, value, scale)
+
+def writeValue(nodeName, sname, value):
+    """
+        Writes a new value for a sensor that is already in the table, keeping its scale and type
+    """
+    catalog = writerCatalogs.get(nodeName)
+    slot = None
+    if catalog is not None:
+        slot = catalog['slots'].get(sname)
+    if slot is None:
+        writeSensor(nodeName, sname, value, None, None)
+        return
+    offset = nodeIndex[nodeName] * regionSize + nodeHeaderSize + catalogSize + slot * slotSize
+    valueFlags, value = encodeNumber(value, valuePresent, valueIsInt)
+    with lockedNode(nodeName):
+        seq, flags, typeCode, oldValue, scale, timestamp = slotStruct.unpack_from(table, offset)
+        writeSlot(offset, (flags & (scalePresent | scaleIsInt)) | valueFlags, typeCode, value, scale)
+
+def removeSensor(nodeName, sname):
+    """
+        Marks the slot of a sensor as removed. The slot is reused if the sensor comes back.
+    """
+    catalog = writerCatalogs.get(nodeName)
+    if catalog is None or sname not in catalog['slots']:
+        return
+    with lockedNode(nodeName):
+        writeSlot(nodeIndex[nodeName] * regionSize + nodeHeaderSize + catalogSize + catalog['slots'][sname] * slotSize, sensorRemoved, 0, 0.0, 0.0)
+
+def writeStatus(nodeName, lastUpdate, connected, nodeState):
+    """
+        Writes the LastUpdateReceived, Connected and NodeState properties of a node
+    """
+    if nodeName not in nodeIndex:
+        return
+    base = nodeIndex[nodeName] * regionSize
+    if lastUpdate is None:
+        lastUpdate = -1
+    with lockedNode(nodeName):
+        seq, version, sensorCount, oldConnected, oldState, oldUpdate = nodeHeader.unpack_from(table, base)
+        writeNodeHeader(base, version, sensorCount, connectedCodes.get(connected, -1), nodeStateCodes.get(nodeState, 0), int(lastUpdate))
+
+def parseCatalog(version, data):
+    try:
+        sensors, types, sensorTypes = json.loads(data.decode())
+    except ValueError:
+        return None
+    return {'version': version, 'sensors': sensors, 'types': [None] + [tuple(stype) for stype in types], 'sensorTypes': sensorTypes,
+            'seqs': {}, 'entries': {}, 'selections': {}}
+
+def readNode(nodeName, readerCache, select=None, selectKey=None):
+    """
+        Reads the sensors and status of a node
+        @param nodeName: the xcatNodeName of the node
+        @param readerCache: dictionary kept by the reader to cache the parsed catalogs
+        @param select: optional function called with the catalog of the node, returns the list of slots to read.
+                       It is only called again when the catalog changes.
+        @param selectKey: the key the result of select is cached under in the catalog
+        @return: dictionary in the format of the telemetry sensor data for the node, or None if the node is
+                 locked longer than readLockTimeout
+    """
+    base = nodeIndex[nodeName] * regionSize
+    catalog = readerCache.get(nodeName)
+    catalogData = None
+    start = base + nodeHeaderSize + catalogSize
+    #only copy the region while holding the lock, it is decoded after the gatherer can write again
+    stripe = acquireNodeLock(nodeName, readLockTimeout)
+    if stripe is None:
+        return None
+    try:
+        seq, version, sensorCount, connected, nodeState, lastUpdate = nodeHeader.unpack_from(table, base)
+        if catalog is None or catalog['version'] != version:
+            length = catalogLength.unpack_from(table, base + nodeHeaderSize)[0]
+            catalogData = table[base + nodeHeaderSize + catalogLength.size:base + nodeHeaderSize + catalogLength.size + length]
+        slotData = table[start:start + min(sensorCount, maxSensors) * slotSize]
+    finally:
+        releaseNodeLock(stripe)
+    if catalogData is not None:
+        catalog = parseCatalog(version, catalogData)
+        if catalog is not None:
+            readerCache[nodeName] = catalog
+    nodeData = {}
+    if catalog is not None:
+        sensors = catalog['sensors']
+        types = catalog['types']
+        #the entries of slots whose seq did not change since the last read are reused, they are never modified
+        seqs = catalog['seqs']
+        entries = catalog['entries']
+        count = min(sensorCount, len(sensors), maxSensors)
+        if select is None:
+            selection = range(count)
+            slots = list(slotStruct.iter_unpack(slotData[:count * slotSize]))
+        else:
+            selection = catalog['selections'].get(selectKey)
+            if selection is None:
+                selection = [slot for slot in select(catalog) if slot < count]
+                catalog['selections'][selectKey] = selection
+            slots = None
+        for slot in selection:
+            if slots is not None:
+                record = slots[slot]
+            else:
+                record = slotStruct.unpack_from(slotData, slot * slotSize)
+            seq = record[0]
+            if seq == seqs.get(slot):
+                if entries[slot] is not None:
+                    nodeData[sensors[slot]] = entries[slot]
+                continue
+            seq, flags, typeCode, value, scale, timestamp = record
+            if flags & sensorRemoved:
+                entry = None
+            else:
+                if flags & valuePresent:
+                    if flags & valueIsInt:
+                        value = int(value)
+                else:
+                    value = None
+                if flags & scalePresent:
+                    if flags & scaleIsInt:
+                        scale = int(scale)
+                else:
+                    scale = None
+                entry = {'value': value, 'scale': scale, 'type': types[typeCode] if typeCode < len(types) else None}
+                nodeData[sensors[slot]] = entry
+            seqs[slot] = seq
+            entries[slot] = entry
+    nodeData['LastUpdateReceived'] = lastUpdate if lastUpdate >= 0 else None
+    nodeData['Connected'] = connectedStates.get(connected)
+    nodeData['NodeState'] = nodeStates.get(nodeState)
+    return nodeData
+
+def readTable(readerCache, select=None, selectKey=None):
+    """
+        Reads the sensors and status of all the nodes
+        @param readerCache: dictionary kept by the reader to cache the parsed catalogs
+        @param select: optional function returning the slots to read from a node catalog, see readNode
+        @param selectKey: the key the slots returned by select are cached under
+        @return: dictionary in the format of the telemetry sensor data
+    """
+    data = {}
+    for nodeName in nodeNames:
+        nodeData = readNode(nodeName, readerCache, select, selectKey)
+        #a node that is locked too long is left out of this read
+        if nodeData is not None:
+            data[nodeName] = nodeData
+    return data
+
+def getSensorNames(readerCache):
+    """
+        Returns the set of the names of all the sensors in the table
+        @param readerCache: dictionary kept by the reader to cache the parsed catalogs
+    """
+    names = set()
+    for nodeName in nodeNames:
+        #reading no slots brings the cached catalog of the node up to date
+        readNode(nodeName, readerCache, lambda catalog: [], 'names')
+        if nodeName in readerCache:
+            names.update(readerCache[nodeName]['sensors'])
+    return names
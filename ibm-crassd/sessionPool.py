@@ -0,0 +1,381 @@
+# 
+#  Copyright 2017 IBM Corporation
+# 
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+# 
+#        http://www.apache.org/licenses/LICENSE-2.0
+# 
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+# 
+
+"""
+    This module keeps one logged in session per BMC for the process using it. Alert polling, push notification
+    listeners, telemetry gatherers and the plugins ask the pool for a session instead of logging in themselves.
+    Sessions are reused until the BMC rejects them, or they have been idle longer than the BMC will keep them.
+    Failed logins are retried with an increasing delay so an unreachable BMC is not hammered with logins.
+
+    The pool is per process. Subprocesses must call resetPool() after they start so they do not share the
+    sockets of a session created by their parent. The session cookies are shared with the other processes
+    through config.bmcSessions, so when a telemetry gatherer process has logged in to a BMC the main process
+    uses the same BMC session to read the SEL instead of logging in again, and the other way around.
+"""
+import json
+import os
+import sys
+import syslog
+import threading
+import time
+import traceback
+import requests
+import config
+
+jsonHeader = {'Content-Type':'application/json'}
+#openbmc expires sessions that have not been used for an hour
+sessionIdleTimeout = 3000
+loginBackoffBase = 5
+loginBackoffMax = 300
+
+pool = {}
+poolLock = threading.Lock()
+bmcLocks = {}
+stats = {'hits': 0, 'misses': 0, 'logins': 0, 'loginFailures': 0, 'expired': 0, 'shared': 0, 'loginTime': 0.0, 'maxLoginTime': 0.0}
+
+def connectionErrHandler(jsonFormat, errorStr, err):
+    """
+         Error handler various connection errors to bmcs
+
+         @param jsonFormat: boolean, used to output in json format with an error code.
+         @param errorStr: string, used to color the text red or green
+         @param err: string, the text from the exception
+    """
+    if errorStr == "Timeout":
+        if not jsonFormat:
+            return("FQPSPIN0000M: Connection timed out. Ensure you have network connectivity to the bmc")
+        else:
+            conerror = {}
+            conerror['CommonEventID'] = 'FQPSPIN0000M'
+            conerror['sensor']="N/A"
+            conerror['state']="N/A"
+            conerror['additionalDetails'] = "N/A"
+            conerror['Message']="Connection timed out. Ensure you have network connectivity to the BMC"
+            conerror['LengthyDescription'] = "While trying to establish a connection with the specified BMC, the BMC failed to respond in adequate time. Verify the BMC is functioning properly, and the network connectivity to the BMC is stable."
+            conerror['Serviceable']="Yes"
+            conerror['CallHomeCandidate']= "No"
+            conerror['Severity'] = "Critical"
+            conerror['EventType'] = "Communication Failure/Timeout"
+            conerror['VMMigrationFlag'] = "Yes"
+            conerror["AffectedSubsystem"] = "Interconnect (Networking)"
+            conerror["timestamp"] = str(int(time.time()))
+            conerror["UserAction"] = "Verify network connectivity between the two systems and the bmc is functional."
+            eventdict = {}
+            eventdict['event0'] = conerror
+            eventdict['numAlerts'] = '1'
+
+            errorMessageStr = json.dumps(eventdict, sort_keys=True, indent=4, separators=(',', ': '), ensure_ascii=False)
+            return(errorMessageStr)
+    elif errorStr == "ConnectionError":
+        if not jsonFormat:
+            return("FQPSPIN0001M: " + str(err))
+        else:
+            conerror = {}
+            conerror['CommonEventID'] = 'FQPSPIN0001M'
+            conerror['sensor']="N/A"
+            conerror['state']="N/A"
+            conerror['additionalDetails'] = str(err)
+            conerror['Message']="Connection Error. View additional details for more information"
+            conerror['LengthyDescription'] = "A connection error to the specified BMC occurred and additional details are provided. Review these details to resolve the issue."
+            conerror['Serviceable']="Yes"
+            conerror['CallHomeCandidate']= "No"
+            conerror['Severity'] = "Critical"
+            conerror['EventType'] = "Communication Failure/Timeout"
+            conerror['VMMigrationFlag'] = "Yes"
+            conerror["AffectedSubsystem"] = "Interconnect (Networking)"
+            conerror["timestamp"] = str(int(time.time()))
+            conerror["UserAction"] = "Correct the issue highlighted in additional details and try again"
+            eventdict = {}
+            eventdict['event0'] = conerror
+            eventdict['numAlerts'] = '1'
+
+            errorMessageStr = json.dumps(eventdict, sort_keys=True, indent=4, separators=(',', ': '), ensure_ascii=False)
+            return(errorMessageStr)
+    elif errorStr == "LoginFailed":
+        if not jsonFormat:
+            return("FQPSPSE0067F: " + str(err))
+        else:
+            conerror = {}
+            conerror['CommonEventID'] = 'FQPSPSE0067F'
+            conerror['sensor']="N/A"
+            conerror['state']="N/A"
+            conerror['additionalDetails'] = str(err)
+            conerror['Message']="Unable to login to the BMC. Ensure the credentials provided are correct."
+            conerror['LengthyDescription'] = "A failure response was received from the BMC, indicating the login was not successful"
+            conerror['Serviceable']="No"
+            conerror['CallHomeCandidate']= "No"
+            conerror['Severity'] = "Warning"
+            conerror['EventType'] = "Administrative"
+            conerror['VMMigrationFlag'] = "Yes"
+            conerror["AffectedSubsystem"] = "Systems Management - Security"
+            conerror["timestamp"] = str(int(time.time()))
+            conerror["UserAction"] = "Correct the issue highlighted in additional details and try again"
+            eventdict = {}
+            eventdict['event0'] = conerror
+            eventdict['numAlerts'] = '1'
+
+            errorMessageStr = json.dumps(eventdict, sort_keys=True, indent=4, separators=(',', ': '), ensure_ascii=False)
+            return(errorMessageStr)
+    else:
+        return("Unknown Error: "+ str(err))
+
+def isString(var):
+    """
+        Returns True if the variable is a string, otherwise false.
+    """
+    if sys.version_info < (3,0):
+        return isinstance(var, basestring)
+    else:
+        return isinstance(var, str)
+
+def login(host, username, pw):
+    """
+         Logs into the BMC and creates a session
+
+         @param host: string, the hostname or IP address of the bmc to log into
+         @param username: The user name for the bmc to log into
+         @param pw: The password for the BMC to log into
+         @return: Session object, a json formatted error string, or None if the response could not be understood
+    """
+    mysess = requests.session()
+    try:
+        r = mysess.post('https://'+host+'/login', headers=jsonHeader, json = {"data": [username, pw]}, verify=False, timeout=30)
+        loginMessage = r.json()
+        if (loginMessage['status'] != "ok"):
+            return (connectionErrHandler(True, "LoginFailed", "Login Failed: {descript}, {statusCode}".format(descript=loginMessage['data']['description'], statusCode=loginMessage['message'])))
+        return mysess
+    except(requests.exceptions.Timeout):
+        return (connectionErrHandler(True, "Timeout", None))
+    except(requests.exceptions.ConnectionError) as err:
+        return (connectionErrHandler(True, "ConnectionError", err))
+    except ValueError:
+        config.errorLogger(syslog.LOG_CRIT, "Failed parse login response from BMC: {bmc}".format(bmc=host))
+        return None
+    except Exception as e:
+        config.errorLogger(syslog.LOG_CRIT, "Failed to login to the BMC: {bmc}".format(bmc=host))
+        exc_type, exc_obj, exc_tb = sys.exc_info()
+        fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+        config.errorLogger(syslog.LOG_DEBUG, "Exception: Error: {err}, Details: {etype}, {fname}, {lineno}".format(err=e, etype=exc_type, fname=fname, lineno=exc_tb.tb_lineno))
+        traceback.print_tb(e.__traceback__)
+        return None
+
+def logout(host, session):
+    """
+         Logs out of the bmc and terminates the session
+
+         @param host: string, the hostname or IP address of the bmc to log out of
+         @param session: the active session to use
+    """
+    try:
+        session.post('https://'+host+'/logout', headers=jsonHeader, json = {"data": []}, verify=False, timeout=10)
+    except Exception:
+        config.errorLogger(syslog.LOG_DEBUG, "Failed to log out of the bmc {bmc}.".format(bmc=host))
+    session.close()
+
+def getSharedSession(bmcHostname):
+    """
+        Creates a session from the cookies another process published for the BMC
+
+        @param bmcHostname: string, the hostname or IP address of the bmc
+        @return: Session object, or None if no other process is logged in to the BMC
+    """
+    try:
+        cookies = config.bmcSessions.get(bmcHostname)
+    except (EOFError, IOError, OSError):
+        #the manager process is gone during shutdown
+        return None
+    if not cookies:
+        return None
+    mysession = requests.session()
+    mysession.cookies.update(cookies)
+    return mysession
+
+def publishSession(bmcHostname, mysession):
+    """
+        Shares the cookies of a session with the other processes
+    """
+    try:
+        config.bmcSessions[bmcHostname] = mysession.cookies.get_dict()
+    except (EOFError, IOError, OSError):
+        pass
+
+def unpublishSession(bmcHostname, mysession):
+    """
+        Stops sharing a session that is no longer valid, unless another process already shared a newer one
+    """
+    try:
+        if config.bmcSessions.get(bmcHostname) == mysession.cookies.get_dict():
+            del config.bmcSessions[bmcHostname]
+    except (EOFError, IOError, OSError, KeyError):
+        pass
+
+def getBMCLock(bmcHostname):
+    """
+        Returns the lock used to serialize logins to a single BMC
+    """
+    with poolLock:
+        if bmcHostname not in bmcLocks:
+            bmcLocks[bmcHostname] = threading.Lock()
+        return bmcLocks[bmcHostname]
+
+def getSession(bmcHostname, username, password):
+    """
+        Returns the pooled session for the BMC, logging in if there is no usable session.
+
+        @param bmcHostname: string, the hostname or IP address of the bmc
+        @param username: The user name for the bmc
+        @param password: The password for the bmc
+        @return: Session object, a json formatted error string if the login failed, or None
+    """
+    with getBMCLock(bmcHostname):
+        now = time.time()
+        expiredSession = None
+        with poolLock:
+            entry = pool.get(bmcHostname)
+            if entry is not None and entry['session'] is not None:
+                if now - entry['lastUsed'] < sessionIdleTimeout:
+                    entry['lastUsed'] = now
+                    stats['hits'] += 1
+                    return entry['session']
+                stats['expired'] += 1
+                expiredSession = entry['session']
+                entry['session'] = None
+            stats['misses'] += 1
+            if entry is not None and now < entry['nextLogin']:
+                #still backing off from the last failed login
+                return entry['lastError']
+        if expiredSession is not None:
+            #the other processes must not hand the idle session back
+            unpublishSession(bmcHostname, expiredSession)
+        mysession = getSharedSession(bmcHostname)
+        if mysession is not None:
+            with poolLock:
+                stats['shared'] += 1
+                entry = pool.setdefault(bmcHostname, {'session': None, 'lastUsed': 0, 'failures': 0, 'nextLogin': 0, 'lastError': None})
+                entry['session'] = mysession
+                entry['lastUsed'] = time.time()
+            return mysession
+        start = time.time()
+        mysession = login(bmcHostname, username, password)
+        loginTime = time.time() - start
+        with poolLock:
+            stats['logins'] += 1
+            stats['loginTime'] += loginTime
+            if loginTime > stats['maxLoginTime']:
+                stats['maxLoginTime'] = loginTime
+            entry = pool.setdefault(bmcHostname, {'session': None, 'lastUsed': 0, 'failures': 0, 'nextLogin': 0, 'lastError': None})
+            if isinstance(mysession, requests.sessions.Session):
+                entry['session'] = mysession
+                entry['lastUsed'] = time.time()
+                entry['failures'] = 0
+                entry['nextLogin'] = 0
+                entry['lastError'] = None
+            else:
+                stats['loginFailures'] += 1
+                entry['failures'] += 1
+                entry['nextLogin'] = time.time() + min(loginBackoffMax, loginBackoffBase * 2 ** (entry['failures'] - 1))
+                entry['lastError'] = mysession
+        if isinstance(mysession, requests.sessions.Session):
+            publishSession(bmcHostname, mysession)
+        return mysession
+
+def invalidateSession(bmcHostname, session=None, doLogout=False):
+    """
+        Removes the pooled session for the BMC so the next request logs in again.
+
+        @param bmcHostname: string, the hostname or IP address of the bmc
+        @param session: only invalidate if this is still the pooled session. None invalidates any session.
+        @param doLogout: boolean, end the session on the BMC as well
+    """
+    with poolLock:
+        entry = pool.get(bmcHostname)
+        if entry is None or entry['session'] is None:
+            return
+        if session is not None and entry['session'] is not session:
+            return
+        oldSession = entry['session']
+        entry['session'] = None
+    unpublishSession(bmcHostname, oldSession)
+    if doLogout:
+        logout(bmcHostname, oldSession)
+
+def request(method, bmcHostname, username, password, path, **kwargs):
+    """
+        Sends a request to the BMC with the pooled session. If the BMC has expired the session,
+        a new session is created and the request is sent one more time.
+
+        @param method: string, the http method to use. Example: get
+        @param bmcHostname: string, the hostname or IP address of the bmc
+        @param username: The user name for the bmc
+        @param password: The password for the bmc
+        @param path: string, the path of the url, starting with /
+        @return: tuple of the response object and the json formatted error string. One of them is always None.
+        Timeouts and connection errors are raised to the caller.
+    """
+    kwargs.setdefault('headers', jsonHeader)
+    kwargs.setdefault('verify', False)
+    kwargs.setdefault('timeout', 60)
+    url = 'https://' + bmcHostname + path
+    for attempt in range(2):
+        mysession = getSession(bmcHostname, username, password)
+        if mysession is None or isString(mysession):
+            return None, mysession
+        try:
+            res = mysession.request(method, url, **kwargs)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            invalidateSession(bmcHostname, mysession)
+            raise
+        if res.status_code != 401:
+            return res, None
+        invalidateSession(bmcHostname, mysession)
+    return res, None
+
+def resetPool():
+    """
+        Drops all of the sessions inherited from a parent process without logging them out.
+    """
+    global poolLock
+    poolLock = threading.Lock()
+    pool.clear()
+    bmcLocks.clear()
+    for key in stats:
+        stats[key] = 0
+
+def closePool():
+    """
+        Logs out of every BMC with a pooled session and empties the pool.
+    """
+    with poolLock:
+        sessions = [(bmcHostname, pool[bmcHostname]['session']) for bmcHostname in pool if pool[bmcHostname]['session'] is not None]
+        pool.clear()
+    for bmcHostname, session in sessions:
+        unpublishSession(bmcHostname, session)
+        logout(bmcHostname, session)
+
+def getPoolStats():
+    """
+        Returns the counters for the session pool
+
+        @return: dictionary containing hits, misses, logins, login failures and login latency in seconds
+    """
+    with poolLock:
+        poolStats = dict(stats)
+        poolStats['sessions'] = len([entry for entry in pool.values() if entry['session'] is not None])
+    if poolStats['logins'] > 0:
+        poolStats['avgLoginTime'] = poolStats['loginTime'] / poolStats['logins']
+    else:
+        poolStats['avgLoginTime'] = 0.0
+    return poolStats
@@ -23,8 +23,15 @@
     
     This module when establishing websocket connections, will assign a maximum of 50 nodes per subprocess. 
     Each of the subprocesses will collect the push notification, and process it into the sensor data dictionary
-    structure. The socket server also establishes it's own subprocess so it can handle dealing with multiple
-    clients. Each websocket subprocess will receive an average rate of 2.5 Mbps worth per 50 monitored nodes.
+    structure. The readings are written to a shared memory sensor table, see sensorTable.py, that the socket
+    server reads directly. The socket server also establishes it's own subprocess so it can handle dealing with multiple
+    clients. A single selector loop accepts the clients, reads their filter messages and sends their updates
+    without blocking. Clients with the same filters and frequency form a subscriber group, the data of a group
+    is encoded once per update and the same bytes are sent to all of its clients. Clients can ask for JSON, the
+    default, or the compact encoding that sends a sensor dictionary once and then binary values. Each websocket
+    subprocess will receive an average rate of 2.5 Mbps worth per 50 monitored nodes.
+    By default each BMC websocket is serviced by its own thread. With gathererEngine = asyncio, the websockets
+    of a subprocess are all serviced by one event loop instead, see asyncGatherer.py.
     
     The socket server will listen on all established network interfaces including the local host. This allows
     telemetry data to be streamed to a local service, or to a remote monitoring application. 
@@ -51,9 +58,14 @@ import os
 import socket
 import struct
 import config
+import sessionPool
+import pollQueue
+import notificationlistener
+import asyncGatherer
+import sensorTable
 import syslog
 import signal
-import select
+import selectors
 
 
 def get_size(obj, seen=None):
@@ -143,20 +155,17 @@ def gathererDumpMem(signum, fname):
             f.write('Queue length: {memsize} \n'.format(memsize =sendQueue.qsize()))
 
 def sockServerDumpMem(signum, fname):
-    global sensorData
-    global telemUpdateQueue
     if (signum ==signal.SIGUSR1):
         myPID = os.getpid()
         curtime = time.strftime("%Y-%m-%d %H:%M:%S")
+        tableData = sensorTable.readTable({})
         with open('/tmp/crassd-socketServer-{apid}-{curTime}.txt'.format(apid=myPID, curTime=curtime), 'w') as f:
-            f.write('---------Sensor Data --------\n')
-            f.write('Size: {memsize}\n'.format(memsize =get_size(sensorData)))
-            f.write('{data}\n\n'.format(data=repr(sensorData)))
+            f.write('---------Sensor Table --------\n')
+            f.write('Size: {memsize}\n'.format(memsize =sensorTable.tableSize()))
+            f.write('{data}\n\n'.format(data=repr(tableData)))
             f.write('--------config.NodeList-------------------\n')
             f.write('Size: {memsize}\n'.format(memsize =get_size(config.mynodelist)))
             f.write('{data}\n\n'.format(data=repr(config.mynodelist)))
-            f.write('--------telemUpdateQueue-------------------\n')
-            f.write('Queue length: {memsize}\n'.format(memsize =telemUpdateQueue.qsize()))
 def killQueueChecker():
     global killNow
     global killQueue
@@ -164,147 +173,46 @@ def killQueueChecker():
         killNow = killQueue.get()
         break
 
-def connectionErrHandler(jsonFormat, errorStr, err):
-    """
-         Error handler various connection errors to bmcs
-           
-         @param jsonFormat: boolean, used to output in json format with an error code. 
-         @param errorStr: string, used to color the text red or green
-         @param err: string, the text from the exception 
-    """ 
-    if errorStr == "Timeout":
-        if not jsonFormat:
-            return("FQPSPIN0000M: Connection timed out. Ensure you have network connectivity to the bmc")
-        else:
-            conerror = {}
-            conerror['CommonEventID'] = 'FQPSPIN0000M'
-            conerror['sensor']="N/A"
-            conerror['state']="N/A"
-            conerror['additionalDetails'] = "N/A"
-            conerror['Message']="Connection timed out. Ensure you have network connectivity to the BMC"
-            conerror['LengthyDescription'] = "While trying to establish a connection with the specified BMC, the BMC failed to respond in adequate time. Verify the BMC is functioning properly, and the network connectivity to the BMC is stable."
-            conerror['Serviceable']="Yes"
-            conerror['CallHomeCandidate']= "No"
-            conerror['Severity'] = "Critical"
-            conerror['EventType'] = "Communication Failure/Timeout"
-            conerror['VMMigrationFlag'] = "Yes"
-            conerror["AffectedSubsystem"] = "Interconnect (Networking)"
-            conerror["timestamp"] = str(int(time.time()))
-            conerror["UserAction"] = "Verify network connectivity between the two systems and the bmc is functional."
-            eventdict = {}
-            eventdict['event0'] = conerror
-            eventdict['numAlerts'] = '1'
-            
-            errorMessageStr = errorMessageStr = json.dumps(eventdict, sort_keys=True, indent=4, separators=(',', ': '), ensure_ascii=False)
-            return(errorMessageStr)
-    elif errorStr == "ConnectionError":
-        if not jsonFormat:
-            return("FQPSPIN0001M: " + str(err))
-        else:
-            conerror = {}
-            conerror['CommonEventID'] = 'FQPSPIN0001M'
-            conerror['sensor']="N/A"
-            conerror['state']="N/A"
-            conerror['additionalDetails'] = str(err)
-            conerror['Message']="Connection Error. View additional details for more information"
-            conerror['LengthyDescription'] = "A connection error to the specified BMC occurred and additional details are provided. Review these details to resolve the issue."
-            conerror['Serviceable']="Yes"
-            conerror['CallHomeCandidate']= "No"
-            conerror['Severity'] = "Critical"
-            conerror['EventType'] = "Communication Failure/Timeout"
-            conerror['VMMigrationFlag'] = "Yes"
-            conerror["AffectedSubsystem"] = "Interconnect (Networking)"
-            conerror["timestamp"] = str(int(time.time()))
-            conerror["UserAction"] = "Correct the issue highlighted in additional details and try again"
-            eventdict = {}
-            eventdict['event0'] = conerror
-            eventdict['numAlerts'] = '1'
-            
-            errorMessageStr = json.dumps(eventdict, sort_keys=True, indent=4, separators=(',', ': '), ensure_ascii=False)
-            return(errorMessageStr)
-    elif errorStr == "LoginFailed":
-        if not jsonFormat:
-            return("FQPSPSE0067F: " + str(err))
-        else:
-            conerror = {}
-            conerror['CommonEventID'] = 'FQPSPSE0067F'
-            conerror['sensor']="N/A"
-            conerror['state']="N/A"
-            conerror['additionalDetails'] = str(err)
-            conerror['Message']="Unable to login to the BMC. Ensure the credentials provided are correct."
-            conerror['LengthyDescription'] = "A failure response was received from the BMC, indicating the login was not successful"
-            conerror['Serviceable']="No"
-            conerror['CallHomeCandidate']= "No"
-            conerror['Severity'] = "Warning"
-            conerror['EventType'] = "Administrative"
-            conerror['VMMigrationFlag'] = "Yes"
-            conerror["AffectedSubsystem"] = "Systems Management - Security"
-            conerror["timestamp"] = str(int(time.time()))
-            conerror["UserAction"] = "Correct the issue highlighted in additional details and try again"
-            eventdict = {}
-            eventdict['event0'] = conerror
-            eventdict['numAlerts'] = '1'
-            
-            errorMessageStr = json.dumps(eventdict, sort_keys=True, indent=4, separators=(',', ': '), ensure_ascii=False)
-            return(errorMessageStr)
-    else:
-        return("Unknown Error: "+ str(err))
+connectionErrHandler = sessionPool.connectionErrHandler
 
+#gatherers write these records for the readings that changed since the last flush into the sensor table
+#(deltaValue, node, sensor, value)
+#(deltaSensor, node, sensor, value, scale, type)
+#(deltaStatus, node, LastUpdateReceived, Connected, NodeState)
+#(deltaRemove, node, sensor)
+deltaValue = 0
+deltaSensor = 1
+deltaStatus = 2
+deltaRemove = 3
+nodeStatusKeys = ['LastUpdateReceived', 'Connected', 'NodeState']
+#seconds between comparing every sensor instead of only the ones marked as changed
+fullResyncInterval = 30
+#sensors and nodes changed since the last flush, in the gatherer processes
+dirtySensors = set()
+dirtyNodes = set()
 
-def login(host, username, pw,jsonFormat):
-    """
-         Logs into the BMC and creates a session
-           
-         @param host: string, the hostname or IP address of the bmc to log into
-         @param username: The user name for the bmc to log into
-         @param pw: The password for the BMC to log into
-         @param jsonFormat: boolean, flag that will only allow relevant data from user command to be display. This function becomes silent when set to true. 
-         @return: Session object
-    """
-    if(jsonFormat==False):
-        config.errorLogger(syslog.LOG_DEBUG, "Attempting login to: {bmc}".format(bmc=host))
-    httpHeader = {'Content-Type':'application/json'}
-    mysess = requests.session()
-    try:
-        r = mysess.post('https://'+host+'/login', headers=httpHeader, json = {"data": [username, pw]}, verify=False, timeout=30)
-        loginMessage = r.json()
-        if (loginMessage['status'] != "ok"):
-            return (connectionErrHandler(jsonFormat, "LoginFailed", "Login Failed: {descript}, {statusCode}".format(descript=loginMessage['data']['description'], statusCode=loginMessage['message'])))
-        return mysess
-    except(requests.exceptions.Timeout):
-        return (connectionErrHandler(jsonFormat, "Timeout", None))
-    except(requests.exceptions.ConnectionError) as err:
-        return (connectionErrHandler(jsonFormat, "ConnectionError", err))
-    except json.decoder.JSONDecodeError as e:
-        config.errorLogger(syslog.LOG_CRIT, "Failed parse login response from BMC: {bmc}".format(bmc=host))
-        return None
-    except Exception as e:
-        config.errorLogger(syslog.LOG_CRIT, "Failed to login to the BMC: {bmc}".format(bmc=host))
-        exc_type, exc_obj, exc_tb = sys.exc_info()
-        fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-        config.errorLogger(syslog.LOG_DEBUG, "Exception: Error: {err}, Details: {etype}, {fname}, {lineno}".format(err=e, etype=exc_type, fname=fname, lineno=exc_tb.tb_lineno))
-        traceback.print_tb(e.__traceback__)
-        return None
-
-def logout(host, username, pw, session, jsonFormat):
-    """
-         Logs out of the bmc and terminates the session
+#largest filter message accepted from a client
+maxFilterMessage = 1048576
+#seconds a client can go without reading any data before it is disconnected
+clientSendTimeout = 60
+#milliseconds a new client has to send its filters before it is sent the unfiltered data
+newClientDelay = 300
 
-         @param host: string, the hostname or IP address of the bmc to log out of
-         @param username: The user name for the bmc to log out of
-         @param pw: The password for the BMC to log out of
-         @param session: the active session to use
-         @param jsonFormat: boolean, flag that will only allow relevant data from user command to be display. This function becomes silent when set to true.
-    """
-    global logoutAPItime
-    jsonHeader = {'Content-Type' : 'application/json'}
-    try:
-        r = session.post('https://'+host+'/logout', headers=jsonHeader,json = {"data": [username, pw]}, verify=False, timeout=60)
-    except(requests.exceptions.Timeout):
-        config.errorLogger(syslog.LOG_CRIT,connectionErrHandler(jsonFormat, "Timeout", None))
-    if(jsonFormat==False):
-        if r.status_code == 200:
-            config.errorLogger(syslog.LOG_DEBUG,'User {usr} has been logged out from {bmc}'.format(usr=username, bmc=host))
+#encodings a client can select with the encoding filter option, json is the default
+validEncodings = ['json', 'compact']
+#with the compact encoding, the first byte of each message tells the frame type. A dictionary frame is
+#a json string with the node names and the name, scale and type of every sensor. It is sent when a client
+#subscribes and whenever the sensors change. Value frames are binary and list the readings in the order
+#of the dictionary:
+#   header: frame type, dictionary version, Time_Sent, node count, sensor count
+#   for each node: LastUpdateReceived (-1 if unknown), Connected (-1 unknown, 0, 1), index in nodeStates
+#   for each sensor: value as a double, NaN if there is no reading
+compactDictionaryFrame = 0x44
+compactValueFrame = 0x56
+compactValueHeader = struct.Struct('<BIqII')
+compactNodeStates = [None, False, 'Powered On', 'Powered Off']
+#sensor table reader cache used to check the sensor names in client filters
+nameReaderCache = {}
 
 def getNodePowerState(host, session, xcatNodeName, node):
     httpHeader = {'Content-Type':'application/json'}
@@ -403,6 +311,7 @@ def initSensors(host, session, xcatNodeName, node):
                         sensorData[xcatNodeName][sensorname]['scale'] = None
                         sensorData[xcatNodeName][sensorname]['type'] = None
                         sensorData[xcatNodeName][sensName]['value'] = None
+            dirtyNodes.add(xcatNodeName)
             if update:
                 node['SensorList'] = senslist
                 node['LastUpdateReceived'] = int(time.time())
@@ -435,64 +344,81 @@ def initSensors(host, session, xcatNodeName, node):
                 else:
                     sensorData[xcatNodeName][sname]['scale'] = 10 ** -3
     
-def processMessages():
-    global killSig
+def closeNodeWebsocket(node):
+    """
+        Closes the telemetry websocket for a node, regardless of the gatherer engine that opened it
+        @param node: dictionary containing the node properties
+    """
+    wspm = node['websocket']
+    if isinstance(wspm, dict):
+        asyncGatherer.wsClose(wspm)
+    else:
+        wspm.close()
+
+def processMessage(text):
+    """
+        Processes a single push notification received from a BMC websocket
+        @param text: dictionary with the node the message came from and the raw message
+    """
     global sensorData
     ##node properties {nodeName:{'LastUpdateReceived':'UNIXTimestamp','NodeState':'Powered On/Off', 'Connected': True | False,'SensorList':,['list','of','sensor','paths']}
-    while True:
-        if killSig.is_set():
-            break
-        text = messageQueue.get()
-        try:
-            updateTime = False
-            message = json.loads(text['msg'])
-            if 'logging' in message['path']:
-                updateTime = True
-                config.errorLogger(syslog.LOG_DEBUG, "Event notification received for {bmc}.".format(bmc=text['node']['bmcHostname']))
-            elif 'sensors' in message["path"]:
-                updateTime = True
-                sensorName = message["path"].split('/')[-1]
-                if 'Value' in message['properties']:
-                    sensorData[text['node']['xcatNodeName']][sensorName]['value'] = message['properties']['Value']
-                    if 'type' not in sensorData[text['node']['xcatNodeName']][sensorName]:
-                        sensorData[text['node']['xcatNodeName']][sensorName]['type'] = None
-                        sensorData[text['node']['xcatNodeName']][sensorName]['scale'] = None
-                        wspm = text['node']['websocket']
-                        wspm.close()
-                        text['node']['Connected'] = False
+    try:
+        updateTime = False
+        message = json.loads(text['msg'])
+        if 'logging' in message['path']:
+            updateTime = True
+            config.errorLogger(syslog.LOG_DEBUG, "Event notification received for {bmc}.".format(bmc=text['node']['bmcHostname']))
+            #the main process processes the pushed entry, or reads the SEL when the message has no complete entry
+            sendQueue.put((text['node'], notificationlistener.decodeLoggingMessage(message)))
+        elif 'sensors' in message["path"]:
+            updateTime = True
+            sensorName = message["path"].split('/')[-1]
+            if 'Value' in message['properties']:
+                sensorData[text['node']['xcatNodeName']][sensorName]['value'] = message['properties']['Value']
+                dirtySensors.add((text['node']['xcatNodeName'], sensorName))
+                if 'type' not in sensorData[text['node']['xcatNodeName']][sensorName]:
+                    sensorData[text['node']['xcatNodeName']][sensorName]['type'] = None
+                    sensorData[text['node']['xcatNodeName']][sensorName]['scale'] = None
+                    closeNodeWebsocket(text['node'])
+                    text['node']['Connected'] = False
 #                 config.errorLogger(syslog.LOG_DEBUG, "Updated sensor readings for {bmc}.".format(bmc=text['node']['bmcHostname']))
-            elif 'control' in message['path']:
-                updateTime = True
-                wspm = text['node']['websocket']
-                wspm.close()
+        elif 'control' in message['path']:
+            updateTime = True
+            closeNodeWebsocket(text['node'])
+            text['node']['Connected'] = False
+            config.errorLogger(syslog.LOG_DEBUG, "OCC state changed for {node}.".format(node=text['node']['xcatNodeName']))
+        elif 'state' in message['path']:
+            updateTime = True
+            if 'CurrentPowerState' in message['properties']:
+                closeNodeWebsocket(text['node'])
                 text['node']['Connected'] = False
-                config.errorLogger(syslog.LOG_DEBUG, "OCC state changed for {node}.".format(node=text['node']['xcatNodeName']))
-            elif 'state' in message['path']:
-                updateTime = True
-                if 'CurrentPowerState' in message['properties']:
-                    wspm = text['node']['websocket']
-                    wspm.close()
-                    text['node']['Connected'] = False
-                    config.errorLogger(syslog.LOG_INFO,'Power state change detected for node {node}. Received state: {msgrcvd}'.format(node=text['node']['xcatNodeName'],msgrcvd=' '.join(message['properties']['CurrentPowerState'].split('.')[-2:])))
-                    if 'PowerState.On' in message['properties']['CurrentPowerState']:
-                        text['node']['NodeState'] = "Powered On"
-                    else:
-                        text['node']['NodeState'] = "Powered Off"
-                    config.errorLogger(syslog.LOG_DEBUG, "Power state changed for node {node}.".format(node=text['node']['xcatNodeName']))
+                config.errorLogger(syslog.LOG_INFO,'Power state change detected for node {node}. Received state: {msgrcvd}'.format(node=text['node']['xcatNodeName'],msgrcvd=' '.join(message['properties']['CurrentPowerState'].split('.')[-2:])))
+                if 'PowerState.On' in message['properties']['CurrentPowerState']:
+                    text['node']['NodeState'] = "Powered On"
                 else:
-                    pass
+                    text['node']['NodeState'] = "Powered Off"
+                config.errorLogger(syslog.LOG_DEBUG, "Power state changed for node {node}.".format(node=text['node']['xcatNodeName']))
             else:
-                sendQueue.put(text['node'])
-            if updateTime:
-                text['node']['LastUpdateReceived'] = int(time.time())
-        except Exception as e:
-            config.errorLogger(syslog.LOG_WARNING, "Error encountered processing BMC message from {bmc}".format(bmc=text['node']['bmcHostname']))
-            config.errorLogger(syslog.LOG_DEBUG, "BMC message was: {msg}".format(msg=text['msg']))
-            exc_type, exc_obj, exc_tb = sys.exc_info()
-            fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-            config.errorLogger(syslog.LOG_DEBUG, "Exception: Error: {err}, Details: {etype}, {fname}, {lineno}".format(err=e, etype=exc_type, fname=fname, lineno=exc_tb.tb_lineno))
-            traceback.print_tb(e.__traceback__)
-            
+                pass
+        else:
+            sendQueue.put((text['node'], None))
+        if updateTime:
+            text['node']['LastUpdateReceived'] = int(time.time())
+    except Exception as e:
+        config.errorLogger(syslog.LOG_WARNING, "Error encountered processing BMC message from {bmc}".format(bmc=text['node']['bmcHostname']))
+        config.errorLogger(syslog.LOG_DEBUG, "BMC message was: {msg}".format(msg=text['msg']))
+        exc_type, exc_obj, exc_tb = sys.exc_info()
+        fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+        config.errorLogger(syslog.LOG_DEBUG, "Exception: Error: {err}, Details: {etype}, {fname}, {lineno}".format(err=e, etype=exc_type, fname=fname, lineno=exc_tb.tb_lineno))
+        traceback.print_tb(e.__traceback__)
+
+def processMessages():
+    global killSig
+    while True:
+        if killSig.is_set():
+            break
+        text = messageQueue.get()
+        processMessage(text)
         messageQueue.task_done()
 
 def getNode(bmcURL):
@@ -521,10 +447,8 @@ def on_error(ws, error):
         config.errorLogger(syslog.LOG_DEBUG, "Websocket error for {bmc}, details: {err}".format(bmc=thisNode['bmcHostname'], err=error))
         thisNode['LastUpdateReceived'] = int(time.time())
         thisNode['Connected'] = False
-        try:
-            logout(thisNode['bmcHostname'],thisNode['username'], thisNode['password'], thisNode['session'], True)
-        except Exception as e:
-            config.errorLogger(syslog.LOG_DEBUG, "Failed to log out of the bmc {bmc} after a websocket error.".format(bmc=thisNode['bmcHostname']))
+        #the session may have been rejected by the BMC, login again on the next connection attempt
+        sessionPool.invalidateSession(thisNode['bmcHostname'], thisNode['session'], doLogout=True)
 
 def on_close(ws):
     thisNode = getNode(ws.url)
@@ -534,10 +458,6 @@ def on_close(ws):
         config.errorLogger(syslog.LOG_DEBUG, "Websocket closed for {bmc}".format(bmc=thisNode['bmcHostname']))
         thisNode['LastUpdateReceived'] = int(time.time())
         thisNode['Connected'] = False
-        try:
-            logout(thisNode['bmcHostname'],thisNode['username'], thisNode['password'], thisNode['session'], True)
-        except Exception as e:
-            config.errorLogger(syslog.LOG_DEBUG, "Failed to log out of the bmc {bmc} after closing the websocket.".format(bmc=thisNode['bmcHostname']))
     
 def on_open(ws):
     #open the websocket and subscribe to the sensors
@@ -547,7 +467,7 @@ def on_open(ws):
     subList = nodeSensors + sensorList
     data = {"paths": subList, "interfaces": ["xyz.openbmc_project.Sensor.Value","xyz.openbmc_project.Logging.Entry",'org.open_power.OCC.Status', 'xyz.openbmc_project.State.Chassis']}
     ws.send(json.dumps(data))
-    sendQueue.put(thisNode)
+    sendQueue.put((thisNode, None))
     config.errorLogger(syslog.LOG_DEBUG, "Websocket opened for {bmc}".format(bmc=thisNode['bmcHostname']))
     thisNode['connecting'] = False
     thisNode['Connected'] = True
@@ -583,7 +503,7 @@ def openWebSocketsThreads(node):
     bmcIP = node['bmcHostname']
     systemName = node['xcatNodeName']
     node['connecting'] = True
-    mysession = login(bmcIP,node['username'], node['password'], True)
+    mysession = sessionPool.getSession(bmcIP, node['username'], node['password'])
     node['session'] = mysession
     if isinstance(mysession, requests.sessions.Session):
         node['down'] = False
@@ -603,7 +523,7 @@ def openWebSocketsThreads(node):
                 createWebsocket(sescookie, bmcIP, node)
                 
             else:
-                logout(bmcIP, node['username'], node['password'],mysession, True)
+                sessionPool.invalidateSession(bmcIP, mysession, doLogout=True)
                 raise ValueError("Failed to get initial sensor readings")
             
         except ValueError as e:
@@ -629,143 +549,261 @@ def openWebSocketsThreads(node):
 def nullAllNodeSensReadings(node):
     global sensorData
     if node['xcatNodeName'] in sensorData:
+        dirtyNodes.add(node['xcatNodeName'])
         for sensor in sensorData[node['xcatNodeName']]:
             sensorData[node['xcatNodeName']][sensor]['value'] = None
 
+def initGathererNode(node):
+    """
+        Sets the connection tracking properties for a node when a gatherer process starts
+        @param node: dictionary containing the node properties
+    """
+    global sensorData
+    node['Connected'] = False
+    node['NodeState'] = False
+    node['down'] = False
+    node['LastUpdateReceived'] = 0
+    if node['accessType'] == 'openbmcRest':
+        node['LastUpdateReceived'] = int(time.time())
+        node['nextConnAttempt'] = int(time.time())+90 #add 90s before first retry attempt to allow all of the subprocesses and threads to start
+        node['retryCount'] = 0
+        node['down'] = False
+        node['Connected'] = False
+        node['connecting']= True
+        node['NodeState'] = False
+        node['SensorList']= []
+        node['telemlistener'] = None
+        sensorData[node['xcatNodeName']] = {}
+        dirtyNodes.add(node['xcatNodeName'])
+        sensorTable.resetNode(node['xcatNodeName'])
+
+def startListenerThread(node):
+    """
+        Starts a thread that opens and services the telemetry websocket for a node
+        @param node: dictionary containing the node properties
+    """
+    ws = threading.Thread(target = openWebSocketsThreads, args=[node])
+    ws.daemon = True
+    node['telemlistener'] = ws
+    ws.start()
+
+def listenerAlive(listener):
+    """
+        Returns True if the thread or asyncio task servicing a node's websocket is still running
+    """
+    if isinstance(listener, threading.Thread):
+        return listener.is_alive()
+    return not listener.done()
+
+def forwardPollRequests(mngedNodeList):
+    """
+        Passes the nodes with new alerts to the main process so they get polled
+        @param mngedNodeList: managed list shared with the main process
+    """
+    while not sendQueue.empty():
+        pollNode, selEntries = sendQueue.get()
+        if 'xcatNodeName' in pollNode:
+            mngedNodeList.append((nodeReferenceDict[pollNode['xcatNodeName']], selEntries))
+        sendQueue.task_done()
+
+def superviseNode(node, curTime, startListener):
+    """
+        Restarts the websocket listener for a node when it is missing or has stopped sending data
+        @param node: dictionary containing the node properties
+        @param curTime: the current time in seconds
+        @param startListener: function used by the gatherer engine to start a listener for the node
+    """
+    global sensorData
+    if node['telemlistener'] is not None:
+        if not listenerAlive(node['telemlistener']):
+            node['telemlistener'] = None
+    msgtimer = curTime - node['LastUpdateReceived']
+    if node['telemlistener'] is None and curTime>= node['nextConnAttempt'] and not node['connecting']:
+        try:
+            if node['retryCount'] <3:
+                node['Connected'] = False
+                node['retryCount'] += 1
+                # throttle reconnection attempts to once every 30s
+                node['nextConnAttempt'] = int(curTime) + 30 
+                startListener(node)
+                config.errorLogger(syslog.LOG_ERR, "No thread found for monitoring {bmc} telemetry data. A new thread has been started.".format(bmc=node['bmcHostname']))
+            elif node['retryCount'] >=3:
+                if not node['down']:
+                    config.errorLogger(syslog.LOG_CRIT, "ibm-crassd has failed to reconnect to BMC, {bmc}, more than three times.".format(bmc=node['bmcHostname']))
+                    node['down'] = True
+                node['retryCount'] = 0
+        except Exception as e:
+            config.errorLogger(syslog.LOG_ERR, "Error trying to restart a thread for monitoring bmc telemetry data.")
+            exc_type, exc_obj, exc_tb = sys.exc_info()
+            fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+            config.errorLogger(syslog.LOG_DEBUG, "Exception: Error: {err}, Details: {etype}, {fname}, {lineno}".format(err=e, etype=exc_type, fname=fname, lineno=exc_tb.tb_lineno))
+            traceback.print_tb(e.__traceback__)
+    elif msgtimer > 90 and node['Connected'] and not node['connecting']:
+        try:
+            config.errorLogger(syslog.LOG_DEBUG, "No new messages received from BMC for 90 seconds. Restarting listener.")
+            node['Connected'] = False
+            node['connecting'] = True
+            nullAllNodeSensReadings(node)
+            if node['retryCount'] <=3:
+                closeNodeWebsocket(node)
+                startListener(node)
+                node['retryCount'] +=1
+            if node['retryCount'] >3 and msgtimer>=300:
+                if not node['down']:
+                    config.errorLogger(syslog.LOG_CRIT, "ibm-crassd has failed to reconnect to BMC, {bmc}, more than three times.".format(bmc=node['bmcHostname']))
+                    node['down'] = True
+                node['retryCount'] = 0
+        except Exception as e:
+            if not node['down']:
+                config.errorLogger(syslog.LOG_CRIT, "The BMC, {bmc}, stopped sending telemetry data and ibm-crassd failed to reconnect to it.".format(bmc=node['bmcHostname']))
+                node['down'] = True
+    else:
+        pass
+    sensorData[node['xcatNodeName']]['LastUpdateReceived'] = node['LastUpdateReceived']
+    sensorData[node['xcatNodeName']]['Connected'] = node['Connected']
+    sensorData[node['xcatNodeName']]['NodeState'] = node['NodeState']
+
 def startMonitoringProcess(nodeList, mngedNodeList):
     #There's one monitoring process per 50 nodes
     global lock
     global killSig
     signal.signal(signal.SIGUSR1, gathererDumpMem)
+    #sessions created by the parent process can't be shared with this process
+    sessionPool.resetPool()
     global gathererNodeList
     gathererNodeList = nodeList
     global sensorData
     for node in nodeList:
-        node['Connected'] = False
-        node['NodeState'] = False
-        node['down'] = False
-        node['LastUpdateReceived'] = 0
+        initGathererNode(node)
         if node['accessType'] == 'openbmcRest':
-            node['LastUpdateReceived'] = int(time.time())
-            node['nextConnAttempt'] = int(time.time())+90 #add 90s before first retry attempt to allow all of the subprocesses and threads to start
-            node['retryCount'] = 0
-            node['down'] = False
-            node['Connected'] = False
-            node['connecting']= True
-            node['NodeState'] = False
-            node['SensorList']= []
-            sensorData[node['xcatNodeName']] = {}
-            ws = threading.Thread(target = openWebSocketsThreads, args=[node])
-            ws.daemon = True
-            node['telemlistener'] = ws
-            ws.start() 
+            startListenerThread(node)
         config.updateManagedDict(config.nodeProperties[node['xcatNodeName']], node)
     pm = threading.Thread(target = processMessages)
     pm.daemon = True
     pm.start()
+    flushState = {}
 #     time.sleep(90)
     
     while True:
         if killSig.is_set():
             config.errorLogger(syslog.LOG_DEBUG, "Killing gatherer process pid {mpid}".format(mpid=os.getpid()))
             break
-        if not sendQueue.empty():
-            pollNode = sendQueue.get()
-            if 'xcatNodeName' not in pollNode:
-                continue
-            else:
-                mngedNodeList.append(nodeReferenceDict[pollNode['xcatNodeName']])
-            sendQueue.task_done()
+        forwardPollRequests(mngedNodeList)
+        if not pm.is_alive():
+            try:
+                pm = threading.Thread(target = processMessages)
+                pm.daemon = True
+                pm.start()
+            except Exception as e:
+                config.errorLogger(syslog.LOG_ERR, "Failed to restart the thread for processing BMC telemetry notifications. ")
+                exc_type, exc_obj, exc_tb = sys.exc_info()
+                fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+                config.errorLogger(syslog.LOG_DEBUG, "Exception: Error: {err}, Details: {etype}, {fname}, {lineno}".format(err=e, etype=exc_type, fname=fname, lineno=exc_tb.tb_lineno))
+                traceback.print_tb(e.__traceback__)
         curTime = time.time()
         for node in nodeList:
-            if node['accessType'] == 'ipmi':
-                #ipmi nodes are only polled and sensor reading isn't supported
-                continue
-            if node['telemlistener'] is not None:
-                if not node['telemlistener'].is_alive():
-                    node['telemlistener'] = None
-            msgtimer = curTime - node['LastUpdateReceived']
             if node['accessType'] == 'openbmcRest':
-                if not pm.isAlive():
-                    try:
-                        pm = threading.Thread(target = processMessages)
-                        pm.daemon = True
-                        pm.start()
-                    except Exception as e:
-                        config.errorLogger(syslog.LOG_ERR, "Failed to restart the thread for processing BMC telemetry notifications. ")
-                        exc_type, exc_obj, exc_tb = sys.exc_info()
-                        fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-                        config.errorLogger(syslog.LOG_DEBUG, "Exception: Error: {err}, Details: {etype}, {fname}, {lineno}".format(err=e, etype=exc_type, fname=fname, lineno=exc_tb.tb_lineno))
-                        traceback.print_tb(e.__traceback__)
-                if node['telemlistener'] is None and curTime>= node['nextConnAttempt'] and not node['connecting']:
-                    try:
-                        if node['retryCount'] <3:
-                            node['Connected'] = False
-                            ws = threading.Thread(target = openWebSocketsThreads, args=[node])
-                            ws.daemon = True
-                            node['telemlistener'] = ws
-                            node['retryCount'] += 1
-                            # throttle reconnection attempts to once every 30s
-                            node['nextConnAttempt'] = int(curTime) + 30 
-                            ws.start() 
-                            config.errorLogger(syslog.LOG_ERR, "No thread found for monitoring {bmc} telemetry data. A new thread has been started.".format(bmc=node['bmcHostname']))
-                        elif node['retryCount'] >=3:
-                            if not node['down']:
-                                config.errorLogger(syslog.LOG_CRIT, "ibm-crassd has failed to reconnect to BMC, {bmc}, more than three times.".format(bmc=node['bmcHostname']))
-                                node['down'] = True
-                            node['retryCount'] = 0
-                    except Exception as e:
-                        config.errorLogger(syslog.LOG_ERR, "Error trying to restart a thread for monitoring bmc telemetry data.")
-                        exc_type, exc_obj, exc_tb = sys.exc_info()
-                        fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-                        config.errorLogger(syslog.LOG_DEBUG, "Exception: Error: {err}, Details: {etype}, {fname}, {lineno}".format(err=e, etype=exc_type, fname=fname, lineno=exc_tb.tb_lineno))
-                        traceback.print_tb(e.__traceback__)
-                elif msgtimer > 90 and node['Connected'] and not node['connecting']:
-                    try:
-                        config.errorLogger(syslog.LOG_DEBUG, "No new messages received from BMC for 90 seconds. Restarting listener.")
-                        node['Connected'] = False
-                        node['connecting'] = True
-                        nullAllNodeSensReadings(node)
-                        if node['retryCount'] <=3:
-                            oldws = node['websocket']
-                            oldws.close()
-                            ws = threading.Thread(target = openWebSocketsThreads, args=[node])
-                            ws.daemon = True
-                            node['telemlistener'] = ws
-                            ws.start() 
-                            node['retryCount'] +=1
-                        if node['retryCount'] >3 and msgtimer>=300:
-                            if not node['down']:
-                                config.errorLogger(syslog.LOG_CRIT, "ibm-crassd has failed to reconnect to BMC, {bmc}, more than three times.".format(bmc=node['bmcHostname']))
-                                node['down'] = True
-                            node['retryCount'] = 0
-                    except Exception as e:
-                        if not node['down']:
-                            config.errorLogger(syslog.LOG_CRIT, "The BMC, {bmc}, stopped sending telemetry data and ibm-crassd failed to reconnect to it.".format(bmc=node['bmcHostname']))
-                            node['down'] = True
-                else:
-                    pass
-                sensorData[node['xcatNodeName']]['LastUpdateReceived'] = node['LastUpdateReceived']
-                sensorData[node['xcatNodeName']]['Connected'] = node['Connected']
-                sensorData[node['xcatNodeName']]['NodeState'] = node['NodeState']
+                #ipmi nodes are only polled and sensor reading isn't supported
+                superviseNode(node, curTime, startListenerThread)
         time.sleep(0.9)
-        telemUpdateQueue.put(sensorData)
+        flushTelemetry(flushState)
 
-def telemReceive():
-    global killSig
-    global sensorData
-    while True:
-        if killSig.is_set():
-            break
-        try:
-            newData = telemUpdateQueue.get()
-            sensorData.update(newData)
-        except Exception as e:
-            config.errorLogger(syslog.LOG_DEBUG, "Error updating sensor data with new readings.")
-            exc_type, exc_obj, exc_tb = sys.exc_info()
-            fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-            config.errorLogger(syslog.LOG_DEBUG, "Exception: Error: {err}, Details: {etype}, {fname}, {lineno}".format(err=e, etype=exc_type, fname=fname, lineno=exc_tb.tb_lineno))
-            traceback.print_tb(e.__traceback__)
+def getGathererTarget():
+    """
+        Returns the function used to run a gatherer process for the configured gatherer engine
+    """
+    if config.gathererEngine == 'asyncio':
+        return asyncGatherer.startMonitoringProcess
+    return startMonitoringProcess
+
+def diffSensor(records, nodeName, sname, reading, sentSensors):
+    """
+        Adds a delta record if a sensor reading differs from what was last sent
+    """
+    current = (reading.get('value'), reading.get('scale'), reading.get('type'))
+    previous = sentSensors.get(sname)
+    if previous == current:
+        return
+    if previous is not None and previous[1:] == current[1:]:
+        records.append((deltaValue, nodeName, sname, current[0]))
+    else:
+        records.append((deltaSensor, nodeName, sname) + current)
+    sentSensors[sname] = current
+
+def getTelemetryDelta(data, lastSent, allNodes=False):
+    """
+        Compares the sensors marked as changed with what was last sent to the socket server
+        @param data: the sensor data dictionary to compare
+        @param lastSent: dictionary with the sensors and node status last sent, updated with the changes
+        @param allNodes: boolean, compare every sensor instead of only the ones marked as changed
+        @return: list of delta records
+    """
+    records = []
+    if allNodes:
+        changedNodes = list(data.keys())
+    else:
+        changedNodes = list(dirtyNodes)
+    dirtyNodes.difference_update(changedNodes)
+    changedSensors = list(dirtySensors)
+    dirtySensors.difference_update(changedSensors)
+    for nodeName in changedNodes:
+        nodeData = data.get(nodeName)
+        if nodeData is None:
+            continue
+        sentSensors = lastSent['sensors'].setdefault(nodeName, {})
+        for sname, reading in list(nodeData.items()):
+            if sname not in nodeStatusKeys:
+                diffSensor(records, nodeName, sname, reading, sentSensors)
+        for sname in list(sentSensors.keys()):
+            if sname not in nodeData:
+                records.append((deltaRemove, nodeName, sname))
+                del sentSensors[sname]
+    if not allNodes:
+        changedNodes = set(changedNodes)
+        for nodeName, sname in changedSensors:
+            if nodeName in changedNodes:
+                continue
+            reading = data.get(nodeName, {}).get(sname)
+            if reading is not None:
+                diffSensor(records, nodeName, sname, reading, lastSent['sensors'].setdefault(nodeName, {}))
+    for nodeName, nodeData in list(data.items()):
+        status = (nodeData.get('LastUpdateReceived'), nodeData.get('Connected'), nodeData.get('NodeState'))
+        if lastSent['status'].get(nodeName) != status:
+            records.append((deltaStatus, nodeName) + status)
+            lastSent['status'][nodeName] = status
+    return records
+
+def flushTelemetry(flushState):
+    """
+        Writes the sensor readings that changed since the last flush to the shared sensor table. Every
+        fullResyncInterval seconds all of the sensors are compared, in case a change was not marked.
+        @param flushState: dictionary holding what was last written and when the next full compare is due
+    """
+    now = time.time()
+    if now >= flushState.get('nextResync', 0):
+        if 'lastSent' not in flushState:
+            flushState['lastSent'] = {'sensors': {}, 'status': {}}
+        records = getTelemetryDelta(sensorData, flushState['lastSent'], allNodes=True)
+        flushState['nextResync'] = now + fullResyncInterval
+    else:
+        records = getTelemetryDelta(sensorData, flushState['lastSent'])
+    applyTelemetryDelta(records)
+
+def applyTelemetryDelta(records):
+    """
+        Writes delta records from a gatherer into the shared sensor table
+        @param records: list of delta records
+    """
+    for record in records:
+        if record[0] == deltaValue:
+            sensorTable.writeValue(record[1], record[2], record[3])
+        elif record[0] == deltaStatus:
+            sensorTable.writeStatus(record[1], record[2], record[3], record[4])
+        elif record[0] == deltaSensor:
+            sensorTable.writeSensor(record[1], record[2], record[3], record[4], record[5])
+        elif record[0] == deltaRemove:
+            sensorTable.removeSensor(record[1], record[2])
+    sensorTable.publishCatalogs()
 
 def init(mngedNodeList):
     websocket.enableTrace(False)
@@ -784,7 +822,7 @@ def init(mngedNodeList):
             monitorNodeList = config.mynodelist[startNum:-1]
         else:
             monitorNodeList = config.mynodelist[startNum:((num+1)*nodespercore)]
-        gathererProc = multiprocessing.Process(target=startMonitoringProcess, args=[monitorNodeList, mngedNodeList])
+        gathererProc = multiprocessing.Process(target=getGathererTarget(), args=[monitorNodeList, mngedNodeList])
         gathererProc.daemon = True
         gathererProc.start()
         pidList.append(gathererProc.pid)
@@ -804,7 +842,8 @@ def recvall(sock, n):
 def process_data(filterData, addr):
     """
         Processes the filter data received from a client. In the case of errors, defaults are used. 
-        For invalid names and types, they are removed from the list. The full path of the sensor name must be included.
+        For invalid names and types, they are removed from the list. Sensor names can be given with or without
+        their path, they are matched against the sensors in the sensor table.
         
         @param filterData: The raw data received from the client. Must be in a JSON formatted string.
         @param addr: The address of the client as a string.
@@ -823,17 +862,20 @@ def process_data(filterData, addr):
                 config.errorLogger(syslog.LOG_ERR, "{value} is not a valid list of names".format(value=filterDict['sensornames']))
                 filterDict.pop('sensornames', None)
             else:
-                fullpathnames = []
+                knownNames = sensorTable.getSensorNames(nameReaderCache)
+                sensorNames = []
                 for sname in filterDict['sensornames']:
-                    found = False
-                    for fullSensName in sensorList:
-                        if sname in fullSensName:
-                            found = True
-                            fullpathnames.append(fullSensName)
-                            break
-                    if not found:
+                    shortName = str(sname).split('/')[-1]
+                    #keep the names as they are while no sensors have been read from the BMCs yet
+                    if shortName in knownNames or not knownNames:
+                        sensorNames.append(shortName)
+                        continue
+                    matches = sorted([name for name in knownNames if shortName in name])
+                    if matches:
+                        sensorNames.append(matches[0])
+                    else:
                         config.errorLogger(syslog.LOG_ERR, "{value} is not a valid sensor name".format(value=sname))
-                filterDict['sensornames'] = fullpathnames
+                filterDict['sensornames'] = sensorNames
                 if len(filterDict['sensornames'])<= 0:
                     filterDict.pop('sensornames', None)
         if 'sensortypes' in filterDict:
@@ -848,141 +890,325 @@ def process_data(filterData, addr):
                         filterDict['sensortypes'].remove(stype)
                 if len(filterDict['sensortypes'])<= 0:
                     filterDict.pop('sensortypes', None)
+        if 'encoding' in filterDict:
+            if filterDict['encoding'] not in validEncodings:
+                config.errorLogger(syslog.LOG_ERR, "{value} is not a valid encoding".format(value=filterDict['encoding']))
+                filterDict.pop('encoding', None)
         return filterDict
     except Exception as e:
         config.errorLogger(syslog.LOG_CRIT, "Unable to process message from client {addr}. Error details: {err}".format(addr=addr, err=e))
 
-def getFilteredData(filterInfo, sensorData):
+def compileFilter(filterInfo):
     """
-        Returns a dictionary containing the filtered sensors. 
+        Compiles the filters of a client into a function that picks the slots to send from a node catalog of
+        the sensor table. The sensor table caches the picked slots with the catalog, so they are only picked
+        again when the sensors of the node change.
         @param filterInfo: Dictionary containing the filters
-        @return: Dictionary containing only the subscribed to sensors
+        @return: function for sensorTable.readNode, or None when all the sensors are sent
     """
-#     global sensorData
-    filteredDict = {}
     #sensor names have the highest priority for filters
-    try:
-        if "sensornames" in filterInfo:
-            for node in sensorData:
-                if 'Time_Sent' in node: continue
-                filteredDict[node] = {}
-                for sname in filterInfo['sensornames']:
-                    filteredDict[node][sname.split('/')[-1]] = sensorData[node][sname.split('/')[-1]]
-                filteredDict[node]['LastUpdateReceived'] = sensorData[node]['LastUpdateReceived']
-                filteredDict[node]['NodeState'] = sensorData[node]['NodeState']
-                filteredDict[node]['Connected'] = sensorData[node]['Connected']
-            return filteredDict
-        elif 'sensortypes' in filterInfo:
-            for node in sensorData:
-                if 'Time_Sent' in node: continue
-                filteredDict[node] = {}
-                for sname in sensorData[node]:
-                    if 'LastUpdateReceived' in sname: continue
-                    elif 'NodeState' in sname: continue
-                    elif 'Connected' in sname: continue
-                    elif sensorData[node][sname]['type'] is None:
-                        filteredDict[node][sname] = sensorData[node][sname]
-                    elif sensorData[node][sname]['type'][0] in filterInfo['sensortypes']:
-                        filteredDict[node][sname] = sensorData[node][sname]
-                    else:
-                        pass
-                filteredDict[node]['LastUpdateReceived'] = sensorData[node]['LastUpdateReceived']
-                filteredDict[node]['NodeState'] = sensorData[node]['NodeState']
-                filteredDict[node]['Connected'] = sensorData[node]['Connected']
-            return filteredDict
+    if 'sensornames' in filterInfo:
+        names = set(filterInfo['sensornames'])
+        return lambda catalog: [slot for slot, sname in enumerate(catalog['sensors']) if sname in names]
+    elif 'sensortypes' in filterInfo:
+        sensorTypes = set(filterInfo['sensortypes'])
+        def selectTypes(catalog):
+            types = catalog['types']
+            #sensors without a type are always sent
+            return [slot for slot, typeCode in enumerate(catalog['sensorTypes'])
+                    if typeCode == 0 or typeCode >= len(types) or types[typeCode][0] in sensorTypes]
+        return selectTypes
+    return None
+
+def getFilterKey(filterInfo, clientSubRate):
+    """
+        Returns the key of the subscriber group for a filter. Clients with the same filters and frequency
+        share a group and receive the same frame.
+        @param filterInfo: Dictionary containing the filters of the client
+        @param clientSubRate: the number of milliseconds between updates sent to the client
+        @return: string that is the same for equivalent filters
+    """
+    canonical = {}
+    for key in filterInfo:
+        if key == 'frequency':
+            continue
+        if isinstance(filterInfo[key], list):
+            canonical[key] = sorted(set(filterInfo[key]))
         else:
-            return sensorData
-    except Exception as e:
-        config.errorLogger(syslog.LOG_DEBUG, "Failed to filter the sensors, returned all of them.")
-        exc_type, exc_obj, exc_tb = sys.exc_info()
-        fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-        config.errorLogger(syslog.LOG_DEBUG, "Exception: Error: {err}, Details: {etype}, {fname}, {lineno}".format(err=e, etype=exc_type, fname=fname, lineno=exc_tb.tb_lineno))
-        traceback.print_tb(e.__traceback__)
-    return sensorData
+            canonical[key] = filterInfo[key]
+    return '{rate}:{filters}'.format(rate=clientSubRate, filters=json.dumps(canonical, sort_keys=True))
 
-def on_new_client(clientsocket, addr):
+def encodeTelemetryFrame(filteredSensors):
     """
-         Run in a thread,under a subprocess, sends telemetry data to a subscribed client
-           
-         @param clientsocket: the socket opened with the subscriber
-         @param addr: The address of the subscriber
-    """ 
-    global killSig
-    global sensorData
-    last_run = next_run = now = get_millis()
-    clientSubRate = update_every
-    clientsocket.settimeout(0.1)
-    count = 0
-    config.errorLogger(syslog.LOG_INFO, "Telemetry streaming connected to {address}".format(address= addr))
+        Builds the length prefixed JSON message sent to the clients of a subscriber group
+        @param filteredSensors: the sensor data read for the group, Time_Sent is added to it
+        @return: bytes ready to be written to the client sockets
+    """
+    filteredSensors['Time_Sent'] = int(time.time())
+    #compact separators give the same bytes as indent=0 with the newlines removed, using the faster C encoder
+    data2send = (json.dumps(filteredSensors, separators=(',', ':')) +"\n").encode()
+    return struct.pack('>I', len(data2send)) + data2send
 
-    filterInfo = {}
-    while True:
-        if killSig.is_set():
-            break
+def encodeCompactFrame(group, filteredSensors, timeSent):
+    """
+        Builds the compact value frame for a subscriber group, and a new dictionary frame for the group
+        when its nodes or sensors changed since the last frame
+        @param group: dictionary with the state of the subscriber group
+        @param filteredSensors: the sensor data filtered for the group
+        @param timeSent: the Time_Sent of the frame
+        @return: bytes of the length prefixed value frame
+    """
+    nodes = []
+    layout = []
+    statuses = []
+    values = []
+    nan = float('nan')
+    for node in filteredSensors:
+        if 'Time_Sent' in node: continue
+        nodeData = filteredSensors[node]
+        nodes.append(node)
+        lastUpdate = nodeData.get('LastUpdateReceived')
+        statuses.append(int(lastUpdate) if isinstance(lastUpdate, (int, float)) else -1)
+        statuses.append({True: 1, False: 0}.get(nodeData.get('Connected'), -1))
+        nodeState = nodeData.get('NodeState')
+        statuses.append(compactNodeStates.index(nodeState) if nodeState in compactNodeStates else 0)
+        snames = [sname for sname in nodeData if sname not in nodeStatusKeys]
+        readings = [nodeData[sname] for sname in snames]
+        #the sensor names, scales and types of each node are compared with the last frame to detect a new dictionary
+        layout.append(snames)
+        layout.append([(reading['scale'], reading['type']) for reading in readings])
+        values.extend([nan if reading['value'] is None else reading['value'] for reading in readings])
+    if nodes != group['nodes'] or layout != group['layout']:
+        group['nodes'] = nodes
+        group['layout'] = layout
+        group['dictionaryVersion'] += 1
+        sensors = []
+        for nodeIndex in range(len(nodes)):
+            for sname, (scale, stype) in zip(layout[nodeIndex * 2], layout[nodeIndex * 2 + 1]):
+                sensors.append([nodeIndex, sname, scale, list(stype) if stype is not None else None])
+        dictionary = {'version': group['dictionaryVersion'], 'nodes': nodes, 'nodeStates': compactNodeStates, 'sensors': sensors}
+        payload = bytes([compactDictionaryFrame]) + json.dumps(dictionary, separators=(',', ':')).encode()
+        group['dictionaryFrame'] = struct.pack('>I', len(payload)) + payload
+        group['valueStruct'] = struct.Struct('<' + 'qbb' * len(nodes) + 'd' * len(values))
+    payload = (compactValueHeader.pack(compactValueFrame, group['dictionaryVersion'], timeSent, len(nodes), len(values)) +
+               group['valueStruct'].pack(*(statuses + values)))
+    return struct.pack('>I', len(payload)) + payload
 
-        if next_run <= now:
-            count += 1
-            while next_run <=now:
-                next_run += clientSubRate
-            dt = now - last_run
-            last_run = now
-            
-            if count == 1:
-                dt = 0
-            filteredSensors = getFilteredData(filterInfo, sensorData)
-            filteredSensors['Time_Sent'] = int(time.time())
-            data2send = (json.dumps(filteredSensors, indent=0, separators=(',', ':')).replace('\n','') +"\n").encode()
-#             data2send = (json.dumps(sensorData, indent=0, separators=(',', ':')).replace('\n','') +"\n").encode()
-            msg = struct.pack('>I', len(data2send)) + data2send
-            clientsocket.sendall(msg) 
-        time.sleep(0.3) #wait 1/3 of a second and check for new
-        now = get_millis()   
-        
-        try:
-            raw_msglen = recvall(clientsocket, 4)
-            if not raw_msglen:
-                break
-            msglen = struct.unpack('>I', raw_msglen)[0]
-            data = recvall(clientsocket, msglen)
-            if not data:
-                break
+def encodeGroupFrame(group, readerCache):
+    """
+        Reads the sensors picked by the filters of a subscriber group from the sensor table and encodes
+        them with the encoding its clients asked for
+        @param group: dictionary with the state of the subscriber group
+        @param readerCache: the sensor table reader cache of the socket server
+        @return: bytes ready to be written to the client sockets
+    """
+    filteredSensors = sensorTable.readTable(readerCache, group['select'], group['key'])
+    if group['filterInfo'].get('encoding') == 'compact':
+        return encodeCompactFrame(group, filteredSensors, int(time.time()))
+    return encodeTelemetryFrame(filteredSensors)
+
+def queueGroupFrame(selector, group, client):
+    """
+        Queues the last frame of a group to one of its clients, preceded by the dictionary frame
+        of the group if the client does not have it yet
+    """
+    dictionary = None
+    if group['dictionaryFrame'] is not None and client['dictionaryVersion'] != group['dictionaryVersion']:
+        dictionary = group['dictionaryFrame']
+        client['dictionaryVersion'] = group['dictionaryVersion']
+    queueFrame(selector, client, group['lastFrame'], dictionary)
+
+def subscribeClient(selector, groups, client, filterInfo, clientSubRate, delay=0):
+    """
+        Adds a client to the subscriber group for its filters, leaving the group it was in before
+        @param selector: the selector of the socket server
+        @param groups: dictionary of the subscriber groups
+        @param client: dictionary with the state of the client connection
+        @param filterInfo: Dictionary containing the filters of the client
+        @param clientSubRate: the number of milliseconds between updates sent to the client
+        @param delay: milliseconds before the first update when a new group is created
+    """
+    unsubscribeClient(groups, client)
+    key = getFilterKey(filterInfo, clientSubRate)
+    if key not in groups:
+        groups[key] = {'key': key, 'filterInfo': filterInfo, 'select': compileFilter(filterInfo), 'rate': clientSubRate,
+                       'next_run': get_millis() + delay, 'clients': {}, 'lastFrame': None, 'nodes': None, 'layout': None, 'dictionaryVersion': 0,
+                       'dictionaryFrame': None, 'valueStruct': None}
+    groups[key]['clients'][client['addr']] = client
+    client['group'] = key
+    client['dictionaryVersion'] = None
+    #clients joining a group that already streams get its last frame right away, then follow its schedule
+    if groups[key]['lastFrame'] is not None:
+        queueGroupFrame(selector, groups[key], client)
+
+def unsubscribeClient(groups, client):
+    """
+        Removes a client from its subscriber group, the group is removed once it is empty
+    """
+    key = client.get('group')
+    if key in groups:
+        groups[key]['clients'].pop(client['addr'], None)
+        if not groups[key]['clients']:
+            del groups[key]
+    client['group'] = None
+
+def queueFrame(selector, client, frame, dictionary=None):
+    """
+        Queues a frame for a client. A client keeps at most one frame waiting behind the one being sent,
+        a newer frame replaces the waiting one so a slow client receives the latest data instead of a backlog.
+        A dictionary frame is never dropped, it stays in front of the frame that replaces the waiting one.
+        @param frame: the frame to send
+        @param dictionary: optional compact dictionary frame that must be sent before the frame
+    """
+    if client['sending'] is None:
+        if dictionary is not None:
+            frame = dictionary + frame
+        client['sending'] = memoryview(frame)
+        client['lastProgress'] = get_millis()
+        selector.modify(client['socket'], selectors.EVENT_READ | selectors.EVENT_WRITE, client)
+    else:
+        if client['waiting'] is not None:
+            client['dropped'] += 1
+        if dictionary is not None:
+            client['waitingDictionary'] = dictionary
+        client['waiting'] = frame
+
+def writeClient(selector, client):
+    """
+        Sends as much of the pending frames as the socket accepts
+        @return: False if the connection failed
+    """
+    try:
+        sent = client['socket'].send(client['sending'])
+    except (BlockingIOError, InterruptedError):
+        return True
+    except OSError:
+        return False
+    client['lastProgress'] = get_millis()
+    client['sending'] = client['sending'][sent:]
+    if len(client['sending']) == 0:
+        if client['waiting'] is not None:
+            if client['waitingDictionary'] is not None:
+                client['sending'] = memoryview(client['waitingDictionary'] + client['waiting'])
             else:
-                filterInfo = process_data(data, addr)
-                if 'frequency' in filterInfo:
-                    clientSubRate = filterInfo['frequency'] * 1000
-        except socket.timeout:
-            pass
+                client['sending'] = memoryview(client['waiting'])
+            client['waiting'] = None
+            client['waitingDictionary'] = None
+        else:
+            client['sending'] = None
+            selector.modify(client['socket'], selectors.EVENT_READ, client)
+    return True
+
+def readClient(selector, groups, client):
+    """
+        Reads filter messages from a client, each one is a 4 byte length followed by a json string
+        @return: False if the connection was closed or sent an invalid message
+    """
+    try:
+        data = client['socket'].recv(65536)
+    except (BlockingIOError, InterruptedError):
+        return True
+    except OSError:
+        return False
+    if not data:
+        return False
+    client['inbuf'] += data
+    while len(client['inbuf']) >= 4:
+        msglen = struct.unpack('>I', client['inbuf'][:4])[0]
+        if msglen > maxFilterMessage:
+            config.errorLogger(syslog.LOG_ERR, "Filter message from {caddress} is too large.".format(caddress=client['addr']))
+            return False
+        if len(client['inbuf']) < msglen + 4:
+            break
+        data = client['inbuf'][4:msglen + 4]
+        client['inbuf'] = client['inbuf'][msglen + 4:]
+        try:
+            filterInfo = process_data(data, client['addr'])
+            if 'frequency' in filterInfo:
+                client['rate'] = filterInfo['frequency'] * 1000
+            subscribeClient(selector, groups, client, filterInfo, client['rate'])
         except Exception as e:
-            config.errorLogger(syslog.LOG_ERR, "Error processing message filters from client at: {caddress}.".format(caddress=addr))
+            config.errorLogger(syslog.LOG_ERR, "Error processing message filters from client at: {caddress}.".format(caddress=client['addr']))
             exc_type, exc_obj, exc_tb = sys.exc_info()
             fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
             config.errorLogger(syslog.LOG_DEBUG, "Exception: Error: {err}, Details: {etype}, {fname}, {lineno}".format(err=e, etype=exc_type, fname=fname, lineno=exc_tb.tb_lineno))
             traceback.print_tb(e.__traceback__)
+    return True
 
-        
-    for item in clientList:
-        if addr == item:
-            clientList.remove(item)
-    clientsocket.close()
-    config.errorLogger(syslog.LOG_INFO, "Telemetry streaming disconnected from {address}".format(address= addr))
+def acceptClients(selector, groups, servsocket):
+    """
+        Accepts all the waiting subscribers
+    """
+    while True:
+        try:
+            clientsocket, addr = servsocket.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        acceptClient(selector, groups, clientsocket, addr)
+
+def acceptClient(selector, groups, clientsocket, addr):
+    """
+        Sets up a new subscriber and streams the unfiltered data to it until it sends filters
+    """
+    clientsocket.setblocking(False)
+    client = {'socket': clientsocket, 'addr': addr, 'inbuf': b'', 'sending': None, 'waiting': None,
+              'waitingDictionary': None, 'dictionaryVersion': None, 'rate': update_every, 'group': None,
+              'lastProgress': get_millis(), 'dropped': 0}
+    selector.register(clientsocket, selectors.EVENT_READ, client)
+    config.errorLogger(syslog.LOG_INFO, "Telemetry streaming connected to {address}".format(address= addr))
+    #most clients send their filters right after connecting, wait for them before encoding the unfiltered data
+    subscribeClient(selector, groups, client, {}, client['rate'], newClientDelay)
+
+def closeClient(selector, groups, client):
+    unsubscribeClient(groups, client)
+    try:
+        selector.unregister(client['socket'])
+    except (KeyError, ValueError):
+        pass
+    client['socket'].close()
+    if client['dropped'] > 0:
+        config.errorLogger(syslog.LOG_DEBUG, "{count} telemetry updates were skipped for the slow client {address}".format(count=client['dropped'], address=client['addr']))
+    config.errorLogger(syslog.LOG_INFO, "Telemetry streaming disconnected from {address}".format(address= client['addr']))
+
+def sendDueFrames(selector, groups, readerCache):
+    """
+        Reads and encodes the data once for every subscriber group that is due and queues it to the clients of the group.
+        Clients that have not accepted any data for clientSendTimeout seconds are disconnected.
+        @return: the number of milliseconds until the next group is due
+    """
+    now = get_millis()
+    nextDue = now + 1000
+    for key in list(groups.keys()):
+        group = groups[key]
+        if group['next_run'] <= now:
+            group['lastFrame'] = encodeGroupFrame(group, readerCache)
+            while group['next_run'] <= now:
+                group['next_run'] += group['rate']
+            for client in list(group['clients'].values()):
+                if client['sending'] is not None and now - client['lastProgress'] > clientSendTimeout * 1000:
+                    config.errorLogger(syslog.LOG_INFO, "Telemetry client {address} stopped reading and was disconnected".format(address=client['addr']))
+                    closeClient(selector, groups, client)
+                else:
+                    queueGroupFrame(selector, group, client)
+        nextDue = min(nextDue, group['next_run'])
+    return nextDue - get_millis()
 
-    
 def socket_server(servsocket):
+    """
+         The telemetry socket server. One selector loop accepts subscribers, reads their filter messages
+         and sends them the telemetry frames when their subscriber group is due.
+           
+         @param servsocket: the socket to listen on
+    """
     signal.signal(signal.SIGUSR1, sockServerDumpMem)
     global pidList
     global serverhostname
     global killSig
-    global sensorData
     global syncTime
     syncTime = int(time.time())
-    for node in config.mynodelist:
-        sensorData[node['xcatNodeName']] = {}
-        sensorData[node['xcatNodeName']]['LastUpdateReceived'] = None
-        sensorData[node['xcatNodeName']]['Connected'] = None
-        sensorData[node['xcatNodeName']]['NodeState'] = None
-    dataUpdaterThread = threading.Thread(target=telemReceive)
-    dataUpdaterThread.daemon = True
-    dataUpdaterThread.start()
+    readerCache = {}
+    syncReaderCache = {}
+    groups = {}
     
 #     killQueueThread = threading.Thread(target=killQueueChecker)
 #     killQueueThread.daemon = True
@@ -991,38 +1217,40 @@ def socket_server(servsocket):
     servsocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     servsocket.bind((serverhostname,config.telemPort))
     servsocket.listen(15)
-    read_list = [servsocket]
+    servsocket.setblocking(False)
+    selector = selectors.DefaultSelector()
+    selector.register(servsocket, selectors.EVENT_READ, None)
     while True:
         if killSig.is_set():
             config.errorLogger(syslog.LOG_DEBUG, "Socket Server terminating")
             break
         try:
-            if not dataUpdaterThread.isAlive():
-                dataUpdaterThread = threading.Thread(target=telemReceive)
-                dataUpdaterThread.daemon = True
-                dataUpdaterThread.start()
-                config.errorLogger(syslog.LOG_DEBUG, "Restarted the data consolidation thread")
-            readable, writeable, errored = select.select(read_list, [], [], 5)
-            for s in readable:
-                if s is servsocket:
-                    c, addr = servsocket.accept()
-                    t = threading.Thread(target=on_new_client, args =[c,addr])
-                    t.daemon = True
-                    t.start()
-                else:
-                    data = s.recv(1024)
-                    if data:
-                        pass
-                    else:
-                        s.close()
-                        read_list.remove(s)
+            timeout = sendDueFrames(selector, groups, readerCache)
+            #wake up at least once a second to check for the kill signal
+            for key, mask in selector.select(min(max(timeout, 0), 1000) / 1000.0):
+                if key.data is None:
+                    acceptClients(selector, groups, servsocket)
+                    continue
+                client = key.data
+                if client['socket'].fileno() < 0:
+                    continue
+                alive = True
+                if mask & selectors.EVENT_READ:
+                    alive = readClient(selector, groups, client)
+                if alive and mask & selectors.EVENT_WRITE:
+                    alive = writeClient(selector, client)
+                if not alive:
+                    closeClient(selector, groups, client)
             if ((int(time.time())-syncTime) >= 600):
                 # syncronize the connection status for each node
                 for node in config.mynodelist:
                     if node['accessType'] != 'ipmi':
-                        config.nodeProperties[node['xcatNodeName']]['LastUpdateReceived'] = sensorData[node['xcatNodeName']]['LastUpdateReceived']
-                        config.nodeProperties[node['xcatNodeName']]['Connected'] = sensorData[node['xcatNodeName']]['Connected']
-                        config.nodeProperties[node['xcatNodeName']]['NodeState'] = sensorData[node['xcatNodeName']]['NodeState']
+                        nodeData = sensorTable.readNode(node['xcatNodeName'], syncReaderCache)
+                        if nodeData is None:
+                            continue
+                        config.nodeProperties[node['xcatNodeName']]['LastUpdateReceived'] = nodeData['LastUpdateReceived']
+                        config.nodeProperties[node['xcatNodeName']]['Connected'] = nodeData['Connected']
+                        config.nodeProperties[node['xcatNodeName']]['NodeState'] = nodeData['NodeState']
                 syncTime = int(time.time())
         except Exception as e:
             config.errorLogger(syslog.LOG_ERR, "Failed to open a telemetry server connection with a client.")
@@ -1031,6 +1259,10 @@ def socket_server(servsocket):
             config.errorLogger(syslog.LOG_DEBUG, "Exception: Error: {err}, Details: {etype}, {fname}, {lineno}".format(err=e, etype=exc_type, fname=fname, lineno=exc_tb.tb_lineno))
             traceback.print_tb(e.__traceback__)
             
+    for key in list(selector.get_map().values()):
+        if key.data is not None:
+            closeClient(selector, groups, key.data)
+    selector.close()
     servsocket.close()
 
 def watchdogThread():
@@ -1074,7 +1306,7 @@ def restartGathererProcess(nodeSet):
         monitorNodeList = config.mynodelist[startNum:-1]
     else:
         monitorNodeList = config.mynodelist[startNum:((nodeSet+1)*nodespercore)]
-    gathererProc = multiprocessing.Process(target=startMonitoringProcess, args=[monitorNodeList, mngedNodeList])
+    gathererProc = multiprocessing.Process(target=getGathererTarget(), args=[monitorNodeList, mngedNodeList])
     gathererProc.daemon = True
     gathererProc.start()
     #pidList[0] is for the socket server, gaterer proc pids begin after that. 
@@ -1138,9 +1370,12 @@ def memWatchdog():
                 with open('/tmp/crassd-{mpid}-{curTime}', 'w') as f:
                     pass
         time.sleep(1)
-def main():
-    global telemUpdateQueue 
-    telemUpdateQueue= multiprocessing.Queue()
+def initSharedState():
+    """
+        Creates the queues, events and data structures shared by the gatherer and socket server processes.
+        Must be called before any of the subprocesses are started.
+    """
+    sensorTable.create(config.mynodelist, config.maxSensorsPerNode)
     global killSig
     killSig = multiprocessing.Event()
     global restartSockServ
@@ -1171,6 +1406,13 @@ def main():
     get_millis = lambda: int(round(time.time() * 1000))
     global sendQueue
     sendQueue = queue.Queue()
+    global nodeReferenceDict
+    nodeReferenceDict = {}
+    for node in config.mynodelist:
+        nodeReferenceDict[node['xcatNodeName']] = node.copy()
+
+def main():
+    initSharedState()
     nodeListManager = multiprocessing.Manager()
     global mngedNodeList
     mngedNodeList = nodeListManager.list()
@@ -1188,12 +1430,8 @@ def main():
     killNow = config.killNow
     global gathererProcs
     gathererProcs = []
-    global nodeReferenceDict
-    nodeReferenceDict = {}
     global pidList 
     pidList = nodeListManager.list()
-    for node in config.mynodelist:
-        nodeReferenceDict[node['xcatNodeName']] = node.copy()
     pidList.append(None)
     init(mngedNodeList)
     
@@ -1221,8 +1459,8 @@ def main():
             if isinstance(mngedNodeList, str): break
             while len(mngedNodeList)>0:
 #                 node = config.alertMessageQueue.get()
-                node = mngedNodeList.pop(0)
-                config.nodes2poll.put(node)
+                node, selEntries = mngedNodeList.pop(0)
+                pollQueue.put(node, selEntries)
 #                 config.alertMessageQueue.task_done()
             if restartSockServ.is_set():
                 sockServProcess = multiprocessing.Process(target=socket_server, args=[serversocket])
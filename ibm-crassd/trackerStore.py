@@ -0,0 +1,360 @@
+#
+#  Copyright 2017 IBM Corporation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+"""
+    This module keeps the tracker, which records the last alert reported to each plugin for every BMC. The
+    tracker is an SQLite database in write ahead log mode next to where the bmclastreports.ini file was kept.
+    Every plugin and BMC has one row keyed by both, with an index on the BMC, so a single cursor is read or
+    written without touching the others.
+
+    Updates are kept in memory and merged per plugin and BMC until flush writes them in one transaction, once
+    the oldest pending update is flushInterval seconds old or flushThreshold updates are pending. A transaction
+    only appends the changed pages to the write ahead log, so the updates survive a crash of the service once
+    flush returns. The updates still pending when the service crashes are lost, and the alerts they recorded
+    are reported again after the restart. An existing bmclastreports.ini file, and the journal written next to it by
+    earlier versions, are imported into the database when the service starts and then renamed.
+
+    updateNodeTimes.py writes the new reporting times of serviced nodes straight to the database. It also
+    queues them in the node_updates table, which the service reads with takeNodeUpdates when it receives
+    SIGUSR2, so the reporting times it holds in memory are updated too.
+"""
+import configparser
+import json
+import os
+import sqlite3
+import sys
+import syslog
+import threading
+import time
+import traceback
+import config
+
+#seconds an update is kept in memory before it is written
+flushInterval = 5
+#the most updates kept in memory before they are written
+flushThreshold = 500
+#seconds to wait for a lock held by another process, such as updateNodeTimes.py
+busyTimeout = 30
+
+schema = ["CREATE TABLE IF NOT EXISTS app_info (key TEXT PRIMARY KEY, value TEXT)",
+          "CREATE TABLE IF NOT EXISTS statistics (key TEXT PRIMARY KEY, value INTEGER)",
+          "CREATE TABLE IF NOT EXISTS cursors (entity TEXT NOT NULL, bmc TEXT NOT NULL, lastLogTime TEXT, dupTimeIDList TEXT, "
+          "hrTime TEXT, PRIMARY KEY (entity, bmc)) WITHOUT ROWID",
+          "CREATE INDEX IF NOT EXISTS cursors_bmc ON cursors (bmc)",
+          "CREATE TABLE IF NOT EXISTS node_updates (entity TEXT NOT NULL, bmc TEXT NOT NULL, node TEXT, lastLogTime TEXT, "
+          "PRIMARY KEY (entity, bmc)) WITHOUT ROWID"]
+
+connection = None
+pending = {}
+oldestPending = None
+storeLock = threading.RLock()
+stats = {'updates': 0, 'merged': 0, 'flushes': 0, 'rowsWritten': 0}
+
+def getDatabaseName(trackerFile):
+    """
+        Returns the name of the database that replaces a bmclastreports.ini file
+    """
+    return os.path.splitext(trackerFile)[0] + '.db'
+
+def getJournalName(trackerFile):
+    return trackerFile + '.journal'
+
+def openDatabase(fileName):
+    """
+        Opens the tracker database, creating its tables when they do not exist
+
+        @param fileName: the full path of the database
+        @return: sqlite3 connection in autocommit mode, transactions are started explicitly
+    """
+    db = sqlite3.connect(fileName, timeout=busyTimeout, isolation_level=None, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    for statement in schema:
+        db.execute(statement)
+    return db
+
+def parseCursor(value):
+    """
+        Returns the cursor dictionary of a bmclastreports.ini entry, written either with str or json.dumps
+    """
+    return json.loads(value.replace("\'", "\""))
+
+def readIniTracker(trackerFile):
+    """
+        Reads a bmclastreports.ini file and applies the updates in its journal
+
+        @return: ConfigParser holding the tracker file
+    """
+    confParser = configparser.ConfigParser()
+    if os.path.exists(trackerFile):
+        confParser.read(trackerFile)
+    journalName = getJournalName(trackerFile)
+    if os.path.exists(journalName):
+        with open(journalName, 'r') as f:
+            for line in f:
+                try:
+                    update = json.loads(line)
+                except ValueError:
+                    #the last line may have been cut short by a crash
+                    break
+                section = update['entity'] + '_bmcs'
+                if section not in confParser:
+                    confParser[section] = {}
+                confParser[section][update['bmchostname']] = json.dumps(update['data'])
+    return confParser
+
+def migrateIniTracker(trackerFile):
+    """
+        Imports a bmclastreports.ini file into the database and renames it so it is only imported once. Must be
+        called with the store lock held.
+
+        @param trackerFile: the full path of the bmclastreports.ini file
+        @return: the number of cursors imported
+    """
+    confParser = readIniTracker(trackerFile)
+    cursors = []
+    for section in confParser.sections():
+        if not section.endswith('_bmcs'):
+            continue
+        entity = section[:-len('_bmcs')]
+        for bmc in confParser[section]:
+            data = parseCursor(confParser[section][bmc])
+            cursors.append((entity, bmc, str(data['lastLogTime']), json.dumps(data.get('dupTimeIDList', [])), data.get('hrTime')))
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        if 'app_info' in confParser:
+            connection.executemany("INSERT OR REPLACE INTO app_info (key, value) VALUES (?, ?)", list(confParser['app_info'].items()))
+        if 'statistics' in confParser:
+            connection.executemany("INSERT OR REPLACE INTO statistics (key, value) VALUES (?, ?)",
+                                   [(key, int(value)) for key, value in confParser['statistics'].items()])
+        connection.executemany("INSERT OR REPLACE INTO cursors (entity, bmc, lastLogTime, dupTimeIDList, hrTime) VALUES (?, ?, ?, ?, ?)", cursors)
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    if os.path.exists(trackerFile):
+        os.rename(trackerFile, trackerFile + '.migrated')
+    if os.path.exists(getJournalName(trackerFile)):
+        os.remove(getJournalName(trackerFile))
+    return len(cursors)
+
+def load(trackerFile):
+    """
+        Opens the tracker database, importing the bmclastreports.ini file if there is one. Node updates
+        left from before a restart are dropped, updateNodeTimes.py already wrote them to the cursors.
+
+        @param trackerFile: the full path of the bmclastreports.ini file
+    """
+    global connection
+    with storeLock:
+        if connection is not None:
+            connection.close()
+        pending.clear()
+        dbName = getDatabaseName(trackerFile)
+        connection = openDatabase(dbName)
+        #the bmclastreports.ini file is renamed once it has been imported
+        if os.path.exists(trackerFile) or os.path.exists(getJournalName(trackerFile)):
+            count = migrateIniTracker(trackerFile)
+            config.errorLogger(syslog.LOG_INFO, "Imported {count} reporting times from {fname} into {dbName}".format(
+                count=count, fname=trackerFile, dbName=dbName))
+        connection.execute("DELETE FROM node_updates")
+
+def getAppInfo(key):
+    """
+        Returns a value of the app_info section, None when it is not set
+    """
+    with storeLock:
+        row = connection.execute("SELECT value FROM app_info WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    return row[0]
+
+def setAppInfo(key, value):
+    with storeLock:
+        connection.execute("INSERT OR REPLACE INTO app_info (key, value) VALUES (?, ?)", (key, value))
+
+def getStatistics():
+    """
+        Returns the stored statistics as a dictionary
+    """
+    with storeLock:
+        return dict(connection.execute("SELECT key, value FROM statistics").fetchall())
+
+def rowToCursor(row):
+    return {'lastLogTime': row[0], 'dupTimeIDList': json.loads(row[1]), 'hrTime': row[2]}
+
+def getCursor(entity, bmcHostname):
+    """
+        Returns the last reported alert of a BMC for a plugin
+
+        @param entity: string, the name of the plugin
+        @param bmcHostname: string, the hostname or IP address of the bmc
+        @return: dictionary with the lastLogTime, dupTimeIDList and hrTime, None when nothing was reported
+    """
+    with storeLock:
+        if (entity, bmcHostname) in pending:
+            return dict(pending[(entity, bmcHostname)])
+        row = connection.execute("SELECT lastLogTime, dupTimeIDList, hrTime FROM cursors WHERE entity = ? AND bmc = ?",
+                                 (entity, bmcHostname)).fetchone()
+    if row is None:
+        return None
+    return rowToCursor(row)
+
+def getCursors(entity):
+    """
+        Returns the last reported alerts of every BMC for a plugin
+
+        @param entity: string, the name of the plugin
+        @return: dictionary of the cursor dictionaries keyed by bmc hostname
+    """
+    with storeLock:
+        rows = connection.execute("SELECT bmc, lastLogTime, dupTimeIDList, hrTime FROM cursors WHERE entity = ?", (entity,)).fetchall()
+        cursors = {}
+        for row in rows:
+            cursors[row[0]] = rowToCursor(row[1:])
+        for key in pending:
+            if key[0] == entity:
+                cursors[key[1]] = dict(pending[key])
+    return cursors
+
+def recordUpdate(entity, bmcHostname, data):
+    """
+        Records the last reported alert of a BMC for a plugin. The database is written by flush.
+
+        @param entity: string, the name of the plugin
+        @param bmcHostname: string, the hostname or IP address of the bmc
+        @param data: dictionary with the lastLogTime, dupTimeIDList and hrTime of the last reported alert
+    """
+    global oldestPending
+    with storeLock:
+        stats['updates'] += 1
+        if (entity, bmcHostname) in pending:
+            stats['merged'] += 1
+        elif len(pending) == 0:
+            oldestPending = time.time()
+        pending[(entity, bmcHostname)] = data
+
+def flushDue():
+    """
+        Returns True when the pending updates have to be written to the database
+    """
+    with storeLock:
+        if len(pending) == 0:
+            return False
+        return len(pending) >= flushThreshold or time.time() - oldestPending >= flushInterval
+
+def flush(statistics=None):
+    """
+        Writes the pending updates to the database in one transaction
+
+        @param statistics: dictionary of statistics to store, None to leave them unchanged
+        @return: True if the updates were written
+    """
+    global oldestPending
+    with storeLock:
+        if connection is None:
+            return False
+        rows = []
+        for key in pending:
+            data = pending[key]
+            rows.append((key[0], key[1], str(data['lastLogTime']), json.dumps(data['dupTimeIDList']), data.get('hrTime')))
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.executemany("INSERT OR REPLACE INTO cursors (entity, bmc, lastLogTime, dupTimeIDList, hrTime) VALUES (?, ?, ?, ?, ?)", rows)
+                if statistics:
+                    connection.executemany("INSERT OR REPLACE INTO statistics (key, value) VALUES (?, ?)", list(statistics.items()))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            pending.clear()
+            oldestPending = None
+            stats['flushes'] += 1
+            stats['rowsWritten'] += len(rows)
+            return True
+        except Exception as e:
+            exc_type, exc_obj, exc_tb = sys.exc_info()
+            fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+            config.errorLogger(syslog.LOG_ERR, "Unable to write the tracker database: {err}".format(err=e))
+            config.errorLogger(syslog.LOG_DEBUG, "Exception: Error: {err}, Details: {etype}, {fname}, {lineno}".format(err=e, etype=exc_type, fname=fname, lineno=exc_tb.tb_lineno))
+            traceback.print_tb(e.__traceback__)
+            return False
+
+def close(statistics=None):
+    """
+        Writes the pending updates and closes the database
+    """
+    global connection
+    with storeLock:
+        if connection is None:
+            return
+        if len(pending) > 0 or statistics:
+            flush(statistics)
+        connection.close()
+        connection = None
+
+def queueNodeUpdates(db, updates):
+    """
+        Sets new reporting times for serviced nodes and queues them for the running service. Used by
+        updateNodeTimes.py with its own connection.
+
+        @param db: connection returned by openDatabase
+        @param updates: list of dictionaries with the entity, bmchostname, node and lastLogTime to set
+    """
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        for update in updates:
+            db.execute("INSERT OR REPLACE INTO cursors (entity, bmc, lastLogTime, dupTimeIDList, hrTime) VALUES (?, ?, ?, ?, ?)",
+                       (update['entity'], update['bmchostname'], str(update['lastLogTime']), json.dumps([]), update.get('hrTime')))
+            db.execute("INSERT OR REPLACE INTO node_updates (entity, bmc, node, lastLogTime) VALUES (?, ?, ?, ?)",
+                       (update['entity'], update['bmchostname'], update['node'], str(update['lastLogTime'])))
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+
+def countNodeUpdates(db):
+    """
+        Returns the number of node updates the service has not read yet
+    """
+    return db.execute("SELECT COUNT(*) FROM node_updates").fetchone()[0]
+
+def takeNodeUpdates():
+    """
+        Reads and removes the node updates queued by updateNodeTimes.py
+
+        @return: list of dictionaries with the entity, bmchostname, node and lastLogTime
+    """
+    with storeLock:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute("SELECT entity, bmc, node, lastLogTime FROM node_updates").fetchall()
+            connection.execute("DELETE FROM node_updates")
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+    return [{'entity': row[0], 'bmchostname': row[1], 'node': row[2], 'lastLogTime': row[3]} for row in rows]
+
+def getStoreStats():
+    """
+        Returns the tracker store statistics for logging
+    """
+    with storeLock:
+        storeStats = dict(stats)
+        storeStats['pending'] = len(pending)
+    return storeStats
@@ -23,7 +23,9 @@ import time
 import json
 import signal
 import sys
-from __builtin__ import True
+import socket
+import datetime
+import trackerStore
 
 def getCRASSDPID():
     """
@@ -140,42 +142,49 @@ def getValidPluginsToUpdate(args, enabledPlugins):
         print("The following plugins are not valid or are currently disabled: {pluginList}".format(pluginList=", ".join(invalidPlugins)))
     return validPlugins
 
-def writeCrassdFile(confWriter):
+def getTrackerDatabase(confparser):
     """
-        Writes the file that will be ingested by ibm-crassd to process the updates.  
+        Determines the tracker database of the ibm-crassd service the same way the service does
         
-        @return: True if the file was created, false if unable to create the file
+        @return: the full path of the tracker database
     """ 
+    hostname = socket.gethostname().split('.')[0]
+    path = os.sep.join(config.configFileName.split('/')[:-1])
+    dynamicConfigFile = path + os.sep + hostname + '.' + config.configFileName.split('/')[-1]
+    basePath = config.bmclastreports
+    if 'lastReports' in confparser:
+        basePath = confparser['lastReports']['fileLoc']
+    if os.path.exists(dynamicConfigFile):
+        return trackerStore.getDatabaseName(basePath + os.sep + hostname + '.bmclastreports.ini')
+    return trackerStore.getDatabaseName(basePath + os.sep + 'bmclastreports.ini')
+
+def updateTrackerStore(db, plugins, nodes, confparser):
+    """
+        Sets the last reported alert time of the nodes to the current time in the tracker database of ibm-crassd
+        
+        @return: True if the times were written, False if unable to write them
+    """ 
+    ts = int(time.time())
+    hrTime = datetime.datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+    bmcHostnames = {}
+    for key in confparser['nodes']:
+        crassdNode = json.loads(confparser['nodes'][key])
+        bmcHostnames[crassdNode['xcatNodeName']] = crassdNode['bmcHostname']
+    updates = []
+    for plugin in plugins:
+        for node in nodes:
+            updates.append({'entity': plugin, 'bmchostname': bmcHostnames[node], 'node': node, 'lastLogTime': ts, 'hrTime': hrTime})
     try:
-        with open(config.updateNodeTimesfile, 'w') as updatefile:
-            confWriter.write(updatefile)
+        trackerStore.queueNodeUpdates(db, updates)
         return True
     except Exception as e:
-        print("Failed to write file for crassd located at {filename}. Exiting".format(filename=config.updateNodeTimesfile))
+        print("Failed to update the ibm-crassd tracker database. Exiting")
         exc_type, exc_obj, exc_tb = sys.exc_info()
         fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
         print("exception: ", exc_type, fname, exc_tb.tb_lineno)
         print(e)
         return False
 
-def createFileforCrassd(plugins, nodes):
-    """
-        Creates the content and writes the file that will be ingested by ibm-crassd to process the updates
-        
-        @return: True if the ini file was created, False if it was unable to create
-    """ 
-    
-    confWriter = configparser.ConfigParser()
-    ts = int(time.time())
-    sectionItems= {}
-    for node in nodes:
-        sectionItems[node] = ts
-    
-    for plugin in plugins:
-        confWriter[plugin] = sectionItems
-        
-    return writeCrassdFile(confWriter)
-
 def getValidNodes(confParser):
     """
         returns a list of node names
@@ -217,10 +226,11 @@ if __name__ == '__main__':
             plugins2Update = getValidPluginsToUpdate(args, eplugins)
             bmcs2update = getValidBMCsToUpdate(args,crassdConfig)
             if len(plugins2Update)>0 and len(bmcs2update) >0:
-                if createFileforCrassd(plugins2Update,bmcs2update):
+                db = trackerStore.openDatabase(getTrackerDatabase(crassdConfig))
+                if updateTrackerStore(db, plugins2Update, bmcs2update, crassdConfig):
                     os.kill(cpid, signal.SIGUSR2)
                     print("Waiting for ibm-crassd to update: ")
-                    while(os.path.exists(config.updateNodeTimesfile)):
+                    while(trackerStore.countNodeUpdates(db) > 0):
                         sys.stdout.write('.')
                         sys.stdout.flush()
                         time.sleep(5)
@@ -16,13 +16,22 @@
 package ipmiSelParser;
 
 import java.io.BufferedReader;
+import java.io.ByteArrayOutputStream;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.IOException;
 import java.io.InputStream;
 import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.io.StringReader;
+import java.nio.charset.StandardCharsets;
 import java.sql.Timestamp;
 import java.text.DateFormat;
 import java.text.SimpleDateFormat;
 import java.util.Date;
 import java.util.Map;
+import java.util.concurrent.ExecutorService;
+import java.util.concurrent.Executors;
 import java.util.concurrent.TimeUnit;
 import java.util.regex.Matcher;
 import java.util.regex.Pattern;
@@ -37,6 +46,14 @@ public class ipmiSelParser {
      * @param args the command line arguments
      */
     public static void main(String[] args) {
+        if (args.length > 0 && args[0].equals("--server")){
+            int workers = 16;
+            if (args.length > 1){
+                workers = Integer.parseInt(args[1]);
+            }
+            runServer(workers);
+            return;
+        }
         long startTime = System.currentTimeMillis();
         String bmcIP = args[0];
         String bmcUser = args[1];
@@ -84,19 +101,47 @@ public class ipmiSelParser {
      * @return Buffered reader containing a sel list. 
      */
     private static BufferedReader getSEL(String bmcIP, String userName, String pw){
-        String ipmiCommand = "ipmitool -I lan -H " +bmcIP + " -U " + userName + " -P " +pw + " sel list";
-        ProcessBuilder pb = new ProcessBuilder("bash","-c",ipmiCommand);
-        pb.redirectErrorStream();
+        //the password is passed in the environment so it is not shown in the process list
+        ProcessBuilder pb = new ProcessBuilder("ipmitool", "-I", "lan", "-H", bmcIP, "-U", userName, "-E", "sel", "list");
+        pb.environment().put("IPMI_PASSWORD", pw);
+        pb.redirectErrorStream(true);
         BufferedReader reader = null;
         try{
             Process p = pb.start();
-            InputStream inputStream = p.getInputStream();
-            BufferedReader error = new BufferedReader(new InputStreamReader(p.getErrorStream()));
-            reader = new BufferedReader(new InputStreamReader(inputStream));
-            p.waitFor(60, TimeUnit.SECONDS);
-            String line;
-            if(!reader.ready()){
-                return error;
+            //read the output on its own thread while waiting, a large sel fills the pipe and blocks ipmitool
+            final ByteArrayOutputStream output = new ByteArrayOutputStream();
+            final InputStream inputStream = p.getInputStream();
+            Thread drain = new Thread(new Runnable(){
+                public void run(){
+                    byte[] buffer = new byte[8192];
+                    int count;
+                    try{
+                        while((count = inputStream.read(buffer)) != -1){
+                            synchronized(output){
+                                output.write(buffer, 0, count);
+                            }
+                        }
+                    }
+                    catch(IOException e){
+                        //the stream is closed when ipmitool is stopped
+                    }
+                }
+            });
+            drain.setDaemon(true);
+            drain.start();
+            if (!p.waitFor(60, TimeUnit.SECONDS)){
+                p.destroyForcibly();
+                System.out.println("Import Failed. ipmitool did not return the SEL of " + bmcIP + " within 60 seconds.");
+                return null;
+            }
+            drain.join(10000);
+            if (drain.isAlive()){
+                inputStream.close();
+                System.out.println("Import Failed. The output of ipmitool for " + bmcIP + " was not closed.");
+                return null;
+            }
+            synchronized(output){
+                reader = new BufferedReader(new StringReader(output.toString("UTF-8")));
             }
 //System.out.println("Import Complete");
         }
@@ -138,24 +183,47 @@ public class ipmiSelParser {
      * @return The number of events parsed
      */
     private static int processSelsHashMap(BufferedReader selList){
+        Map<String,Map> lookupEvents = loadLookupEvents();
+        if (lookupEvents == null){
+            return 0;
+        }
+        return decodeSels(selList, lookupEvents, System.out);
+    }
+    /**
+     * Load the lookup table from the xml into a hash map. 
+     *  
+     * @return The hash map containing the lookup table, or null if it could not be loaded
+     */
+    private static Map<String,Map> loadLookupEvents(){
+        BmcEventParser bmcPars = new BmcEventParser();
+        try{
+            return bmcPars.fromNodeList(bmcPars.getEventNodes());
+        }
+        catch(Exception e){
+            System.out.println(e);
+        }
+        return null;
+    }
+    /**
+     * Decode the SEL entries against the lookup table and print them as a JSON document. 
+     *  
+     * @param selList The buffered reader object that contains the SEL entries
+     * @param lookupEvents The hash map containing the lookup table
+     * @param out The stream to print the JSON document to
+     * @return The number of events parsed
+     */
+    private static int decodeSels(BufferedReader selList, Map<String,Map> lookupEvents, PrintStream out){
         String line;
         int alertCount = 0;
-        BmcEventParser bmcPars = new BmcEventParser();
-        Map<String,Map> lookupEvents;
-        //load xml into hashMap
-        
         try{
             long processTimeStart = System.currentTimeMillis();
-            lookupEvents = bmcPars.fromNodeList(bmcPars.getEventNodes());
-            long processTimeEnd = System.currentTimeMillis();
-            //System.out.println("Time to create hash map from xml: "+ String.valueOf(processTimeEnd-processTimeStart) + " ms");
-            processTimeStart = System.currentTimeMillis();
-            System.out.println("{");
+            long processTimeEnd;
+            out.println("{");
             while((line = selList.readLine()) != null){
                 
                 BmcEvent cerEvent;
                 if(line.contains("Error: Unable to establish IPMI v2 / RMCP+ session")){
-                    System.out.println("\t\"event" + alertCount+ "\":{\n"+
+                    out.println("\t\"event" + alertCount+ "\":{\n"+
                             "\t\t\"CerID\": \"FQPSPIN0004M\",\n"+
                             "\t\t\"sensor\": \"N/A\",\n"+
                             "\t\t\"state\": \"N/A\",\n" +
@@ -172,7 +240,7 @@ public class ipmiSelParser {
                             "\n\t},");
                 }
                 else if(line.contains("Address lookup for") && line.contains("failed")){
-                    System.out.println("\t\"event" + alertCount+ "\":{\n"+
+                    out.println("\t\"event" + alertCount+ "\":{\n"+
                             "\t\t\"CerID\": \"FQPSPIN0002M\",\n"+
                             "\t\t\"sensor\": \"N/A\",\n"+
                             "\t\t\"state\": \"N/A\",\n" +
@@ -189,7 +257,7 @@ public class ipmiSelParser {
                             "\n\t},");
                 }
                 else if(line.contains("Error: Unable to establish LAN session")){
-                    System.out.println("\t\"event" + alertCount+ "\":{\n"+
+                    out.println("\t\"event" + alertCount+ "\":{\n"+
                             "\t\t\"CerID\": \"FQPSPIN0003M\",\n"+
                             "\t\t\"sensor\": \"N/A\",\n"+
                             "\t\t\"state\": \"N/A\",\n" +
@@ -206,7 +274,7 @@ public class ipmiSelParser {
                             "\n\t},");
                 }
                 else if(line.contains("Authentication type NONE not supported")){
-                    System.out.println("\t\"event" + alertCount+ "\":{\n"+
+                    out.println("\t\"event" + alertCount+ "\":{\n"+
                             "\t\t\"CerID\": \"FQPSPSE0004M\",\n"+
                             "\t\t\"sensor\": \"N/A\",\n"+
                             "\t\t\"state\": \"N/A\",\n" +
@@ -227,7 +295,7 @@ public class ipmiSelParser {
                 }
                 /*
                 else if(line.contains("test")){
-                    System.out.println("\t\"event" + alertCount+ "\":{\n"+
+                    out.println("\t\"event" + alertCount+ "\":{\n"+
                             "\t\t\"CerID\": \"FQPSPIN0000M\",\n"+
                             "\t\t\"sensor\": \"N/A\",\n"+
                             "\t\t\"state\": \"N/A\",\n" +
@@ -265,15 +333,15 @@ public class ipmiSelParser {
                             cerEvent = createCEREventFromMap(eventAttr);
                             cerEvent.setTimestamp(unixTimestamp);
                             //System.out.println(cerEvent.getSensor() + cerEvent.getState());
-                            System.out.println("\t\"event" + alertCount+ "\":" + cerEvent.toJSON() + ",");
+                            out.println("\t\"event" + alertCount+ "\":" + cerEvent.toJSON() + ",");
                         }
                         else{
-                            System.out.println("\t\"event"+ alertCount+ "\":" + "{\n\t\"error\": \"Could not find: " + mapKey+ "\" \n},");
+                            out.println("\t\"event"+ alertCount+ "\":" + "{\n\t\"error\": \"Could not find: " + mapKey+ "\" \n},");
                         }
                     }
                 else{ //ipmitool error
                     //System.out.println("\t\"event"+ alertCount+ "\":" + "{\n\t\"error\": \"Could not find: " + line.trim().replace("\t", " ")+ "\" \n},");
-                    System.out.println("\t\"event" + alertCount+ "\":{\n"+
+                    out.println("\t\"event" + alertCount+ "\":{\n"+
                             "\t\t\"CerID\": \"FQPSPCR0020M\",\n"+
                             "\t\t\"sensor\": \"N/A\",\n"+
                             "\t\t\"state\": \"N/A\",\n" +
@@ -291,8 +359,8 @@ public class ipmiSelParser {
                 }
                 alertCount++;
             }
-            System.out.println("\t\"numAlerts\": "+ alertCount);
-            System.out.println("}");
+            out.println("\t\"numAlerts\": "+ alertCount);
+            out.println("}");
             processTimeEnd = System.currentTimeMillis();
             //System.out.println("Processed " + String.valueOf(alertCount) + " alerts.");
             if(alertCount>0){
@@ -302,10 +370,81 @@ public class ipmiSelParser {
             
         }
         catch(Exception e){
-            System.out.println(e);
+            out.println(e);
         }
         return alertCount;
     }
+    /**
+     * Run as a long lived SEL decoding service. The lookup table is loaded once and requests are read from
+     * stdin, one per line with the request id, BMC hostname, user name and password separated by tabs. Each
+     * request is decoded by a pool of worker threads. The response is written to stdout as a line with the
+     * request id and the length in bytes of the JSON document, followed by the document. Returns when stdin
+     * is closed. 
+     *  
+     * @param workers The number of SEL lists read and decoded at the same time
+     */
+    private static void runServer(int workers){
+        final PrintStream responses = new PrintStream(new FileOutputStream(FileDescriptor.out), false);
+        //anything else printed goes to stderr so it cannot corrupt the responses
+        System.setOut(System.err);
+        final Map<String,Map> lookupEvents = loadLookupEvents();
+        if (lookupEvents == null){
+            return;
+        }
+        ExecutorService pool = Executors.newFixedThreadPool(workers);
+        responses.println("ready");
+        responses.flush();
+        BufferedReader requests = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        String line;
+        try{
+            while((line = requests.readLine()) != null){
+                final String[] request = line.split("\t", -1);
+                if (request.length != 4){
+                    System.err.println("Invalid request ignored");
+                    continue;
+                }
+                pool.submit(new Runnable(){
+                    public void run(){
+                        writeResponse(responses, request[0], decodeRequest(request[1], request[2], request[3], lookupEvents));
+                    }
+                });
+            }
+        }
+        catch(Exception e){
+            System.err.println(e);
+        }
+        pool.shutdown();
+    }
+    /**
+     * Read and decode the SEL list of one BMC for the service. 
+     *  
+     * @return The JSON document of the decoded SEL entries
+     */
+    private static byte[] decodeRequest(String bmcIP, String userName, String pw, Map<String,Map> lookupEvents){
+        ByteArrayOutputStream document = new ByteArrayOutputStream();
+        try{
+            PrintStream out = new PrintStream(document, false, "UTF-8");
+            BufferedReader ipmiSelList = getSEL(bmcIP, userName, pw);
+            if (ipmiSelList != null){
+                decodeSels(ipmiSelList, lookupEvents, out);
+            }
+            out.flush();
+        }
+        catch(Exception e){
+            System.err.println(e);
+        }
+        return document.toByteArray();
+    }
+    /**
+     * Write a response of the service to stdout. 
+     */
+    private static void writeResponse(PrintStream responses, String requestId, byte[] document){
+        synchronized(responses){
+            responses.print(requestId + "\t" + document.length + "\n");
+            responses.write(document, 0, document.length);
+            responses.flush();
+        }
+    }
     private static BmcEvent createCEREventFromMap(Map eventMap){
         BmcEvent newEvent = new BmcEvent();
         newEvent.setCerId(eventMap.get("CommonEventID").toString());